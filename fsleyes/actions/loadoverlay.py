@@ -17,24 +17,34 @@ called directly:
    makeWildcard
    loadOverlays
    loadImage
+   probeImage
    interactiveLoadOverlays
 
 
+The :class:`OverlayCache` class may be used to re-use overlays across
+multiple calls to :func:`loadOverlays`.
+
+
 Finally, this module provides a singleton :class:`RecentPathManager` instance
 called :attr:`recentPathManager`, which can be registered with to be notified
 when new files have been loaded.
 """
 
 
-import            logging
-import            os
-import os.path as op
+import                       logging
+import                       os
+import                       contextlib
+import                       collections
+import                       threading
+import os.path            as op
+import concurrent.futures as futures
 
 import numpy   as np
 
 import fsl.utils.idle               as idle
 import fsl.utils.notifier           as notifier
 import fsl.utils.settings           as fslsettings
+import fsleyes_widgets              as fwidgets
 import fsleyes_widgets.utils.status as status
 import fsleyes.autodisplay          as autodisplay
 import fsleyes.strings              as strings
@@ -71,22 +81,31 @@ class LoadOverlayAction(base.Action):
         of each new overlay.
         """
 
-        def onLoad(paths, overlays):
+        # Overlays are added to the list
+        # as soon as they have been loaded
+        def onLoadOne(idx, overlays):
 
             if len(overlays) == 0:
                 return
 
             self.overlayList.extend(overlays)
 
-            self.displayCtx.selectedOverlay = self.displayCtx.overlayOrder[-1]
-
             if self.displayCtx.autoDisplay:
                 for overlay in overlays:
                     autodisplay.autoDisplay(overlay,
                                             self.overlayList,
                                             self.displayCtx)
 
+        def onLoad(paths, overlays):
+
+            if len(overlays) == 0:
+                return
+
+            self.displayCtx.selectedOverlay = self.displayCtx.overlayOrder[-1]
+
         interactiveLoadOverlays(onLoad=onLoad,
+                                onLoadOne=onLoadOne,
+                                overlayList=self.overlayList,
                                 inmem=self.displayCtx.loadInMemory)
 
 
@@ -142,13 +161,18 @@ def loadOverlays(paths,
                  saveDir=True,
                  onLoad=None,
                  inmem=False,
-                 blocking=False):
+                 blocking=False,
+                 onLoadOne=None,
+                 overlayList=None,
+                 cache=None):
     """Loads all of the overlays specified in the sequence of files
     contained in ``paths``.
 
-    .. note:: The overlays are loaded asynchronously via :func:`.idle.idle`.
-              Use the ``onLoad`` argument if you wish to be notified when
-              the overlays have been loaded.
+    .. note:: The overlays are loaded asynchronously on a pool of threads
+              (see the ``fsleyes.overlay.loadThreads`` setting). Use the
+              ``onLoad`` argument if you wish to be notified when the
+              overlays have been loaded, or the ``onLoadOne`` argument
+              to be notified as each overlay is loaded.
 
     :arg loadFunc:  A function which is called just before each overlay
                     is loaded, and is passed the overlay path. The default
@@ -183,8 +207,30 @@ def loadOverlays(paths,
 
     :arg blocking:  Defaults to ``False``. If ``True``, overlays are loaded
                     immediately (and the ``onLoad`` function is called
-                    directly. Otherwise, overlays and the ``onLoad`` are loaded
-                    and called on the :func:`.idle.idle` loop.
+                    directly. Otherwise, overlays are loaded concurrently on
+                    a pool of threads, and the ``onLoad`` function is called
+                    on the :func:`.idle.idle` loop.
+
+    :arg onLoadOne: Optional function which is called (on the
+                    :func:`.idle.idle` loop if ``blocking is False``) for
+                    each path, in the order given by ``paths``, as soon as
+                    the overlays for that path, and for all preceding paths,
+                    have been loaded. Must accept two parameters - the index
+                    of the path into ``paths``, and a list of the overlays
+                    that were loaded from it.
+
+    :arg overlayList: Optional :class:`.OverlayList`. If provided, calls to
+                    ``onLoadOne`` which are made at the same time (e.g.
+                    when several files finish loading together, or when
+                    ``blocking is True``) are made within a single
+                    :meth:`.OverlayList.batch`, so that any overlays which
+                    are added to the list by ``onLoadOne`` are processed by
+                    listeners in one pass. The ``onLoad`` function is
+                    called after the batch has finished.
+
+    :arg cache:     Optional :class:`OverlayCache`. If provided, overlays
+                    are retrieved from the cache if possible, and newly
+                    loaded overlays are added to it.
 
     :returns:       If ``blocking is False`` (the default), returns ``None``.
                     Otherwise returns a list containing the loaded overlay
@@ -209,16 +255,39 @@ def loadOverlays(paths,
             strings.messages['loadOverlays.error'].format(s),
             e)
 
-    # A function which loads a single overlay
-    def loadPath(path, idx):
-
-        loadFunc(path)
-
-        dtype, _, path = dutils.guessType(path)
+    # A function which loads a single overlay.
+    # This may be called on a separate thread,
+    # so must not call loadFunc/errorFunc, or
+    # otherwise interact with the GUI. Returns
+    # a tuple containing the (possibly resolved)
+    # path, a list of loaded overlays, and an
+    # error (which is None if the load succeeded).
+    def loadPath(path):
+
+        # guessType may need to read the
+        # file header, so will raise an
+        # error if the file is corrupt
+        try:
+            dtype, _, path = dutils.guessType(path)
+        except Exception as e:
+            return path, [], e
 
         if dtype is None:
-            errorFunc(path, strings.messages['loadOverlays.unknownType'])
-            return
+            return path, None, strings.messages['loadOverlays.unknownType']
+
+        # The same file may be listed more than
+        # once - a cached overlay is only returned
+        # once, as an overlay cannot be added to
+        # an OverlayList more than once.
+        cached = None
+        if cache is not None:
+            cached = cache.get(path, inmem)
+            with cacheLock:
+                if cached is not None and \
+                   not any(id(o) in cacheUsed for o in cached):
+                    cacheUsed.update(id(o) for o in cached)
+                    log.debug('Using cached overlay(s) for %s', path)
+                    return path, cached, None
 
         log.debug('Loading overlay {} (guessed data type: {})'.format(
             path, dtype.__name__))
@@ -233,11 +302,32 @@ def loadOverlays(paths,
             else:
                 loaded = [dtype(path)]
 
+        except Exception as e:
+            return path, [], e
+
+        if cache is not None and cached is None:
+            with cacheLock:
+                cacheUsed.update(id(o) for o in loaded)
+                cache.put(path, inmem, loaded)
+
+        return path, loaded, None
+
+    # Called on the main thread with the result
+    # of loadPath for each path, in order.
+    def pathLoaded(idx, path, loaded, error):
+
+        # unknown type
+        if loaded is None:
+            errorFunc(path, error)
+            return
+
+        if error is not None:
+            errorFunc(path, error)
+        else:
             overlays.extend(loaded)
             pathIdxs.extend([idx] * len(loaded))
-
-        except Exception as e:
-            errorFunc(path, e)
+            if onLoadOne is not None:
+                onLoadOne(idx, loaded)
 
         # Record the path in the
         # recent files list
@@ -264,23 +354,131 @@ def loadOverlays(paths,
     if loadFunc  == 'default': loadFunc  = defaultLoadFunc
     if errorFunc == 'default': errorFunc = defaultErrorFunc
 
-    pathIdxs = []
-    overlays = []
-    funcs    = []
-
-    # Load the images
-    for idx, path in enumerate(paths):
-        funcs.append(lambda p=path, i=idx: loadPath(p, i))
-    funcs.append(realOnLoad)
-
-    for func in funcs:
-        if blocking: func()
-        else:        idle.idle(func)
+    # Used to group calls to pathLoaded
+    def batch():
+        if overlayList is None: return contextlib.nullcontext()
+        else:                   return overlayList.batch()
+
+    pathIdxs  = []
+    overlays  = []
+    cacheUsed = set()
+    cacheLock = threading.Lock()
+
+    # Load the overlays one by one on
+    # the calling thread. We do this
+    # when a GUI is not running, as
+    # callers will be expecting the
+    # overlays to be loaded by the
+    # time this function returns.
+    if blocking or not fwidgets.haveGui():
+        with batch():
+            for idx, path in enumerate(paths):
+                loadFunc(path)
+                pathLoaded(idx, *loadPath(path))
+        realOnLoad()
+
+    # Otherwise load the overlays
+    # concurrently, and pass them
+    # to the caller in order
+    else:
+        _loadConcurrently(paths, loadPath, loadFunc, pathLoaded, realOnLoad,
+                          batch)
 
     if blocking: return overlays
     else:        return None
 
 
+_pool     = None
+_poolLock = threading.Lock()
+
+
+def _loadPool():
+    """Used by :func:`loadOverlays`. Returns a
+    ``concurrent.futures.ThreadPoolExecutor`` which is used to load overlays
+    concurrently. The pool is created on the first call. The number of
+    threads is controlled by the ``fsleyes.overlay.loadThreads`` setting,
+    and defaults to the number of CPUs, up to a maximum of 4.
+    """
+
+    global _pool
+
+    with _poolLock:
+        if _pool is None:
+            default = min(4, os.cpu_count() or 1)
+            workers = fslsettings.read('fsleyes.overlay.loadThreads', default)
+            _pool   = futures.ThreadPoolExecutor(
+                max_workers=max(1, int(workers)),
+                thread_name_prefix='fsleyes-loadoverlay')
+        return _pool
+
+
+def _loadConcurrently(paths,
+                      loadPath,
+                      loadFunc,
+                      pathLoaded,
+                      onFinish,
+                      batch=None):
+    """Used by :func:`loadOverlays`. Calls ``loadPath`` for every path on
+    the :func:`_loadPool`, and then calls ``pathLoaded`` on the
+    :func:`.idle.idle` loop for each path, in the original order, as soon as
+    it (and all preceding paths) have been loaded. ``onFinish`` is called on
+    the ``idle`` loop after the last ``pathLoaded`` call.
+
+    :arg paths:      Paths to load
+    :arg loadPath:   Function which loads a path, returning a tuple
+                     containing ``(path, loaded, error)``.
+    :arg loadFunc:   Function which is called (on the ``idle`` loop) just
+                     before each path is loaded
+    :arg pathLoaded: Function which is passed the index of the path, and the
+                     result of ``loadPath``.
+    :arg onFinish:   Function to call when all paths have been loaded.
+    :arg batch:      Optional function which returns a context manager.
+                     All ``pathLoaded`` calls which are made on the same
+                     ``idle`` callback are made within this context.
+    """
+
+    if batch is None:
+        batch = contextlib.nullcontext
+
+    if len(paths) == 0:
+        idle.idle(onFinish)
+        return
+
+    pool    = _loadPool()
+    results = {}
+    nextIdx = [0]
+
+    def load(path):
+        idle.idle(loadFunc, path)
+        return loadPath(path)
+
+    def done(idx, result):
+        results[idx] = result
+        with batch():
+            while nextIdx[0] in results:
+                pathLoaded(nextIdx[0], *results.pop(nextIdx[0]))
+                nextIdx[0] += 1
+        if nextIdx[0] == len(paths):
+            onFinish()
+
+    # Errors which are not handled by
+    # loadPath are passed to pathLoaded
+    # in the same way as those which
+    # are, so that subsequent paths are
+    # not held up.
+    def futureDone(future, idx, path):
+        try:
+            result = future.result()
+        except Exception as e:
+            result = (path, [], e)
+        idle.idle(done, idx, result)
+
+    for idx, path in enumerate(paths):
+        future = pool.submit(load, path)
+        future.add_done_callback(
+            lambda f, i=idx, p=path: futureDone(f, i, p))
+
+
 def loadImage(dtype, path, inmem=False):
     """Called by the :func:`loadOverlays` function. Loads an overlay which
     is represented by an ``Image`` instance, or a sub-class of ``Image``.
@@ -298,55 +496,140 @@ def loadImage(dtype, path, inmem=False):
     :returns:   A sequence of :class:`.Image` instances that were loaded.
     """
 
-    import fsl.data.image            as fslimage
     import fsleyes.data.imagewrapper as imagewrapper
+    import fsleyes.data.imagestats   as imagestats
 
-    # We're going to load the file twice - first to
-    # get its dimensions/data type, and then for real.
-    #
-    # TODO It is annoying that you have to create a 'dtype'
-    #      instance twice, as e.g. the MelodicImage does a
-    #      bunch of extra stuff (e.g. loading component
-    #      time courses) that don't need to be done. Maybe
-    #      the path passed to this function could be resolved
-    #      (e.g. ./filtered_func.ica/ turned into
-    #      ./filtered_func.ica/melodic_IC) so that you can
-    #      just create a fsl.data.Image, or a nib.Nifti1Image.
-    image  = dtype(path)
-    shape  = image.shape
-    nbytes = np.prod(shape) * image.niftiDataTypeSize / 8
-    image  = None
+    # Figure out the image dimensions/data
+    # type, ideally just from the header.
+    shape, nbytes = probeImage(dtype, path)
 
     # If the file is a large 4D image, we will use an
     # ImageWrapper to manage acccess to the data. The
     # ImageWrapper will incrementally update the
     # known data range of an image as more data is
-    # read from disk.
+    # read from disk. If the file is compressed,
+    # the ImageWrapper will read from it via a
+    # seek point index, so that random access
+    # does not require the whole file to be
+    # decompressed.
     useWrapper = fslsettings.read('fsleyes.overlay.usewrapper', 536870912)
     useWrapper = all((not inmem,
                       len(shape) > 3,
                       nbytes >= useWrapper))
-    if useWrapper: wrapper = imagewrapper.ImageWrapper(threaded=True)
+    if useWrapper: wrapper = imagewrapper.ImageWrapper(threaded=True,
+                                                       indexed=True)
     else:          wrapper = None
 
     image = dtype(path, loadMeta=True, dataMgr=wrapper)
 
     # Force-load the full image data array
     # into memory. See the Image.data method.
-    if inmem:
-        image.data
+    # Compressed images which are not being
+    # managed by an ImageWrapper are also
+    # loaded now, as any access to their
+    # data requires the whole file to be
+    # decompressed anyway. The number of
+    # images which are being decompressed
+    # at any one time is limited by the
+    # fsleyes.overlay.loadBudget setting.
+    compressed = str(image.dataSource).endswith('.gz')
+    if inmem or (wrapper is None and compressed):
+        with _loadBudget.reserve(nbytes):
+            image.data
 
     # If using an image wrapper, read a
     # sample of data to force the wrapper
-    # to initialise its known data range
+    # to initialise its known data range.
+    # If the full data range was saved the
+    # last time that the image was loaded,
+    # the wrapper starts with it. Otherwise
+    # it is saved once the wrapper has read
+    # all of the image data.
     if wrapper is not None:
-        wrapper.setImage(image.nibImage)
+        stats = imagestats.imageStats(image)
+        wrapper.setImage(image.nibImage, stats.dataRange)
+
+        def saveRanges(*a):
+            if wrapper.covered and not saveRanges.saved:
+                saveRanges.saved = True
+                stats.setVolumeRanges(wrapper.volumeRanges)
+        saveRanges.saved = False
+
+        wrapper.register(f'{id(stats)}_saveRanges', saveRanges)
         with wrapper.unthreaded():
             wrapper[..., 0]
 
     return [image]
 
 
+def probeImage(dtype, path):
+    """Called by :func:`loadImage`. Returns the shape of the image at
+    ``path``, and the size of its data in bytes. The image header is read
+    via ``nibabel`` if possible, so that the image data, and any other files
+    associated with the image type (e.g. the component time courses of a
+    :class:`.MelodicImage`), do not need to be loaded. Otherwise a ``dtype``
+    instance is created.
+
+    :arg dtype: Overlay type (``Image``, or a sub-class of ``Image``).
+    :arg path:  Path to the overlay file.
+    :returns:   A tuple containing the image shape, and data size in bytes.
+    """
+
+    import nibabel        as nib
+    import fsl.data.image as fslimage
+
+    try:
+        header = nib.load(fslimage.addExt(path)).header
+        shape  = fslimage.canonicalShape(header.get_data_shape())
+        nbytes = np.prod(shape) * header.get_data_dtype().itemsize
+
+    # e.g. path is a FEAT/MELODIC directory
+    except Exception:
+        image  = dtype(path)
+        shape  = image.shape
+        nbytes = np.prod(shape) * image.niftiDataTypeSize / 8
+
+    return tuple(shape), nbytes
+
+
+class _LoadBudget:
+    """Used by :func:`loadImage` to limit the amount of image data which is
+    being loaded into memory concurrently, according to the
+    ``fsleyes.overlay.loadBudget`` setting (default 2GB).
+    """
+
+    def __init__(self):
+        self.__cond = threading.Condition()
+        self.__used = 0
+
+
+    @contextlib.contextmanager
+    def reserve(self, nbytes):
+        """Context manager which blocks until ``nbytes`` can be reserved
+        within the budget. An image which is larger than the budget may be
+        loaded when no other images are being loaded.
+        """
+
+        budget = fslsettings.read('fsleyes.overlay.loadBudget', 2147483648)
+        nbytes = max(0, min(nbytes, budget))
+
+        with self.__cond:
+            while self.__used > 0 and self.__used + nbytes > budget:
+                self.__cond.wait()
+            self.__used += nbytes
+
+        try:
+            yield
+
+        finally:
+            with self.__cond:
+                self.__used -= nbytes
+                self.__cond.notify_all()
+
+
+_loadBudget = _LoadBudget()
+
+
 def interactiveLoadOverlays(fromDir=None, dirdlg=False, **kwargs):
     """Convenience function for interactively loading one or more overlays.
 
@@ -407,6 +690,86 @@ def interactiveLoadOverlays(fromDir=None, dirdlg=False, **kwargs):
     loadOverlays(paths, saveDir=saveFromDir, **kwargs)
 
 
+class OverlayCache:
+    """An ``OverlayCache`` may be passed to :func:`loadOverlays`, so that
+    overlays which have already been loaded can be re-used, instead of being
+    loaded again. It is used by the :mod:`fsleyes.render` batch mode, where
+    the same files are often used in many scenes.
+
+    The cache contains up to ``size`` files, and the least recently used
+    file is discarded when the cache is full. A cached file is re-loaded
+    if it has been modified since it was cached.
+
+    .. note:: Cached overlays must be removed from any
+              :class:`.OverlayList` (and any :class:`.DisplayContext`
+              which is managing them must be destroyed) before they are
+              re-used.
+    """
+
+
+    def __init__(self, size=None):
+        """Create an ``OverlayCache``.
+
+        :arg size: Maximum number of files to cache. Defaults to the
+                   ``fsleyes.overlay.cacheSize`` setting (default 8).
+        """
+
+        if size is None:
+            size = fslsettings.read('fsleyes.overlay.cacheSize', 8)
+
+        self.__size  = max(0, int(size))
+        self.__lock  = threading.Lock()
+        self.__cache = collections.OrderedDict()
+
+
+    def __len__(self):
+        """Returns the number of files in the cache. """
+        return len(self.__cache)
+
+
+    def clear(self):
+        """Discards all cached overlays. """
+        with self.__lock:
+            self.__cache.clear()
+
+
+    def __key(self, path, inmem):
+        """Returns a key for the given file, which includes its size and
+        modification time, or ``None`` if the file cannot be found.
+        """
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return None
+        return (op.abspath(path), bool(inmem), stat.st_size, stat.st_mtime_ns)
+
+
+    def get(self, path, inmem=False):
+        """Returns a list of overlays loaded from ``path``, or ``None`` if
+        ``path`` is not in the cache.
+        """
+        key = self.__key(path, inmem)
+        with self.__lock:
+            loaded = self.__cache.get(key, None)
+            if loaded is not None:
+                self.__cache.move_to_end(key)
+            return loaded
+
+
+    def put(self, path, inmem, loaded):
+        """Adds a list of overlays that were loaded from ``path`` to the
+        cache.
+        """
+        key = self.__key(path, inmem)
+        if key is None or self.__size == 0:
+            return
+        with self.__lock:
+            self.__cache[key] = list(loaded)
+            self.__cache.move_to_end(key)
+            while len(self.__cache) > self.__size:
+                self.__cache.popitem(last=False)
+
+
 class RecentPathManager(notifier.Notifier):
     """The ``RecentPathManager`` is a simple class which provides
     access to a list of recently loaded files, and can notify
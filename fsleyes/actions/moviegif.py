@@ -6,18 +6,14 @@
 #
 """This module provides the :class:`MovieGifAction`, which allows the user
 to save animated gifs. The :func:`makeGif` function can also be used to
-programmatically generate animated gifs.
+programmatically generate animated gifs, or movies in any other format
+supported by the :mod:`.movie` module.
 """
 
 
-import os.path as op
-import            os
-import            shutil
-import            tempfile
+import os
 
-import            PIL
-import            wx
-import numpy   as np
+import wx
 
 import fsl.utils.idle                 as idle
 import fsl.transform.affine           as affine
@@ -28,6 +24,7 @@ from   fsleyes_widgets import            isalive
 from . import base
 
 import fsleyes.strings            as strings
+import fsleyes.movie              as fslmovie
 import fsleyes.actions.screenshot as screenshot
 import fsleyes.views.scene3dpanel as scene3dpanel
 
@@ -145,10 +142,16 @@ def makeGif(overlayList,
             panel,
             filename,
             progfunc=None,
-            onfinish=None):
+            onfinish=None,
+            fps=20):
     """Save an animated gif of the currently selected overlay, according to the
     current movie mode settings.
 
+    Each frame is read from the off-screen render targets of the GL canvases
+    in the ``panel``, and passed to a :class:`.MovieWriter`, which encodes
+    it as soon as it has been captured. The movie format is determined by
+    the ``filename`` suffix (see :func:`.movie.openMovie`).
+
     .. note:: This function will return immediately, as the animated GIF is
               generated on the ``wx`` :mod:`.idle` loop.
 
@@ -159,6 +162,7 @@ def makeGif(overlayList,
     :arg progfunc:    Function which will be called after each frame is saved.
     :arg onfinish:    Function which will be called after all frames have been
                       saved.
+    :arg fps:         Movie frame rate, in frames per second.
     """
 
     def defaultProgFunc(frame):
@@ -169,7 +173,7 @@ def makeGif(overlayList,
 
     overlay = displayCtx.getSelectedOverlay()
     opts    = displayCtx.getOpts(overlay)
-    tempdir = tempfile.mkdtemp()
+    writer  = fslmovie.openMovie(filename, fps)
     is3d    = isinstance(panel, scene3dpanel.Scene3DPanel) and \
               panel.movieAxis != 3
     ctx     = MovieContext(is3d)
@@ -181,17 +185,11 @@ def makeGif(overlayList,
         pass
 
     def finalise(ctx):
-        if not ctx.cancelled and len(ctx.images) > 0:
-            ctx.images[0].save(filename,
-                               format='gif',
-                               save_all=True,
-                               append_images=ctx.images[1:],
-                               duration=50,
-                               loop=0)
-        shutil.rmtree(tempdir)
-
-        if onfinish is not None:
-            onfinish()
+        try:
+            writer.close(discard=ctx.cancelled or len(ctx.frames) == 0)
+        finally:
+            if onfinish is not None:
+                onfinish()
 
     def ready():
         globjs = [c.getGLObject(o)
@@ -200,15 +198,22 @@ def makeGif(overlayList,
         globjs = [g for g in globjs if g is not None]
         return all([g.ready() for g in globjs])
 
+    def refresh(ctx):
+        """Refresh the canvases, and schedule the frame capture. The capture
+        is queued on the idle loop after the canvas refreshes, so it will
+        be executed after the canvases have been drawn.
+        """
+        panel.movieSync()
+        idle.idle(captureFrame, ctx)
+
     def captureFrame(ctx):
         """Capture one frame, update the view to the next frame, and
         schedule the next frame capture.
         """
         try:
-            panel.movieSync()
             realCaptureFrame(ctx)
-            idle.idleWhen(captureFrame, ready, ctx, after=0.1)
             panel.doMovieUpdate(overlay, opts)
+            idle.idleWhen(refresh, ready, ctx, pollTime=0.01)
 
         except Finished:
             finalise(ctx)
@@ -222,10 +227,7 @@ def makeGif(overlayList,
         or Finished() when the movie capture is complete.
         """
 
-        # individual frames don't
-        # need to be saved as gif
         idx   = len(ctx.frames)
-        fname = op.join(tempdir, '{}.png'.format(idx))
         frame = panel.getMovieFrame(overlay, opts)
 
         if not progfunc(idx):
@@ -236,14 +238,14 @@ def makeGif(overlayList,
         if finished:
             raise Finished()
 
-        screenshot.screenshot(panel, fname)
-        ctx.addFrame(frame, PIL.Image.open(fname))
+        writer.addFrame(screenshot.canvasPanelBitmap(panel, blit=False))
+        ctx.addFrame(frame)
 
-    idle.idleWhen(captureFrame, ready, ctx, after=0.1)
+    idle.idleWhen(refresh, ready, ctx, pollTime=0.01)
 
 
 class MovieContext:
-    """Used by :func:`makeGif`. Stores references to captured frames,
+    """Used by :func:`makeGif`. Stores the values of captured frames,
     and contains logic to detect when enough frames have been captured.
     """
 
@@ -262,12 +264,12 @@ class MovieContext:
         self.looped     = False
         self.cancelled  = False
         self.startFrame = None
-        self.images     = []
         self.frames     = []
 
-    def addFrame(self, frame, image):
-        """Save refs to a movie frame and associated screenshot. """
-        self.images.append(image)
+    def addFrame(self, frame):
+        """Save the value of a captured movie frame (see
+        :meth:`processFrame`).
+        """
         self.frames.append(frame)
 
     def processFrame(self, frame):
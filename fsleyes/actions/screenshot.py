@@ -17,6 +17,7 @@ A few stand-alone functions are defined in this module:
    screenshot
    plotPanelScreenshot
    canvasPanelScreenshot
+   canvasPanelBitmap
 """
 
 
@@ -159,6 +160,27 @@ def canvasPanelScreenshot(panel, filename):
     or :class:`.PlotPanel`, saving it to the given ``filename``.
     """
 
+    data = canvasPanelBitmap(panel)
+
+    try:              fmt = op.splitext(filename)[1][1:]
+    except Exception: fmt = None
+
+    mplimg.imsave(filename, data, format=fmt)
+
+
+def canvasPanelBitmap(panel, blit=True):
+    """Capture the contents of the given :class:`.CanvasPanel`, returning
+    it as a ``(height, width, 4)`` ``uint8`` array.
+
+    :arg panel: The :class:`.CanvasPanel`
+    :arg blit:  If ``True`` (the default), the entire panel is copied from
+                the screen, and the contents of each GL canvas are patched
+                in. Otherwise only the GL canvases are copied, from their
+                off-screen render targets, onto a background of the panel
+                background colour. This is much faster, and can be used when
+                capturing many frames (e.g. by :func:`.moviegif.makeGif`).
+    """
+
     # The canvas panel container is the
     # direct parent of the colour bar
     # canvas, and an ancestor of the
@@ -183,6 +205,28 @@ def canvasPanelScreenshot(panel, filename):
     log.debug('Creating bitmap {} * {} for {} screenshot'.format(
         width, height, type(cpanel).__name__))
 
+    if blit:
+        _blitPanel(panel, data)
+
+    # Blitting is rarely sufficient to capture
+    # the content of OpenGL canvases - e.g. if
+    # another window is obscuring the canvas,
+    # the obscured region will be black. So we
+    # use OpenGL calls to patch the contents of
+    # each GL canvas into the blitted bitmap.
+    data = _patchInCanvases(cpanel, panel, data, bgColour)
+    data[:, :,  3] = 255
+
+    return data
+
+
+def _blitPanel(panel, data):
+    """Used by the :func:`canvasPanelBitmap` function. Copies the contents
+    of the given ``wx`` panel from the screen into the given ``data`` array.
+    """
+
+    height, width = data.shape[:2]
+
     # The typical way to get a screen grab of a
     # wx Window is to use a wx.WindowDC, and a
     # wx.MemoryDC, and to 'blit' a region from
@@ -215,20 +259,6 @@ def canvasPanelScreenshot(panel, filename):
 
     data[:, :, :3] = rgb.reshape(height, width, 3)
 
-    # Blitting is rarely sufficient to capture
-    # the content of OpenGL canvases - e.g. if
-    # another window is obscuring the canvas,
-    # the obscured region will be black. So we
-    # use OpenGL calls to patch the contents of
-    # each GL canvas into the blitted bitmap.
-    data = _patchInCanvases(cpanel, panel, data, bgColour)
-    data[:, :,  3] = 255
-
-    try:              fmt = op.splitext(filename)[1][1:]
-    except Exception: fmt = None
-
-    mplimg.imsave(filename, data, format=fmt)
-
 
 def _patchInCanvases(canvasPanel, containerPanel, data, bgColour):
     """Used by the :func:`canvasPanelScreenshot` function.
@@ -0,0 +1,16 @@
+/*
+ * Fragment shader used by Text instances. The glyph atlas texture
+ * contains glyph coverage in its alpha channel, which is used to
+ * modulate the opacity of the text colour.
+ *
+ * Author: Paul McCarthy <pauldmccarthy@gmail.com>
+ */
+#version 120
+
+uniform sampler2D tex;
+uniform vec4      colour;
+varying vec2      fragTexCoord;
+
+void main(void) {
+  gl_FragColor = vec4(colour.rgb, colour.a * texture2D(tex, fragTexCoord).a);
+}
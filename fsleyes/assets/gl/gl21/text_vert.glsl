@@ -0,0 +1,17 @@
+/*
+ * Vertex shader used by Text instances.
+ *
+ * Author: Paul McCarthy <pauldmccarthy@gmail.com>
+ */
+#version 120
+
+uniform   mat4 MVP;
+attribute vec3 vertex;
+attribute vec2 texCoord;
+varying   vec2 fragTexCoord;
+
+void main(void) {
+
+  fragTexCoord = texCoord;
+  gl_Position  = MVP * vec4(vertex, 1);
+}
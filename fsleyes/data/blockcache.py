@@ -0,0 +1,345 @@
+#!/usr/bin/env python
+#
+# blockcache.py - The TimeSeriesBlockCache class.
+#
+# Author: Paul McCarthy <pauldmccarthy@gmail.com>
+#
+"""This module provides the :class:`TimeSeriesBlockCache` class, which is
+used by :class:`.VoxelDataSeries` instances to retrieve voxel time series from
+4D :class:`.Image` overlays.
+
+.. autosummary::
+   :nosignatures:
+
+   blockCache
+   useBlockCache
+"""
+
+
+import logging
+import threading
+import collections
+import weakref
+
+import numpy as np
+
+import fsl.utils.idle     as idle
+import fsl.utils.settings as fslsettings
+
+
+log = logging.getLogger(__name__)
+
+
+_caches     = weakref.WeakKeyDictionary()
+_cachesLock = threading.Lock()
+_thread     = None
+
+
+def useBlockCache(image):
+    """Returns ``True`` if a :class:`TimeSeriesBlockCache` should be used to
+    retrieve time series from the given :class:`.Image`, ``False`` otherwise.
+    Block caches are used for images with more than three dimensions, and can
+    be disabled by setting the ``fsleyes.timeseries.cacheSize`` setting to
+    ``0``.
+    """
+
+    budget = fslsettings.read('fsleyes.timeseries.cacheSize', 268435456)
+
+    if budget is None or budget <= 0:
+        return False
+
+    return len(image.shape) > 3
+
+
+def blockCache(image):
+    """Returns a :class:`TimeSeriesBlockCache` for the given :class:`.Image`.
+    A single ``TimeSeriesBlockCache`` is shared by all callers for each
+    ``Image``, and is discarded when the ``Image`` is garbage-collected.
+    """
+    with _cachesLock:
+        cache = _caches.get(image, None)
+        if cache is None:
+            cache          = TimeSeriesBlockCache(image)
+            _caches[image] = cache
+        return cache
+
+
+def _prefetchThread():
+    """Returns an :class:`.idle.TaskThread` which is shared by all
+    :class:`TimeSeriesBlockCache` instances, and used to prefetch blocks.
+    The thread is created on the first call.
+    """
+    global _thread
+    with _cachesLock:
+        if _thread is None:
+            _thread        = idle.TaskThread()
+            _thread.daemon = True
+            _thread.start()
+        return _thread
+
+
+class TimeSeriesBlockCache:
+    """A ``TimeSeriesBlockCache`` reads and caches the data for blocks of
+    voxels (by default, ``8 * 8 * 8`` voxels) across all time points of a 4D
+    :class:`.Image`.
+
+    Retrieving the time series for a single voxel from a compressed 4D image
+    is expensive, as most of the file may need to be decompressed. By reading
+    a block of voxels at a time, the time series for neighbouring voxels are
+    available from memory once the first voxel has been read.
+
+    Every time a time series is requested via :meth:`timeSeries`, the
+    direction in which the requested location is moving is recorded, and the
+    next block in that direction is read on a separate thread (unless
+    ``threaded=False``).
+
+    Blocks are stored in least-recently-used order, up to the memory limit
+    specified by the ``fsleyes.timeseries.cacheSize`` setting (default
+    256MB). The block size is specified by the ``fsleyes.timeseries.blockSize``
+    setting. All blocks are discarded when the image data changes.
+
+    The number of hits and misses (requests for a time series which was/was
+    not available) are available via the :meth:`stats` method.
+    """
+
+
+    def __init__(self, image, blockSize=None, budget=None, threaded=True):
+        """Create a ``TimeSeriesBlockCache``.
+
+        :arg image:     The :class:`.Image`
+        :arg blockSize: Block size along each spatial dimension. Defaults to
+                        the ``fsleyes.timeseries.blockSize`` setting.
+        :arg budget:    Maximum memory, in bytes, to use. Defaults to the
+                        ``fsleyes.timeseries.cacheSize`` setting.
+        :arg threaded:  If ``True`` (the default), blocks are prefetched on a
+                        separate thread. Otherwise they are prefetched
+                        immediately (intended for testing).
+        """
+
+        if blockSize is None:
+            blockSize = fslsettings.read('fsleyes.timeseries.blockSize', 8)
+        if budget is None:
+            budget = fslsettings.read('fsleyes.timeseries.cacheSize',
+                                      268435456)
+
+        self.__name      = '{}_{}'.format(type(self).__name__, id(self))
+        self.__image     = weakref.ref(image)
+        self.__blockSize = max(1, int(blockSize))
+        self.__budget    = int(budget)
+        self.__threaded  = threaded
+        self.__lock      = threading.RLock()
+
+        # { (block, volume) : array }, in
+        # least recently used order, where
+        # block is the (i, j, k) block index,
+        # and volume is a tuple of indices
+        # into the higher dimensions.
+        self.__blocks   = collections.OrderedDict()
+        self.__size     = 0
+        self.__pending  = set()
+        self.__last     = None
+        self.__hits     = 0
+        self.__misses   = 0
+        self.__fetched  = 0
+
+        # Incremented whenever the image data
+        # changes, so that blocks which were
+        # being read at the time are discarded
+        self.__generation = 0
+
+        image.register(self.__name, self.__imageDataChanged, 'data')
+
+
+    def destroy(self):
+        """Clears the cache. May be called when this ``TimeSeriesBlockCache``
+        is no longer needed.
+        """
+        image = self.__image()
+        if image is not None:
+            image.deregister(self.__name, 'data')
+        self.clear()
+
+
+    @property
+    def blockSize(self):
+        """Returns the block size along each spatial dimension. """
+        return self.__blockSize
+
+
+    def stats(self):
+        """Returns a dictionary containing statistics about this
+        ``TimeSeriesBlockCache``:
+
+        ============= =====================================================
+        ``hits``      Number of requests which were available.
+        ``misses``    Number of requests which were not available.
+        ``fetched``   Number of blocks which have been prefetched.
+        ``blocks``    Number of blocks currently stored.
+        ``size``      Memory, in bytes, currently in use.
+        ``budget``    Maximum memory, in bytes.
+        ============= =====================================================
+        """
+        with self.__lock:
+            return {'hits'    : self.__hits,
+                    'misses'  : self.__misses,
+                    'fetched' : self.__fetched,
+                    'blocks'  : len(self.__blocks),
+                    'size'    : self.__size,
+                    'budget'  : self.__budget}
+
+
+    def clear(self):
+        """Discards all stored blocks. """
+        with self.__lock:
+            self.__blocks.clear()
+            self.__size        = 0
+            self.__last        = None
+            self.__generation += 1
+
+
+    def timeSeries(self, sliceobj):
+        """Returns the data for a single voxel, across the time dimension.
+
+        :arg sliceobj: Slice object, of the form returned by
+                       :meth:`.NiftiOpts.index` with ``atVolume=False``, i.e.
+                       containing integer ``x``, ``y`` and ``z`` voxel
+                       coordinates, a ``slice(None)`` for the time dimension,
+                       and integer indices for any other dimensions.
+
+        :returns:      A ``numpy`` array containing the time series.
+        """
+
+        voxel  = [int(v) for v in sliceobj[:3]]
+        volume = tuple(None if isinstance(s, slice) else int(s)
+                       for s in sliceobj[3:])
+        bs     = self.__blockSize
+        block  = tuple(v // bs for v in voxel)
+        key    = (block, volume)
+        offset = tuple(v - b * bs for v, b in zip(voxel, block))
+
+        with self.__lock:
+            data = self.__blocks.get(key, None)
+            if data is None:
+                self.__misses += 1
+            else:
+                self.__hits += 1
+                self.__blocks.move_to_end(key)
+
+        if data is None:
+            data = self.__readBlock(block, volume)
+            self.__addBlock(key, data, self.__generation)
+
+        self.__advance(block, volume)
+
+        return np.array(data[offset])
+
+
+    def __imageDataChanged(self, *a):
+        """Called when the image data changes. Discards all stored blocks. """
+        self.clear()
+
+
+    def __readBlock(self, block, volume):
+        """Reads and returns the data for the given block. """
+
+        image = self.__image()
+        bs    = self.__blockSize
+        shape = image.shape
+        slc   = []
+
+        for b, s in zip(block, shape[:3]):
+            slc.append(slice(b * bs, min((b + 1) * bs, s)))
+
+        for v in volume:
+            if v is None: slc.append(slice(None))
+            else:         slc.append(v)
+
+        data = np.asarray(image[tuple(slc)])
+
+        # Make sure the block has one
+        # dimension for each spatial
+        # dimension, and one for time
+        return data.reshape([s.stop - s.start for s in slc[:3]] + [-1])
+
+
+    def __addBlock(self, key, data, generation):
+        """Stores the given block, and removes least recently used blocks
+        until the memory budget is satisfied.
+        """
+
+        with self.__lock:
+
+            if generation != self.__generation or key in self.__blocks:
+                return
+
+            self.__blocks[key] = data
+            self.__size       += data.nbytes
+
+            while len(self.__blocks) > 1 and self.__size > self.__budget:
+                _, old       = self.__blocks.popitem(last=False)
+                self.__size -= old.nbytes
+
+
+    def __advance(self, block, volume):
+        """Called by :meth:`timeSeries`. Figures out the direction in which
+        the requested location is moving, and schedules the next block in
+        that direction to be read.
+        """
+
+        image = self.__image()
+        last  = self.__last
+
+        self.__last = (block, volume)
+
+        if image is None or last is None or last[1] != volume:
+            return
+
+        step = [int(np.sign(b - l)) for b, l in zip(block, last[0])]
+
+        if not any(step):
+            return
+
+        nblocks = [int(np.ceil(s / self.__blockSize)) for s in image.shape[:3]]
+        nxt     = tuple(b + s for b, s in zip(block, step))
+
+        if any(n < 0 or n >= nb for n, nb in zip(nxt, nblocks)):
+            return
+
+        key = (nxt, volume)
+
+        with self.__lock:
+            if key in self.__blocks or key in self.__pending:
+                return
+            self.__pending.add(key)
+
+        generation = self.__generation
+
+        if self.__threaded:
+            _prefetchThread().enqueue(self.__prefetch,
+                                      key,
+                                      generation,
+                                      taskName='{}_{}'.format(self.__name,
+                                                              key))
+        else:
+            self.__prefetch(key, generation)
+
+
+    def __prefetch(self, key, generation):
+        """Reads and stores the given block. """
+
+        try:
+            if generation != self.__generation or \
+               self.__image() is None:
+                return
+
+            data = self.__readBlock(*key)
+
+            with self.__lock:
+                self.__fetched += 1
+            self.__addBlock(key, data, generation)
+
+            log.debug('%s: prefetched block %s', self.__name, key)
+
+        finally:
+            with self.__lock:
+                self.__pending.discard(key)
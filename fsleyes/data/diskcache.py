@@ -0,0 +1,498 @@
+#!/usr/bin/env python
+#
+# diskcache.py - Persistent on-disk cache for data derived from image files.
+#
+# Author: Paul McCarthy <pauldmccarthy@gmail.com>
+#
+"""This module provides functions for storing data which has been derived
+from an image file (e.g. downsampled copies of the image data) in a
+persistent on-disk cache, so it does not need to be re-calculated every time
+the file is loaded.
+
+Cached data is stored as ``.npy`` files within a ``cache`` directory in the
+FSLeyes settings directory (see :func:`fsl.utils.settings.filePath`). Each
+cache file is identified by a *category* (e.g. ``'pyramid'``) and a *key*,
+which is derived from the absolute path, size and modification time of the
+source file, so any change to the file automatically invalidates its cached
+data.
+
+The cache can be disabled by setting ``fsleyes.cache.enabled`` to ``False``.
+
+The total size of the cache is limited by the ``fsleyes.cache.maxSize``
+setting (in bytes, defaulting to 2GB). Whenever data is saved to the cache,
+the least recently used entries are deleted to make room for it (see
+:func:`evict`). All of the files for a key (which may be stored with
+different suffixes, or with different extra identifiers appended to the key)
+are treated as a single entry. Entries whose source file has been modified
+or deleted are also deleted.
+
+.. autosummary::
+   :nosignatures:
+
+   enabled
+   maxSize
+   fileKey
+   imageKey
+   cachePath
+   load
+   save
+   create
+   evict
+   clear
+"""
+
+
+import os.path    as op
+import               os
+import               re
+import               json
+import               time
+import               shutil
+import               hashlib
+import               logging
+import               tempfile
+import               threading
+import contextlib as ctxlib
+
+import numpy as np
+
+import fsl.utils.settings as fslsettings
+
+
+log = logging.getLogger(__name__)
+
+
+def enabled():
+    """Returns ``True`` if the on-disk cache is enabled, ``False`` otherwise.
+    """
+    return bool(fslsettings.read('fsleyes.cache.enabled', True))
+
+
+def maxSize():
+    """Returns the maximum total size, in bytes, of all data in the cache.
+    """
+    return int(fslsettings.read('fsleyes.cache.maxSize', 2147483648))
+
+
+_sources = {}
+"""Used by :func:`fileKey`. Dictionary of ``{key : (path, size, mtime)}``
+mappings, which are saved alongside cached data, so that :func:`evict` can
+identify entries whose source file has changed.
+"""
+
+
+_pruned = False
+"""Used by :func:`evict`. Set to ``True`` once stale entries have been
+deleted, as this only needs to be done once.
+"""
+
+
+_evictLock = threading.Lock()
+"""Used by :func:`evict` to prevent concurrent evictions. """
+
+
+STALE_TMP_AGE = 86400
+"""Temporary files in the cache which are older than this (in seconds) are
+assumed to have been left behind by a process which crashed, and are deleted
+by :func:`evict`.
+"""
+
+
+def fileKey(path, *extra):
+    """Generates a key which uniquely identifies the current state of the file
+    at ``path``.
+
+    :arg path:  Path to a file
+    :arg extra: Any other values which should be incorporated into the key.
+    :returns:   A string containing a hexadecimal SHA1 digest, or ``None``
+                if ``path`` does not exist.
+    """
+
+    try:
+        path = op.abspath(path)
+        st   = os.stat(path)
+    except (OSError, TypeError):
+        return None
+
+    digest = hashlib.sha1()
+    for val in (path, st.st_size, st.st_mtime_ns) + extra:
+        if not isinstance(val, bytes):
+            val = str(val).encode()
+        digest.update(val)
+
+    key           = digest.hexdigest()
+    _sources[key] = (path, st.st_size, st.st_mtime_ns)
+
+    return key
+
+
+def imageKey(image, *extra):
+    """Generates a key which uniquely identifies the data for the given
+    :class:`.Image`, via :func:`fileKey`. The image header is incorporated
+    into the key.
+
+    Returns ``None`` if the image was not loaded from a file, or if its data
+    has been modified since it was loaded, as in either case the file
+    contents do not reflect the in-memory data.
+    """
+
+    if image.dataSource is None or not image.saveState:
+        return None
+
+    header = getattr(image.header, 'binaryblock', b'')
+    header = hashlib.sha1(header).hexdigest()
+
+    return fileKey(image.dataSource, header, *extra)
+
+
+def cachePath(category, key, suffix='.npy'):
+    """Returns the path to the cache file for the given ``category`` and
+    ``key``. The file, and its containing directory, may not exist.
+
+    :arg category: Cache category
+    :arg key:      Cache key
+    :arg suffix:   File suffix - defaults to ``'.npy'``. Other suffixes may
+                   be used for cache files which are not managed via the
+                   :func:`load` and :func:`save` functions.
+    """
+    return fslsettings.filePath(op.join('cache', category, f'{key}{suffix}'))
+
+
+def load(category, key, mmap=False):
+    """Loads an array from the cache.
+
+    :arg category: Cache category
+    :arg key:      Cache key
+    :arg mmap:     If ``True``, the file is memory-mapped rather than
+                   loaded into memory.
+    :returns:      A ``numpy`` array, or ``None`` if the cache is disabled,
+                   or there is no cached data for the given ``key``.
+    """
+
+    if key is None or not enabled():
+        return None
+
+    path = cachePath(category, key)
+
+    if not op.exists(path):
+        return None
+
+    try:
+        if mmap: data = np.load(path, mmap_mode='r', allow_pickle=False)
+        else:    data = np.load(path, allow_pickle=False)
+
+        # Entries are evicted in least
+        # recently used order
+        os.utime(path)
+        return data
+
+    # Corrupt/partial cache file - delete it
+    except Exception as e:
+        log.warning('Could not load cache file %s (%s) - deleting it',
+                    path, e)
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+        return None
+
+
+def save(category, key, data):
+    """Saves an array to the cache. The file is written atomically, so
+    concurrent readers will never see a partially written file. Any errors
+    are logged and ignored. Other entries are evicted from the cache if
+    necessary (see :func:`evict`). The data is not saved if it is larger
+    than the cache size limit.
+
+    :arg category: Cache category
+    :arg key:      Cache key
+    :arg data:     ``numpy`` array to save
+    :returns:      ``True`` if the data was saved, ``False`` otherwise.
+    """
+
+    if key is None or not enabled():
+        return False
+
+    if not evict(data.nbytes, key):
+        log.debug('Not caching %s/%s - data is larger than the cache '
+                  'size limit (%i bytes)', category, key, data.nbytes)
+        return False
+
+    path    = cachePath(category, key)
+    dirname = op.dirname(path)
+
+    try:
+        os.makedirs(dirname, exist_ok=True)
+        _saveSource(key)
+
+        fd, tmp = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                np.save(f, data, allow_pickle=False)
+            os.replace(tmp, path)
+        finally:
+            if op.exists(tmp):
+                os.remove(tmp)
+
+    except Exception as e:
+        log.warning('Could not save cache file %s: %s', path, e)
+        return False
+
+    return True
+
+
+@ctxlib.contextmanager
+def create(category, key, shape, dtype):
+    """Context manager which creates a new memory-mapped array, to be saved
+    in the cache. This can be used instead of :func:`save` for arrays which
+    are too large to be created in memory.
+
+    The array is written to a temporary file, which is atomically moved into
+    the cache when the context manager exits, so concurrent readers will never
+    see a partially written file. If an error occurs, the temporary file is
+    deleted, and the error is propagated. Other entries are evicted from the
+    cache if necessary (see :func:`evict`).
+
+    :arg category: Cache category
+    :arg key:      Cache key
+    :arg shape:    Array shape
+    :arg dtype:    Array data type
+    :returns:      A writable ``numpy.memmap``, or ``None`` if the cache is
+                   disabled, the array is larger than the cache size limit,
+                   or the file could not be created. The array must not be
+                   used after the context manager has exited.
+    """
+
+    if key is None or not enabled():
+        yield None
+        return
+
+    nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+
+    if not evict(nbytes, key):
+        log.debug('Not caching %s/%s - data is larger than the cache '
+                  'size limit (%i bytes)', category, key, nbytes)
+        yield None
+        return
+
+    path    = cachePath(category, key)
+    dirname = op.dirname(path)
+    tmp     = None
+
+    try:
+        os.makedirs(dirname, exist_ok=True)
+        _saveSource(key)
+        fd, tmp = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+        os.close(fd)
+        data = np.lib.format.open_memmap(tmp, mode='w+',
+                                         shape=shape, dtype=dtype)
+    except Exception as e:
+        log.warning('Could not create cache file %s: %s', path, e)
+        if tmp is not None and op.exists(tmp):
+            os.remove(tmp)
+        yield None
+        return
+
+    try:
+        yield data
+        data.flush()
+        del data
+        os.replace(tmp, path)
+    finally:
+        if op.exists(tmp):
+            os.remove(tmp)
+
+
+def evict(reserve=0, keep=None):
+    """Deletes entries from the cache, least recently used first, until the
+    total size of the cache, plus ``reserve`` bytes, is within the limit
+    given by :func:`maxSize`. The first time that this function is called,
+    entries whose source file has been modified or deleted since they were
+    saved are also deleted. Temporary files which have been left behind
+    by crashed processes are deleted.
+
+    :arg reserve: Number of bytes which are about to be added to the cache.
+    :arg keep:    Key of an entry which must not be deleted (e.g. the
+                  entry which is about to be saved).
+    :returns:     ``True`` if ``reserve`` bytes can be added to the cache,
+                  ``False`` if ``reserve`` is larger than the cache size
+                  limit.
+    """
+
+    global _pruned
+
+    budget = maxSize()
+
+    if reserve > budget:
+        return False
+
+    if keep is not None:
+        keep = _entryId(keep)
+
+    with _evictLock:
+
+        entries = _entries()
+
+        if not _pruned:
+            _pruned = True
+            _prune(entries, keep)
+
+        total = sum(e['size'] for e in entries.values())
+
+        for eid, entry in sorted(entries.items(), key=lambda e: e[1]['mtime']):
+            if total + reserve <= budget:
+                break
+            if eid[1] == keep:
+                continue
+            log.debug('Evicting cache entry %s (%i bytes)', eid, entry['size'])
+            _deleteFiles(entry['files'])
+            total -= entry['size']
+
+    return True
+
+
+def clear(category=None):
+    """Deletes all cached data for the given ``category``, or all cached data
+    if ``category is None``.
+    """
+
+    if category is None:
+        path = fslsettings.filePath('cache')
+    else:
+        path = fslsettings.filePath(op.join('cache', category))
+
+    if op.exists(path):
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def _entryId(key):
+    """Returns an identifier for the cache entry that the given ``key``
+    belongs to. Keys generated by :func:`fileKey` may have extra identifiers
+    appended to them, so entries are identified by the leading SHA1 digest.
+    """
+    match = re.match('[0-9a-f]{40}', key)
+    if match is None: return key
+    else:             return match.group(0)
+
+
+def _entries():
+    """Used by :func:`evict`. Returns a dictionary of ``{(category, id) :
+    entry}`` mappings for all entries in the cache, where each entry is a
+    dictionary containing the ``files`` for the entry, their total ``size``,
+    and the most recent modification time (``mtime``). Stale temporary files
+    are deleted.
+    """
+
+    entries = {}
+    root    = fslsettings.filePath('cache')
+    now     = time.time()
+
+    if root is None or not op.isdir(root):
+        return entries
+
+    for category in os.scandir(root):
+
+        # Hidden directories are not categories
+        # (e.g. the source files - see _saveSource)
+        if not category.is_dir() or category.name.startswith('.'):
+            continue
+
+        for f in os.scandir(category.path):
+            try:
+                st = f.stat()
+            except OSError:
+                continue
+
+            # Temporary files may be in the process of
+            # being written by another process, so are
+            # only deleted when they are very old.
+            if f.name.endswith('.tmp'):
+                if now - st.st_mtime > STALE_TMP_AGE:
+                    _deleteFiles([f.path])
+                continue
+
+            eid   = (category.name, _entryId(f.name.split('.')[0]))
+            entry = entries.setdefault(eid, {'files' : [],
+                                             'size'  : 0,
+                                             'mtime' : 0})
+            entry['files'].append(f.path)
+            entry['size'] += st.st_size
+            entry['mtime'] = max(entry['mtime'], st.st_mtime)
+
+    return entries
+
+
+def _prune(entries, keep):
+    """Used by :func:`evict`. Deletes all entries whose source file (see
+    :func:`_saveSource`) has been modified or deleted, and removes them
+    from the ``entries`` dictionary. Source files which do not correspond
+    to any entry are also deleted.
+
+    :arg entries: Dictionary of entries, as returned by :func:`_entries`.
+    :arg keep:    Identifier of an entry which must not be deleted.
+    """
+
+    srcdir = _sourcePath('')
+
+    if not op.isdir(srcdir):
+        return
+
+    eids = {eid for _, eid in entries.keys()}
+
+    for f in os.scandir(srcdir):
+
+        eid = f.name
+
+        if eid == keep:
+            continue
+
+        try:
+            with open(f.path, 'rt') as src:
+                path, size, mtime = json.load(src)
+            st    = os.stat(path)
+            stale = st.st_size != size or st.st_mtime_ns != mtime
+        except (OSError, ValueError, TypeError):
+            stale = True
+
+        if stale:
+            for cat, ceid in list(entries.keys()):
+                if ceid == eid:
+                    log.debug('Deleting stale cache entry %s/%s', cat, eid)
+                    _deleteFiles(entries.pop((cat, ceid))['files'])
+
+        if stale or eid not in eids:
+            _deleteFiles([f.path])
+
+
+def _sourcePath(eid):
+    """Returns the path to the file which contains information about the
+    source file for the cache entry with identifier ``eid``.
+    """
+    return fslsettings.filePath(op.join('cache', '.sources', eid))
+
+
+def _saveSource(key):
+    """Used by :func:`save` and :func:`create`. If ``key`` was generated by
+    :func:`fileKey`, saves the path, size and modification time of its source
+    file, so that :func:`evict` can detect when the source file has changed.
+    """
+
+    eid    = _entryId(key)
+    source = _sources.get(eid, None)
+    path   = _sourcePath(eid)
+
+    if source is None or op.exists(path):
+        return
+
+    os.makedirs(op.dirname(path), exist_ok=True)
+    with open(path, 'wt') as f:
+        json.dump(source, f)
+
+
+def _deleteFiles(files):
+    """Deletes the given files, ignoring any errors. """
+    for f in files:
+        try:
+            os.remove(f)
+        except OSError:
+            pass
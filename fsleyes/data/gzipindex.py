@@ -0,0 +1,206 @@
+#!/usr/bin/env python
+#
+# gzipindex.py - Persistent seek point indices for compressed image files.
+#
+# Author: Paul McCarthy <pauldmccarthy@gmail.com>
+#
+"""This module provides functions which allow random access into compressed
+(``.nii.gz``) image files, using the `indexed_gzip
+<https://github.com/pauldmccarthy/indexed_gzip/>`_ library.
+
+Without an index, reading data from any location within a compressed file
+requires the file to be decompressed from the beginning. An ``indexed_gzip``
+index contains *seek points* at regular intervals throughout the file, so
+that decompression can start from the nearest seek point instead.
+
+Indices are built in the background the first time that a file is accessed,
+and are then saved to the on-disk cache (see the :mod:`.diskcache` module),
+keyed by the path, size, and modification time of the file, so they are
+available immediately the next time the file is loaded.
+
+Indexed access is only available if ``indexed_gzip`` is installed, and can
+be disabled by setting ``fsleyes.overlay.gzipindex`` to ``False``.
+
+.. autosummary::
+   :nosignatures:
+
+   available
+   useIndex
+   indexPath
+   hasIndex
+   openFile
+   arrayProxy
+   buildIndex
+"""
+
+
+import os.path as op
+import            os
+import            logging
+import            tempfile
+import            threading
+
+import nibabel.arrayproxy as arrayproxy
+
+import fsl.utils.settings     as fslsettings
+import fsleyes.data.diskcache as diskcache
+
+
+log = logging.getLogger(__name__)
+
+
+def available():
+    """Returns ``True`` if ``indexed_gzip`` is installed, ``False``
+    otherwise.
+    """
+    try:
+        import indexed_gzip  # noqa
+        return True
+    except ImportError:
+        return False
+
+
+def useIndex(path):
+    """Returns ``True`` if the file at ``path`` should be accessed via a
+    seek point index, ``False`` otherwise.
+    """
+
+    if path is None or not path.endswith('.gz') or not op.exists(path):
+        return False
+
+    if not fslsettings.read('fsleyes.overlay.gzipindex', True):
+        return False
+
+    return available()
+
+
+def indexPath(path):
+    """Returns the path to the cached index file for the compressed file at
+    ``path``, or ``None`` if the on-disk cache is disabled. The index file
+    may not exist.
+    """
+
+    key = diskcache.fileKey(path)
+
+    if key is None or not diskcache.enabled():
+        return None
+
+    return diskcache.cachePath('gzipindex', key, '.gzidx')
+
+
+def hasIndex(path):
+    """Returns ``True`` if a cached index exists for the compressed file at
+    ``path``, ``False`` otherwise.
+    """
+    idxpath = indexPath(path)
+    return idxpath is not None and op.exists(idxpath)
+
+
+def openFile(path):
+    """Opens the compressed file at ``path`` as an
+    ``indexed_gzip.IndexedGzipFile``. If a cached index exists for the file,
+    it is imported. Otherwise seek points are created as the file is read.
+    """
+
+    import indexed_gzip as igzip
+
+    fobj    = igzip.IndexedGzipFile(filename=path)
+    idxpath = indexPath(path)
+
+    if idxpath is not None and op.exists(idxpath):
+        try:
+            fobj.import_index(filename=idxpath)
+            log.debug('Imported gzip index for %s from %s', path, idxpath)
+
+        # Corrupt/partial index file - throw it
+        # away, and start from a fresh file
+        except Exception as e:
+            log.warning('Could not import gzip index %s (%s) - deleting it',
+                        idxpath, e)
+            fobj.close()
+            try:
+                os.remove(idxpath)
+            except OSError:
+                pass
+            fobj = igzip.IndexedGzipFile(filename=path)
+
+    return fobj
+
+
+def arrayProxy(path, dataobj):
+    """Creates and returns a ``nibabel`` ``ArrayProxy`` which can be used to
+    read data from the compressed image file at ``path``, via an
+    ``IndexedGzipFile`` (see :func:`openFile`).
+
+    :arg path:    Path to a compressed NIfTI image file
+    :arg dataobj: The ``ArrayProxy`` created by ``nibabel`` for the image,
+                  from which the data shape, type, offset and scaling are
+                  taken. These cannot be taken from the image header, as
+                  ``nibabel`` resets the data offset in the header of a
+                  loaded image.
+    """
+    spec = (dataobj.shape,
+            dataobj.dtype,
+            dataobj.offset,
+            dataobj.slope,
+            dataobj.inter)
+    return arrayproxy.ArrayProxy(openFile(path), spec, order=dataobj.order)
+
+
+def buildIndex(path, onFinish=None, threaded=True):
+    """Builds a full seek point index for the compressed file at ``path``,
+    and saves it to the on-disk cache. Any errors are logged and ignored.
+
+    :arg path:     Path to a compressed file
+    :arg onFinish: Function to call when the index has been saved. Not called
+                   if the index could not be built or saved.
+    :arg threaded: If ``True`` (the default), the index is built on a
+                   separate thread.
+    """
+
+    def build():
+
+        idxpath = indexPath(path)
+
+        if idxpath is None:
+            return
+
+        dirname = op.dirname(idxpath)
+
+        try:
+            os.makedirs(dirname, exist_ok=True)
+
+            log.debug('Building gzip index for %s', path)
+
+            # Use a separate file handle, so
+            # reads through any other handle
+            # are not blocked
+            fobj = openFile(path)
+            try:
+                fobj.build_full_index()
+
+                fd, tmp = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+                os.close(fd)
+                try:
+                    fobj.export_index(filename=tmp)
+                    os.replace(tmp, idxpath)
+                finally:
+                    if op.exists(tmp):
+                        os.remove(tmp)
+            finally:
+                fobj.close()
+
+        except Exception as e:
+            log.warning('Could not build gzip index for %s: %s', path, e)
+            return
+
+        log.debug('Saved gzip index for %s to %s', path, idxpath)
+
+        if onFinish is not None:
+            onFinish()
+
+    if threaded:
+        thread = threading.Thread(target=build, daemon=True)
+        thread.start()
+    else:
+        build()
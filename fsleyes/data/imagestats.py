@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+#
+# imagestats.py - The ImageStats class.
+#
+# Author: Paul McCarthy <pauldmccarthy@gmail.com>
+#
+"""This module provides the :class:`ImageStats` class, which stores
+statistics about the data in an :class:`.Image` (data ranges, percentiles
+and histograms) in the on-disk cache (see the :mod:`.diskcache` module), so
+that they are available immediately the next time that the image is loaded.
+
+.. autosummary::
+   :nosignatures:
+
+   imageStats
+"""
+
+
+import logging
+import threading
+import weakref
+
+import numpy as np
+
+import fsleyes.data.diskcache as diskcache
+
+
+log = logging.getLogger(__name__)
+
+
+PERCENTILES = np.linspace(0, 100, 1001)
+"""Percentiles which are calculated and stored for each volume by
+:meth:`ImageStats.percentiles`. Other percentiles are interpolated from
+these values.
+"""
+
+
+_stats     = weakref.WeakKeyDictionary()
+_statsLock = threading.Lock()
+
+
+def imageStats(image):
+    """Returns an :class:`ImageStats` for the given :class:`.Image`. A single
+    ``ImageStats`` is shared by all callers for each ``Image``, and is
+    discarded when the ``Image`` is garbage-collected.
+    """
+    with _statsLock:
+        stats = _stats.get(image, None)
+        if stats is None:
+            stats         = ImageStats(image)
+            _stats[image] = stats
+        return stats
+
+
+class ImageStats:
+    """An ``ImageStats`` object provides access to statistics about the data
+    in an :class:`.Image`, which are stored in the on-disk cache. Three types
+    of statistic are stored:
+
+      - The ``(min, max)`` values of every volume, which are calculated
+        elsewhere (e.g. by an :class:`.ImageWrapper`), and saved via
+        :meth:`setVolumeRanges`.
+
+      - The :data:`PERCENTILES` of the finite, non-zero values in a volume,
+        which are calculated on the first call to :meth:`percentiles`.
+
+      - A single fine-grained histogram of each volume (e.g. a
+        :class:`.BaseHistogram`), from which histograms with any number of
+        bins can be derived. These are calculated elsewhere (e.g. by an
+        :class:`.ImageHistogramSeries`), and retrieved or saved via
+        :meth:`histogram`.
+
+    Statistics are only stored for images which have been loaded from file,
+    and which have not been modified (see :func:`.diskcache.imageKey`).
+    Otherwise every statistic is calculated on demand.
+    """
+
+
+    def __init__(self, image):
+        """Create an ``ImageStats``.
+
+        :arg image: The :class:`.Image`
+        """
+        self.__image = weakref.ref(image)
+
+
+    def __key(self, *extra):
+        """Returns a key which identifies the cache file for a statistic of
+        the image, or ``None`` if statistics cannot be stored for the image.
+        """
+        image = self.__image()
+        if image is None:
+            return None
+        return diskcache.imageKey(image, 'stats', *extra)
+
+
+    @property
+    def volumeRanges(self):
+        """Returns a ``numpy`` array of shape ``(nvols, 2)`` containing the
+        ``(min, max)`` values of every volume in the image, or ``None`` if
+        they are not known.
+        """
+        return diskcache.load('stats', self.__key('ranges'))
+
+
+    @property
+    def dataRange(self):
+        """Returns the ``(min, max)`` values of the image data, calculated
+        from :meth:`volumeRanges`, or ``None`` if they are not known.
+        """
+
+        ranges = self.volumeRanges
+
+        if ranges is None or len(ranges) == 0:
+            return None
+
+        if np.all(np.isnan(ranges)):
+            return None
+
+        return float(np.nanmin(ranges[:, 0])), float(np.nanmax(ranges[:, 1]))
+
+
+    def setVolumeRanges(self, ranges):
+        """Save the ``(min, max)`` values of every volume in the image.
+
+        :arg ranges: A ``numpy`` array of shape ``(nvols, 2)``
+        """
+        ranges = np.asarray(ranges, dtype=np.float64)
+        diskcache.save('stats', self.__key('ranges'), ranges)
+
+
+    def percentiles(self, pcts, volume=None):
+        """Returns percentiles of the finite, non-zero values in a volume of
+        the image. The :data:`PERCENTILES` of the volume are calculated and
+        saved on the first call, and the requested percentiles are
+        interpolated from them.
+
+        :arg pcts:   Sequence of percentiles in the range ``[0, 100]``.
+        :arg volume: Index of the volume (along the last dimension) for
+                     images with more than three dimensions. Ignored for
+                     3D images.
+        :returns:    A ``numpy`` array containing the requested percentiles,
+                     or ``None`` if the image has been garbage-collected.
+        """
+
+        image = self.__image()
+
+        if image is None:
+            return None
+
+        if image.ndim <= 3:
+            volume = None
+        elif volume is None:
+            volume = 0
+
+        key   = self.__key('percentiles', volume)
+        table = diskcache.load('stats', key)
+
+        if table is None:
+
+            if volume is None: data = image[:]
+            else:              data = image[..., volume]
+
+            data = data[np.isfinite(data) & (data != 0)]
+
+            if data.size == 0: table = np.zeros(len(PERCENTILES))
+            else:              table = np.percentile(data, PERCENTILES)
+
+            diskcache.save('stats', key, table)
+
+        pcts = np.clip(pcts, 0, 100)
+
+        return np.interp(pcts, PERCENTILES, table)
+
+
+    def histogram(self, key, calc):
+        """Retrieves the fine-grained histogram of some image data from the
+        cache, or calculates and saves it if it is not available. A single
+        histogram is stored for each volume, from which histograms with any
+        number of bins, or over any range, are derived (see the
+        :class:`.BaseHistogram` class).
+
+        :arg key:  Tuple of values (e.g. volume index) which uniquely
+                   identify the histogram.
+        :arg calc: Function which calculates the histogram. Must return a
+                   one-dimensional ``numpy`` array containing the histogram
+                   (e.g. via :meth:`.BaseHistogram.toArray`).
+        :returns:  A ``numpy`` array containing the histogram.
+        """
+
+        key  = self.__key('histogram', *key)
+        hist = diskcache.load('stats', key)
+
+        if hist is None:
+            hist = np.asarray(calc(), dtype=np.float64)
+            diskcache.save('stats', key, hist)
+
+        return hist
@@ -39,21 +39,27 @@ get their definitions straight:
 """
 
 
-import                    logging
-import                    collections
-import collections.abc as abc
-import itertools       as it
-import contextlib      as ctxlib
+import                       os
+import                       logging
+import                       threading
+import                       warnings
+import                       collections
+import collections.abc    as abc
+import itertools          as it
+import contextlib         as ctxlib
+import concurrent.futures as futures
 
 from typing import Tuple
 
 import numpy           as np
 import nibabel         as nib
 
-import fsl.data.image        as fslimage
-import fsl.utils.notifier    as notifier
-import fsl.utils.naninfrange as nir
-import fsl.utils.idle        as idle
+import fsl.data.image         as fslimage
+import fsl.utils.notifier     as notifier
+import fsl.utils.naninfrange  as nir
+import fsl.utils.idle         as idle
+import fsl.utils.settings     as fslsettings
+import fsleyes.data.gzipindex as gzipindex
 
 
 log = logging.getLogger(__name__)
@@ -86,6 +92,13 @@ class ImageWrapper(fslimage.DataManager, notifier.Notifier):
     If any of these conditions do not hold, the image data will be loaded into
     memory and accessed directly.
 
+    If an ``ImageWrapper`` is created with ``indexed=True``, and the image is
+    stored in a compressed (``.nii.gz``) file, data is read from the file via
+    a seek point index (see the :mod:`.gzipindex` module), so that reading
+    data from the end of the file does not require the whole file to be
+    decompressed. If an index has not previously been saved for the file, a
+    full index is built and saved in the background.
+
 
     *Data range*
 
@@ -106,10 +119,20 @@ class ImageWrapper(fslimage.DataManager, notifier.Notifier):
     image, separate coverages and data ranges are stored for each 2D slice.
 
 
+    When a region of the image is added to the coverage, the data range of
+    every volume in that region is calculated at once (see
+    :func:`calcVolumeRanges`). Regions which span many volumes are split into
+    chunks which, if the data can be read efficiently, are processed in
+    parallel (see :func:`rangePool`). If the ``ImageWrapper`` was created with
+    ``threaded=True``, regions which are accessed while the data range is
+    being updated are processed together, so that listeners are notified
+    once, rather than once for every region.
+
+
     The ``ImageWrapper`` implements the :class:`.Notifier` interface.
     Listeners can register to be notified whenever the known image data range
-    is updated. The data range can be accessed via the :attr:`dataRange`
-    property.
+    is updated, and when the full image data range becomes known. The data
+    range can be accessed via the :attr:`dataRange` property.
 
 
     The ``ImageWrapper`` class uses the following functions (also defined in
@@ -124,20 +147,39 @@ class ImageWrapper(fslimage.DataManager, notifier.Notifier):
        sliceCovered
        calcExpansion
        adjustCoverage
+       calcVolumeRanges
+       rangePool
     """
 
 
-    def __init__(self, threaded : bool = False):
+    def __init__(self, threaded : bool = False, indexed : bool = False):
         """Create an ``ImageWrapper``. The image must be specified by a
         subsequent call to :meth:`setImage`.
 
         :arg threaded:  If ``True``, the data range is updated on a
                         :class:`.TaskThread`. Otherwise (the default), the
                         data range is updated directly on reads/writes.
+
+        :arg indexed:   If ``True``, and the image is stored in a compressed
+                        file, data is read via a seek point index. Defaults
+                        to ``False``.
         """
 
         self.__image      = None
         self.__taskThread = None
+        self.__indexed    = indexed
+
+        # If using a gzip index, data
+        # is read via this ArrayProxy
+        # instead of image.dataobj. We
+        # keep a ref to its file handle
+        # so we can close it when the
+        # ArrayProxy is replaced. The
+        # lock ensures that the handle
+        # is not closed during a read.
+        self.__dataobj     = None
+        self.__fileobj     = None
+        self.__dataobjLock = threading.Lock()
 
         # Information about image dimensionality
         # is initialised in the setImage method.
@@ -148,6 +190,7 @@ class ImageWrapper(fslimage.DataManager, notifier.Notifier):
         # attributes - they're initialised in the
         # reset method.
         self.__range     = None
+        self.__initRange = None
         self.__coverage  = None
         self.__volRanges = None
         self.__covered   = False
@@ -159,6 +202,13 @@ class ImageWrapper(fslimage.DataManager, notifier.Notifier):
         # is loaded into memory.
         self.__data = None
 
+        # When threaded, slices which need to be
+        # added to the coverage are accumulated
+        # here until the task thread gets to them
+        # (see __queueExpansion).
+        self.__pending     = []
+        self.__pendingLock = threading.Lock()
+
         if threaded:
             self.__taskThread        = idle.TaskThread()
             self.__taskThread.daemon = True
@@ -176,6 +226,10 @@ class ImageWrapper(fslimage.DataManager, notifier.Notifier):
                         important information about this parameter.
         """
         self.__image = image
+        self.__setDataobj(None)
+
+        if self.__indexed:
+            self.__initIndex()
 
         # Save the number of 'real' dimensions,
         # that is the number of dimensions minus
@@ -203,7 +257,7 @@ class ImageWrapper(fslimage.DataManager, notifier.Notifier):
 
         :arg image:     A ``nibabel.Nifti1Image`` or ``nibabel.Nifti2Image``.
         """
-        new = ImageWrapper(self.__taskThread is not None)
+        new = ImageWrapper(self.__taskThread is not None, self.__indexed)
         new.setImage(image, self.__range)
         return new
 
@@ -214,11 +268,63 @@ class ImageWrapper(fslimage.DataManager, notifier.Notifier):
         """
         self.__image = None
         self.__data  = None
+        self.__setDataobj(None)
         if self.__taskThread is not None:
             self.__taskThread.stop()
             self.__taskThread = None
 
 
+    def __initIndex(self):
+        """Called by :meth:`setImage` if this ``ImageWrapper`` was created
+        with ``indexed=True``. If the image is stored in a compressed file,
+        creates an ``ArrayProxy`` which reads from the file via a seek point
+        index. If an index has not been saved for the file, a full index is
+        built in the background, and the ``ArrayProxy`` is replaced once it
+        is available.
+        """
+
+        image   = self.__image
+        path    = image.get_filename()
+        dataobj = image.dataobj
+
+        if not gzipindex.useIndex(path) or not nib.is_proxy(dataobj):
+            return
+
+        def indexBuilt():
+            if self.__image is image:
+                self.__setDataobj(gzipindex.arrayProxy(path, dataobj))
+
+        try:
+            self.__setDataobj(gzipindex.arrayProxy(path, dataobj))
+        except Exception as e:
+            log.warning('Could not open %s with indexed_gzip: %s', path, e)
+            return
+
+        if not gzipindex.hasIndex(path):
+            gzipindex.buildIndex(path, indexBuilt)
+
+
+    def __setDataobj(self, dataobj):
+        """Used by :meth:`setImage`, :meth:`__initIndex` and :meth:`__del__`.
+        Replaces the ``ArrayProxy`` which is used to read data via a seek
+        point index, and closes the ``IndexedGzipFile`` used by the old
+        ``ArrayProxy``.
+
+        :arg dataobj: The new ``ArrayProxy``, or ``None`` to clear it.
+        """
+
+        if dataobj is None: fileobj = None
+        else:               fileobj = dataobj.file_like
+
+        with self.__dataobjLock:
+            oldfobj        = self.__fileobj
+            self.__dataobj = dataobj
+            self.__fileobj = fileobj
+
+        if oldfobj is not None:
+            oldfobj.close()
+
+
     def getTaskThread(self):
         """If this ``ImageWrapper`` was created with ``threaded=True``,
         this method returns the ``TaskThread`` that is used for running
@@ -265,7 +371,11 @@ class ImageWrapper(fslimage.DataManager, notifier.Notifier):
 
         # The current known image data range. This
         # gets updated as more image data gets read.
-        self.__range = dataRange
+        # The initial range is also saved, as the
+        # known range is never allowed to be
+        # narrower than it.
+        self.__range     = dataRange
+        self.__initRange = dataRange
 
         # The coverage array is used to keep track of
         # the portions of the image which have been
@@ -339,6 +449,16 @@ class ImageWrapper(fslimage.DataManager, notifier.Notifier):
         return self.__covered
 
 
+    @property
+    def volumeRanges(self):
+        """Returns a ``numpy`` array of shape ``(nvols, 2)`` containing the
+        currently known ``(min, max)`` values of each volume (for a 4D image,
+        slice for a 3D image, or vector for a 2D image). Volumes which have
+        not been read contain ``np.nan`` values.
+        """
+        return np.array(self.__volRanges)
+
+
     def coverage(self, vol):
         """Returns the current image data coverage for the specified volume
         (for a 4D image, slice for a 3D image, or vector for a 2D images).
@@ -382,8 +502,14 @@ class ImageWrapper(fslimage.DataManager, notifier.Notifier):
         # (the dataobj attribute) cannot handle
         # fancy indexing. In this case an error
         # will be raised.
-        if self.__data is not None: return self.__data[         sliceobj]
-        else:                       return self.__image.dataobj[sliceobj]
+        if self.__data is not None:
+            return self.__data[sliceobj]
+
+        with self.__dataobjLock:
+            if self.__dataobj is not None:
+                return self.__dataobj[sliceobj]
+
+        return self.__image.dataobj[sliceobj]
 
 
     def __imageIsCovered(self):
@@ -396,9 +522,100 @@ class ImageWrapper(fslimage.DataManager, notifier.Notifier):
         return sliceCovered(slices, self.__coverage)
 
 
-    def __expandCoverage(self, slices):
+    def __concurrentAccess(self):
+        """Returns ``True`` if arbitrary portions of the image data can be
+        read efficiently and concurrently, ``False`` otherwise. This is not
+        the case for compressed images which are not in memory, as every read
+        requires the file to be decompressed from the beginning. Nor is it
+        the case for compressed images which are read via a seek point index,
+        as reads through the index share a single file handle, so are
+        performed one at a time (see :meth:`__getData`).
+        """
+        if self.__data    is not None: return True
+        if self.__dataobj is not None: return False
+
+        image = self.__image
+        path  = image.get_filename()
+
+        if not nib.is_proxy(image.dataobj): return True
+        if path is None:                    return True
+
+        return not str(path).endswith('.gz')
+
+
+    def __calcExpansionRanges(self, expansions):
+        """Used by :meth:`__expandCoverage`. Reads the data for each of the
+        given ``expansions``, and calculates the data range of each
+        volume within each expansion.
+
+        Expansions which span many volumes are split into chunks of volumes
+        (whose size is controlled by the ``fsleyes.imagewrapper.chunkSize``
+        setting, in bytes). If the image data can be read concurrently (see
+        :meth:`__concurrentAccess`), chunks are read and reduced in parallel
+        on the :func:`rangePool`. Otherwise they are read and reduced one at
+        a time.
+
+        :returns: A list containing a ``numpy`` array of shape
+                  ``(nvols, 2)`` for each expansion, containing the
+                  ``(min, max)`` values of each volume in the expansion.
+        """
+
+        voldim      = self.__numRealDims - 1
+        squeezeDims = tuple(range(self.__numRealDims,
+                                  self.__numRealDims + self.__numPadDims))
+        itemsize    = self.__image.get_data_dtype().itemsize
+        chunkSize   = fslsettings.read('fsleyes.imagewrapper.chunkSize',
+                                       67108864)
+
+        # As we access the data for each expansion,
+        # we want it to have the same dimensionality
+        # as the full image, so we can access data
+        # for each volume in the image separately.
+        # So we squeeze out the padding dimensions,
+        # but not the volume dimension.
+        def calcRanges(exp):
+            data = self.__getData(exp, isTuple=True)
+            data = data.squeeze(squeezeDims)
+            return calcVolumeRanges(data)
+
+        # Split each expansion into
+        # chunks of adjacent volumes
+        chunks = []
+        for ei, exp in enumerate(expansions):
+
+            vlo, vhi = exp[voldim]
+            volsize  = itemsize * np.prod([hi - lo for lo, hi in exp[:voldim]])
+            step     = max(1, int(chunkSize // max(1, volsize)))
+
+            for clo in range(vlo, vhi, step):
+                chunk         = list(exp)
+                chunk[voldim] = (clo, min(vhi, clo + step))
+                chunks.append((ei, chunk))
+
+        if len(chunks) > 1 and self.__concurrentAccess():
+            pool    = rangePool()
+            results = list(pool.map(calcRanges, [c for _, c in chunks]))
+        else:
+            results = [calcRanges(c) for _, c in chunks]
+
+        ranges = [[] for _ in expansions]
+        for (ei, _), result in zip(chunks, results):
+            ranges[ei].append(result)
+
+        return [np.concatenate(r) for r in ranges]
+
+
+    def __expandCoverage(self, slices, notify=True):
         """Expands the current image data range and coverage to encompass the
         given ``slices``.
+
+        :arg slices: Slices to expand the coverage to
+        :arg notify: If ``True`` (the default), and the data range has
+                     changed, or the entire image has now been covered,
+                     listeners are notified.
+
+        :returns:    ``True`` if the known data range has changed, or the
+                     entire image has now been covered, ``False`` otherwise.
         """
 
         _, expansions = calcExpansion(slices, self.__coverage)
@@ -416,64 +633,107 @@ class ImageWrapper(fslimage.DataManager, notifier.Notifier):
                   self.__coverage,
                   self.__volRanges)
 
-        # As we access the data for each expansions,
-        # we want it to have the same dimensionality
-        # as the full image, so we can access data
-        # for each volume in the image separately.
-        # So we squeeze out the padding dimensions,
-        # but not the volume dimension.
-        squeezeDims = tuple(range(self.__numRealDims,
-                                  self.__numRealDims + self.__numPadDims))
-
         # The calcExpansion function splits up the
         # expansions on volumes - here we calculate
-        # the min/max per volume/expansion, and
-        # iteratively update the stored per-volume
-        # coverage and data range.
-        for exp in expansions:
-
-            data     = self.__getData(exp, isTuple=True)
-            data     = data.squeeze(squeezeDims)
-            vlo, vhi = exp[self.__numRealDims - 1]
-
-            for vi, vol in enumerate(range(vlo, vhi)):
-
-                oldvlo, oldvhi = self.__volRanges[vol, :]
-                voldata        = data[..., vi]
-                newvlo, newvhi = nir.naninfrange(voldata)
-
-                if np.isnan(newvlo) or \
-                   (not np.isnan(oldvlo) and oldvlo < newvlo):
-                    newvlo = oldvlo
-                if np.isnan(newvhi) or \
-                   (not np.isnan(oldvhi) and oldvhi > newvhi):
-                    newvhi = oldvhi
-
-                # Update the stored range and
-                # coverage for each volume
-                self.__volRanges[vol, :]  = newvlo, newvhi
-                self.__coverage[..., vol] = adjustCoverage(
-                    self.__coverage[..., vol], exp)
+        # the min/max of every volume in every
+        # expansion, and then update the stored
+        # per-volume coverage and data range in
+        # one step. np.fmin/fmax ignore nans, so
+        # volumes with no stored range, and new
+        # ranges which are all nan, are handled.
+        ndims  = self.__numRealDims - 1
+        ranges = self.__calcExpansionRanges(expansions)
+
+        for exp, expRanges in zip(expansions, ranges):
+
+            vlo, vhi  = exp[ndims]
+            expLow    = np.array([e[0] for e in exp[:ndims]])[:, None]
+            expHigh   = np.array([e[1] for e in exp[:ndims]])[:, None]
+            volRanges = self.__volRanges[vlo:vhi, :]
+            coverage  = self.__coverage[:, :, vlo:vhi]
+
+            volRanges[:, 0] = np.fmin(volRanges[:, 0], expRanges[:, 0])
+            volRanges[:, 1] = np.fmax(volRanges[:, 1], expRanges[:, 1])
+            coverage[0]     = np.fmin(coverage[0], expLow)
+            coverage[1]     = np.fmax(coverage[1], expHigh)
 
         # Calculate the new known data
         # range over the entire image
         # (i.e. over all volumes).
-        newmin, newmax = nir.naninfrange(self.__volRanges)
+        newmin,  newmax  = nir.naninfrange(self.__volRanges)
+        initmin, initmax = self.__initRange
+
+        if initmin is not None: newmin = float(np.fmin(newmin, initmin))
+        if initmax is not None: newmax = float(np.fmax(newmax, initmax))
 
         oldmin, oldmax = self.__range
+        oldcovered     = self.__covered
         self.__range   = (newmin, newmax)
         self.__covered = self.__imageIsCovered()
 
-        if any((oldmin is None, oldmax is None)) or \
-           not np.all(np.isclose([oldmin, oldmax], [newmin, newmax])):
+        changed = any((oldmin is None, oldmax is None)) or \
+            not np.all(np.isclose([oldmin, oldmax], [newmin, newmax]))
+
+        if changed:
             log.debug('Image range changed: [%s, %s] -> [%s, %s]',
                       oldmin,
                       oldmax,
                       newmin,
                       newmax)
+
+        # Listeners are also notified when the
+        # full data range becomes known, so
+        # they can e.g. save it for later use
+        if changed or (self.__covered and not oldcovered):
+            if notify:
+                self.notify()
+            return True
+
+        return False
+
+
+    def __expandPending(self):
+        """Called on the :class:`.TaskThread` by
+        :meth:`__queueExpansion`. Expands the coverage to encompass all
+        slices which have been queued since the last call, and then notifies
+        listeners once if the data range has changed, or the entire image has
+        now been covered.
+        """
+
+        with self.__pendingLock:
+            pending        = self.__pending
+            self.__pending = []
+
+        changed = False
+        for slices in pending:
+            changed = self.__expandCoverage(slices, notify=False) or changed
+
+        if changed:
             self.notify()
 
 
+    def __queueExpansion(self, slices):
+        """Called by :meth:`__updateDataRangeOnRead` and
+        :meth:`__updateDataRangeOnWrite`. Expands the coverage to encompass
+        the given ``slices`` - directly, or on the :class:`.TaskThread` if
+        this ``ImageWrapper`` is threaded. Slices which are queued while the
+        task thread is busy are processed together, so that listeners are
+        only notified once.
+        """
+
+        if self.__taskThread is None:
+            self.__expandCoverage(slices)
+            return
+
+        name = f'{id(self)}_expand'
+
+        with self.__pendingLock:
+            if slices not in self.__pending:
+                self.__pending.append(slices)
+            if not self.__taskThread.isQueued(name):
+                self.__taskThread.enqueue(self.__expandPending, taskName=name)
+
+
     def __updateDataRangeOnRead(self, slices, data):
         """Called by :meth:`__getitem__`. Calculates the minimum/maximum
         values of the given data (which has been extracted from the portion of
@@ -491,13 +751,7 @@ class ImageWrapper(fslimage.DataManager, notifier.Notifier):
         #      the provided data to avoid
         #      reading it in again.
 
-        if self.__taskThread is None:
-            self.__expandCoverage(slices)
-        else:
-            name = f'{id(self)}_read_{slices}'
-            if not self.__taskThread.isQueued(name):
-                self.__taskThread.enqueue(
-                    self.__expandCoverage, slices, taskName=name)
+        self.__queueExpansion(slices)
 
 
     def __updateDataRangeOnWrite(self, slices, data):
@@ -514,6 +768,11 @@ class ImageWrapper(fslimage.DataManager, notifier.Notifier):
 
         overlap = sliceOverlap(slices, self.__coverage)
 
+        # Any initial data range passed to reset
+        # describes the original image data, so
+        # is no longer valid once it is modified.
+        self.__initRange = None, None
+
         # If there's no overlap between the written
         # area and the current coverage, then it's
         # easy - we just expand the coverage to
@@ -563,13 +822,7 @@ class ImageWrapper(fslimage.DataManager, notifier.Notifier):
                 self.__volRanges[     vol, :] = np.nan
 
 
-        if self.__taskThread is None:
-            self.__expandCoverage(slices)
-        else:
-            name = f'{id(self)}_write_{slices}'
-            if not self.__taskThread.isQueued(name):
-                self.__taskThread.enqueue(
-                    self.__expandCoverage, slices, taskName=name)
+        self.__queueExpansion(slices)
 
 
     def __getitem__(self, sliceobj):
@@ -619,6 +872,72 @@ class ImageWrapper(fslimage.DataManager, notifier.Notifier):
         self.__updateDataRangeOnWrite(slices, values)
 
 
+_rangePool     = None
+_rangePoolLock = threading.Lock()
+
+
+def rangePool():
+    """Returns a ``concurrent.futures.ThreadPoolExecutor`` which is shared by
+    all :class:`ImageWrapper` instances, and used to calculate the data range
+    of chunks of image data in parallel. It is also used to calculate
+    histograms (see the :class:`.BaseHistogram` class). The pool is created
+    on the first
+    call. The number of threads is controlled by the
+    ``fsleyes.imagewrapper.rangeThreads`` setting, and defaults to the number
+    of CPUs, up to a maximum of 4.
+    """
+
+    global _rangePool
+
+    with _rangePoolLock:
+        if _rangePool is None:
+            default    = min(4, os.cpu_count() or 1)
+            workers    = fslsettings.read('fsleyes.imagewrapper.rangeThreads',
+                                          default)
+            _rangePool = futures.ThreadPoolExecutor(
+                max_workers=max(1, int(workers)),
+                thread_name_prefix='fsleyes-imagewrapper')
+        return _rangePool
+
+
+def calcVolumeRanges(data):
+    """Calculates the minimum and maximum values of every volume (index
+    along the last dimension) of ``data``, ignoring ``nan`` and ``inf``
+    values, in the same manner as the :func:`.naninfrange` function.
+
+    The ranges are calculated for all volumes at once, falling back to
+    :func:`.naninfrange` only for structured (e.g. RGB) data, and for
+    volumes which contain infinite values.
+
+    :arg data: ``numpy`` array
+    :returns:  A ``numpy`` array of shape ``(nvols, 2)``, containing the
+               ``(min, max)`` values of each volume.
+    """
+
+    nvols = data.shape[-1]
+    axes  = tuple(range(data.ndim - 1))
+
+    if len(data.dtype) > 0:
+        return np.array([nir.naninfrange(data[..., v]) for v in range(nvols)])
+
+    if not np.issubdtype(data.dtype, np.floating):
+        return np.stack((data.min(axis=axes), data.max(axis=axes)), axis=1)
+
+    with warnings.catch_warnings():
+        warnings.filterwarnings('ignore')
+        ranges = np.stack((np.nanmin(data, axis=axes),
+                           np.nanmax(data, axis=axes)), axis=1)
+
+    # Volumes which contain infs (but are not
+    # entirely nan) need to be re-calculated
+    # on the finite values only
+    inf = ~np.all(np.isfinite(ranges), axis=1) & ~np.isnan(ranges[:, 0])
+    for v in np.where(inf)[0]:
+        ranges[v] = nir.naninfrange(data[..., v])
+
+    return ranges
+
+
 def sliceObjToSliceTuple(sliceobj, shape):
     """Turns a sequence of slice objects into a tuple of (low, high) index
     pairs, one pair for each dimension in the given shape
@@ -659,6 +978,40 @@ def sliceObjToSliceTuple(sliceobj, shape):
     return tuple(indices)
 
 
+def fancySliceBoundingBox(sliceobj, shape):
+    """Calculates the bounding box of the elements which are selected by the
+    given boolean ``sliceobj``, as a tuple of (low, high) index pairs, one
+    pair for each dimension in the given ``shape``. Returns ``None`` if the
+    ``sliceobj`` does not select any elements.
+
+    :arg sliceobj: Boolean ``numpy`` array which can be used to slice an
+                   array of shape ``shape`` (see
+                   :func:`fsl.data.image.isValidFancySliceObj`).
+
+    :arg shape:    Shape of the array being sliced.
+    """
+
+    if not fslimage.isValidFancySliceObj(sliceobj, shape):
+        raise ValueError('Invalid fancy slice object for '
+                         'shape {}'.format(shape))
+
+    sliceobj = sliceobj.reshape(shape)
+    bbox     = []
+
+    # Reduce over all other dimensions
+    # to find the extent along each one
+    for dim in range(len(shape)):
+        axes  = tuple(d for d in range(len(shape)) if d != dim)
+        nzero = np.flatnonzero(sliceobj.any(axis=axes))
+
+        if len(nzero) == 0:
+            return None
+
+        bbox.append((int(nzero[0]), int(nzero[-1]) + 1))
+
+    return tuple(bbox)
+
+
 def sliceTupleToSliceObj(slices):
     """Turns a sequence of (low, high) index pairs into a tuple of array
     ``slice`` objects.
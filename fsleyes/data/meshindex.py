@@ -0,0 +1,302 @@
+#!/usr/bin/env python
+#
+# meshindex.py - The MeshFaceIndex class.
+#
+# Author: Paul McCarthy <pauldmccarthy@gmail.com>
+#
+"""This module provides the :class:`MeshFaceIndex` class, which is used by
+:class:`.GLMesh` instances to calculate the intersection of a :class:`.Mesh`
+with a 2D viewing plane.
+
+.. autosummary::
+   :nosignatures:
+
+   faceIndex
+"""
+
+
+import logging
+import threading
+import collections
+import weakref
+
+import numpy as np
+
+import fsl.transform.affine as affine
+import fsl.utils.settings   as fslsettings
+
+
+log = logging.getLogger(__name__)
+
+
+_indices     = weakref.WeakKeyDictionary()
+_indicesLock = threading.Lock()
+
+
+def faceIndex(mesh):
+    """Returns a :class:`MeshFaceIndex` for the given :class:`.Mesh`. A single
+    ``MeshFaceIndex`` is shared by all callers for each ``Mesh``, and is
+    discarded when the ``Mesh`` is garbage-collected.
+    """
+    with _indicesLock:
+        index = _indices.get(mesh, None)
+        if index is None:
+            index          = MeshFaceIndex(mesh)
+            _indices[mesh] = index
+        return index
+
+
+class MeshFaceIndex:
+    """A ``MeshFaceIndex`` calculates and caches the intersection of a
+    :class:`.Mesh` with planes that are perpendicular to one of the display
+    coordinate system axes.
+
+    The ``Mesh.planeIntersection`` method tests every face (triangle) of the
+    mesh against the plane. Instead, a ``MeshFaceIndex`` sorts the faces by
+    their minimum coordinate along each display axis, so that only the faces
+    which may straddle the plane (those with a minimum coordinate no less than
+    the plane position minus the largest face extent along the axis) need to
+    be tested. The index is built on first use for each combination of
+    vertex set, mesh-to-display transformation, and display axis.
+
+    The results of the most recent intersections are cached, in least
+    recently used order, so that repeated draws of the same slice (e.g. when
+    panning, or when the same slice is shown on several canvases) do not need
+    to be re-calculated. The number of cached intersections is controlled by
+    the ``fsleyes.mesh.intersectionCacheSize`` setting (default 256). All
+    cached data is discarded when the mesh vertices change.
+
+    The number of hits and misses (intersections which were/were not
+    available in the cache) are available via the :meth:`stats` method.
+    """
+
+
+    MAX_INDICES = 4
+    """Maximum number of face indices (one for each combination of vertex set
+    and mesh-to-display transformation) that are kept in memory.
+    """
+
+
+    def __init__(self, mesh, cacheSize=None):
+        """Create a ``MeshFaceIndex``.
+
+        :arg mesh:      The :class:`.Mesh`
+        :arg cacheSize: Maximum number of intersections to cache. Defaults
+                        to the ``fsleyes.mesh.intersectionCacheSize``
+                        setting.
+        """
+
+        if cacheSize is None:
+            cacheSize = fslsettings.read(
+                'fsleyes.mesh.intersectionCacheSize', 256)
+
+        self.__name      = '{}_{}'.format(type(self).__name__, id(self))
+        self.__mesh      = weakref.ref(mesh)
+        self.__cacheSize = max(0, int(cacheSize))
+        self.__lock      = threading.RLock()
+        self.__hits      = 0
+        self.__misses    = 0
+
+        # { (vertex set, xform) : (vertices, { zax : index }) },
+        # where vertices are the mesh vertices in the display
+        # coordinate system, and each index is a tuple
+        # containing (order, fmin, fmax, extent) - see
+        # __axisIndex.
+        self.__indices = collections.OrderedDict()
+
+        # { (zax, zpos, vertex set, xform) :
+        #   (lines, faces, dists) }, in least
+        # recently used order
+        self.__cache = collections.OrderedDict()
+
+        mesh.register(self.__name, self.__verticesChanged, 'vertices')
+
+
+    def stats(self):
+        """Returns a tuple containing the number of cache hits and misses.
+        """
+        with self.__lock:
+            return self.__hits, self.__misses
+
+
+    def clear(self):
+        """Discards all face indices and cached intersections. """
+        with self.__lock:
+            self.__indices.clear()
+            self.__cache  .clear()
+
+
+    def __verticesChanged(self, *a):
+        """Called when the mesh vertices change. Discards all face indices
+        and cached intersections.
+        """
+        self.clear()
+
+
+    def planeIntersection(self, zax, zpos, xform=None):
+        """Calculates the intersection of the mesh with the plane which is
+        perpendicular to display axis ``zax``, at position ``zpos``.
+
+        :arg zax:   Display coordinate system axis (0, 1 or 2)
+        :arg zpos:  Position of the plane along ``zax``
+        :arg xform: Transformation from the mesh coordinate system to the
+                    display coordinate system. Defaults to identity.
+
+        :returns:   A tuple containing:
+
+                     - A ``(n, 2, 3)`` array which contains the two vertices
+                       of a line for every intersected face, in the mesh
+                       coordinate system.
+
+                     - A ``(n, )`` array containing the indices of the
+                       intersected faces (indices into the
+                       :attr:`.Mesh.indices` array).
+
+                     - A ``(n, 2, 3)`` array containing the barycentric
+                       coordinates of the intersection line vertices.
+
+                    These arrays are cached, so must not be modified.
+        """
+
+        mesh = self.__mesh()
+
+        if xform is None:
+            xform = np.eye(4)
+
+        xform = np.asarray(xform, dtype=np.float64)
+        zax   = int(zax)
+        zpos  = float(zpos)
+        vset  = mesh.selectedVertices()
+        key   = (zax, zpos, vset, xform.tobytes())
+
+        with self.__lock:
+            result = self.__cache.get(key, None)
+            if result is not None:
+                self.__hits += 1
+                self.__cache.move_to_end(key)
+                return result
+            self.__misses += 1
+
+        result = self.__intersect(mesh, zax, zpos, vset, xform)
+
+        if self.__cacheSize > 0:
+            with self.__lock:
+                self.__cache[key] = result
+                while len(self.__cache) > self.__cacheSize:
+                    self.__cache.popitem(last=False)
+
+        return result
+
+
+    def __axisIndex(self, mesh, zax, vset, xform):
+        """Returns the display space vertices, and the face index for the
+        given axis, vertex set and transformation, building them if
+        necessary. The index is a tuple containing:
+
+          - The face indices, sorted by their minimum coordinate along
+            ``zax``.
+          - The minimum coordinate of each face, in the same order.
+          - The maximum coordinate of each face, in the same order.
+          - The largest extent of any face along ``zax``.
+        """
+
+        key = (vset, xform.tobytes())
+
+        with self.__lock:
+
+            entry = self.__indices.get(key, None)
+
+            if entry is None:
+                vertices = mesh.vertices
+                if not np.all(np.isclose(xform, np.eye(4))):
+                    vertices = affine.transform(vertices, xform)
+                entry               = (vertices, {})
+                self.__indices[key] = entry
+                while len(self.__indices) > self.MAX_INDICES:
+                    self.__indices.popitem(last=False)
+            else:
+                self.__indices.move_to_end(key)
+
+            vertices, axes = entry
+            index          = axes.get(zax, None)
+
+            if index is None:
+                coords = vertices[:, zax][mesh.indices]
+                fmin   = coords.min(axis=1)
+                fmax   = coords.max(axis=1)
+                order  = np.argsort(fmin, kind='stable')
+
+                if len(order) > 0: extent = float((fmax - fmin).max())
+                else:              extent = 0
+
+                index     = (order, fmin[order], fmax[order], extent)
+                axes[zax] = index
+
+        return vertices, index
+
+
+    def __intersect(self, mesh, zax, zpos, vset, xform):
+        """Calculates the intersection of the mesh with a plane. See
+        :meth:`planeIntersection`.
+        """
+
+        vertices, index           = self.__axisIndex(mesh, zax, vset, xform)
+        order, fmin, fmax, extent = index
+
+        # Candidate faces have a minimum
+        # coordinate within extent of zpos,
+        # which is a contiguous range of the
+        # sorted faces
+        lo    = np.searchsorted(fmin, zpos - extent, side='left')
+        hi    = np.searchsorted(fmin, zpos,          side='right')
+        cand  = order[lo:hi][fmax[lo:hi] >= zpos]
+        faces = mesh.indices[cand]
+
+        # Signed distance of each face vertex
+        # to the plane. Vertices which lie on
+        # the plane are treated as being above
+        # it, so that every intersected face
+        # has exactly one vertex on one side of
+        # the plane, and two on the other.
+        d      = vertices[:, zax][faces] - zpos
+        above  = d >= 0
+        nabove = above.sum(axis=1)
+        hit    = (nabove == 1) | (nabove == 2)
+        cand   = cand[hit]
+        faces  = faces[hit]
+        d      = d[hit]
+        above  = above[hit]
+        nabove = nabove[hit]
+        n      = len(cand)
+        rows   = np.arange(n)
+
+        # The lone vertex, and the two edges which
+        # connect it to the other vertices, cross
+        # the plane. The barycentric coordinates
+        # of the crossing points are calculated in
+        # the display coordinate system, but are
+        # valid in the mesh coordinate system, as
+        # the transformation is affine.
+        lone = np.where(nabove == 1,
+                        np.argmax(above, axis=1),
+                        np.argmin(above, axis=1))
+        i1   = (lone + 1) % 3
+        i2   = (lone + 2) % 3
+        d0   = d[rows, lone]
+        t1   = d0 / (d0 - d[rows, i1])
+        t2   = d0 / (d0 - d[rows, i2])
+
+        dists                = np.zeros((n, 2, 3), dtype=np.float64)
+        dists[rows, 0, lone] = 1 - t1
+        dists[rows, 0, i1]   = t1
+        dists[rows, 1, lone] = 1 - t2
+        dists[rows, 1, i2]   = t2
+
+        lines = np.einsum('nij,njk->nik', dists, mesh.vertices[faces])
+        lines = np.asarray(lines, dtype=np.float32)
+        cand  = np.asarray(cand,  dtype=np.uint32)
+
+        for arr in (lines, cand, dists):
+            arr.flags.writeable = False
+
+        return lines, cand, dists
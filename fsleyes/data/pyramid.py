@@ -0,0 +1,397 @@
+#!/usr/bin/env python
+#
+# pyramid.py - The ImagePyramid class.
+#
+# Author: Paul McCarthy <pauldmccarthy@gmail.com>
+#
+"""This module provides the :class:`ImagePyramid` class, which manages a set
+of downsampled copies of the data in an :class:`.Image`, for use when
+displaying very large images at low magnification.
+
+A few standalone functions are also provided:
+
+.. autosummary::
+   :nosignatures:
+
+   usePyramid
+   levelShape
+   downsample
+   castData
+"""
+
+
+import logging
+import threading
+import collections
+
+import numpy as np
+
+import fsl.utils.idle         as idle
+import fsl.utils.notifier     as notifier
+import fsl.utils.settings     as fslsettings
+import fsleyes.data.diskcache as diskcache
+
+
+log = logging.getLogger(__name__)
+
+
+DEFAULT_FACTORS = (2, 4, 8)
+"""Default downsampling factors used by :class:`ImagePyramid` instances. """
+
+
+def usePyramid(image):
+    """Returns ``True`` if an :class:`ImagePyramid` should be used when
+    displaying the given :class:`.Image`, ``False`` otherwise.
+
+    Pyramids are used for real-valued, single-valued 3D/4D images which are
+    larger than the ``fsleyes.pyramid.threshold`` setting (default 256MB). A
+    threshold of ``0`` or less disables pyramids.
+    """
+
+    threshold = fslsettings.read('fsleyes.pyramid.threshold', 268435456)
+
+    if threshold is None or threshold <= 0:
+        return False
+
+    if image.nvals != 1 or image.iscomplex:
+        return False
+
+    shape = image.shape[:3]
+
+    if len(shape) < 3 or any(s < 2 for s in shape):
+        return False
+
+    return np.prod(shape) * image.dtype.itemsize >= threshold
+
+
+def levelShape(shape, factor):
+    """Returns the shape of a pyramid level for an image of the given
+    ``shape``, downsampled by ``factor``.
+    """
+    return tuple(int(np.ceil(s / factor)) for s in shape[:3])
+
+
+def downsample(data, factor, dtype=None):
+    """Downsamples ``data`` by ``factor`` along every axis, by averaging
+    non-overlapping blocks of ``factor ** ndim`` values. If the data shape is
+    not divisible by ``factor``, the data is padded by replicating the edge
+    values.
+
+    :arg data:   ``numpy`` array to downsample
+    :arg factor: Integer downsampling factor
+    :arg dtype:  Output data type. If not provided, the result is returned
+                 as a ``float64`` array. If an integer type is specified,
+                 the result is rounded to the nearest integer.
+    """
+
+    data = np.asarray(data)
+    pad  = [(0, -s % factor) for s in data.shape]
+
+    if any(p[1] > 0 for p in pad):
+        data = np.pad(data, pad, mode='edge')
+
+    blocks = []
+    for s in data.shape:
+        blocks.extend((s // factor, factor))
+
+    axes = tuple(range(1, 2 * data.ndim, 2))
+    data = data.reshape(blocks).mean(axis=axes, dtype=np.float64)
+
+    if dtype is None: return data
+    else:             return castData(data, dtype)
+
+
+def castData(data, dtype):
+    """Casts ``data`` to ``dtype``. Values are rounded and clipped to the
+    representable range if ``dtype`` is an integer type.
+    """
+
+    dtype = np.dtype(dtype)
+
+    if np.issubdtype(dtype, np.integer):
+        info = np.iinfo(dtype)
+        data = np.clip(np.round(data), info.min, info.max)
+
+    return data.astype(dtype)
+
+
+class ImagePyramid(notifier.Notifier):
+    """An ``ImagePyramid`` manages a set of downsampled copies (*levels*) of
+    the data for each volume of an :class:`.Image`. Each level is identified
+    by its downsampling factor (by default, 2, 4, and 8 - see
+    :attr:`DEFAULT_FACTORS`).
+
+    The levels for a volume are calculated when they are requested via the
+    :meth:`build` method, on a separate thread (unless ``threaded=False``).
+    The image data is read in slabs, so that the full volume never needs to
+    be held in memory. The first level is calculated from the image data,
+    and every other level is calculated from the preceding level.
+
+    Once calculated, levels are saved to the on-disk cache (see the
+    :mod:`.diskcache` module), so that they are available immediately the
+    next time the image is loaded. Levels loaded from the cache are made
+    available coarsest-first.
+
+    Levels for the most recently used volumes (up to the
+    ``fsleyes.pyramid.maxVolumes`` setting, default 4) are kept in memory.
+
+    Listeners registered on an ``ImagePyramid`` are notified whenever a new
+    level becomes available, or when the levels are discarded because the
+    image data has changed. The notification value is the index of the
+    affected volume (or ``None`` for the latter case).
+    """
+
+
+    def __init__(self, image, factors=None, threaded=True):
+        """Create an ``ImagePyramid``.
+
+        :arg image:    The :class:`.Image`.
+        :arg factors:  Sequence of downsampling factors. Each factor must be
+                       a multiple of the preceding factor. Defaults to
+                       :attr:`DEFAULT_FACTORS`.
+        :arg threaded: If ``True`` (the default), levels are calculated on a
+                       separate thread.
+        """
+
+        if factors is None:
+            factors = DEFAULT_FACTORS
+
+        factors = sorted(int(f) for f in factors)
+
+        if any(f < 2 for f in factors) or \
+           any(b % a != 0 for a, b in zip(factors[:-1], factors[1:])):
+            raise ValueError('Invalid pyramid factors: {}'.format(factors))
+
+        self.__image   = image
+        self.__factors = tuple(factors)
+        self.__name    = '{}_{}'.format(type(self).__name__, id(self))
+
+        # { volume : { factor : array } }, in
+        # least-recently-used order. The
+        # generation counter is used to discard
+        # results for builds which were running
+        # when the image data was changed.
+        self.__levels     = collections.OrderedDict()
+        self.__maxVolumes = fslsettings.read('fsleyes.pyramid.maxVolumes', 4)
+        self.__generation = 0
+        self.__thread     = None
+        self.__pending    = set()
+        self.__lock       = threading.RLock()
+
+        if threaded:
+            self.__thread        = idle.TaskThread()
+            self.__thread.daemon = True
+            self.__thread.start()
+
+        image.register(self.__name, self.__imageDataChanged, 'data')
+
+
+    def destroy(self):
+        """Must be called when this ``ImagePyramid`` is no longer needed. """
+
+        self.__image.deregister(self.__name, 'data')
+
+        if self.__thread is not None:
+            self.__thread.stop()
+
+        with self.__lock:
+            self.__levels.clear()
+        self.__image  = None
+        self.__thread = None
+
+
+    @property
+    def image(self):
+        """Returns the :class:`.Image` associated with this ``ImagePyramid``.
+        """
+        return self.__image
+
+
+    @property
+    def factors(self):
+        """Returns a tuple containing the downsampling factor for each level.
+        """
+        return self.__factors
+
+
+    def level(self, factor, volume=None):
+        """Returns the data for the level with the given downsampling
+        ``factor``, for the given ``volume``, or ``None`` if it is not
+        available.
+
+        :arg factor: Downsampling factor
+        :arg volume: Sequence of indices into the fourth and higher image
+                     dimensions.
+        """
+        volume = self.__volumeKey(volume)
+        with self.__lock:
+            return self.__levels.get(volume, {}).get(factor, None)
+
+
+    def readyFactors(self, volume=None):
+        """Returns a sorted list containing the factors of all levels which
+        are available for the given ``volume``.
+        """
+        volume = self.__volumeKey(volume)
+        with self.__lock:
+            return sorted(self.__levels.get(volume, {}).keys())
+
+
+    def build(self, volume=None):
+        """Calculates (or loads from the disk cache) all of the levels for
+        the given ``volume``, if they are not already available. If this
+        ``ImagePyramid`` is threaded, the work is performed on a separate
+        thread, and any builds which have been queued for other volumes are
+        cancelled.
+        """
+
+        volume = self.__volumeKey(volume)
+
+        with self.__lock:
+            if volume in self.__levels:
+                self.__levels.move_to_end(volume)
+                if len(self.__levels[volume]) == len(self.__factors):
+                    return
+
+        if self.__thread is None:
+            self.__build(volume, self.__generation)
+            return
+
+        taskName = '{}_build_{}'.format(self.__name, volume)
+
+        # The pending set is also
+        # modified on the build thread
+        with self.__lock:
+
+            # Already queued or running
+            if taskName in self.__pending:
+                return
+
+            # Cancel builds for other volumes,
+            # unless they are already running
+            for other in list(self.__pending):
+                if self.__thread.isQueued(other):
+                    self.__thread.dequeue(other)
+                    self.__pending.discard(other)
+
+            self.__pending.add(taskName)
+            self.__thread.enqueue(self.__build,
+                                  volume,
+                                  self.__generation,
+                                  taskName=taskName)
+
+
+    def __volumeKey(self, volume):
+        """Converts ``volume`` into a hashable tuple. """
+        if volume is None: return ()
+        else:              return tuple(volume)
+
+
+    def __imageDataChanged(self, *a):
+        """Called when the image data changes. Discards all levels. They
+        will be re-calculated on the next call to :meth:`build`.
+        """
+        self.__generation += 1
+        with self.__lock:
+            self.__levels.clear()
+        self.notify(value=None)
+
+
+    def __addLevel(self, volume, factor, data, generation):
+        """Stores the given ``data`` for the given level, and notifies
+        listeners. The data is discarded if the image data has changed since
+        the level was calculated.
+        """
+
+        if generation != self.__generation or self.__image is None:
+            return
+
+        with self.__lock:
+            self.__levels.setdefault(volume, {})[factor] = data
+            self.__levels.move_to_end(volume)
+
+            while len(self.__levels) > max(1, self.__maxVolumes):
+                self.__levels.popitem(last=False)
+
+        self.notify(value=volume)
+
+
+    def __build(self, volume, generation):
+        """Loads or calculates all levels for the given ``volume``. """
+
+        try:
+            self.__buildLevels(volume, generation)
+        finally:
+            with self.__lock:
+                self.__pending.discard(
+                    '{}_build_{}'.format(self.__name, volume))
+
+
+    def __buildLevels(self, volume, generation):
+        """Called by :meth:`__build`. Does the work. """
+
+        image = self.__image
+
+        if image is None:
+            return
+
+        factors = self.__factors
+        key     = diskcache.imageKey(image, 'pyramid', volume)
+        keys    = {f : None if key is None else '{}_{}'.format(key, f)
+                   for f in factors}
+        cached  = {f : diskcache.load('pyramid', keys[f]) for f in factors}
+
+        # If every level is in the on-disk
+        # cache, make them available coarsest
+        # first, for progressive refinement.
+        if all(c is not None for c in cached.values()):
+            log.debug('%s: loaded pyramid for volume %s from cache',
+                      image.name, volume)
+            for f in reversed(factors):
+                self.__addLevel(volume, f, cached[f], generation)
+            return
+
+        log.debug('%s: calculating pyramid for volume %s (factors %s)',
+                  image.name, volume, factors)
+
+        shape  = image.shape[:3]
+        first  = factors[0]
+        dtype  = None
+        levels = {}
+
+        # Read the image in slabs along
+        # the z axis. Each slab thickness
+        # is a multiple of the first factor
+        # so that slabs map to whole slices
+        # in the first level. Levels are
+        # accumulated at single precision,
+        # unless the image is 64 bit.
+        step  = first * max(1, 16 // first)
+        acc   = np.float64 if image.dtype.itemsize >= 8 else np.float32
+        level = np.zeros(levelShape(shape, first), dtype=acc)
+
+        for zlo in range(0, shape[2], step):
+
+            if generation != self.__generation:
+                return
+
+            zhi  = min(zlo + step, shape[2])
+            slc  = (slice(None), slice(None), slice(zlo, zhi)) + volume
+            slab = np.asarray(image[slc])
+            slab = slab.reshape(shape[:2] + (zhi - zlo,))
+
+            if dtype is None:
+                dtype = slab.dtype
+
+            level[:, :, zlo // first:int(np.ceil(zhi / first))] = \
+                downsample(slab, first)
+
+        levels[first] = level
+
+        for prev, f in zip(factors[:-1], factors[1:]):
+            levels[f] = downsample(levels[prev], f // prev)
+
+        for f in reversed(factors):
+            data = castData(levels[f], dtype)
+            diskcache.save('pyramid', keys[f], data)
+            self.__addLevel(volume, f, data, generation)
@@ -8,69 +8,94 @@
 for displaying streamline tractography ``.trk`` or ``.tck`` files.
 
 The ``Tractogram`` class is just a thin wrapper around a
-``nibabel.streamlines.Tractogram`` object.
+``nibabel.streamlines`` file object. Streamline vertices are read from a
+memory-mapped copy of the streamline file, which is stored in the on-disk
+cache (see the :mod:`.diskcache` module), so that large tractograms do not
+need to be loaded into memory. The copy is created, in a single streaming
+pass over the file, the first time that the file is loaded. If the copy would
+not fit within the cache size limit (see :func:`.diskcache.evict`), the file
+is loaded into memory instead.
 """
 
 
-import functools as ft
-import os.path   as op
+import os.path as op
+import            os
+import            logging
+import            itertools
+import            tempfile
 
 import numpy                as np
 import nibabel.streamlines  as nibstrm
 
-import fsl.transform.affine as affine
-import fsl.data.constants   as constants
+import fsl.transform.affine   as affine
+import fsl.data.constants     as constants
+import fsleyes.data.diskcache as diskcache
+
+
+log = logging.getLogger(__name__)
 
 
 ALLOWED_EXTENSIONS     = ['.tck', '.trk']
 EXTENSION_DESCRIPTIONS = ['MRtrix .tck file', 'TrackVis .trk file']
 
 
+CHUNK_SIZE = 1048576
+"""Number of vertices which are processed at a time when converting a
+streamline file, or calculating vertex orientations.
+"""
+
+
 class Tractogram:
     """The ``Tractogram`` class is a thin wrapper around a
-    ``nibabel.streamlines.Tractogram`` object, with a few methods for managing
+    ``nibabel.streamlines`` file object, with a few methods for managing
     per-vertex and per-streamline data.
 
     Per-vertex/streamline data can be added via the :meth:`loadVertexData`
-    and :meth:`addVertexData` methods. Per-streamline data is duplicated to
-    be per-vertex, as this makes it much easier to use in the rendering
-    logic in the :class:`.GLTractogram` class.
+    and :meth:`addVertexData` methods. Per-streamline data is stored per
+    streamline, and is duplicated to be per-vertex when it is retrieved via
+    :meth:`getVertexData`, as this makes it much easier to use in the
+    rendering logic in the :class:`.GLTractogram` class.
     """
 
     def __init__(self, fname):
 
         self.dataSource = op.abspath(fname)
         self.name       = op.basename(fname)
-        self.tractFile  = nibstrm.load(fname)
+        self.tractFile  = nibstrm.load(fname, lazy_load=True)
 
-        # Bounding box is calculsted on first
-        # call to bounds(), then cached for
-        # subsequent calls.
-        self.__bounds = None
+        # Vertex orientations and the level of
+        # detail ordering are calculated on first
+        # access, then cached for subsequent calls.
+        self.__orients  = None
+        self.__lodOrder = None
 
         # Data sets associated with each
         # vertex, or with each streamline.
         # Per-streamline data sets are
-        # duplicated to be per-vertex on
-        # load.
-        self.__vertexData = {}
+        # duplicated to be per-vertex when
+        # they are retrieved.
+        self.__vertexData     = {}
+        self.__streamlineData = {}
 
-        # Load any per-vertex / per-streamline data
-        # which is stored in the streamline file
+        # Streamline vertices, offsets, lengths,
+        # bounds, and any per-vertex / per-
+        # streamline data which is stored in the
+        # streamline file. Memory-mapped from the
+        # on-disk cache if possible.
+        loaded = loadCached(self.dataSource, self.tractFile)
+        if loaded is None:
+            loaded = loadInMemory(self.dataSource)
 
-        # nibabel supports storage of multiple
-        # values per key per streamline/vertex,
-        # but we currently only support scalar
-        # values (i.e. one value per key per
-        # streamline/vertex), and discard all
-        # but the first value.
-        tractogram = self.tractFile.tractogram
-        for key in tractogram.data_per_streamline.keys():
-            data = tractogram.data_per_streamline[key]
-            self.addVertexData(key, data[:, 0].reshape(-1))
-        for key in tractogram.data_per_point.keys():
-            data = tractogram.data_per_point[key].get_data()
-            self.addVertexData(key, data[:, 0].reshape(-1))
+        vertices, lengths, bounds, pointData, strmData = loaded
+
+        self.__vertices    = vertices
+        self.__lengths     = lengths
+        self.__bounds      = bounds
+        self.__offsets     = np.zeros(len(lengths), dtype=np.int64)
+        self.__offsets[1:] = np.cumsum(lengths)[:-1]
+
+        for key, data in strmData .items(): self.addVertexData(key, data)
+        for key, data in pointData.items(): self.addVertexData(key, data)
 
 
     def __str__(self):
@@ -91,18 +116,15 @@ class Tractogram:
         """Returns the bounding box of all streamlines as a tuple of
         ``((xlo, ylo, zlo),  (xhi, yhi, zhi))`` values.
         """
-        if self.__bounds is None:
-            data = self.tractFile.streamlines.get_data()
-            self.__bounds = (data.min(axis=0), data.max(axis=0))
         return self.__bounds
 
 
     @property
     def vertices(self):
         """Returns a numpy array of shape ``(n, 3)`` containing all
-        vertices of all streamlines.
+        vertices of all streamlines. The array may be memory-mapped.
         """
-        return self.tractFile.streamlines.get_data()
+        return self.__vertices
 
 
     @property
@@ -110,7 +132,7 @@ class Tractogram:
         """Returns a 1D numpy array containing the lengths (number of vertices)
         of all streamlines.
         """
-        return self.tractFile.streamlines._lengths
+        return self.__lengths
 
 
     @property
@@ -118,13 +140,13 @@ class Tractogram:
         """Returns a 1D numpy array containing the offsets into
         :meth:`vertices` for all streamlines.
         """
-        return self.tractFile.streamlines._offsets
+        return self.__offsets
 
 
     @property
     def nstreamlines(self):
         """Returns the number of streamlines. """
-        return len(self.tractFile.streamlines)
+        return len(self.__lengths)
 
 
     @property
@@ -157,7 +179,6 @@ class Tractogram:
 
 
     @property
-    @ft.lru_cache()
     def vertexOrientations(self):
         """Calculates and returns an orientation vector for every vertex of
         every streamline in the tractogram.
@@ -165,24 +186,136 @@ class Tractogram:
         The orientation assigned to a vertex is just the difference between
         that vertex and the previous vertex in the streamline. The first
         vertex in a streamline is given the same orientation as the second
-        (i.e. o0 = o1 = (v1 - v0)).
+        (i.e. o0 = o1 = (v1 - v0)). The vertex of a single-vertex streamline
+        is given an orientation of zero.
+
+        Orientations are calculated :data:`CHUNK_SIZE` vertices at a time,
+        and are stored in the on-disk cache alongside the vertices if
+        possible. Otherwise they are calculated in memory.
         """
 
+        if self.__orients is not None:
+            return self.__orients
+
         verts   = self.vertices
         offsets = self.offsets
-        orients = np.zeros(verts.shape, dtype=np.float32)
+        lengths = self.lengths
+        nverts  = len(verts)
+        path    = cachePath(self.dataSource, 'orients')
+
+        if path is not None and op.exists(path):
+            self.__orients = loadRaw(path)
+            return self.__orients
+
+        def calc(orients):
+            for lo in range(1, nverts, CHUNK_SIZE):
+                hi    = min(nverts, lo + CHUNK_SIZE)
+                diffs = verts[lo:hi] - verts[lo - 1:hi - 1]
+                orients[lo:hi] = affine.normalise(diffs)
+
+            # The first vertex of each streamline
+            # gets the orientation of the second.
+            # Single-vertex streamlines have no
+            # orientation.
+            first  = offsets[lengths >  1]
+            single = offsets[lengths == 1]
+            orients[first]  = orients[first + 1]
+            orients[single] = 0
+
+        orients = None
+        if path is not None:
+            key     = diskcache.fileKey(self.dataSource, 'tractogram')
+            orients = writeRaw(path, key, verts.shape, calc)
+
+        if orients is None:
+            orients = np.zeros(verts.shape, dtype=np.float32)
+            calc(orients)
+
+        self.__orients = orients
+        return orients
 
-        diffs               = verts[1:, :] - verts[:-1, :]
-        orients[1:,      :] = affine.normalise(diffs)
-        orients[offsets, :] = orients[offsets + 1, :]
 
-        return orients
+    @property
+    def lodOrder(self):
+        """Returns a 1D numpy array containing a deterministic level of
+        detail ordering of all streamlines, such that any prefix of the
+        array contains a representative sample of the tractogram.
+
+        Streamlines are divided into strata according to their length
+        (number of vertices) and principal orientation (the axis along which
+        their endpoints are furthest apart). Within each stratum, streamlines
+        are placed in a fixed pseudo-random order. Streamlines are then
+        interleaved across strata in proportion to the stratum sizes, so that
+        the first ``n`` streamlines contain roughly the same proportion of
+        streamlines from each stratum as the full tractogram.
+        """
+
+        if self.__lodOrder is not None:
+            return self.__lodOrder
+
+        nstrms  = self.nstreamlines
+        lengths = self.lengths
+        offsets = self.offsets
+
+        if nstrms == 0:
+            self.__lodOrder = np.zeros(0, dtype=np.int64)
+            return self.__lodOrder
+
+        # Eight length bins, by quantile, and
+        # three orientation bins. np.unique is
+        # used so that the bins are always
+        # valid for short/uniform lengths.
+        qs     = np.quantile(lengths, np.linspace(0, 1, 9)[1:-1])
+        lbins  = np.searchsorted(np.unique(qs), lengths, side='right')
+        ends   = self.vertices[offsets + lengths - 1] - self.vertices[offsets]
+        obins  = np.argmax(np.abs(ends), axis=1)
+        strata = lbins * 3 + obins
+
+        # Fixed seed, so the order is the same
+        # every time the file is loaded
+        rng  = np.random.default_rng(0)
+        perm = rng.permutation(nstrms)
+
+        # Position of each streamline within its
+        # stratum, as a proportion of the stratum
+        # size, determines its place in the
+        # final ordering.
+        counts      = np.bincount(strata)
+        starts      = np.zeros(len(counts), dtype=np.int64)
+        starts[1:]  = np.cumsum(counts)[:-1]
+        order       = np.lexsort((perm, strata))
+        pos         = np.zeros(nstrms, dtype=np.int64)
+        pos[order]  = np.arange(nstrms) - starts[strata[order]]
+        frac        = (pos + 0.5) / counts[strata]
+
+        self.__lodOrder = np.lexsort((perm, frac))
+        return self.__lodOrder
+
+
+    def vertexIndices(self, indices):
+        """Returns indices into the :meth:`vertices` array for all vertices
+        of the streamlines specified by ``indices``, which are indices into
+        the :meth:`offsets` / :meth:`lengths` arrays.
+        """
+
+        offsets = np.asarray(self.offsets[indices], dtype=np.int64)
+        lengths = np.asarray(self.lengths[indices], dtype=np.int64)
+        total   = int(lengths.sum())
+
+        # The offset of each streamline in the
+        # output, subtracted from its offset in
+        # the full vertex array, added to a
+        # running count of output vertices.
+        newOffsets     = np.zeros(len(offsets), dtype=np.int64)
+        newOffsets[1:] = np.cumsum(lengths)[:-1]
+        shifts         = np.repeat(offsets - newOffsets, lengths)
+
+        return (shifts + np.arange(total)).astype(np.uint32)
 
 
     def subset(self, indices):
         """Extract a sub-set of streamlines using the given ``indices`` into
-        the :meth:`offsets` / :meth:`lengths` arrays. The provided ``indices``
-        must be sorted.
+        the :meth:`offsets` / :meth:`lengths` arrays.
 
         :returns: A tuple of numpy arrays:
                     - New streamline vertices
@@ -191,17 +324,10 @@ class Tractogram:
                     - Indices into the full :meth:`vertices` array.
         """
 
-        offsets = self.offsets[indices]
-        lengths = self.lengths[indices]
-
-        vertIdxs = np.zeros(np.sum(lengths), dtype=np.uint32)
-        i        = 0
-        for o, l in zip(offsets, lengths):
-            vertIdxs[i:i + l] = np.arange(o, o + l, dtype=np.uint32)
-            i                += l
-
+        lengths        = np.asarray(self.lengths[indices])
+        vertIdxs       = self.vertexIndices(indices)
         vertices       = self.vertices[vertIdxs]
-        newOffsets     = np.zeros(len(offsets), dtype=np.int32)
+        newOffsets     = np.zeros(len(lengths), dtype=np.int32)
         newOffsets[1:] = np.cumsum(lengths)[:-1]
 
         return vertices, newOffsets, lengths, vertIdxs
@@ -235,19 +361,302 @@ class Tractogram:
             raise ValueError('{}: incompatible vertex/streamline data '
                              'shape: {}'.format(key, vdata.shape))
 
-        # Duplicate per-streamline
-        # data to be per-vertex
-        if vdata.shape[0] == nstrms:
-            vdata = np.repeat(vdata, self.lengths)
+        self.__vertexData    .pop(key, None)
+        self.__streamlineData.pop(key, None)
 
-        self.__vertexData[key] = vdata
+        # Per-streamline data is duplicated
+        # to be per-vertex in getVertexData
+        if vdata.shape[0] == nstrms and nstrms != nverts:
+            self.__streamlineData[key] = vdata
+        else:
+            self.__vertexData[key] = vdata
 
 
     def getVertexData(self, key):
-        """Return the specified per-vertex data. """
+        """Return the specified per-vertex data. Per-streamline data is
+        duplicated to be per-vertex.
+        """
+        if key in self.__streamlineData:
+            return np.repeat(self.__streamlineData[key], self.lengths)
         return self.__vertexData[key]
 
 
     def vertexDataSets(self):
         """Returns a list of keys for all loaded vertex data sets. """
-        return list(self.__vertexData.keys())
+        return list(self.__streamlineData.keys()) + \
+               list(self.__vertexData.keys())
+
+
+def cachePath(path, which):
+    """Returns a path to a file in the on-disk cache which is used to store
+    data for the streamline file at ``path``, or ``None`` if the cache is
+    disabled. The file may not exist.
+
+    :arg path:  Path to the streamline file
+    :arg which: Name identifying the data (e.g. ``'vertices'``)
+    """
+    key = diskcache.fileKey(path, 'tractogram')
+    if key is None or not diskcache.enabled():
+        return None
+    return diskcache.cachePath('tractogram', key, f'.{which}')
+
+
+def loadRaw(path):
+    """Memory-maps a file containing raw ``float32`` data, which was created
+    by :func:`writeRaw`. 1D files are returned as-is, all others are
+    returned with shape ``(n, 3)``.
+    """
+    # np.memmap does not support empty files
+    if op.getsize(path) == 0: data = np.zeros(0, dtype=np.float32)
+    else:                     data = np.memmap(path, dtype=np.float32,
+                                               mode='r')
+    if path.endswith('.orients') or path.endswith('.vertices'):
+        data = data.reshape(-1, 3)
+    return data
+
+
+def writeRaw(path, key, shape, fill):
+    """Creates a file containing raw ``float32`` data of the given ``shape``.
+    The file is memory-mapped and passed to ``fill``, which must populate
+    it. The file is written atomically, and then memory-mapped read-only
+    and returned.
+
+    :arg path:  Path to the file, as returned by :func:`cachePath`
+    :arg key:   Cache key of the streamline file (see
+                :func:`.diskcache.fileKey`)
+    :arg shape: Shape of the data
+    :arg fill:  Function which populates the data
+    :returns:   The memory-mapped data, or ``None`` if the data is larger
+                than the cache size limit (see :func:`.diskcache.evict`).
+    """
+
+    nbytes = int(np.prod(shape)) * 4
+
+    if not diskcache.evict(nbytes, key):
+        log.debug('Not caching %s - data is larger than the cache '
+                  'size limit (%i bytes)', path, nbytes)
+        return None
+
+    dirname = op.dirname(path)
+    os.makedirs(dirname, exist_ok=True)
+
+    fd, tmp = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+    os.close(fd)
+    try:
+        data = np.memmap(tmp, dtype=np.float32, mode='w+', shape=shape)
+        fill(data)
+        data.flush()
+        del data
+        os.replace(tmp, path)
+    finally:
+        if op.exists(tmp):
+            os.remove(tmp)
+
+    return loadRaw(path)
+
+
+def loadInMemory(path):
+    """Loads the streamline file at ``path`` into memory. Used by the
+    :class:`Tractogram` if the on-disk cache cannot be used.
+
+    :returns: A tuple containing:
+                - The vertices
+                - Streamline lengths
+                - Bounding box
+                - A dict containing per-vertex data sets
+                - A dict containing per-streamline data sets
+    """
+
+    tractFile  = nibstrm.load(path)
+    tractogram = tractFile.tractogram
+    vertices   = tractFile.streamlines.get_data()
+    lengths    = tractFile.streamlines._lengths
+    bounds     = (vertices.min(axis=0), vertices.max(axis=0))
+
+    # nibabel supports storage of multiple
+    # values per key per streamline/vertex,
+    # but we currently only support scalar
+    # values (i.e. one value per key per
+    # streamline/vertex), and discard all
+    # but the first value.
+    pointData = {}
+    strmData  = {}
+    for key in tractogram.data_per_streamline.keys():
+        data          = tractogram.data_per_streamline[key]
+        strmData[key] = data[:, 0].reshape(-1)
+    for key in tractogram.data_per_point.keys():
+        data           = tractogram.data_per_point[key].get_data()
+        pointData[key] = data[:, 0].reshape(-1)
+
+    return vertices, lengths, bounds, pointData, strmData
+
+
+def loadCached(path, tractFile):
+    """Loads the streamline file at ``path`` from the on-disk cache. If the
+    file has not been cached, it is converted, in a single streaming pass
+    over the lazily-loaded ``tractFile``. Vertices and per-vertex data are
+    memory-mapped.
+
+    :returns: A tuple with the same contents as :func:`loadInMemory`, or
+              ``None`` if the cache cannot be used, or if the converted
+              file would not fit within the cache size limit.
+    """
+
+    vpath = cachePath(path, 'vertices')
+    if vpath is None:
+        return None
+
+    key = diskcache.fileKey(path, 'tractogram')
+
+    # The lengths array is saved last,
+    # so its presence indicates that
+    # the cache is complete.
+    try:
+        if diskcache.load('tractogram', f'{key}_lengths') is None:
+            if not convert(path, tractFile):
+                return None
+    except Exception as e:
+        log.warning('Could not convert %s for memory-mapped '
+                    'access: %s', path, e)
+        return None
+
+    lengths   = diskcache.load('tractogram', f'{key}_lengths')
+    bounds    = diskcache.load('tractogram', f'{key}_bounds')
+    pkeys     = diskcache.load('tractogram', f'{key}_pointkeys')
+    skeys     = diskcache.load('tractogram', f'{key}_strmkeys')
+
+    if any(d is None for d in (lengths, bounds, pkeys, skeys)):
+        return None
+
+    vertices  = loadRaw(vpath)
+    pointData = {}
+    strmData  = {}
+
+    for i, pkey in enumerate(pkeys):
+        pointData[str(pkey)] = loadRaw(cachePath(path, f'point{i}'))
+    for i, skey in enumerate(skeys):
+        strmData[str(skey)] = diskcache.load('tractogram', f'{key}_strm{i}')
+
+    return vertices, lengths, (bounds[0], bounds[1]), pointData, strmData
+
+
+def convert(path, tractFile):
+    """Used by :func:`loadCached`. Reads all streamlines from the lazily
+    loaded ``tractFile``, and saves them to the on-disk cache. Vertices and
+    per-vertex data are written as raw ``float32`` files, :data:`CHUNK_SIZE`
+    vertices at a time, so that the full tractogram is never held in
+    memory.
+
+    The number of vertices is not known until the whole file has been read,
+    so space is reserved in the cache (see :func:`.diskcache.evict`) for a
+    copy which is the same size as the streamline file. The copy only stores
+    one value per vertex/streamline for each data set, so will not usually
+    be larger than the file.
+
+    :returns: ``True`` if the file was converted, ``False`` if it is larger
+              than the cache size limit.
+    """
+
+    key = diskcache.fileKey(path, 'tractogram')
+
+    if not diskcache.evict(op.getsize(path), key):
+        log.debug('Not converting %s - file is larger than the cache '
+                  'size limit', path)
+        return False
+
+    log.debug('Converting %s for memory-mapped access', path)
+
+    tractogram = tractFile.tractogram
+    pkeys      = list(tractogram.data_per_point     .keys())
+    skeys      = list(tractogram.data_per_streamline.keys())
+    vpath      = cachePath(path, 'vertices')
+    ppaths     = [cachePath(path, f'point{i}') for i in range(len(pkeys))]
+    dirname    = op.dirname(vpath)
+    lengths    = []
+    strmData   = [[] for _ in skeys]
+    bounds     = [np.full(3, np.inf), np.full(3, -np.inf)]
+    tmps       = []
+
+    os.makedirs(dirname, exist_ok=True)
+
+    def tmpfile():
+        fd, tmp = tempfile.mkstemp(dir=dirname, suffix='.tmp')
+        tmps.append(tmp)
+        return os.fdopen(fd, 'wb')
+
+    vfile  = tmpfile()
+    pfiles = [tmpfile() for _ in pkeys]
+    vchunk = []
+    pchunk = [[] for _ in pkeys]
+    nchunk = 0
+
+    def flush():
+        if len(vchunk) == 0:
+            return
+        verts     = np.concatenate(vchunk).astype(np.float32)
+        bounds[0] = np.minimum(bounds[0], verts.min(axis=0))
+        bounds[1] = np.maximum(bounds[1], verts.max(axis=0))
+        vfile.write(verts.tobytes())
+        for f, chunk in zip(pfiles, pchunk):
+            f.write(np.concatenate(chunk).astype(np.float32).tobytes())
+            chunk.clear()
+        vchunk.clear()
+
+    try:
+        # nibabel supports storage of multiple
+        # values per key per streamline/vertex,
+        # but we currently only support scalar
+        # values (i.e. one value per key per
+        # streamline/vertex), and discard all
+        # but the first value.
+        #
+        # Iterating over a lazy tractogram does
+        # not apply its affine transformation
+        # to the streamlines - this is only
+        # done by the streamlines generator.
+        # So the per-vertex/streamline data is
+        # read separately, only if needed.
+        if len(pkeys) + len(skeys) > 0: items = tractogram.data
+        else:                           items = itertools.repeat(None)
+
+        for strm, item in zip(tractogram.streamlines, items):
+            lengths.append(len(strm))
+            vchunk.append(strm)
+            nchunk += len(strm)
+            for i, k in enumerate(pkeys):
+                pchunk[i].append(item.data_for_points[k][:, 0])
+            for i, k in enumerate(skeys):
+                strmData[i].append(item.data_for_streamline[k][0])
+            if nchunk >= CHUNK_SIZE:
+                flush()
+                nchunk = 0
+        flush()
+
+        for f in [vfile] + pfiles:
+            f.close()
+
+        os.replace(tmps[0], vpath)
+        for tmp, ppath in zip(tmps[1:], ppaths):
+            os.replace(tmp, ppath)
+
+    finally:
+        for f in [vfile] + pfiles:
+            f.close()
+        for tmp in tmps:
+            if op.exists(tmp):
+                os.remove(tmp)
+
+    for i, data in enumerate(strmData):
+        diskcache.save('tractogram', f'{key}_strm{i}', np.array(data))
+
+    pkeys   = np.array(pkeys,   dtype=str)
+    skeys   = np.array(skeys,   dtype=str)
+    bounds  = np.array(bounds)
+    lengths = np.array(lengths, dtype=np.int64)
+
+    diskcache.save('tractogram', f'{key}_pointkeys', pkeys)
+    diskcache.save('tractogram', f'{key}_strmkeys',  skeys)
+    diskcache.save('tractogram', f'{key}_bounds',    bounds)
+    diskcache.save('tractogram', f'{key}_lengths',   lengths)
+
+    return True
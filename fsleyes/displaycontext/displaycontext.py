@@ -504,7 +504,9 @@ class DisplayContext(props.SyncableHasProperties):
                           or an index into the ``OverlayList``.
 
         All other keyword arguments are assumed to be ``name=value`` pairs,
-        containing initial property values.
+        containing initial property values. If none are given, any initial
+        property values that were specified when the overlay was added to the
+        :class:`.OverlayList` are used (see :meth:`.OverlayList.initProps`).
         """
 
         if overlay is None:
@@ -525,6 +527,12 @@ class DisplayContext(props.SyncableHasProperties):
 
         except KeyError:
 
+            # The Display may be created before we have
+            # been notified that the overlay has been
+            # added, e.g. within an OverlayList.batch
+            if len(kwargs) == 0:
+                kwargs = self.__overlayList.initProps(overlay)
+
             if not self.__child:
                 dParent = None
             else:
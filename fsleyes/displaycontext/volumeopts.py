@@ -12,14 +12,15 @@ import logging
 
 import numpy as np
 
-import fsl.data.image       as fslimage
-import fsleyes_props        as props
-import fsleyes.gl           as fslgl
+import fsl.data.image          as fslimage
+import fsleyes_props           as props
+import fsleyes.gl              as fslgl
+import fsleyes.data.imagestats as imagestats
 
-import fsleyes.colourmaps   as fslcm
-from . import colourmapopts as cmapopts
-from . import volume3dopts  as vol3dopts
-from . import                  niftiopts
+import fsleyes.colourmaps      as fslcm
+from . import colourmapopts    as cmapopts
+from . import volume3dopts     as vol3dopts
+from . import                     niftiopts
 
 
 log = logging.getLogger(__name__)
@@ -182,10 +183,8 @@ class VolumeOpts(cmapopts.ColourMapOpts,
                 # is defined as being "silly"
                 if abs(dmax - dmin) > 10e7:
 
-                    if   overlay.ndim == 3: sample = overlay[:]
-                    elif overlay.ndim == 4: sample = overlay[..., 0]
-
-                    drange = np.percentile(sample[sample != 0], [1, 99])
+                    stats  = imagestats.imageStats(overlay)
+                    drange = stats.percentiles([1, 99])
 
                     self.overrideDataRange       = drange
                     self.enableOverrideDataRange = True
@@ -200,11 +199,14 @@ class VolumeOpts(cmapopts.ColourMapOpts,
 
             drange, percentiles = drange
 
+            # Percentiles are calculated from the
+            # first volume, and saved to the image
+            # statistics cache so they do not need
+            # to be recalculated the next time that
+            # the image is loaded.
             if percentiles:
-                if   overlay.ndim == 3: sample = overlay[:]
-                elif overlay.ndim == 4: sample = overlay[..., 0]
-                drange = np.clip(drange, 0, 100)
-                drange = np.percentile(sample[sample != 0], drange)
+                stats  = imagestats.imageStats(overlay)
+                drange = stats.percentiles(drange)
 
             self.displayRange  = drange
             self.modulateRange = drange
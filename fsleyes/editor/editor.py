@@ -17,6 +17,7 @@ import numpy as np
 
 import fsleyes.actions    as actions
 from . import                selection
+from . import                history
 
 
 log = logging.getLogger(__name__)
@@ -65,7 +66,8 @@ class Editor(actions.ActionProvider):
     An ``Editor`` instance keeps track of all changes made to the
     :class:`Image` data and to the ``Selection``  Every selection/data
     change made is recorded using :class:`SelectionChange` and
-    :class:`.ValueChange` instances, which are stored in a list. These changes
+    :class:`.ValueChange` instances, which are stored in a
+    :class:`.history.History`. These changes
     can be undone (and redone), through the :meth:`undo` and :meth:`redo`
     "action" methods (see the :mod:`.actions` module). Changes to the
     ``Selection`` object are, by default, only recorded when the selection is
@@ -84,6 +86,12 @@ class Editor(actions.ActionProvider):
     completes, call the :meth:`endChangeGroup` to stop group changes.  When
     undoing/redoing changes, all of the changes in a change group will be
     undone/redone together.
+
+
+    The amount of memory used to store the change history is limited - older
+    changes are compressed, and the oldest changes are discarded (or moved to
+    temporary files) when the limit is reached. See the
+    :class:`.history.History` class for details.
     """
 
 
@@ -115,17 +123,9 @@ class Editor(actions.ActionProvider):
         if recordSelection:
             self.__selection.register(self.__name, self.__selectionChanged)
 
-        # A list of state objects, providing
-        # records of what has been done. The
-        # doneIndex points to the current
-        # state. Everything before the doneIndex
-        # represents previous states, and
-        # everything after the doneIndex
-        # represents states which have been
-        # undone.
-        self.__doneList        = []
-        self.__doneIndex       = -1
-        self.__inGroup         = False
+        # A record of what has been done,
+        # which can be undone and redone.
+        self.__history         = history.History()
         self.__recordChanges   = True
         self.__recordSelection = recordSelection
         self.undo.enabled      = False
@@ -146,9 +146,11 @@ class Editor(actions.ActionProvider):
         """
         actions.ActionProvider.destroy(self)
         self.__selection.deregister(self.__name)
+        self.__selection.destroy()
+        self.__history.destroy()
         self.__image     = None
         self.__selection = None
-        self.__doneList  = None
+        self.__history   = None
 
 
     def getImage(self):
@@ -247,16 +249,13 @@ class Editor(actions.ActionProvider):
         if not self.__recordChanges:
             return
 
-        del self.__doneList[self.__doneIndex + 1:]
-
-        self.__inGroup    = True
-        self.__doneIndex += 1
-        self.__doneList.append([])
+        self.__history.startGroup()
+        self.redo.enabled = False
 
         log.debug('{}: starting change group - merging subsequent '
                   'changes at index {} of {}'.format(self.__image.name,
-                                                     self.__doneIndex,
-                                                     len(self.__doneList)))
+                                                     self.__history.index,
+                                                     len(self.__history)))
 
 
     def endChangeGroup(self):
@@ -267,11 +266,11 @@ class Editor(actions.ActionProvider):
         if not self.__recordChanges:
             return
 
-        self.__inGroup = False
+        self.__history.endGroup()
         log.debug('{}: ending change group at {} of {}'.format(
             self.__image.name,
-            self.__doneIndex,
-            len(self.__doneList)))
+            self.__history.index,
+            len(self.__history)))
 
 
     def recordChanges(self, record=True):
@@ -302,28 +301,21 @@ class Editor(actions.ActionProvider):
         change objects that were undone - either :class:`ValueChange` or
         :class:`SelectionChange` objects.
         """
-        if self.__doneIndex == -1:
+        if not self.__history.canUndo:
             return []
 
         log.debug('{}: undo change {} of {}'.format(
             self.__image.name,
-            self.__doneIndex,
-            len(self.__doneList)))
-
-        change = self.__doneList[self.__doneIndex]
+            self.__history.index,
+            len(self.__history)))
 
-        if not isinstance(change, abc.Sequence):
-            change = [change]
+        change = self.__history.undo()
 
         for c in reversed(change):
             self.__revertChange(c)
 
-        self.__doneIndex -= 1
-
-        self.__inGroup = False
         self.redo.enabled = True
-        if self.__doneIndex == -1:
-            self.undo.enabled = False
+        self.undo.enabled = self.__history.canUndo
 
         return change
 
@@ -334,28 +326,21 @@ class Editor(actions.ActionProvider):
         all change objects that were undone - either :class:`ValueChange` or
         :class:`SelectionChange` objects.
         """
-        if self.__doneIndex == len(self.__doneList) - 1:
+        if not self.__history.canRedo:
             return []
 
         log.debug('{}: redo change {} of {}'.format(
             self.__image.name,
-            self.__doneIndex + 1,
-            len(self.__doneList)))
-
-        change = self.__doneList[self.__doneIndex + 1]
+            self.__history.index + 1,
+            len(self.__history)))
 
-        if not isinstance(change, abc.Sequence):
-            change = [change]
+        change = self.__history.redo()
 
         for c in change:
             self.__applyChange(c)
 
-        self.__doneIndex += 1
-
-        self.__inGroup = False
         self.undo.enabled = True
-        if self.__doneIndex == len(self.__doneList) - 1:
-            self.redo.enabled = False
+        self.redo.enabled = self.__history.canRedo
 
         return change
 
@@ -420,21 +405,16 @@ class Editor(actions.ActionProvider):
         if not self.__recordChanges:
             return
 
-        if self.__inGroup:
-            self.__doneList[self.__doneIndex].append(change)
-        else:
-            del self.__doneList[self.__doneIndex + 1:]
-            self.__doneList.append(change)
-            self.__doneIndex += 1
+        self.__history.add(change)
 
-        self.undo.enabled = True
+        self.undo.enabled = self.__history.canUndo
         self.redo.enabled = False
 
         log.debug('{}: new change to {} ({} of {})'.format(
             self.__image.name,
             change.overlay.name,
-            self.__doneIndex,
-            len(self.__doneList)))
+            self.__history.index,
+            len(self.__history)))
 
 
     def __applyChange(self, change):
@@ -454,10 +434,10 @@ class Editor(actions.ActionProvider):
                       change.overlay.name,
                       change.offset,
                       change.volume,
-                      change.oldVals.shape)
+                      change.shape)
 
             sliceobj = self.__makeSlice(change.offset,
-                                        change.newVals.shape,
+                                        change.shape,
                                         opts.index()[3:])
             image[sliceobj] = change.newVals
 
@@ -484,10 +464,10 @@ class Editor(actions.ActionProvider):
                           change.overlay.name,
                           change.offset,
                           change.volume,
-                          change.oldVals.shape))
+                          change.shape))
 
             sliceobj = self.__makeSlice(change.offset,
-                                        change.oldVals.shape,
+                                        change.shape,
                                         opts.index()[3:])
             image[sliceobj] = change.oldVals
 
@@ -524,6 +504,9 @@ class ValueChange(object):
     """Represents a change which has been made to the data for an
     :class:`.Image` instance. Stores the location, the old values,
     and the new values.
+
+    The values are stored in :class:`.history.StoredArray` objects, so may be
+    compressed. The new values are stored as differences from the old values.
     """
 
 
@@ -538,17 +521,55 @@ class ValueChange(object):
         :arg newVals: A ``numpy`` array containing the new image values.
         """
 
+        newVals = np.asarray(newVals, dtype=oldVals.dtype)
+
         self.overlay = overlay
         self.volume  = volume
         self.offset  = offset
-        self.oldVals = oldVals
-        self.newVals = newVals
+        self.__old   = history.StoredArray(oldVals)
+        self.__new   = history.StoredArray(newVals, self.__old)
+
+
+    def arrays(self):
+        """Returns the :class:`.history.StoredArray` objects which contain
+        the old and new values.
+        """
+        return [self.__old, self.__new]
+
+
+    def destroy(self):
+        """Called when this ``ValueChange`` is discarded from the change
+        history.
+        """
+        self.__old.destroy()
+        self.__new.destroy()
+
+
+    @property
+    def shape(self):
+        """Returns the shape of the changed block. """
+        return self.__old.shape
+
+
+    @property
+    def oldVals(self):
+        """Returns a ``numpy`` array containing the old image values. """
+        return self.__old.array()
+
+
+    @property
+    def newVals(self):
+        """Returns a ``numpy`` array containing the new image values. """
+        return self.__new.array()
 
 
 class SelectionChange(object):
     """Represents a change which has been made to a
     :class:`.selection.Selection` instance. Stores the location, the old
     selection, and the new selection.
+
+    The selections are stored in :class:`.history.StoredArray` objects, so
+    may be compressed.
     """
 
 
@@ -561,7 +582,34 @@ class SelectionChange(object):
         :arg newSelection: A ``numpy`` array containing the new selection.
         """
 
-        self.overlay      = overlay
-        self.offset       = offset
-        self.oldSelection = oldSelection
-        self.newSelection = newSelection
+        self.overlay = overlay
+        self.offset  = offset
+        self.__old   = history.StoredArray(oldSelection)
+        self.__new   = history.StoredArray(newSelection)
+
+
+    def arrays(self):
+        """Returns the :class:`.history.StoredArray` objects which contain
+        the old and new selections.
+        """
+        return [self.__old, self.__new]
+
+
+    def destroy(self):
+        """Called when this ``SelectionChange`` is discarded from the change
+        history.
+        """
+        self.__old.destroy()
+        self.__new.destroy()
+
+
+    @property
+    def oldSelection(self):
+        """Returns a ``numpy`` array containing the old selection. """
+        return self.__old.array()
+
+
+    @property
+    def newSelection(self):
+        """Returns a ``numpy`` array containing the new selection. """
+        return self.__new.array()
@@ -0,0 +1,428 @@
+#!/usr/bin/env python
+#
+# history.py - The History and StoredArray classes.
+#
+# Author: Paul McCarthy <pauldmccarthy@gmail.com>
+#
+"""This module provides the :class:`History` class, which is used by the
+:class:`.Editor` to store a bounded history of changes, and the
+:class:`StoredArray` class, which is used by change objects to store their
+data in a compressed form.
+"""
+
+
+import logging
+import tempfile
+import zlib
+
+import numpy as np
+
+import fsl.utils.settings as fslsettings
+
+
+log = logging.getLogger(__name__)
+
+
+class StoredArray:
+    """A ``StoredArray`` holds a ``numpy`` array which is part of a change
+    record, e.g. the old or new values of a :class:`.ValueChange`.
+
+    The array is initially kept as-is. It can be compressed with
+    :meth:`compress`, and the compressed data moved to a temporary file with
+    :meth:`spill`. The :meth:`array` method can be used to retrieve the data
+    regardless of how it is stored.
+
+    Arrays are compressed with ``zlib``. If a ``base`` array is given, only
+    the elements which differ from the ``base`` are stored - this is effective
+    for image edits, where the new values of a block only differ from the old
+    values within the selection. Boolean and integer selection blocks are
+    stored in full, as they are highly compressible.
+    """
+
+
+    def __init__(self, data, base=None):
+        """Create a ``StoredArray``.
+
+        :arg data: ``numpy`` array to store.
+        :arg base: Another ``StoredArray`` with the same shape and type,
+                   which contains values that are mostly the same as
+                   ``data``. Only the differences from ``base`` are stored
+                   when this ``StoredArray`` is compressed.
+        """
+        self.__data  = data
+        self.__base  = base
+        self.__shape = data.shape
+        self.__dtype = data.dtype
+        self.__blob  = None
+        self.__file  = None
+        self.__size  = 0
+
+
+    def destroy(self):
+        """Must be called when this ``StoredArray`` is no longer needed.
+        Deletes the temporary file, if the data has been spilled.
+        """
+        if self.__file is not None:
+            self.__file.close()
+        self.__data = None
+        self.__base = None
+        self.__blob = None
+        self.__file = None
+
+
+    @property
+    def shape(self):
+        """Returns the shape of the stored array. """
+        return self.__shape
+
+
+    @property
+    def compressed(self):
+        """Returns ``True`` if the data has been compressed (or spilled),
+        ``False`` otherwise.
+        """
+        return self.__data is None
+
+
+    @property
+    def spilled(self):
+        """Returns ``True`` if the data has been spilled to a temporary file,
+        ``False`` otherwise.
+        """
+        return self.__file is not None
+
+
+    @property
+    def nbytes(self):
+        """Returns the number of bytes of memory used to store the data. """
+        if   self.__data is not None: return self.__data.nbytes
+        elif self.__blob is not None: return len(self.__blob)
+        else:                         return 0
+
+
+    @property
+    def diskBytes(self):
+        """Returns the number of bytes of disk space used to store the data.
+        """
+        if self.__file is not None: return self.__size
+        else:                       return 0
+
+
+    def compress(self):
+        """Compresses the data, if it has not already been compressed. """
+
+        if self.__data is None:
+            return
+
+        data = self.__data
+
+        if self.__base is not None:
+            base = self.__base.array()
+            diff = base != data
+            if np.issubdtype(data.dtype, np.floating):
+                diff &= ~(np.isnan(base) & np.isnan(data))
+            payload = np.packbits(diff).tobytes() + data[diff].tobytes()
+        else:
+            payload = np.ascontiguousarray(data).tobytes()
+
+        self.__blob = zlib.compress(payload, 1)
+        self.__data = None
+
+
+    def spill(self):
+        """Compresses the data, and moves it into a temporary file. """
+
+        if self.__file is not None:
+            return
+
+        self.compress()
+
+        self.__file = tempfile.TemporaryFile(prefix='fsleyes_undo_')
+        self.__size = len(self.__blob)
+        self.__file.write(self.__blob)
+        self.__file.flush()
+        self.__blob = None
+
+
+    def array(self):
+        """Returns the stored data as a ``numpy`` array. Compressed data is
+        decompressed on every call, and is not retained. The returned array
+        must not be modified.
+        """
+
+        if self.__data is not None:
+            return self.__data
+
+        if self.__file is not None:
+            self.__file.seek(0)
+            blob = self.__file.read()
+        else:
+            blob = self.__blob
+
+        payload = zlib.decompress(blob)
+        nelems  = int(np.prod(self.__shape))
+
+        if self.__base is None:
+            data = np.frombuffer(payload, dtype=self.__dtype)
+            return data.reshape(self.__shape)
+
+        nmask = (nelems + 7) // 8
+        diff  = np.frombuffer(payload[:nmask], dtype=np.uint8)
+        diff  = np.unpackbits(diff, count=nelems).astype(bool)
+        vals  = np.frombuffer(payload[nmask:], dtype=self.__dtype)
+        data  = np.array(self.__base.array(), dtype=self.__dtype)
+
+        data.reshape(-1)[diff] = vals
+
+        return data
+
+
+class History:
+    """The ``History`` class stores a list of changes, which may be undone
+    and redone. It is used by the :class:`.Editor` to store
+    :class:`.ValueChange` and :class:`.SelectionChange` objects. Changes may
+    be grouped together (see :meth:`startGroup`), so that they are undone and
+    redone at once.
+
+    The amount of memory used by the history is limited by a byte budget:
+
+     - The most recent changes are kept as-is, up to a quarter of the budget,
+       so that they can be undone and redone quickly.
+
+     - Older changes are compressed (see :class:`StoredArray`).
+
+     - If the compressed changes still exceed the budget, the oldest changes
+       are either discarded or, if spilling is enabled, moved into temporary
+       files. Spilled changes are limited by a separate disk budget, beyond
+       which the oldest changes are discarded.
+
+    The budgets are controlled by the ``fsleyes.editor.undoBudget``
+    (default 512MB), ``fsleyes.editor.undoSpill`` (default ``False``), and
+    ``fsleyes.editor.undoDiskBudget`` (default 4GB) settings.
+
+    Change objects must provide ``arrays()``, which returns a list of all of
+    their :class:`StoredArray` objects, and ``destroy()`` methods.
+    """
+
+
+    def __init__(self, budget=None, spill=None, diskBudget=None):
+        """Create a ``History``.
+
+        :arg budget:     Maximum number of bytes of memory to use. Defaults
+                         to the ``fsleyes.editor.undoBudget`` setting.
+        :arg spill:      Whether to spill old changes to temporary files.
+                         Defaults to the ``fsleyes.editor.undoSpill``
+                         setting.
+        :arg diskBudget: Maximum number of bytes of disk space to use for
+                         spilled changes. Defaults to the
+                         ``fsleyes.editor.undoDiskBudget`` setting.
+        """
+
+        if budget is None:
+            budget = fslsettings.read('fsleyes.editor.undoBudget', 536870912)
+        if spill is None:
+            spill = fslsettings.read('fsleyes.editor.undoSpill', False)
+        if diskBudget is None:
+            diskBudget = fslsettings.read('fsleyes.editor.undoDiskBudget',
+                                          4294967296)
+
+        self.__budget     = max(0, int(budget))
+        self.__spill      = bool(spill)
+        self.__diskBudget = max(0, int(diskBudget))
+
+        # A list of lists of changes. The
+        # index points to the current state.
+        # Everything before the index
+        # represents previous states, and
+        # everything after the index
+        # represents states which have been
+        # undone.
+        self.__entries = []
+        self.__index   = -1
+        self.__inGroup = False
+
+
+    def destroy(self):
+        """Must be called when this ``History`` is no longer needed. Clears
+        all stored changes.
+        """
+        self.clear()
+
+
+    def clear(self):
+        """Discards all stored changes. """
+        for entry in self.__entries:
+            self.__destroyEntry(entry)
+        self.__entries = []
+        self.__index   = -1
+        self.__inGroup = False
+
+
+    @property
+    def index(self):
+        """Returns the index of the current state. """
+        return self.__index
+
+
+    def __len__(self):
+        """Returns the number of stored entries (single changes or change
+        groups).
+        """
+        return len(self.__entries)
+
+
+    @property
+    def canUndo(self):
+        """Returns ``True`` if there is a change which can be undone. """
+        return self.__index >= 0
+
+
+    @property
+    def canRedo(self):
+        """Returns ``True`` if there is a change which can be redone. """
+        return self.__index < len(self.__entries) - 1
+
+
+    def nbytes(self):
+        """Returns a tuple containing the number of bytes of memory and disk
+        space used by all stored changes.
+        """
+        arrays = [a for e in self.__entries for a in self.__entryArrays(e)]
+        return (sum(a.nbytes    for a in arrays),
+                sum(a.diskBytes for a in arrays))
+
+
+    def startGroup(self):
+        """Starts a change group. All subsequent changes will be grouped
+        together until a call to :meth:`endGroup`, or to :meth:`undo` or
+        :meth:`redo`.
+        """
+        self.__discardRedo()
+        self.__inGroup  = True
+        self.__index   += 1
+        self.__entries.append([])
+
+
+    def endGroup(self):
+        """Ends a change group previously started by a call to
+        :meth:`startGroup`.
+        """
+        self.__inGroup = False
+
+
+    def add(self, change):
+        """Adds a change to the history. Any changes which have been undone
+        are discarded, and the budget is enforced.
+        """
+
+        if self.__inGroup:
+            self.__entries[self.__index].append(change)
+        else:
+            self.__discardRedo()
+            self.__entries.append([change])
+            self.__index += 1
+
+        self.__enforceBudget()
+
+
+    def undo(self):
+        """Moves the current state back one entry, and returns a list of
+        the changes which need to be reverted.
+        """
+        if not self.canUndo:
+            return []
+
+        entry          = self.__entries[self.__index]
+        self.__index  -= 1
+        self.__inGroup = False
+        return list(entry)
+
+
+    def redo(self):
+        """Moves the current state forward one entry, and returns a list of
+        the changes which need to be re-applied.
+        """
+        if not self.canRedo:
+            return []
+
+        self.__index  += 1
+        self.__inGroup = False
+        return list(self.__entries[self.__index])
+
+
+    def __entryArrays(self, entry):
+        """Returns a list of all :class:`StoredArray` objects in the given
+        entry.
+        """
+        return [a for change in entry for a in change.arrays()]
+
+
+    def __destroyEntry(self, entry):
+        """Destroys all changes in the given entry. """
+        for change in entry:
+            change.destroy()
+
+
+    def __discardRedo(self):
+        """Discards all entries which have been undone. """
+        for entry in self.__entries[self.__index + 1:]:
+            self.__destroyEntry(entry)
+        del self.__entries[self.__index + 1:]
+
+
+    def __evict(self):
+        """Discards the least useful entry - the oldest entry, if there are
+        at least two entries which can be undone, or the last entry which
+        can be redone otherwise. Returns ``False`` if there is nothing to
+        evict, ``True`` otherwise.
+        """
+
+        if self.__index >= 1:
+            entry         = self.__entries.pop(0)
+            self.__index -= 1
+        elif len(self.__entries) > self.__index + 2:
+            entry = self.__entries.pop()
+        else:
+            return False
+
+        log.debug('Undo history exceeds budget - discarding '
+                  'entry with %i change(s)', len(entry))
+        self.__destroyEntry(entry)
+        return True
+
+
+    def __enforceBudget(self):
+        """Compresses, spills, and discards entries so that the memory and
+        disk space used by this ``History`` is within budget.
+        """
+
+        rawBudget = self.__budget // 4
+        rawBytes  = 0
+
+        # Keep the most recent entries
+        # as-is, and compress the rest.
+        for entry in reversed(self.__entries):
+            arrays    = self.__entryArrays(entry)
+            rawBytes += sum(a.nbytes for a in arrays if not a.compressed)
+            if rawBytes > rawBudget:
+                for a in arrays:
+                    a.compress()
+
+        mem, disk = self.nbytes()
+
+        # Spill or evict the oldest
+        # entries, leaving the most
+        # recent entry in memory
+        for entry in self.__entries[:-1]:
+            if mem <= self.__budget or not self.__spill:
+                break
+            for a in self.__entryArrays(entry):
+                if not a.spilled:
+                    mem -= a.nbytes
+                    a.spill()
+                    disk += a.diskBytes
+
+        while mem > self.__budget or disk > self.__diskBudget:
+            if not self.__evict():
+                break
+            mem, disk = self.nbytes()
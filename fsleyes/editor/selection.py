@@ -12,7 +12,6 @@ import logging
 import collections.abc as abc
 
 import numpy          as np
-import scipy.ndimage  as ndimage
 
 import fsl.utils.notifier  as notifier
 import fsleyes.gl.routines as glroutines
@@ -98,6 +97,8 @@ class Selection(notifier.Notifier):
                         as ``image``. This array is *not* copied.
         """
 
+        self.__name               = '{}_{}'.format(type(self).__name__,
+                                                   id(self))
         self.__image              = image
         self.__display            = display
         self.__clear              = True
@@ -105,6 +106,16 @@ class Selection(notifier.Notifier):
         self.__lastChangeOldBlock = None
         self.__lastChangeNewBlock = None
 
+        # A RegionGrower is kept from the most
+        # recent local selectByValue call, so
+        # that it can be re-used if the next
+        # call uses the same seed location
+        # (e.g. when the precision or radius
+        # is changed). It is discarded when
+        # the image data changes.
+        self.__grower             = None
+        self.__growerKey          = None
+
         # We keep track of regions of the selection
         # that have been modified, as a sequence of
         # (xlo, ylo, zlo, xhi, yhi, zhi) values.
@@ -122,6 +133,8 @@ class Selection(notifier.Notifier):
 
         self.__selection = selection
 
+        image.register(self.__name, self.__imageDataChanged, 'data')
+
         log.debug('%s.init (%s)', type(self).__name__, id(self))
 
 
@@ -131,6 +144,25 @@ class Selection(notifier.Notifier):
             log.debug('%s.del (%s)', type(self).__name__, id(self))
 
 
+    def destroy(self):
+        """Must be called when this ``Selection`` is no longer needed.
+        De-registers the listener on the image data, and clears references.
+        """
+        self.__image.deregister(self.__name, 'data')
+        self.__image     = None
+        self.__display   = None
+        self.__grower    = None
+        self.__growerKey = None
+
+
+    def __imageDataChanged(self, *a):
+        """Called when the image data changes. Discards the cached
+        :class:`RegionGrower`, if there is one.
+        """
+        self.__grower    = None
+        self.__growerKey = None
+
+
     @property
     def shape(self):
         """Returns the selection shape. """
@@ -516,7 +548,8 @@ class Selection(notifier.Notifier):
                       searchRadius=None,
                       local=False,
                       restrict=None,
-                      combine=False):
+                      combine=False,
+                      connectivity=6):
         """A *bucket fill* style selection routine.
 
         :arg combine:      Combine with the previous stored change (see
@@ -525,18 +558,44 @@ class Selection(notifier.Notifier):
         See the :func:`selectByValue` function for details on the other
         arguments.
 
+        When ``local is True``, the :class:`RegionGrower` used to find the
+        selected region is retained, and is re-used by subsequent calls with
+        the same seed location, restriction, and connectivity. So if the
+        ``precision`` or ``searchRadius`` is increased (e.g. while the user is
+        adjusting them), only voxels on the border of the previously selected
+        region need to be tested.
+
         :returns: The generated selection array (a ``numpy`` boolean array),
                   and offset of this array into the full selection image.
         """
 
-        opts = self.__display.opts
-        data = self.__image[opts.index()]
+        opts   = self.__display.opts
+        data   = self.__image[opts.index()]
+        grower = None
+
+        if local:
+            restrict = fixSlices(restrict)
+            key      = (tuple(int(v) for v in seedLoc),
+                        tuple((s.start, s.stop, s.step) for s in restrict),
+                        tuple(opts.index()[3:]),
+                        connectivity)
+
+            if key == self.__growerKey:
+                grower = self.__grower
+            else:
+                space, seed      = restrictSearch(data, seedLoc, restrict)[:2]
+                grower           = RegionGrower(space, seed, connectivity)
+                self.__grower    = grower
+                self.__growerKey = key
+
         block, offset = selectByValue(data,
                                       seedLoc,
                                       precision,
                                       searchRadius,
                                       local,
-                                      restrict)
+                                      restrict,
+                                      connectivity,
+                                      grower)
 
         self.setSelection(block, offset, combine)
 
@@ -729,12 +788,60 @@ def fixSlices(slices):
     return tuple(slices)
 
 
+def restrictSearch(data, seedLoc, restrict=None):
+    """Used by :func:`selectByValue`. Extracts the portion of ``data``
+    specified by ``restrict``.
+
+    :arg data:     The 3D image data
+    :arg seedLoc:  Voxel coordinates of the seed location
+    :arg restrict: An optional sequence of three ``slice`` objects
+
+    :returns: A tuple containing:
+               - The restricted data
+               - The seed location, relative to the restricted data
+               - The offset of the restricted data into ``data``
+    """
+
+    seedLoc = [int(v) for v in seedLoc]
+
+    if restrict is None:
+        return data, seedLoc, [0, 0, 0]
+
+    restrict = fixSlices(list(restrict))
+    xs, xe   = restrict[0].start, restrict[0].step
+    ys, ye   = restrict[1].start, restrict[1].step
+    zs, ze   = restrict[2].start, restrict[2].step
+
+    if xs is None: xs = 0
+    if ys is None: ys = 0
+    if zs is None: zs = 0
+    if xe is None: xe = data.shape[0]
+    if ye is None: ye = data.shape[1]
+    if ze is None: ze = data.shape[2]
+
+    # The seed location has to be in the sub-set
+    # o the image specified by the restrictions
+    if seedLoc[0] < xs or seedLoc[0] >= xe or \
+       seedLoc[1] < ys or seedLoc[1] >= ye or \
+       seedLoc[2] < zs or seedLoc[2] >= ze:
+        raise ValueError('Seed location ({}) is outside '
+                         'of restrictions ({})'.format(
+                             seedLoc, ((xs, xe), (ys, ye), (zs, ze))))
+
+    offset  = [xs, ys, zs]
+    seedLoc = [sl - so for sl, so in zip(seedLoc, offset)]
+
+    return data[restrict], seedLoc, offset
+
+
 def selectByValue(data,
                   seedLoc,
                   precision=None,
                   searchRadius=None,
                   local=False,
-                  restrict=None):
+                  restrict=None,
+                  connectivity=6,
+                  grower=None):
     """A *bucket fill* style selection routine. Given a seed location,
     finds all voxels which have a value similar to that of that location.
     The current selection is replaced with all voxels that were found.
@@ -754,12 +861,21 @@ def selectByValue(data,
                        image space.
 
     :arg local:        If ``True``, a voxel will only be selected if it
-                       is adjacent to an already selected voxel (using
-                       8-neighbour connectivity).
+                       is connected to the seed location via other selected
+                       voxels (see :class:`RegionGrower`).
 
     :arg restrict:     An optional sequence of three ``slice`` object,
                        specifying a sub-set of the image to search.
 
+    :arg connectivity: Neighbourhood used when ``local`` is ``True`` - one
+                       of ``6`` (the default), ``18``, or ``26``.
+
+    :arg grower:       A :class:`RegionGrower` to use when ``local`` is
+                       ``True``. Must have been created with the same
+                       ``data``, ``seedLoc``, ``restrict`` (see
+                       :func:`restrictSearch`) and ``connectivity``. If not
+                       provided, a new ``RegionGrower`` is created.
+
     :returns: The generated selection array (a ``numpy`` boolean array),
               and offset of this array into the data.
     """
@@ -767,10 +883,6 @@ def selectByValue(data,
     if precision is not None and precision < 0:
         precision = 0
 
-    shape   = data.shape
-    seedLoc = np.array(seedLoc)
-    value   = float(data[seedLoc[0], seedLoc[1], seedLoc[2]])
-
     # Search radius may be either None, a scalar value,
     # or a sequence of three values (one for each axis).
     # If it is one of the first two options (None/scalar),
@@ -781,55 +893,26 @@ def selectByValue(data,
         searchRadius = np.array([searchRadius] * 3)
 
     searchRadius = np.ceil(searchRadius)
-    searchOffset = (0, 0, 0)
 
     # Reduce the data set if
     # restrictions have been
     # specified
-    if restrict is not None:
-
-        restrict = fixSlices(restrict)
-        xs, xe   = restrict[0].start, restrict[0].step
-        ys, ye   = restrict[1].start, restrict[1].step
-        zs, ze   = restrict[2].start, restrict[2].step
-
-        if xs is None: xs = 0
-        if ys is None: ys = 0
-        if zs is None: zs = 0
-        if xe is None: xe = data.shape[0]
-        if ye is None: ye = data.shape[1]
-        if ze is None: ze = data.shape[2]
-
-        # The seed location has to be in the sub-set
-        # o the image specified by the restrictions
-        if seedLoc[0] < xs or seedLoc[0] >= xe or \
-           seedLoc[1] < ys or seedLoc[1] >= ye or \
-           seedLoc[2] < zs or seedLoc[2] >= ze:
-            raise ValueError('Seed location ({}) is outside '
-                             'of restrictions ({})'.format(
-                                 seedLoc, ((xs, xe), (ys, ye), (zs, ze))))
-
-        data         = data[restrict]
-        shape        = data.shape
-        searchOffset = [xs, ys, zs]
-        seedLoc      = [sl - so for sl, so in zip(seedLoc, searchOffset)]
+    data, seedLoc, searchOffset = restrictSearch(data, seedLoc, restrict)
+    shape                       = data.shape
+    value                       = float(data[tuple(seedLoc)])
 
     # No search radius - search
     # through the entire image
     if np.any(searchRadius == 0):
-        searchSpace  = data
-        searchMask   = None
+        searchRadius = None
+        slices       = [slice(0, s) for s in shape]
 
     # Search radius specified - limit
-    # the search space, and specify
-    # an ellipsoid mask with the
-    # specified per-axis radii
+    # the search space to a box around
+    # the seed location
     else:
-        ranges = [None, None, None]
         slices = [None, None, None]
 
-        # Calculate xyz indices
-        # of the search space
         for ax in range(3):
 
             idx = seedLoc[     ax]
@@ -841,56 +924,215 @@ def selectByValue(data,
             if lo < 0:             lo = 0
             if hi > shape[ax] - 1: hi = shape[ax]
 
-            ranges[ax] = np.arange(lo, hi)
-            slices[ax] = slice(    lo, hi)
+            slices[ax] = slice(lo, hi)
+
+    lows         = [s.start for s in slices]
+    searchOffset = [so + lo for so, lo in zip(searchOffset, lows)]
 
-        xs, ys, zs = np.meshgrid(*ranges, indexing='ij')
+    # If local is true, limit the selection to
+    # adjacent points with the same/similar
+    # value, by growing a region outwards from
+    # the seed location.
+    if local:
+        if grower is None:
+            grower = RegionGrower(data, seedLoc, connectivity)
 
-        # Centre those indices and the
-        # seed location at (0, 0, 0)
-        xs         -= seedLoc[0]
-        ys         -= seedLoc[1]
-        zs         -= seedLoc[2]
-        seedLoc[0] -= ranges[0][0]
-        seedLoc[1] -= ranges[1][0]
-        seedLoc[2] -= ranges[2][0]
+        coords = grower.grow(precision, searchRadius) - lows
+        hits   = np.zeros([s.stop - s.start for s in slices], dtype=bool)
+        hits[tuple(coords.T)] = True
 
-        # Distances from each point in the search
-        # space to the centre of the search space
-        dists = ((xs / searchRadius[0]) ** 2 +
-                 (ys / searchRadius[1]) ** 2 +
-                 (zs / searchRadius[2]) ** 2)
+        return hits, searchOffset
 
-        # Extract the search space, and
-        # create the ellipsoid mask
-        searchSpace  = data[tuple(slices)]
-        searchOffset = [so + r[0] for so, r in zip(searchOffset, ranges)]
-        searchMask   = dists <= 1
+    # Otherwise, any same or similar
+    # values are part of the selection
+    searchSpace = data[tuple(slices)]
 
     if precision is None: hits = searchSpace == value
     else:                 hits = np.abs(searchSpace - value) <= precision
 
-    if searchMask is not None:
-        hits[~searchMask] = False
-
-    # If local is true, limit the selection to
-    # adjacent points with the same/similar value
-    # (using scipy.ndimage.measurements.label)
-    #
-    # The label function defaults to 6 neighbour
-    # connectivity for 3D, or 4 neighbour
-    # connectivity for 2D.
-    #
-    # If local is not True, any same or similar
-    # values are part of the selection
-    if local:
-        hits, _   = ndimage.label(hits)
-        seedLabel = hits[seedLoc[0], seedLoc[1], seedLoc[2]]
-        hits      = hits == seedLabel
+    # Limit the selection to an ellipsoid
+    # with the specified per-axis radii,
+    # centred at the seed location
+    if searchRadius is not None:
+        xs, ys, zs = [(np.arange(s.start, s.stop) - sl) / r
+                      for s, sl, r in zip(slices, seedLoc, searchRadius)]
+        dists      = (xs[:, None, None] ** 2 +
+                      ys[None, :, None] ** 2 +
+                      zs[None, None, :] ** 2)
+        hits[dists > 1] = False
 
     return hits, searchOffset
 
 
+class RegionGrower:
+    """The ``RegionGrower`` is used by :func:`selectByValue` to find the set
+    of voxels which are connected to a seed location, and which have a value
+    similar to that of the seed location.
+
+    The region is grown outwards from the seed, one layer of neighbouring
+    voxels at a time, so the amount of work is proportional to the size of
+    the selected region (and its border), rather than to the size of the
+    search space. Neighbouring voxels are defined with either 6 (faces),
+    18 (faces and edges), or 26 (faces, edges, and corners) connectivity.
+
+    A ``RegionGrower`` keeps the selected region, and the voxels on its
+    border which were rejected. When :meth:`grow` is called again with a
+    larger (or equal) ``precision`` and ``radius``, the region is grown
+    from the rejected border voxels, rather than from scratch.
+    """
+
+
+    def __init__(self, data, seedLoc, connectivity=6):
+        """Create a ``RegionGrower``.
+
+        :arg data:         3D ``numpy`` array
+        :arg seedLoc:      Voxel coordinates of the seed location
+        :arg connectivity: ``6``, ``18``, or ``26``.
+        """
+
+        if connectivity not in (6, 18, 26):
+            raise ValueError('Invalid connectivity: {}'.format(connectivity))
+
+        offsets = np.array(np.meshgrid([-1, 0, 1],
+                                       [-1, 0, 1],
+                                       [-1, 0, 1],
+                                       indexing='ij')).reshape(3, -1).T
+        ndiffs  = np.abs(offsets).sum(axis=1)
+        maxdiff = {6 : 1, 18 : 2, 26 : 3}[connectivity]
+        offsets = offsets[(ndiffs > 0) & (ndiffs <= maxdiff)]
+
+        self.__data      = data
+        self.__shape     = np.array(data.shape)
+        self.__seed      = np.array(seedLoc, dtype=int)
+        self.__value     = float(data[tuple(self.__seed)])
+        self.__offsets   = offsets
+        self.__precision = None
+        self.__radius    = None
+        self.__visited   = None
+        self.__region    = None
+        self.__rejected  = None
+
+
+    def __reset(self):
+        """Discards the current region, and starts again from the seed. """
+
+        seed             = self.__seed
+        self.__visited   = np.zeros(self.__data.shape, dtype=bool)
+        self.__region    = [seed.reshape(1, 3)]
+        self.__rejected  = []
+        self.__visited[tuple(seed)] = True
+
+        return self.__region[0]
+
+
+    def __accept(self, coords, precision, radius):
+        """Returns a boolean array indicating which of the given voxel
+        coordinates are within ``radius`` of the seed, and have a value
+        within ``precision`` of the seed value.
+        """
+
+        vals = self.__data[tuple(coords.T)]
+
+        if precision is None: accept = vals == self.__value
+        else:                 accept = np.abs(vals - self.__value) <= precision
+
+        if radius is not None:
+            dists   = ((coords - self.__seed) / radius) ** 2
+            accept &= dists.sum(axis=1) <= 1
+
+        return accept
+
+
+    def __canContinue(self, precision, radius):
+        """Returns ``True`` if the current region is a subset of the region
+        for the given ``precision`` and ``radius``, and so can be grown
+        from its border, ``False`` otherwise.
+        """
+
+        if self.__region is None:
+            return False
+
+        oldPrec = self.__precision
+        oldRad  = self.__radius
+
+        if oldPrec   is None: oldPrec   = 0
+        if precision is None: precision = 0
+
+        if precision < oldPrec:
+            return False
+
+        if radius is None: return True
+        if oldRad is None: return False
+
+        return np.all(np.asarray(radius) >= oldRad)
+
+
+    def grow(self, precision=None, radius=None):
+        """Grows the region.
+
+        :arg precision: Voxels with a value within ``precision`` of the seed
+                        value are included in the region. If ``None``, the
+                        value must be equal to the seed value.
+
+        :arg radius:    Sequence of three per-axis radii (in voxels),
+                        defining an ellipsoid centred at the seed location,
+                        which limits the region. If ``None``, the region is
+                        not limited.
+
+        :returns:       A ``(n, 3)`` array containing the coordinates of all
+                        voxels in the region.
+        """
+
+        if radius is not None:
+            radius = np.array(radius, dtype=np.float64)
+
+        if self.__canContinue(precision, radius):
+            if len(self.__rejected) > 0:
+                border = np.concatenate(self.__rejected)
+            else:
+                border = np.zeros((0, 3), dtype=int)
+            accept          = self.__accept(border, precision, radius)
+            frontier        = border[accept]
+            self.__rejected = [border[~accept]]
+            self.__region.append(frontier)
+        else:
+            frontier = self.__reset()
+
+        self.__precision = precision
+        self.__radius    = radius
+
+        shape   = self.__shape
+        visited = self.__visited.reshape(-1)
+
+        while len(frontier) > 0:
+
+            # All in-bounds neighbours of the
+            # current frontier which have not
+            # already been tested
+            nbrs = (frontier[:, None, :] + self.__offsets).reshape(-1, 3)
+            nbrs = nbrs[np.all((nbrs >= 0) & (nbrs < shape), axis=1)]
+            idxs = np.ravel_multi_index(nbrs.T, shape)
+            idxs = np.unique(idxs)
+            idxs = idxs[~visited[idxs]]
+
+            visited[idxs] = True
+
+            nbrs     = np.array(np.unravel_index(idxs, shape)).T
+            accept   = self.__accept(nbrs, precision, radius)
+            frontier = nbrs[accept]
+
+            self.__rejected.append(nbrs[~accept])
+            self.__region  .append(frontier)
+
+        region        = np.concatenate(self.__region)
+        self.__region = [region]
+
+        if len(self.__rejected) > 1:
+            self.__rejected = [np.concatenate(self.__rejected)]
+
+        return region
+
+
 def selectLine(shape,
                dims,
                from_,
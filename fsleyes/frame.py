@@ -2140,13 +2140,15 @@ class OverlayDropTarget(wx.FileDropTarget):
         if len(overlays) == 0:
             return
 
-        self.__overlayList.extend(overlays)
+        with self.__overlayList.batch():
 
-        if self.__displayCtx.autoDisplay:
-            for overlay in overlays:
-                autodisplay.autoDisplay(overlay,
-                                        self.__overlayList,
-                                        self.__displayCtx)
+            self.__overlayList.extend(overlays)
+
+            if self.__displayCtx.autoDisplay:
+                for overlay in overlays:
+                    autodisplay.autoDisplay(overlay,
+                                            self.__overlayList,
+                                            self.__displayCtx)
 
 
     def OnDropFiles(self, x, y, filenames):
@@ -29,6 +29,10 @@ following annotation types are defined:
    Ellipse
    VoxelSelection
    TextAnnotation
+
+
+Fixed and persistent :class:`Point`, :class:`Line` and :class:`Arrow`
+annotations are drawn in batches by an :class:`AnnotationBatch`.
 """
 
 
@@ -132,6 +136,7 @@ class Annotations(props.HasProperties):
         self.__fixed     = []
         self.__canvas    = canvas
         self.__shader    = None
+        self.__batch     = AnnotationBatch(self)
 
 
     @property
@@ -146,6 +151,7 @@ class Annotations(props.HasProperties):
         needed.
         """
         self.clear()
+        self.__batch.destroy()
         if self.__shader is not None:
             self.__shader.destroy()
             self.__shader = None
@@ -157,18 +163,23 @@ class Annotations(props.HasProperties):
         types.
         """
 
-        if self.__shader is not None:
-            return self.__shader
+        if self.__shader is None:
+            self.__shader = self.createShader()
+        return self.__shader
 
+
+    @staticmethod
+    def createShader():
+        """Creates and returns a new shader program of the type returned by
+        :meth:`defaultShader`. Used by the :class:`AnnotationBatch`, which
+        needs its own vertex buffers.
+        """
         vertSrc = shaders.getVertexShader(  'annotations')
         fragSrc = shaders.getFragmentShader('annotations')
         if float(fslgl.GL_COMPATIBILITY) < 2.1:
-            shader = shaders.ARBPShader(vertSrc, fragSrc)
+            return shaders.ARBPShader(vertSrc, fragSrc)
         else:
-            shader = shaders.GLSLShader(vertSrc, fragSrc)
-
-        self.__shader = shader
-        return shader
+            return shaders.GLSLShader(vertSrc, fragSrc)
 
 
     def __create(self, atype, *args, **kwargs):
@@ -288,22 +299,57 @@ class Annotations(props.HasProperties):
                    coordinate system.
         """
 
-        objs = (list(self.__fixed)     +
-                list(self.annotations) +
-                list(self.__transient))
-
         drawTime = time.time()
 
-        for obj in objs:
-
-            if obj.expired(drawTime): continue
-            if not obj.enabled:       continue
+        def visible(obj):
+            if obj.expired(drawTime): return False
+            if not obj.enabled:       return False
             if obj.honourZLimits:
-                if obj.zmin is not None and zpos < obj.zmin: continue
-                if obj.zmax is not None and zpos > obj.zmax: continue
+                if obj.zmin is not None and zpos < obj.zmin: return False
+                if obj.zmax is not None and zpos > obj.zmax: return False
+            return True
+
+        static    = list(self.__fixed) + list(self.annotations)
+        static    = [o for o in static           if visible(o)]
+        transient = [o for o in self.__transient if visible(o)]
+
+        # Fixed and persistent annotations which
+        # can be batched are divided into runs of
+        # consecutive annotations, so that the
+        # drawing order is preserved with respect
+        # to annotations which cannot be batched.
+        # Transient annotations are likely to
+        # change on every draw, so are not batched.
+        items = []
+        for obj in static:
+            if not obj.batchable:
+                items.append(obj)
+            elif len(items) > 0 and isinstance(items[-1], list):
+                items[-1].append(obj)
+            else:
+                items.append([obj])
+
+        runs = [i for i in items if isinstance(i, list)]
+
+        try:
+            self.__batch.update(runs, zpos, axes)
+        except Exception as e:
+            log.warning(e, exc_info=True)
+            items = static
+
+        run = 0
+        for item in items + transient:
+
+            if isinstance(item, list):
+                try:
+                    self.__batch.draw(run)
+                except Exception as e:
+                    log.warning(e, exc_info=True)
+                run += 1
+                continue
 
             try:
-                obj.draw2D(self.canvas, zpos, axes)
+                item.draw2D(self.canvas, zpos, axes)
             except Exception as e:
                 log.warning(e, exc_info=True)
 
@@ -371,6 +417,18 @@ class AnnotationObject(globject.GLSimpleObject, props.HasProperties):
 
     Subclasses must, at the very least, override the
     :meth:`globject.GLObject.vertices2D` method.
+
+    Sub-classes which are drawn with the default :meth:`draw2D`
+    implementation, using only the ``GL_TRIANGLES`` primitive, may set the
+    :attr:`batchable` attribute to ``True``, and override the
+    :meth:`vertexState` method, so that they can be drawn by an
+    :class:`AnnotationBatch`.
+    """
+
+
+    batchable = False
+    """Class-level attribute which specifies whether annotations of this
+    type can be drawn by an :class:`AnnotationBatch`.
     """
 
 
@@ -561,6 +619,17 @@ class AnnotationObject(globject.GLSimpleObject, props.HasProperties):
             return self.lineWidth * max((1 / cw, 1 / ch))
 
 
+    def vertexState(self):
+        """Must be implemented by :attr:`batchable` sub-classes. Returns a
+        tuple containing the values of all attributes, other than those
+        defined on the ``AnnotationObject`` class, that the vertices returned
+        by :meth:`vertices2D` depend upon. This is used by the
+        :class:`AnnotationBatch` to determine when vertices need to be
+        re-generated.
+        """
+        raise NotImplementedError()
+
+
     def vertices2D(self, zpos, axes):
         """Must be implemented by sub-classes which rely on the default
         :meth:`draw2D` implementation. Generates and returns verticws to
@@ -637,6 +706,194 @@ class AnnotationObject(globject.GLSimpleObject, props.HasProperties):
         self.__draw(canvas, vertices, xform)
 
 
+class AnnotationBatch:
+    """An ``AnnotationBatch`` is used by an :class:`Annotations` object to
+    draw :attr:`AnnotationObject.batchable` annotations in 2D.
+
+    Rather than each annotation generating and uploading its vertices on
+    every draw, the ``AnnotationBatch`` stores the vertices of all batched
+    annotations in a single vertex buffer, and draws consecutive annotations
+    which have the same colour with a single draw call. Annotations are
+    always drawn in the order in which they were added, so that they
+    overlap one another as they would if they were drawn individually.
+
+    The vertices for each annotation are cached, and are only re-generated
+    when the annotation changes (see :meth:`AnnotationObject.vertexState`),
+    or when the slice, line width or canvas zoom changes. The vertex buffer
+    is only re-uploaded when the vertices of any annotation have changed, or
+    when annotations are added, removed, enabled or disabled.
+
+    Annotations are passed to the :meth:`update` method as a sequence of
+    runs, where each run is a list of annotations which can be drawn
+    together. Each run is then drawn via the :meth:`draw` method.
+    """
+
+
+    def __init__(self, annot):
+        """Create an ``AnnotationBatch``.
+
+        :arg annot: The :class:`Annotations` object that owns this
+                    ``AnnotationBatch``.
+        """
+
+        self.__annot  = annot
+        self.__shader = None
+
+        # { id(obj) : (key, vertices) } - see update
+        self.__vertices = {}
+
+        # Key describing the contents of the
+        # vertex buffer - if the key passed to
+        # update is the same, nothing needs to
+        # be re-uploaded.
+        self.__key = None
+
+        # [[(colour, applyMvp, offset, count)]],
+        # one list for each run, describing
+        # the vertex ranges to draw.
+        self.__runs = []
+
+
+    def destroy(self):
+        """Must be called when this ``AnnotationBatch`` is no longer needed.
+        Destroys the shader program.
+        """
+        if self.__shader is not None:
+            self.__shader.destroy()
+        self.__shader   = None
+        self.__vertices = {}
+        self.__runs     = []
+
+
+    @staticmethod
+    def objectKey(obj, zpos, axes):
+        """Returns a tuple containing all of the values that the vertices
+        and colour of the given :class:`AnnotationObject` depend upon.
+        """
+        return (obj.vertexState(),
+                tuple(obj.colour[:3]),
+                obj.alpha,
+                obj.lineWidth,
+                obj.normalisedLineWidth,
+                obj.applyMvp,
+                zpos,
+                tuple(axes))
+
+
+    def update(self, runs, zpos, axes):
+        """Prepares the given runs of annotations for drawing. The vertices
+        of any annotations which have changed are re-generated, and if
+        necessary the vertex buffer is re-uploaded.
+
+        :arg runs: Sequence of lists of :class:`AnnotationObject` instances.
+        :arg zpos: Position along the Z axis
+        :arg axes: Display coordinate system axis mapping to the screen
+                   coordinate system.
+        """
+
+        cache   = self.__vertices
+        newKeys = {}
+        key     = []
+
+        for run in runs:
+            runKey = []
+            for obj in run:
+                okey = self.objectKey(obj, zpos, axes)
+                newKeys[id(obj)] = (obj, okey)
+                runKey.append((id(obj), okey))
+            key.append(tuple(runKey))
+
+        key = tuple(key)
+
+        if key == self.__key:
+            return
+
+        # Re-generate vertices for any annotations
+        # which have changed, and discard cached
+        # vertices for annotations which are no
+        # longer being drawn.
+        vertices = {}
+        for oid, (obj, okey) in newKeys.items():
+            cached = cache.get(oid, None)
+            if cached is not None and cached[0] == okey:
+                vertices[oid] = cached
+                continue
+
+            verts = obj.vertices2D(zpos, axes)
+            if verts is None or len(verts) == 0:
+                verts = np.zeros((0, 3), dtype=np.float32)
+            else:
+                verts = np.vstack([v[1] for v in verts])
+            vertices[oid] = (okey, np.asarray(verts, dtype=np.float32))
+
+        # Generate a single vertex array for
+        # all runs. Consecutive annotations
+        # with the same colour are merged into
+        # a single range, but annotations are
+        # not re-ordered, so that they are
+        # drawn on top of one another in the
+        # order in which they were added.
+        allVerts = []
+        allRuns  = []
+        offset   = 0
+
+        for run in runs:
+            ranges = []
+            for obj in run:
+                verts  = vertices[id(obj)][1]
+                count  = len(verts)
+                colour = tuple(obj.colour[:3]) + (obj.alpha / 100.0, )
+                group  = (colour, obj.applyMvp)
+
+                if count == 0:
+                    continue
+
+                allVerts.append(verts)
+
+                if len(ranges) > 0 and ranges[-1][:2] == group:
+                    roff, rcount = ranges[-1][2:]
+                    ranges[-1]   = group + (roff, rcount + count)
+                else:
+                    ranges.append(group + (offset, count))
+                offset += count
+            allRuns.append(ranges)
+
+        if self.__shader is None:
+            self.__shader = self.__annot.createShader()
+
+        if offset > 0:
+            with self.__shader.loaded():
+                self.__shader.setAtt('vertex', np.vstack(allVerts))
+
+        self.__vertices = vertices
+        self.__runs     = allRuns
+        self.__key      = key
+
+
+    def draw(self, run):
+        """Draws the annotations in the specified run. Must be called after
+        :meth:`update`.
+
+        :arg run: Index of the run to draw.
+        """
+
+        ranges = self.__runs[run]
+        shader = self.__shader
+
+        if len(ranges) == 0:
+            return
+
+        canvasMvp = self.__annot.canvas.mvpMatrix
+        identity  = np.eye(4, dtype=np.float32)
+
+        with shader.loaded(), shader.loadedAtts():
+            for colour, applyMvp, offset, count in ranges:
+                if applyMvp: shader.set('MVP', canvasMvp)
+                else:        shader.set('MVP', identity)
+                shader.set( 'colour', colour)
+                shader.draw(gl.GL_TRIANGLES, offset, count)
+
+
 class Point(AnnotationObject):
     """The ``Point`` class is an :class:`AnnotationObject` which represents a
     point, drawn as a small crosshair. The size of the point is proportional
@@ -644,6 +901,11 @@ class Point(AnnotationObject):
     """
 
 
+    batchable = True
+    """``Point`` annotations can be drawn by an :class:`AnnotationBatch`.
+    """
+
+
     def __init__(self, annot, x, y, z=None, **kwargs):
         """Create a ``Point`` annotation.
 
@@ -665,6 +927,11 @@ class Point(AnnotationObject):
         self.z = z
 
 
+    def vertexState(self):
+        """Returns the ``Point`` coordinates. """
+        return (self.x, self.y)
+
+
     def vertices2D(self, zpos, axes):
         """Returns vertices to draw this ``Point`` annotation. """
 
@@ -734,6 +1001,12 @@ class Line(AnnotationObject):
     """
 
 
+    batchable = True
+    """``Line`` (and :class:`Arrow`) annotations can be drawn by an
+    :class:`AnnotationBatch`.
+    """
+
+
     def __init__(self, annot, x1, y1, x2, y2, z1=None, z2=None, **kwargs):
         """Create a ``Line`` annotation.
 
@@ -759,6 +1032,11 @@ class Line(AnnotationObject):
         self.z2 = z2
 
 
+    def vertexState(self):
+        """Returns the ``Line`` end point coordinates. """
+        return (self.x1, self.y1, self.x2, self.y2)
+
+
     def vertices2D(self, zpos, axes):
         """Returns a set of vertices for drawing this line on a 2D plane,
         with the ``GL_TRIANGLES`` primitive.
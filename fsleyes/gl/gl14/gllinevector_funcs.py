@@ -15,7 +15,8 @@ instances.
 
 
 A :class:`.GLLineVertices` instance is used to generate line vertices and
-texture coordinates for each voxel in the image. A fragment shader (the same
+texture coordinates for the voxels in each slice that is drawn. A fragment
+shader (the same
 as that used by the :class:`.GLRGBVector` class) is used to colour each line
 according to the orientation of the underlying vector.
 """
@@ -106,7 +106,7 @@ def updateShaderState(self):
     # for looking up an appropriate colour
     # in the 1D colour map texture.
     voxValXform = affine.concat(self.cmapTexture.getCoordinateTransform(),
-                                self.imageTexture.voxValXform)
+                                self.displayTexture.voxValXform)
     voxValXform = [voxValXform[0, 0], voxValXform[0, 3], 0, 0]
 
     # And the clipping range, normalised
@@ -120,7 +120,7 @@ def updateShaderState(self):
     imageIsMod   = 1 if opts.modulateImage is None else -1
     fullModXform = self.getModulateValueXform()
 
-    imgXform = self.imageTexture.invVoxValXform
+    imgXform = self.displayTexture.invVoxValXform
     if opts.clipImage:     clipXform = self.clipTexture.invVoxValXform
     else:                  clipXform = imgXform
     if opts.modulateImage: modXform  = self.modulateTexture.invVoxValXform
@@ -54,8 +54,10 @@ def compileShaders(self):
         self.shaders[colourMode][clipMode].append(shader)
 
 
-def draw2D(self, canvas, mvp):
-    """Called by :class:`.GLTractogram.draw2D`. """
+def draw2D(self, canvas, mvp, first, count):
+    """Called by :class:`.GLTractogram.draw2D`. Draws ``count`` vertices,
+    starting from vertex ``first``.
+    """
 
     opts       = self.opts
     colourMode = opts.effectiveColourMode
@@ -71,13 +73,16 @@ def draw2D(self, canvas, mvp):
 
     gl.glPolygonMode(gl.GL_FRONT_AND_BACK, gl.GL_FILL)
 
-    with shader.loaded(), shader.loadedAtts():
+    # Per-vertex attributes are offset so
+    # that the first instance corresponds
+    # to the first vertex to be drawn
+    with shader.loaded(), shader.loadedAtts(firstInstance=first):
         shader.set(   'MVP',          mvp)
         shader.setAtt('circleVertex', vertices)
         glexts.glDrawArraysInstanced(gl.GL_TRIANGLE_FAN,
                                      0,
                                      len(vertices),
-                                     len(self.vertices))
+                                     count)
 
 
 def draw3D(self, canvas, xform=None):
@@ -93,7 +98,7 @@ def draw3D(self, canvas, xform=None):
     lineWidth  = opts.lineWidth
     offsets    = self.offsets
     counts     = self.counts
-    nstrms     = len(offsets)
+    nstrms     = self.nstreamlines
     shader     = self.shaders[colourMode][clipMode][0]
 
     if xform is None: xform = vertXform
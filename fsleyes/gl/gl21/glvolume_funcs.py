@@ -81,7 +81,7 @@ def updateShaderState(self):
     # range, but the shader needs them to be in image
     # texture value range (0.0 - 1.0). So let's scale
     # them.
-    imgXform = self.imageTexture.invVoxValXform
+    imgXform = self.displayTexture.invVoxValXform
     if imageIsClip: clipXform = imgXform
     else:           clipXform = self.clipTexture.invVoxValXform
     if imageIsMod:  modXform  = imgXform
@@ -98,7 +98,7 @@ def updateShaderState(self):
     modZero    = 0.0                   * modXform[ 0, 0] + modXform[ 0, 3]
     clipZero   = 0.0                   * clipXform[0, 0] + clipXform[0, 3]
     imageShape = self.image.shape[:3]
-    texShape   = self.imageTexture.shape[:3]
+    texShape   = self.displayTexture.shape[:3]
 
     if len(texShape) == 2:
         texShape = list(texShape) + [1]
@@ -114,7 +114,7 @@ def updateShaderState(self):
     # values to colour map texture coordinates.
     img2CmapXform = affine.concat(
         self.cmapTexture.getCoordinateTransform(),
-        self.imageTexture.voxValXform)
+        self.displayTexture.voxValXform)
 
     shader.load()
 
@@ -86,8 +86,10 @@ def compileShaders(self):
         self.shaders[colourMode][clipMode].extend(progs)
 
 
-def draw2D(self, canvas, mvp):
-    """Called by :class:`.GLTractogram.draw2D`. """
+def draw2D(self, canvas, mvp, first, count):
+    """Called by :class:`.GLTractogram.draw2D`. Draws ``count`` vertices,
+    starting from vertex ``first``.
+    """
     opts       = self.opts
     colourMode = opts.effectiveColourMode
     clipMode   = opts.effectiveClipMode
@@ -100,7 +102,7 @@ def draw2D(self, canvas, mvp):
         shader.set('MVP',    mvp)
         shader.set('xscale', scales[0])
         shader.set('yscale', scales[1])
-        shader.draw(gl.GL_POINTS, 0,  len(self.vertices))
+        shader.draw(gl.GL_POINTS, first, count)
 
 
 def draw3D(self, canvas, xform=None):
@@ -116,11 +118,10 @@ def draw3D(self, canvas, xform=None):
     mv         = canvas.viewMatrix
     lighting   = canvas.opts.light
     lightPos   = affine.transform(canvas.lightPos, mvp)
-    nstrms     = ovl.nstreamlines
     lineWidth  = self.normalisedLineWidth(canvas, mvp)
     offsets    = self.offsets
     counts     = self.counts
-    nstrms     = len(offsets)
+    nstrms     = self.nstreamlines
 
     if opts.resolution <= 2: geom = 'line'
     else:                    geom = 'tube'
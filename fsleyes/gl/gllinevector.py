@@ -13,10 +13,12 @@ when running in OpenGL 1.4. See the :mod:`.gl14.gllinevector_funcs` and
 """
 
 import logging
+import collections
 
 import numpy                as np
 import fsl.data.dtifit      as dtifit
 import fsl.transform.affine as affine
+import fsl.utils.settings   as fslsettings
 import fsleyes.gl           as fslgl
 import fsleyes.gl.routines  as glroutines
 import fsleyes.gl.glvector  as glvector
@@ -221,7 +223,7 @@ class GLLineVector(glvector.GLVector):
 class GLLineVertices:
     """The ``GLLineVertices`` class is used when rendering a
     :class:`GLLineVector` with OpenGL 1.4. It contains logic to generate
-    vertices for every vector in the vector :class:`.Image` that is being
+    vertices for the vectors in the vector :class:`.Image` that is being
     displayed by a ``GLLineVector`` instance.
 
 
@@ -232,15 +234,19 @@ class GLLineVertices:
     so cannot retrieve the vector data.
 
 
-    After a ``GLLineVertices`` instance has been created, the :meth:`refresh`
-    method can be used to generate line vector vertices and voxel
-    coordinates for every voxel in the :class:`Image`. These vertices and
-    coordinates are stored as attributes of the ``GLLineVertices`` instance.
+    When the line vectors from a 2D slice of the image need to be displayed,
+    the :meth:`getVertices2D` method can be used to generate the vertices
+    and voxel coordinates for the slice. Vertices are only generated for the
+    requested slice, and are cached, along with the triangles generated from
+    them, in least recently used order, so that slices which are drawn
+    repeatedly do not need to be re-generated. The number of cached slices is
+    controlled by the ``fsleyes.linevector.cacheSize`` setting (default 64).
 
 
-    Later, when the line vectors from a 2D slice  of the image need to be
-    displayed, the :meth:`getVertices2D` method can be used to extract the
-    vertices and coordinates from the slice.
+    Cached slices are keyed by the slice location and by the value returned
+    by :meth:`calculateHash`, so they do not need to be cleared when the
+    display properties change - the :meth:`refresh` method simply discards
+    slices which were generated with different display properties.
 
 
     A ``GLLineVertices`` instance is not associated with a specific
@@ -251,15 +257,27 @@ class GLLineVertices:
     passed to most of the methods of a ``GLLineVertices`` instance.
     """
 
-    def __init__(self, glvec):
-        """Create a ``GLLineVertices``. Vertices are calculated for the
-        given :class:`.GLLineVector` instance.
+    def __init__(self, glvec, cacheSize=None):
+        """Create a ``GLLineVertices``.
 
-        :arg glvec: A :class:`GLLineVector` which is using this
-                    ``GLLineVertices`` instance.
+        :arg glvec:     A :class:`GLLineVector` which is using this
+                        ``GLLineVertices`` instance.
+        :arg cacheSize: Maximum number of slices to cache. Defaults to the
+                        ``fsleyes.linevector.cacheSize`` setting.
         """
 
-        self.__hash = None
+        if cacheSize is None:
+            cacheSize = fslsettings.read('fsleyes.linevector.cacheSize', 64)
+
+        self.__hash      = None
+        self.__cacheSize = max(1, int(cacheSize))
+
+        # { (zax, zpos, hash, xform) : slice },
+        # in least recently used order, where
+        # each slice is a dict - see
+        # getVertices2D.
+        self.__slices = collections.OrderedDict()
+
         self.refresh(glvec)
 
 
@@ -267,8 +285,7 @@ class GLLineVertices:
         """Should be called when this ``GLLineVertices`` instance is no
         longer needed. Clears references to cached vertices/coordinates.
         """
-        self.vertices  = None
-        self.voxCoords = None
+        self.__slices.clear()
 
 
     def __hash__(self):
@@ -295,30 +312,40 @@ class GLLineVertices:
         call to :meth:`refresh`).
         """
         opts = glvec.opts
-        return (hash(opts.transform)  ^
-                hash(opts.orientFlip) ^
-                hash(opts.directed)   ^
-                hash(opts.unitLength) ^
-                hash(opts.lengthScale))
+        return hash((opts.transform,
+                     opts.orientFlip,
+                     opts.directed,
+                     opts.unitLength,
+                     opts.lengthScale))
 
 
     def refresh(self, glvec):
-        """(Re-)calculates the vertices  of this ``GLLineVertices`` instance.
+        """Must be called when the properties used by :meth:`calculateHash`
+        change. Discards any cached slices which were generated with
+        different properties. Vertices are not generated until they are
+        requested via :meth:`getVertices2D`.
+        """
+
+        self.__hash   = self.calculateHash(glvec)
+        self.__slices = collections.OrderedDict(
+            (k, v) for k, v in self.__slices.items() if k[2] == self.__hash)
+
 
-        For each voxel, in the :class:`.Image` overlay being displayed by the
-        :class:`GLLineVector` associated with this ``GLLineVertices``
-        instance, two vertices are generated, which define a line that
+    def generateVertices(self, glvec, coords):
+        """Generates line vertices for the vectors at the given voxels.
+
+        For each voxel, two vertices are generated, which define a line that
         represents the vector at the voxel.
 
-        The vertices are stored as a :math:`X\\times Y\\times Z\\times
-        2\\times 3` ``numpy`` array, as an attribute of this instance,
-        called ``vertices``.
+        :arg glvec:  The :class:`GLLineVector`
+        :arg coords: A ``(3, N)`` array of integer voxel coordinates
+        :returns:    A ``(N * 2, 3)`` ``numpy`` array containing the line
+                     vertices.
         """
 
         opts  = glvec.opts
         image = glvec.vectorImage
-        data  = image.data
-        shape = image.shape
+        data  = image.data[coords[0], coords[1], coords[2]]
 
         # Pull out the xyz components of the
         # vectors, and calculate vector lengths.
@@ -326,12 +353,11 @@ class GLLineVertices:
         # The image may either
         # have shape (X, Y, Z, 3)
         if image.nvals == 1:
-            vertices = np.array(data, dtype=np.float32)
+            vertices = np.array(data, dtype=np.float32).reshape(-1, 3)
         # Or (we assume) a RGB
         # structured array
         else:
-            vertices         = np.zeros(list(data.shape) + [3],
-                                        dtype=np.float32)
+            vertices         = np.zeros((len(data), 3), dtype=np.float32)
             vertices[..., 0] = (data['R'].astype(np.float32) / 127.5) - 1
             vertices[..., 1] = (data['G'].astype(np.float32) / 127.5) - 1
             vertices[..., 2] = (data['B'].astype(np.float32) / 127.5) - 1
@@ -360,6 +386,9 @@ class GLLineVertices:
             # mm (e.g. the FSL coordinate system).
             vertices /= (image.pixdim[:3] / min(image.pixdim[:3]))
 
+        elif opts.orientFlip:
+            vertices[..., 0] = x
+
         # Scale the vectors by the length scaling factor
         vertices *= opts.lengthScale / 100.0
 
@@ -370,66 +399,90 @@ class GLLineVertices:
         # add an origin point for each vector.
         if opts.directed:
             origins  = np.zeros(vertices.shape, dtype=np.float32)
-            vertices = np.concatenate((origins, vertices), axis=3)
+            vertices = np.concatenate((origins, vertices), axis=1)
         else:
-            vertices = np.concatenate((-vertices, vertices), axis=3)
-
-        vertices = vertices.reshape((shape[0],
-                                     shape[1],
-                                     shape[2],
-                                     2,
-                                     3))
+            vertices = np.concatenate((-vertices, vertices), axis=1)
 
-        self.vertices = vertices
-        self.__hash   = self.calculateHash(glvec)
+        return vertices.reshape(-1, 3)
 
 
     def getVertices2D(self, glvec, canvas, zpos, axes, bbox=None):
-        """Extracts and returns a slice of line vertices, and the associated
-        voxel coordinates, which are in a plane located at the given Z
-        position (in display coordinates).
+        """Returns a slice of line vertices, and the associated voxel
+        coordinates, which are in a plane located at the given Z position (in
+        display coordinates).
 
         The line vertices are transformed into rectangular polygons, suitable
         for being drawn with the ``GL_TRIANGLES`` primitive.
 
-        This method assumes that the :meth:`refresh` method has already been
-        called.
+        Vertices are generated for the whole slice, and are cached, so the
+        ``bbox`` argument is ignored - cached slices can then be re-used when
+        the view is panned or zoomed. The polygons are re-generated when the
+        line width (in the vector coordinate system) changes.
+
+        :returns: A tuple containing the polygon vertices, the triangle
+                  indices, and the voxel coordinates of each vertex. These
+                  arrays are cached, so must not be modified.
         """
 
-        opts   = glvec.opts
-        image  = glvec.image
-        shape  = image.shape[:3]
-        zax    = axes[2]
+        opts      = glvec.opts
+        zax       = axes[2]
+        lineWidth = glvec.normalisedLineWidth(canvas)
+        v2d       = opts.getTransform('voxel', 'display')
+        key       = (zax,
+                     float(zpos),
+                     self.calculateHash(glvec),
+                     np.asarray(v2d).tobytes())
+
+        slc = self.__slices.get(key, None)
+
+        if slc is None:
+            slc                = self.__generateSlice(glvec, zpos, axes)
+            self.__slices[key] = slc
+            while len(self.__slices) > self.__cacheSize:
+                self.__slices.popitem(last=False)
+        else:
+            self.__slices.move_to_end(key)
+
+        # Convert line segments into rectangles so
+        # we can draw lines at arbitrary widths.
+        if slc['lineWidth'] != lineWidth:
+            vertices, indices = glroutines.lineAsPolygon(slc['lines'],
+                                                         lineWidth,
+                                                         zax,
+                                                         indices=True)
+
+            if not vertices.flags['C_CONTIGUOUS']:
+                vertices = np.ascontiguousarray(vertices)
 
-        vertices  = self.vertices
-        voxCoords = glvec.generateVoxelCoordinates2D(zpos, axes, bbox)
+            slc['lineWidth'] = lineWidth
+            slc['vertices']  = vertices
+            slc['indices']   = indices
+
+        return slc['vertices'], slc['indices'], slc['voxCoords']
+
+
+    def __generateSlice(self, glvec, zpos, axes):
+        """Used by :meth:`getVertices2D`. Generates line vertices and voxel
+        coordinates for the slice at ``zpos``. Returns a dict containing
+        the line vertices (``'lines'``), and the voxel coordinates for each
+        polygon vertex (``'voxCoords'``).
+        """
+
+        image     = glvec.vectorImage
+        voxCoords = glvec.generateVoxelCoordinates2D(zpos, axes)
 
         # Turn the voxel coordinates into
         # indices suitable for looking up
-        # the corresponding vertices
+        # the corresponding vectors
         coords = np.array(np.floor(voxCoords + 0.5), dtype=np.int32)
 
         # remove any out-of-bounds voxel coordinates
-        shape     = np.array(vertices.shape[:3])
+        shape     = np.array(image.shape[:3])
         inBounds  = ((coords >= [0, 0, 0]) & (coords < shape)).all(1)
         coords    = coords[   inBounds, :].T
         voxCoords = voxCoords[inBounds, :]
 
-        # pull out the vertex data
-        # corresponding to the voxels
-        vertices = vertices[coords[0], coords[1], coords[2], :, :]
-        vertices = vertices.reshape(-1, 3)
-
-        # Convert line segments into rectangles so
-        # we can draw lines at arbitrary widths.
-        lineWidth         = glvec.normalisedLineWidth(canvas)
-        vertices, indices = glroutines.lineAsPolygon(vertices,
-                                                     lineWidth,
-                                                     zax,
-                                                     indices=True)
-
-        if not vertices.flags['C_CONTIGUOUS']:
-            vertices = np.ascontiguousarray(vertices)
+        lines = self.generateVertices(glvec, coords)
 
         # We are drawing each line with four vertices
         # (rectangle made of two triangles). So we
@@ -437,4 +490,8 @@ class GLLineVertices:
         # vertex.
         voxCoords = voxCoords.repeat(repeats=4, axis=0)
 
-        return vertices, indices, voxCoords
+        return {'lines'     : lines,
+                'voxCoords' : voxCoords,
+                'lineWidth' : None,
+                'vertices'  : None,
+                'indices'   : None}
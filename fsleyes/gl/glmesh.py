@@ -13,12 +13,13 @@ import numpy        as np
 import numpy.linalg as npla
 import OpenGL.GL    as gl
 
-from . import                  globject
-import fsl.data.utils       as dutils
-import fsl.transform.affine as affine
-import fsleyes.gl           as fslgl
-import fsleyes.gl.routines  as glroutines
-import fsleyes.gl.textures  as textures
+from . import                    globject
+import fsl.data.utils         as dutils
+import fsl.transform.affine   as affine
+import fsleyes.data.meshindex as meshindex
+import fsleyes.gl             as fslgl
+import fsleyes.gl.routines    as glroutines
+import fsleyes.gl.textures    as textures
 
 
 class GLMesh(globject.GLObject):
@@ -400,13 +401,13 @@ class GLMesh(globject.GLObject):
     def draw2DOutlineEnabled(self):
         """Only relevent for 2D rendering. Returns ``True`` if outline mode
         should be used, ``False`` otherwise.
-        """
 
-        opts    = self.opts
-        overlay = self.overlay
+        Outline mode does not require ``trimesh`` - plane intersections are
+        calculated by the :class:`.MeshFaceIndex`, using ``numpy`` only.
+        """
 
-        return ((overlay.trimesh is not None) and
-                (opts.outline or opts.vertexData is not None))
+        opts = self.opts
+        return opts.outline or opts.vertexData is not None
 
 
     def preDraw(self):
@@ -797,9 +798,11 @@ class GLMesh(globject.GLObject):
 
 
     def calculateIntersection(self, zpos, axes, bbox=None):
-        """Uses the :func:`.Mesh.planeIntersection` method to
-        calculate the intersection of the mesh with the viewing plane at
-        the given ``zpos``.
+        """Uses a :class:`.MeshFaceIndex` to calculate the intersection of
+        the mesh with the viewing plane at the given ``zpos``. Intersections
+        are cached by the ``MeshFaceIndex``, which is shared by all
+        ``GLMesh`` instances for the same :class:`.Mesh`, so repeated draws
+        of the same slice do not need to be re-calculated.
 
         :arg zpos:  Z axis coordinate at which the intersection is to be
                     calculated
@@ -808,6 +811,9 @@ class GLMesh(globject.GLObject):
 
         :arg bbox:  A tuple containing a ``([xlo, ylo, zlo], [xhi, yhi, zhi])``
                     bounding box to which the calculation can be restricted.
+                    Currently ignored - intersections are calculated for the
+                    whole plane, so that they can be re-used when the view
+                    is panned or zoomed.
 
         :returns: A tuple containing:
 
@@ -832,27 +838,13 @@ class GLMesh(globject.GLObject):
                   index of the display Z axis.
         """
 
-        overlay     = self.overlay
-        zax         = axes[2]
-        opts        = self.opts
-        origin      = [0] * 3
-        normal      = [0] * 3
-        origin[zax] = zpos
-        normal[zax] = 1
-
-        vertXform = opts.getTransform(           'mesh',    'display')
-        origin    = opts.transformCoords(origin, 'display', 'mesh')
-        normal    = opts.transformCoords(normal, 'display', 'mesh',
-                                         vector=True)
-
-        # TODO use bbox to constrain? This
-        #      would be nice, but is not
-        #      supported by trimesh.
-        lines, faces, dists = overlay.planeIntersection(
-            normal, origin, distances=True)
-
-        lines = np.asarray(lines, dtype=np.float32)
-        faces = np.asarray(faces, dtype=np.uint32)
+        overlay   = self.overlay
+        zax       = axes[2]
+        opts      = self.opts
+        vertXform = opts.getTransform('mesh', 'display')
+        index     = meshindex.faceIndex(overlay)
+
+        lines, faces, dists = index.planeIntersection(zax, zpos, vertXform)
 
         # cache the line vertices for other
         # things which might be interested.
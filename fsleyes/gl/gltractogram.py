@@ -60,6 +60,24 @@ class GLTractogram(globject.GLObject):
         self.imageTextures  = textures.AuxImageTextureManager(
             self, colour=None, clip=None)
 
+        # For 2D views, vertices are sorted by
+        # their depth in the display coordinate
+        # system, so that only the vertices
+        # within a slice need to be drawn. The
+        # depthKey identifies the depth axis and
+        # display transform used for the sort,
+        # and depths contains the sorted depths
+        # (see updateStreamlineData/sliceRange).
+        self.depthKey       = None
+        self.depths         = None
+
+        # The subsample used in the most recent
+        # call to updateStreamlineData, and the
+        # number of streamlines to draw in 3D
+        # (see updateSubsample).
+        self.subsample      = None
+        self.nstreamlines   = 0
+
         self.compileShaders()
         self.updateStreamlineData()
         self.refreshImageTexture('clip')
@@ -89,8 +107,8 @@ class GLTractogram(globject.GLObject):
         def refresh(*_):
             self.notify()
 
-        def data(*_):
-            self.updateStreamlineData()
+        def subsamp(*_):
+            self.updateSubsample()
             self.notify()
 
         def shader(*_):
@@ -110,7 +128,7 @@ class GLTractogram(globject.GLObject):
             self.notifyWhen(self.ready)
 
         opts   .addListener('resolution',          name, shader,  weak=False)
-        opts   .addListener('subsample',           name, data,    weak=False)
+        opts   .addListener('subsample',           name, subsamp, weak=False)
         opts   .addListener('colourMode',          name, colour,  weak=False)
         opts   .addListener('clipMode',            name, clip,    weak=False)
         opts   .addListener('lineWidth',           name, refresh, weak=False)
@@ -325,13 +343,22 @@ class GLTractogram(globject.GLObject):
 
     def updateStreamlineData(self):
         """Prepares streamline data and passes it to GL. This method is called
-        on creation, and whenever the :attr:`.TractogramOpts.subsample` setting
-        changes.
+        on creation, and, for 2D views, whenever the
+        :attr:`.TractogramOpts.subsample` setting changes.
+
+        Streamlines are subsampled according to the
+        :attr:`.Tractogram.lodOrder`, so that a given subsample percentage
+        always selects the same streamlines.
 
         For 2D views (ortho/lightbox), the tractogram is drawn as ``GL_POINT``
-        points using glDrawArrays (or equivalent). For 3D views, streamlines
-        are drawn as ``GL_LINE_STRIP`` lines using offsets/counts into the
-        vertex array.
+        points using glDrawArrays (or equivalent). Once the depth axis is
+        known (see :meth:`draw2D`), vertices are sorted by their depth, so
+        that each slice can be drawn from a contiguous range of the vertex
+        array (see :meth:`sliceRange`). For 3D views, streamlines are drawn
+        as ``GL_LINE_STRIP`` lines using offsets/counts into the vertex array.
+        All vertices are uploaded, and the offsets/counts are stored in level
+        of detail order, so that a subsample is just a prefix of them (see
+        :meth:`updateSubsample`).
         """
 
         ovl         = self.overlay
@@ -342,28 +369,40 @@ class GLTractogram(globject.GLObject):
         kwargs      = self.shaderAttributeArgs()
         threedee    = self.threedee
         indices     = None
-
-        # randomly select a subset of streamlines
-        # (3D) or vertices (2D).
-        if subsamp < 100:
-            if threedee: lim = nstrms
-            else:        lim = nverts
-            n       = int(lim * subsamp / 100)
-            indices = np.random.choice(lim, n)
-            indices = np.sort(indices)
-
-            if threedee:
-                vertices, offsets, counts, indices = ovl.subset(indices)
-                orients = ovl.vertexOrientations[indices]
-            else:
-                offsets, counts = [0], [0]
-                vertices        = ovl.vertices[          indices]
-                orients         = ovl.vertexOrientations[indices]
+        self.depths = None
+
+        # Select the vertices of a subset
+        # of streamlines for 2D views
+        if not threedee and subsamp < 100:
+            n       = int(nstrms * subsamp / 100)
+            indices = np.sort(ovl.lodOrder[:n])
+            indices = ovl.vertexIndices(indices)
+
+        # Sort vertices by depth for 2D views.
+        # The sort order is folded into the
+        # indices, so that it is also applied
+        # to the vertex/clip data.
+        if not threedee and self.depthKey is not None:
+            zax, xform = self.depthKey
+            xform      = np.frombuffer(xform).reshape(4, 4)
+            if indices is None:
+                indices = np.arange(nverts, dtype=np.uint32)
+            depths      = ovl.vertices[indices] @ xform[zax, :3]
+            depths     += xform[zax, 3]
+            order       = np.argsort(depths, kind='stable')
+            indices     = indices[order]
+            self.depths = depths[order]
+
+        if indices is not None:
+            offsets, counts = [0], [0]
+            vertices        = ovl.vertices[          indices]
+            orients         = ovl.vertexOrientations[indices]
         else:
+            lod      = ovl.lodOrder
             vertices = ovl.vertices
             orients  = ovl.vertexOrientations
-            offsets  = ovl.offsets
-            counts   = ovl.lengths
+            offsets  = ovl.offsets[lod]
+            counts   = ovl.lengths[lod]
 
         # Orientation is used for RGB colouring.
         # We have to apply abs so that GL doesn't
@@ -375,6 +414,11 @@ class GLTractogram(globject.GLObject):
         self.offsets  =        np.asarray(offsets,  dtype=np.int32)
         self.counts   =        np.asarray(counts,   dtype=np.int32)
         self.indices  = indices
+        self.subsample    = subsamp
+        self.nstreamlines = len(self.offsets)
+
+        if threedee:
+            self.nstreamlines = int(self.nstreamlines * subsamp / 100)
 
         # upload vertices/orients/indices to GL.
         # For 3D, offsets/counts are passed on
@@ -392,6 +436,42 @@ class GLTractogram(globject.GLObject):
             self.updateClipData()
 
 
+    def updateSubsample(self):
+        """Called when the :attr:`.TractogramOpts.subsample` setting
+        changes. For 3D views, updates ``nstreamlines``, the number of
+        streamlines to draw, without any data being passed to GL. For 2D
+        views, calls :meth:`updateStreamlineData`.
+        """
+
+        subsamp = self.opts.subsample
+
+        if subsamp == self.subsample:
+            return
+
+        if self.threedee:
+            self.subsample    = subsamp
+            self.nstreamlines = int(len(self.offsets) * subsamp / 100)
+        else:
+            self.updateStreamlineData()
+
+
+    def sliceRange(self, zlo, zhi):
+        """Used by :meth:`draw2D`. Returns the range of vertices which
+        lie within the given depth range, as a tuple containing the index of
+        the first vertex, and the number of vertices. If the vertices have
+        not been sorted by depth, the range covers all vertices. If no
+        vertices lie within the range (including when ``zlo > zhi``), the
+        number of vertices is zero.
+        """
+        if self.depths is None:
+            return 0, len(self.vertices)
+
+        first = np.searchsorted(self.depths, zlo, side='left')
+        last  = np.searchsorted(self.depths, zhi, side='right')
+
+        return int(first), int(max(0, last - first))
+
+
     def updateShaderState(self):
         """Passes display properties as uniform values to the shader programs.
         """
@@ -634,7 +714,22 @@ class GLTractogram(globject.GLObject):
         strm2disp = opts.displayTransform
         mvp       = affine.concat(projmat, viewmat, xform, strm2disp)
 
-        fslgl.gltractogram_funcs.draw2D(self, canvas, mvp)
+        # GL will clip everything outside of the
+        # slice, but we only submit the vertices
+        # which are within the slice, after
+        # sorting them by depth along the
+        # current depth axis if necessary.
+        depthKey = (zax, np.asarray(strm2disp, dtype=np.float64).tobytes())
+        if depthKey != self.depthKey:
+            self.depthKey = depthKey
+            self.updateStreamlineData()
+
+        first, count = self.sliceRange(zlo, zhi)
+
+        if count == 0:
+            return
+
+        fslgl.gltractogram_funcs.draw2D(self, canvas, mvp, first, count)
 
 
     def draw3D(self, *args, **kwargs):
@@ -15,8 +15,10 @@ import logging
 import numpy                     as np
 import OpenGL.GL                 as gl
 
+import fsleyes_widgets           as fwidgets
 import fsl.utils.idle            as idle
 import fsl.transform.affine      as affine
+import fsleyes.data.pyramid      as pyramid
 import fsleyes.gl                as fslgl
 import fsleyes.gl.routines       as glroutines
 import fsleyes.gl.shaders.filter as glfilter
@@ -181,7 +183,30 @@ class GLVolume(glimageobject.GLImageObject, globject.GLObject):
     ``renderTexture2``   The first :class:`.RenderTexture` used for 3D
                          rendering.
     ``texName``          A name used for the ``imageTexture``.
+    ``pyramid``          An :class:`.ImagePyramid` containing downsampled
+                         copies of the image data, or ``None`` if the image
+                         is not large enough to require one.
+    ``levelTexture``     A :class:`.PyramidLevelTexture` which is drawn
+                         instead of the ``imageTexture`` at low
+                         magnifications, or ``None``.
     ==================== ==================================================
+
+
+    **Multi-resolution display**
+
+
+    When a very large image (see :func:`.pyramid.usePyramid`) is displayed
+    in 2D, an :class:`.ImagePyramid` is used to calculate (or load from an
+    on-disk cache) downsampled copies of the image data in the background.
+    Before each draw, the :meth:`selectLevel` method compares the current
+    magnification with the downsampling factors of the available pyramid
+    levels - when one voxel is smaller than a display pixel, the coarsest
+    level which is still no coarser than one pixel is drawn instead of the
+    full resolution ``imageTexture`` (see :meth:`displayTexture`).
+
+    If the ``imageTexture`` is not yet ready, the finest available level is
+    drawn, so the image can be displayed straight away. Finer levels are
+    swapped in as they become available.
     """
 
 
@@ -214,6 +239,41 @@ class GLVolume(glimageobject.GLImageObject, globject.GLObject):
         # refer to the ImageTexture for a given image.
         self.texName  = '{}_{}'.format(type(self).__name__, id(self.image))
 
+        # Very large images are stored in a
+        # BrickedImageTexture when being drawn
+        # in 2D, so that only the bricks which
+        # are needed for the visible slices are
+        # loaded. Bricked textures are not
+        # shared with 3D GLVolumes, which need
+        # access to the entire volume.
+        self.bricked = (not threedee) and \
+            textures.brickedtexture.useBricks(self.image)
+
+        if self.bricked:
+            self.texName = '{}_bricked'.format(self.texName)
+
+        # Very large images being drawn in 2D
+        # are also given a multi-resolution
+        # pyramid, which is shared between all
+        # GLVolumes for the image. Pyramids are
+        # not used for off-screen rendering,
+        # as levels are calculated on demand
+        # in the background.
+        self.pyramid      = None
+        self.levelTexture = None
+
+        if (not threedee)        and \
+           fwidgets.haveGui()    and \
+           pyramid.usePyramid(self.image):
+            self.pyramid = glresources.get(
+                '{}_{}'.format(pyramid.ImagePyramid.__name__, id(self.image)),
+                pyramid.ImagePyramid,
+                self.image)
+            self.pyramid.register(self.name,
+                                  self.__pyramidChanged,
+                                  runOnIdle=True)
+            self.pyramid.build(self.opts.index()[3:])
+
         # Ref to an OpenGL shader program -
         # the glvolume_funcs module will
         # create this for us.
@@ -284,9 +344,20 @@ class GLVolume(glimageobject.GLImageObject, globject.GLObject):
 
         self.removeDisplayListeners()
 
+        if self.levelTexture is not None:
+            self.levelTexture.deregister(self.name)
+            glresources.delete(self.levelTexture.name)
+            self.levelTexture = None
+
         self.imageTexture.deregister(self.name)
         glresources.delete(self.imageTexture.name)
 
+        if self.pyramid is not None:
+            self.pyramid.deregister(self.name)
+            glresources.delete('{}_{}'.format(
+                pyramid.ImagePyramid.__name__, id(self.image)))
+            self.pyramid = None
+
         self.auxmgr .destroy()
         self.cmapmgr.destroy()
 
@@ -316,12 +387,26 @@ class GLVolume(glimageobject.GLImageObject, globject.GLObject):
 
 
     def texturesReady(self):
-        """Returns ``True`` if the ``imageTexture`` and ``clipTexture`` (if
-        applicable) are both ready to be used, ``False`` otherwise.
+        """Returns ``True`` if the ``imageTexture`` (or the ``levelTexture``)
+        and ``clipTexture`` (if applicable) are both ready to be used,
+        ``False`` otherwise.
         """
         imageTexReady = (self.imageTexture is not None and
                          self.imageTexture.ready())
-        return imageTexReady and self.auxmgr.texturesReady()
+        levelTexReady = (self.levelTexture is not None and
+                         self.levelTexture.ready())
+        return (imageTexReady or levelTexReady) and \
+            self.auxmgr.texturesReady()
+
+
+    @property
+    def displayTexture(self):
+        """Returns the texture which is currently being used to draw the
+        image - the ``levelTexture`` if one is in use, otherwise the
+        ``imageTexture``.
+        """
+        if self.levelTexture is not None: return self.levelTexture
+        else:                             return self.imageTexture
 
 
     @property
@@ -617,9 +702,12 @@ class GLVolume(glimageobject.GLImageObject, globject.GLObject):
         if opts.enableOverrideDataRange: normRange = opts.overrideDataRange
         else:                            normRange = None
 
+        if self.bricked: createFunc = textures.BrickedImageTexture
+        else:            createFunc = textures.createImageTexture
+
         self.imageTexture = glresources.get(
             texName,
-            textures.createImageTexture,
+            createFunc,
             texName,
             self.image,
             interp=interp,
@@ -631,6 +719,13 @@ class GLVolume(glimageobject.GLImageObject, globject.GLObject):
 
         self.imageTexture.register(self.name, self.__texturesChanged)
 
+        # level texture names are
+        # derived from the image
+        # texture name, so need
+        # to be refreshed
+        if self.levelTexture is not None:
+            self.__setLevel(self.levelTexture.factor)
+
 
     def registerAuxImage(self, which, image, onReady=None):
         """Calls :meth:`.AuxImageTextureManager.registerAuxImage`, making
@@ -654,7 +749,7 @@ class GLVolume(glimageobject.GLImageObject, globject.GLObject):
         """
 
         # Set up the image and colour textures
-        self.imageTexture    .bindTexture(gl.GL_TEXTURE0)
+        self.displayTexture  .bindTexture(gl.GL_TEXTURE0)
         self.cmapTexture     .bindTexture(gl.GL_TEXTURE1)
         self.negCmapTexture  .bindTexture(gl.GL_TEXTURE2)
         self.clipTexture     .bindTexture(gl.GL_TEXTURE3)
@@ -663,14 +758,94 @@ class GLVolume(glimageobject.GLImageObject, globject.GLObject):
         fslgl.glvolume_funcs.preDraw(self)
 
 
-    def draw2D(self, canvas, *args, **kwargs):
+    def loadSlice(self, canvas, zpos, axes):
+        """If the image texture is a :class:`.BrickedImageTexture`, makes sure
+        that the data required to draw the slice at ``zpos`` has been loaded
+        on to the GPU. Called by :meth:`draw2D` and :meth:`drawAll`.
+        """
+
+        if (not self.bricked) or (self.levelTexture is not None):
+            return
+
+        # Load the bounding box of the slice in
+        # voxel coordinates, with a margin to
+        # accommodate linear/spline interpolation
+        voxCoords = self.generateVertices2D(zpos, axes, canvas.viewport)[1]
+        self.imageTexture.loadRegion(voxCoords.min(axis=0) - 2,
+                                     voxCoords.max(axis=0) + 2)
+
+
+    def selectLevel(self, canvas, axes):
+        """Called by :meth:`draw2D` and :meth:`drawAll`. If this ``GLVolume``
+        has an :class:`.ImagePyramid`, chooses the pyramid level to draw,
+        according to the current magnification of the ``canvas``. If a
+        different level is needed, the change is made asynchronously (as this
+        method is called during a draw), and a redraw is triggered.
+        """
+
+        if self.pyramid is None:
+            return
+
+        volume = self.opts.index()[3:]
+        ready  = self.pyramid.readyFactors(volume)
+        vpp    = self.voxelsPerPixel(canvas, axes)
+
+        # (Re-)calculate the levels for this volume
+        # if they are needed - this is a no-op if
+        # they are available, or being calculated.
+        if vpp >= self.pyramid.factors[0]:
+            self.pyramid.build(volume)
+
+        if not self.imageTexture.ready():
+            factors = ready[:1]
+        else:
+            factors = [f for f in ready if f <= vpp]
+
+        if len(factors) == 0: factor = None
+        else:                 factor = max(factors)
+
+        if self.levelTexture is None: current = None
+        else:                         current = self.levelTexture.factor
+
+        if factor != current:
+            idle.idle(self.__setLevel,
+                      factor,
+                      name='{}_setLevel'.format(self.name),
+                      skipIfQueued=True)
+
+
+    def voxelsPerPixel(self, canvas, axes):
+        """Returns the approximate number of image voxels which span a
+        single pixel on the given ``canvas``, when drawing a slice along the
+        given ``axes``.
+        """
+
+        bbox = canvas.viewport
+        d2v  = self.opts.getTransform('display', 'voxel')
+
+        if hasattr(canvas, 'GetScaledSize'): w, h = canvas.GetScaledSize()
+        else:                                w, h = canvas.shape[:2]
+
+        vpp = []
+
+        for ax, npixels in zip(axes[:2], (w, h)):
+            dpp = (bbox[ax][1] - bbox[ax][0]) / max(npixels, 1)
+            vpp.append(dpp * np.linalg.norm(d2v[:3, ax]))
+
+        return min(vpp)
+
+
+    def draw2D(self, canvas, zpos, axes, xform=None):
         """Calls the version dependent ``draw2D`` function. """
 
+        self.selectLevel(canvas, axes)
+        self.loadSlice(canvas, zpos, axes)
+
         with glroutines.enabled((gl.GL_CULL_FACE)):
             gl.glPolygonMode(gl.GL_FRONT_AND_BACK, gl.GL_FILL)
             gl.glCullFace(gl.GL_BACK)
             gl.glFrontFace(self.frontFace(canvas))
-            fslgl.glvolume_funcs.draw2D(self, canvas, *args, **kwargs)
+            fslgl.glvolume_funcs.draw2D(self, canvas, zpos, axes, xform)
 
 
     def draw3D(self, canvas, xform=None):
@@ -749,9 +924,15 @@ class GLVolume(glimageobject.GLImageObject, globject.GLObject):
             src.depthTexture = olddep
 
 
-    def drawAll(self, *args, **kwargs):
+    def drawAll(self, canvas, axes, zposes, xforms):
         """Calls the version dependent ``drawAll`` function. """
-        fslgl.glvolume_funcs.drawAll(self, *args, **kwargs)
+
+        self.selectLevel(canvas, axes)
+
+        for zpos in zposes:
+            self.loadSlice(canvas, zpos, axes)
+
+        fslgl.glvolume_funcs.drawAll(self, canvas, axes, zposes, xforms)
 
 
     def postDraw(self):
@@ -759,7 +940,7 @@ class GLVolume(glimageobject.GLImageObject, globject.GLObject):
         version-dependent ``postDraw`` function.
         """
 
-        self.imageTexture    .unbindTexture()
+        self.displayTexture  .unbindTexture()
         self.cmapTexture     .unbindTexture()
         self.negCmapTexture  .unbindTexture()
         self.clipTexture     .unbindTexture()
@@ -780,7 +961,8 @@ class GLVolume(glimageobject.GLImageObject, globject.GLObject):
         return affine.concat(
             self.auxmgr.textureXform(which),
             # to support 2D image textures
-            self.imageTexture.invTexCoordXform(self.overlay.shape))
+            # and pyramid level textures
+            self.displayTexture.invTexCoordXform(self.overlay.shape))
 
 
     def getModulateValueXform(self):
@@ -797,7 +979,7 @@ class GLVolume(glimageobject.GLImageObject, globject.GLObject):
 
         opts = self.opts
         if opts.modulateImage is None:
-            modXform = self.imageTexture.voxValXform
+            modXform = self.displayTexture.voxValXform
         else:
             modXform = self.modulateTexture.voxValXform
 
@@ -812,7 +994,8 @@ class GLVolume(glimageobject.GLImageObject, globject.GLObject):
         """Overrides :meth:`.GLImageObject.generateVertices2D`.
 
         Appliies the :meth:`.ImageTextureBase.texCoordXform` to the texture
-        coordinates - this is performed to support 2D images/textures.
+        coordinates - this is performed to support 2D images/textures, and
+        pyramid level textures.
         """
 
         vertices, voxCoords, texCoords = \
@@ -820,7 +1003,7 @@ class GLVolume(glimageobject.GLImageObject, globject.GLObject):
                 self, zpos, axes, bbox)
 
         texCoords = affine.transform(
-            texCoords, self.imageTexture.texCoordXform(self.overlay.shape))
+            texCoords, self.displayTexture.texCoordXform(self.overlay.shape))
 
         return vertices, voxCoords, texCoords
 
@@ -955,6 +1138,19 @@ class GLVolume(glimageobject.GLImageObject, globject.GLObject):
         self.clipTexture    .set(interp=interp, volRefresh=False)
         self.modulateTexture.set(interp=interp, volRefresh=False)
 
+        # Switch to the same pyramid level for
+        # the new volume (if it is available),
+        # and start calculating its levels
+        if self.pyramid is not None:
+            self.pyramid.build(opts.index()[3:])
+
+            if self.levelTexture is not None:
+                self.__setLevel(self.levelTexture.factor)
+
+            if self.levelTexture is not None:
+                self.levelTexture.set(interp=interp,
+                                      normaliseRange=normRange)
+
 
     def _channelChanged(self, *a, **kwa):
         """Called when the :attr:`.NiftiOpts.channel` changes.
@@ -1066,3 +1262,83 @@ class GLVolume(glimageobject.GLImageObject, globject.GLObject):
         changes. Calls :meth:`updateShaderState`.
         """
         self.updateShaderState(alwaysNotify=True)
+
+
+    def __pyramidChanged(self, *a):
+        """Called when a new :class:`.ImagePyramid` level becomes available,
+        or when the pyramid levels are discarded. Releases the
+        ``levelTexture`` if its level is no longer available and, if the
+        ``imageTexture`` is not ready, switches to the finest available
+        level. Otherwise triggers a redraw, so that :meth:`selectLevel` can
+        choose a new level.
+        """
+
+        if self.destroyed or self.pyramid is None:
+            return
+
+        ready = self.pyramid.readyFactors(self.opts.index()[3:])
+
+        if self.levelTexture is not None and \
+           self.levelTexture.factor not in ready:
+            self.__setLevel(None)
+
+        if len(ready) > 0 and not self.imageTexture.ready():
+            self.__setLevel(ready[0])
+        else:
+            self.notify()
+
+
+    def __setLevel(self, factor):
+        """Changes the ``levelTexture`` to one which stores the given
+        :class:`.ImagePyramid` level for the current volume. If ``factor`` is
+        ``None``, or the level is not available, the ``levelTexture`` is
+        released, and the full resolution ``imageTexture`` will be drawn.
+        """
+
+        if self.destroyed:
+            return
+
+        opts   = self.opts
+        volume = opts.index()[3:]
+        old    = self.levelTexture
+        new    = None
+
+        if factor not in self.pyramid.readyFactors(volume):
+            factor = None
+
+        if factor is not None:
+
+            name = '{}_level{}_{}'.format(self.imageTexture.name,
+                                          factor,
+                                          tuple(volume))
+
+            if old is not None and old.name == name:
+                return
+
+            if opts.interpolation == 'none': interp = gl.GL_NEAREST
+            else:                            interp = gl.GL_LINEAR
+
+            if opts.enableOverrideDataRange: normRange = opts.overrideDataRange
+            else:                            normRange = None
+
+            new = glresources.get(name,
+                                  textures.PyramidLevelTexture,
+                                  name,
+                                  self.pyramid,
+                                  factor,
+                                  volume,
+                                  interp=interp,
+                                  normaliseRange=normRange)
+            new.register(self.name, self.__texturesChanged)
+
+        elif old is None:
+            return
+
+        if old is not None:
+            old.deregister(self.name)
+            glresources.delete(old.name)
+
+        log.debug('%s: switching to pyramid level %s', self.name, factor)
+
+        self.levelTexture = new
+        self.updateShaderState(alwaysNotify=True)
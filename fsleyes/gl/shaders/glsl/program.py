@@ -11,6 +11,7 @@ optionally a geometry shader (for OpenGL >= 3.3).
 
 
 import logging
+import ctypes
 import contextlib
 
 import jinja2                as j2
@@ -258,14 +259,16 @@ class GLSLShader:
 
 
     @contextlib.contextmanager
-    def loadedAtts(self):
+    def loadedAtts(self, firstInstance=0):
         """Context manager which calls :meth:`loadAtts`, yields, then
         calls :meth:`unloadAtts`.
 
         This is called automatically by :meth:`draw`, so there is no need
         to explicitly call it.
+
+        :arg firstInstance: Passed through to :meth:`loadAtts`.
         """
-        self.loadAtts()
+        self.loadAtts(firstInstance)
         try:
             yield
         finally:
@@ -277,7 +280,7 @@ class GLSLShader:
         gl.glUseProgram(self.program)
 
 
-    def loadAtts(self):
+    def loadAtts(self, firstInstance=0):
         """Binds all of the shader program ``attribute`` variables - you
         must set the data for each attribute via :meth:`setAtt` before
         calling this method.
@@ -286,6 +289,12 @@ class GLSLShader:
         to explicitly call it.
 
         Attributes may be set before or after this method is called.
+
+        :arg firstInstance: Index of the first instance to draw, when using
+                            instanced rendering. Attributes which have a
+                            divisor are offset so that they start from this
+                            instance (``glDrawArraysInstancedBaseInstance``
+                            is not available in older versions of OpenGL).
         """
         self.attsLoaded += 1
         if self.attsLoaded > 1:
@@ -300,6 +309,17 @@ class GLSLShader:
             aDivisor       = self.attDivisors.get(att)
             glType, glSize = glslAttributeType(aType)
 
+            # Attribute data is stored as 32 bit
+            # values, apart from bools (see the
+            # _attribute_* methods)
+            if aDivisor is not None and firstInstance > 0:
+                if aType == 'bool': itemsize = 1
+                else:               itemsize = 4
+                offset = ctypes.c_void_p(
+                    itemsize * glSize * (firstInstance // aDivisor))
+            else:
+                offset = None
+
             gl.glBindBuffer(gl.GL_ARRAY_BUFFER, aBuf)
             gl.glEnableVertexAttribArray(aPos)
             gl.glVertexAttribPointer(    aPos,
@@ -307,7 +327,7 @@ class GLSLShader:
                                          glType,
                                          gl.GL_FALSE,
                                          0,
-                                         None)
+                                         offset)
 
             if aDivisor is not None:
                 glexts.glVertexAttribDivisor(aPos, aDivisor)
@@ -1,32 +1,467 @@
 #!/usr/bin/env python
 #
-# text.py - The Text class
+# text.py - The Text and GlyphAtlas classes.
 #
 # Author: Paul McCarthy <pauldmccarthy@gmail.com>
 #
-"""This module provides the :class:`Text` class, which uses the
-:mod:`fsleyes_widgets.utils.textbitmap` module, and a :class:`.Texture2D`
-object to render text to a GL canvas.
+"""This module provides the :class:`Text` class, which can be used to render
+text to a GL canvas, and the :class:`GlyphAtlas` class, which is used by
+``Text`` objects to store rasterised glyphs in a :class:`.Texture2D`.
+
+.. autosummary::
+   :nosignatures:
+
+   glyphAtlas
+   textShader
 """
 
 
 import numpy as np
 
-import fsleyes_widgets.utils.textbitmap as textbmp
-from   fsleyes.gl                   import textures
-import fsleyes.gl.routines              as glroutines
-from   fsleyes.utils                import lazyimport
+import matplotlib.colors       as mplcolors
+import matplotlib.font_manager as mplfm
+import matplotlib.ft2font      as mplft
+
+from   fsleyes.gl       import textures
+import fsleyes.gl               as fslgl
+import fsleyes.gl.shaders       as shaders
+import fsleyes.gl.resources     as glresources
+import fsleyes.gl.routines      as glroutines
+from   fsleyes.utils    import lazyimport
 
 
 gl = lazyimport('OpenGL.GL', f'{__name__}.gl')
 
 
+DPI = 96
+"""Resolution used to convert font sizes from points to pixels. """
+
+
+MARGIN = 2
+"""Margin, in points, added to the right of centred and right-aligned text,
+so that it is positioned in the same way as text which is rendered with
+:func:`fsleyes_widgets.utils.textbitmap.textBitmap`.
+"""
+
+
+# The kerning mode was changed from
+# an int to an enum in matplotlib 3.10
+try:
+    KERNING = mplft.Kerning.DEFAULT
+except AttributeError:
+    KERNING = mplft.KERNING_DEFAULT
+
+
+def glyphAtlas(fontSize):
+    """Returns a :class:`GlyphAtlas` for the given font size. A single
+    ``GlyphAtlas`` is shared by all :class:`Text` objects which use the same
+    font size. ``GlyphAtlas`` objects are managed by the :mod:`.resources`
+    module - the caller must pass the ``GlyphAtlas.name`` to
+    :func:`.resources.delete` when it no longer needs the atlas.
+    """
+    name = '{}_{}'.format(GlyphAtlas.__name__, fontSize)
+    return glresources.get(name, GlyphAtlas, fontSize)
+
+
+SHADER_NAME = 'Text_shader'
+"""Name of the shader program returned by :func:`textShader`. """
+
+
+def textShader():
+    """Returns the shader program used to draw :class:`Text` objects. A
+    single shader program is shared by all ``Text`` objects. It is managed
+    by the :mod:`.resources` module - the caller must pass the
+    :data:`SHADER_NAME` to :func:`.resources.delete` when it no longer needs
+    the shader.
+    """
+
+    def create():
+        vertSrc = shaders.getVertexShader(  'text')
+        fragSrc = shaders.getFragmentShader('text')
+        if float(fslgl.GL_COMPATIBILITY) < 2.1:
+            shader = shaders.ARBPShader(vertSrc, fragSrc, {'texture' : 0})
+        else:
+            shader = shaders.GLSLShader(vertSrc, fragSrc)
+            with shader.loaded():
+                shader.set('tex', 0)
+        return shader
+
+    return glresources.get(SHADER_NAME, create)
+
+
+class GlyphAtlas:
+    """A ``GlyphAtlas`` rasterises individual characters (glyphs) at a
+    specific font size, and stores them in a single :class:`.Texture2D`, so
+    that any text can be drawn as a set of textured quads, one per character.
+
+    All printable ASCII characters are rasterised when a ``GlyphAtlas`` is
+    created. Any other characters are rasterised when they are first used,
+    after which the texture is re-uploaded. So changing the text that is
+    displayed does not usually require any rasterisation or texture uploads.
+
+    Glyphs are rasterised with ``matplotlib``, using the default
+    ``matplotlib`` font, and are positioned using the glyph and kerning
+    metrics of the font. Each line of text is ``fontSize`` points high, as
+    when text is drawn with ``matplotlib``. The atlas also contains a small
+    block of fully opaque texels, which can be used to draw solid background
+    rectangles with the same texture and shader as the glyphs (see
+    :meth:`solid`).
+
+    The :meth:`layout` method can be used to generate the quads for a piece
+    of text, without needing a GL context. The texture is created on the
+    first call to :meth:`texture`.
+    """
+
+
+    WIDTH = 512
+    """Width of the atlas image in pixels. The image height grows as glyphs
+    are added.
+    """
+
+
+    def __init__(self, fontSize):
+        """Create a ``GlyphAtlas``.
+
+        :arg fontSize: Font size in points.
+        """
+
+        font = mplfm.get_font(mplfm.findfont(mplfm.FontProperties()))
+
+        self.__name     = '{}_{}'.format(type(self).__name__, fontSize)
+        self.__fontSize = fontSize
+        self.__font     = font
+        self.__texture  = None
+        self.__dirty    = True
+
+        # { char : (advance, (xoff, yoff, w, h), (row, col)) }
+        # The glyph offset is relative to the pen position on
+        # the baseline, and (row, col) is the location of the
+        # top-left of the glyph in the atlas image.
+        self.__glyphs = {}
+
+        # { (left, right) : kerning }, populated
+        # as pairs of characters are laid out
+        self.__kerning = {}
+
+        # Atlas image, top row first, and
+        # the current packing position
+        # (the row/column of the next
+        # glyph, and the height of the
+        # current shelf of glyphs)
+        self.__image     = np.zeros((0, self.WIDTH, 4), dtype=np.uint8)
+        self.__penRow    = 0
+        self.__penCol    = 0
+        self.__rowHeight = 0
+
+        # A 4x4 block of opaque texels is
+        # placed at the start of the atlas
+        solid           = np.full((4, 4), 255, dtype=np.uint8)
+        self.__solid    = self.__pack(solid)
+        self.__ascent   = 0
+        self.__descent  = 0
+
+        for char in map(chr, range(32, 127)):
+            self.__addGlyph(char)
+
+        # Line metrics are calculated from
+        # the ASCII glyphs, so that the
+        # height of a Text does not depend
+        # on the characters that it contains
+        for _, (_, yoff, _, h), _ in self.__glyphs.values():
+            self.__ascent  = max(self.__ascent,  yoff + h)
+            self.__descent = max(self.__descent, -yoff)
+
+
+    def destroy(self):
+        """Must be called when this ``GlyphAtlas`` is no longer needed.
+        Destroys the texture.
+        """
+        if self.__texture is not None:
+            self.__texture.destroy()
+            self.__texture = None
+
+
+    @property
+    def name(self):
+        """Returns the name of this ``GlyphAtlas``, which is used as its
+        :mod:`.resources` key.
+        """
+        return self.__name
+
+
+    @property
+    def fontSize(self):
+        """Returns the font size, in points, of this ``GlyphAtlas``. """
+        return self.__fontSize
+
+
+    @property
+    def image(self):
+        """Returns the atlas image, as a ``uint8`` array of shape
+        ``(height, width, 4)``, top row first.
+        """
+        return self.__image
+
+
+    @property
+    def lineHeight(self):
+        """Returns the height of one line of text, in pixels. """
+        return self.__fontSize * DPI / 72
+
+
+    def texture(self):
+        """Returns a :class:`.Texture2D` containing the atlas image, creating
+        or refreshing it if necessary. Must be called with a GL context.
+        """
+
+        if self.__texture is None:
+            self.__texture = textures.Texture2D(
+                '{}_{}'.format(self.__name, id(self)),
+                interp=gl.GL_LINEAR)
+
+        if self.__dirty:
+            data = np.flipud(self.__image).transpose([2, 1, 0])
+            self.__texture.set(data=data)
+            self.__dirty = False
+
+        return self.__texture
+
+
+    def __pack(self, bitmap):
+        """Copies the given glyph coverage bitmap, of shape ``(h, w)``, into
+        the atlas image, and returns its ``(row, col)`` location. Each
+        glyph is surrounded by at least one column of empty texels on
+        either side, so that glyphs can be drawn at sub-pixel horizontal
+        positions (see :meth:`layout`).
+        """
+
+        h, w = bitmap.shape
+        pad  = 1
+
+        if self.__penCol + w + 2 * pad > self.WIDTH:
+            self.__penRow    += self.__rowHeight + pad
+            self.__penCol     = 0
+            self.__rowHeight  = 0
+
+        row, col = self.__penRow, self.__penCol + pad
+        nrows    = row + h + pad
+
+        if nrows > self.__image.shape[0]:
+            image = np.zeros((nrows, self.WIDTH, 4), dtype=np.uint8)
+            image[:self.__image.shape[0]] = self.__image
+            self.__image = image
+
+        self.__image[row:row + h, col:col + w, :3] = 255
+        self.__image[row:row + h, col:col + w,  3] = bitmap
+
+        self.__penCol     = col + w
+        self.__rowHeight  = max(self.__rowHeight, h)
+        self.__dirty      = True
+
+        return row, col
+
+
+    def __addGlyph(self, char):
+        """Rasterises the given character and adds it to the atlas. """
+
+        font = self.__font
+        font.clear()
+        font.set_size(self.__fontSize, DPI)
+        font.set_text(char, 0.0)
+        font.draw_glyphs_to_bitmap(antialiased=True)
+
+        glyph   = font.load_char(ord(char))
+        bitmap  = np.asarray(font.get_image(), dtype=np.uint8)
+        advance = glyph.linearHoriAdvance / 65536
+        xoff    = glyph.horiBearingX      / 64
+        top     = glyph.horiBearingY      / 64
+
+        # The rendered image is padded, so
+        # we crop it to the extent of the
+        # glyph, and position it using the
+        # glyph metrics. Blank characters
+        # (e.g. space) only have an advance.
+        rows = np.where(bitmap.any(axis=1))[0]
+        cols = np.where(bitmap.any(axis=0))[0]
+
+        if len(rows) == 0:
+            self.__glyphs[char] = (advance, (0, 0, 0, 0), (0, 0))
+            return
+
+        bitmap = bitmap[rows[0]:rows[-1] + 1, cols[0]:cols[-1] + 1]
+        h, w   = bitmap.shape
+        yoff   = top - h
+
+        self.__glyphs[char] = (advance,
+                               (xoff, yoff, w, h),
+                               self.__pack(bitmap))
+
+
+    def __kern(self, left, right):
+        """Returns the kerning adjustment, in pixels, to be applied between
+        the given pair of characters.
+        """
+
+        pair = (left, right)
+        kern = self.__kerning.get(pair, None)
+
+        if kern is None:
+            # The font object is shared between
+            # atlases, so may be set to a
+            # different size by another atlas
+            font = self.__font
+            font.set_size(self.__fontSize, DPI)
+            kern = font.get_kerning(font.get_char_index(ord(left)),
+                                    font.get_char_index(ord(right)),
+                                    KERNING) / 64
+            self.__kerning[pair] = kern
+
+        return kern
+
+
+    def solid(self):
+        """Returns the ``(column, row)`` pixel coordinates of a fully
+        opaque texel in the atlas image.
+        """
+        row, col = self.__solid
+        return (col + 2, row + 2)
+
+
+    def texCoords(self, pixels):
+        """Converts ``(column, row)`` atlas image pixel coordinates, as
+        returned by :meth:`layout` and :meth:`solid`, into texture
+        coordinates. Pixel coordinates remain valid when the atlas grows,
+        whereas texture coordinates do not, so callers should only convert
+        pixel coordinates immediately before drawing.
+        """
+        pixels       = np.array(pixels, dtype=np.float32).reshape(-1, 2)
+        height       = self.__image.shape[0]
+        pixels[:, 0] =     pixels[:, 0] / self.WIDTH
+        pixels[:, 1] = 1 - pixels[:, 1] / height
+        return pixels
+
+
+    def layout(self, text, halign=None):
+        """Generates quads to draw the given text. Any characters which are
+        not already in the atlas are rasterised and added.
+
+        :arg text:   The text to lay out. May contain newlines.
+        :arg halign: Horizontal alignment of each line - ``'left'`` (the
+                     default), ``'centre'``, or ``'right'``. Centred and
+                     right-aligned text is given a :data:`MARGIN` on the
+                     right.
+
+        :returns:    A tuple containing:
+
+                      - A ``(n, 6, 2)`` array containing pixel coordinates
+                        for two triangles for each of the ``n`` visible
+                        glyphs, relative to the bottom left of the text.
+                      - A ``(n, 6, 2)`` array containing the location of
+                        each glyph in the atlas image, as ``(column, row)``
+                        pixel coordinates. These can be converted into
+                        texture coordinates with :meth:`texCoords`.
+                      - The ``(width, height)`` of the text in pixels,
+                        including any margin.
+        """
+
+        for char in set(text):
+            if char not in self.__glyphs and char != '\n':
+                self.__addGlyph(char)
+
+        lines   = text.split('\n')
+        lheight = self.lineHeight
+        height  = lheight * len(lines)
+        lines   = [self.__layoutLine(line) for line in lines]
+        width   = max(lwidth for _, lwidth in lines)
+        verts   = []
+        tcoords = []
+
+        # The ascent/descent of the font
+        # is centred within each line
+        baseline = height - lheight / 2 - (self.__ascent - self.__descent) / 2
+
+        for i, (glyphs, lwidth) in enumerate(lines):
+
+            if   halign == 'centre': linex = (width - lwidth) / 2
+            elif halign == 'right':  linex =  width - lwidth
+            else:                    linex = 0
+
+            liney = baseline - i * lheight
+
+            # Glyphs are drawn at sub-pixel horizontal
+            # positions, and are interpolated by the
+            # texture. Each quad is widened by one
+            # texel on either side, to include the
+            # empty texels around each glyph.
+            for penx, (xoff, yoff, w, h), (row, col) in glyphs:
+                xlo = linex + penx + xoff - 1
+                ylo = np.round(liney + yoff)
+                verts  .append(quad(xlo,     xlo + w + 2, ylo,     ylo + h))
+                tcoords.append(quad(col - 1, col + w + 1, row + h, row))
+
+        if len(verts) == 0:
+            verts   = np.zeros((0, 6, 2), dtype=np.float32)
+            tcoords = np.zeros((0, 6, 2), dtype=np.float32)
+        else:
+            verts   = np.array(verts,   dtype=np.float32)
+            tcoords = np.array(tcoords, dtype=np.float32)
+
+        if halign in ('centre', 'right'):
+            width += MARGIN * DPI / 72
+
+        return verts, tcoords, (width, height)
+
+
+    def __layoutLine(self, line):
+        """Used by :meth:`layout`. Calculates the pen position of each visible
+        glyph in a single line of text.
+
+        :returns: A tuple containing:
+
+                   - A list of ``(x, (xoff, yoff, w, h), (row, col))``
+                     tuples, one for each visible glyph, where ``x`` is the
+                     pen position, including any kerning.
+                   - The width of the line (the final pen position) in
+                     pixels.
+        """
+
+        glyphs = []
+        penx   = 0
+        prev   = None
+
+        for char in line:
+            advance, (xoff, yoff, w, h), (row, col) = self.__glyphs[char]
+
+            if prev is not None:
+                penx += self.__kern(prev, char)
+
+            if w > 0 and h > 0:
+                glyphs.append((penx, (xoff, yoff, w, h), (row, col)))
+
+            penx += advance
+            prev  = char
+
+        return glyphs, penx
+
+
+def quad(xlo, xhi, ylo, yhi):
+    """Returns a ``(6, 2)`` array containing two triangles which cover the
+    given rectangle.
+    """
+    return [[xlo, ylo], [xlo, yhi], [xhi, ylo],
+            [xhi, ylo], [xlo, yhi], [xhi, yhi]]
+
+
 class Text:
-    """A ``Text`` object manages a RGBA :class:`.Texture2D` object, allowing
-    text to be drawn to a GL canvas.
+    """A ``Text`` object allows text to be drawn to a GL canvas.
 
-    The :mod:`fsleyes_widgets.utils.textbitmap` module is used to render the
-    text, using ``matplotlib``.
+    Text is drawn as a set of textured quads, one for each character, using
+    a :class:`GlyphAtlas` which is shared by all ``Text`` objects with the
+    same font size, and a shader program which is shared by all ``Text``
+    objects (see :func:`textShader`). The quads are cached, and are only
+    re-generated when the text, font size or alignment changes - changing
+    the text does not require any text to be rasterised, or any texture data
+    to be uploaded.
 
     Usage::
 
@@ -94,87 +529,52 @@ class Text:
                           NOT IMPLEMENTED YET AND PROBABLY NEVER WILL BE
         """
 
-        # Every time any display properties change,
-        # the text bitmap is re-generated and cached.
-        # (see __refreshBitmap). Re-generating the
-        # bitmap on every call to draw would be
-        # unnecessarily expensive.
-        self.__bitmap   = None
+        # Every time the text, font size or
+        # alignment change, the glyph quads
+        # are re-generated and cached (see
+        # __refreshLayout). Colours are applied
+        # at draw time, so do not require the
+        # layout to be refreshed.
+        self.__layout   = None
+        self.__atlas    = None
 
         # Access to these attributes is protected,
-        # as they induce a bitmap refresh
+        # as they induce a layout refresh
         self.__text     = text
         self.__fontSize = fontSize
-        self.__colour   = colour
-        self.__bgColour = bgColour
-        self.__alpha    = alpha
+        self.__halign   = halign
 
-        # All othjer attributes can be assigned directly
+        # All other attributes can be assigned directly
         self.pos         = pos
         self.off         = off
         self.coordinates = coordinates
-        self.halign      = halign
         self.valign      = valign
+        self.colour      = colour
+        self.bgColour    = bgColour
+        self.alpha       = alpha
         self.scale       = scale
         self.angle       = angle
-        self.__texture   = textures.Texture2D(
-            '{}_{}'.format(type(self).__name__, id(self)),
-            interp=gl.GL_LINEAR)
+        self.__shader    = None
 
 
     def destroy(self):
-        """Must be called when this ``Text`` is no longer needed. Frees
-        texture resources.
+        """Must be called when this ``Text`` is no longer needed. Releases
+        the shader program and the glyph atlas.
         """
-        self.__texture.destroy()
-        self.__texture = None
+        if self.__shader is not None:
+            glresources.delete(SHADER_NAME)
+            self.__shader = None
+        if self.__atlas is not None:
+            glresources.delete(self.__atlas.name)
+            self.__atlas = None
 
 
-    def __clearBitmap(self, old, new):
-        """Used by property setters to clear cached bitmap, if a value which
-        requires the bitmap to be re-generated is changed.
+    def __clearLayout(self, old, new):
+        """Used by property setters to clear the cached layout, if a value
+        which requires the layout to be re-generated is changed.
         """
         if old != new:
-            self.__bitmap = None
-
-
-    @property
-    def colour(self):
-        """Return the current foreground colour. """
-        return self.__colour
-
-
-    @colour.setter
-    def colour(self, value):
-        """Set the foreground colour. """
-        self.__clearBitmap(self.__colour, value)
-        self.__colour = value
-
-
-    @property
-    def bgColour(self):
-        """Return the current background colour. """
-        return self.__bgColour
-
-
-    @bgColour.setter
-    def bgColour(self, value):
-        """Set the background colour. """
-        self.__clearBitmap(self.__bgColour, value)
-        self.__bgColour = value
-
-
-    @property
-    def alpha(self):
-        """Return the current opacity. """
-        return self.__alpha
-
-
-    @alpha.setter
-    def alpha(self, value):
-        """Set the opacity. """
-        self.__clearBitmap(self.__alpha, value)
-        self.__alpha = value
+            self.__layout = None
 
 
     @property
@@ -186,7 +586,7 @@ class Text:
     @text.setter
     def text(self, value):
         """Update the text."""
-        self.__clearBitmap(self.__text, value)
+        self.__clearLayout(self.__text, value)
         self.__text = value
 
 
@@ -199,20 +599,33 @@ class Text:
     @fontSize.setter
     def fontSize(self, value):
         """Update the font size."""
-        self.__clearBitmap(self.__fontSize, value)
+        self.__clearLayout(self.__fontSize, value)
         self.__fontSize = value
 
 
+    @property
+    def halign(self):
+        """Returns the current horizontal alignment."""
+        return self.__halign
+
+
+    @halign.setter
+    def halign(self, value):
+        """Update the horizontal alignment."""
+        self.__clearLayout(self.__halign, value)
+        self.__halign = value
+
+
     @property
     def size(self):
-        """Return the size of the text texture in pixels, scaled by
-        the ``scale`` factor if it is set. Returns ``None`` if the
-        text has not yet been drawn and the bitmap not created.
+        """Return the size of the text in pixels, scaled by the ``scale``
+        factor if it is set. Returns ``None`` if the text has not yet been
+        drawn.
         """
-        if self.__bitmap is None:
+        if self.__layout is None:
             return None
 
-        size = self.__bitmap.shape[1:]
+        size = self.__layout[2]
 
         if self.scale is not None:
             size = (size[0] * self.scale, size[1] * self.scale)
@@ -220,21 +633,31 @@ class Text:
         return size
 
 
-    def __refreshBitmap(self):
-        """Called when the text bitmap and texture data needs a refresh. """
-        bmp = textbmp.textBitmap(self.text,
-                                 fontSize=self.fontSize,
-                                 fgColour=self.colour,
-                                 bgColour=self.bgColour,
-                                 halign=self.halign,
-                                 alpha=self.alpha)
-        bmp = np.flipud(bmp).transpose([2, 1, 0])
-        self.__bitmap = bmp
-        self.__texture.set(data=bmp)
+    def __refreshLayout(self):
+        """Called when the glyph quads need to be re-generated. """
+
+        atlas = self.__atlas
+
+        if atlas is None or atlas.fontSize != self.fontSize:
+            if atlas is not None:
+                glresources.delete(atlas.name)
+            atlas        = glyphAtlas(self.fontSize)
+            self.__atlas = atlas
+
+        self.__layout = atlas.layout(self.text, self.halign)
+
+
+    def __getShader(self):
+        """Returns the shader program used to draw glyphs, which is shared
+        by all ``Text`` objects (see :func:`textShader`).
+        """
+        if self.__shader is None:
+            self.__shader = textShader()
+        return self.__shader
 
 
     def draw(self, width, height):
-        """Draws the texture onto the current GL canvas.
+        """Draws the text onto the current GL canvas.
 
         :arg width:  Width of canvas in pixels
         :arg height: Height of canvas in pixels
@@ -249,8 +672,8 @@ class Text:
         if (width == 0) or (height == 0):
             return
 
-        if self.__bitmap is None:
-            self.__refreshBitmap()
+        if self.__layout is None:
+            self.__refreshLayout()
 
         if self.off is not None: off = list(self.off)
         else:                    off = [0, 0]
@@ -273,8 +696,53 @@ class Text:
         xhi = xlo    + size[0]
         yhi = ylo    + size[1]
 
+        atlas             = self.__atlas
+        verts, tcoords, _ = self.__layout
+        scale             = self.scale
+        alpha             = self.alpha
+        colour            = self.colour
+        bgColour          = self.bgColour
+
+        if scale  is None: scale  = 1
+        if alpha  is None: alpha  = 1
+        if colour is None: colour = '#000000'
+
+        verts = verts.reshape(-1, 2) * scale + [xlo, ylo]
+        verts = np.hstack((verts, np.zeros((len(verts), 1))))
+
+        # Solid background quad, drawn with
+        # the same texture and shader, using
+        # an opaque region of the atlas
+        if bgColour is not None:
+            bgVerts        = np.zeros((6, 3), dtype=np.float32)
+            bgVerts[:, :2] = quad(xlo, xhi, ylo, yhi)
+            bgTcoords      = np.tile(atlas.solid(), (6, 1))
+        else:
+            bgVerts   = np.zeros((0, 3), dtype=np.float32)
+            bgTcoords = np.zeros((0, 2), dtype=np.float32)
+
+        verts   = np.vstack((bgVerts,   verts))
+        tcoords = np.vstack((bgTcoords, tcoords.reshape(-1, 2)))
+        verts   = np.asarray(verts, dtype=np.float32)
+        tcoords = atlas.texCoords(tcoords)
+
         # Set up an ortho view where the
         # display coordinates correspond
         # to the canvas pixel coordinates.
-        xform = glroutines.ortho2D(0, width, 0, height, -1, 1)
-        self.__texture.drawOnBounds(0, xlo, xhi, ylo, yhi, 0, 1, xform)
+        xform   = glroutines.ortho2D(0, width, 0, height, -1, 1)
+        shader  = self.__getShader()
+        texture = atlas.texture()
+
+        with texture.bound(gl.GL_TEXTURE0), shader.loaded():
+            shader.set(   'MVP',      xform)
+            shader.setAtt('vertex',   verts)
+            shader.setAtt('texCoord', tcoords)
+            with shader.loadedAtts():
+                if bgColour is not None:
+                    bgColour = mplcolors.to_rgba(bgColour, alpha)
+                    shader.set( 'colour', bgColour)
+                    shader.draw(gl.GL_TRIANGLES, 0, 6)
+                shader.set( 'colour', mplcolors.to_rgba(colour, alpha))
+                shader.draw(gl.GL_TRIANGLES,
+                            len(bgVerts),
+                            len(verts) - len(bgVerts))
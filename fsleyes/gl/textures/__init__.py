@@ -23,6 +23,8 @@ from .texture3d          import  Texture3D
 from .imagetexture       import (ImageTexture,
                                  ImageTexture2D,
                                  createImageTexture)
+from .brickedtexture     import  BrickedImageTexture
+from .pyramidtexture     import  PyramidLevelTexture
 from .colourmaptexture   import  ColourMapTexture
 from .lookuptabletexture import  LookupTableTexture
 from .selectiontexture   import (SelectionTexture2D,
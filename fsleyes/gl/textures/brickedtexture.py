@@ -0,0 +1,378 @@
+#!/usr/bin/env python
+#
+# brickedtexture.py - The BrickedImageTexture class.
+#
+# Author: Paul McCarthy <pauldmccarthy@gmail.com>
+#
+"""This module provides the :class:`BrickedImageTexture` class, an
+:class:`.ImageTexture` which populates its data on demand, in fixed-size
+bricks, rather than uploading an entire volume in one go.
+
+
+A few standalone functions are also provided:
+
+.. autosummary::
+   :nosignatures:
+
+   useBricks
+   brickIndices
+   brickSlices
+"""
+
+
+import itertools as it
+import              logging
+import              collections
+
+import numpy as np
+
+import fsl.utils.settings               as fslsettings
+import fsleyes.gl.textures.data         as texdata
+import fsleyes.gl.textures.imagetexture as imagetexture
+import fsleyes.gl.textures.texture3d    as texture3d
+from   fsleyes.utils                import lazyimport
+
+
+log = logging.getLogger(__name__)
+
+
+gl = lazyimport('OpenGL.GL', f'{__name__}.gl')
+
+
+def useBricks(image):
+    """Returns ``True`` if a :class:`BrickedImageTexture` should be used to
+    store the data for the given :class:`.Image`, ``False`` otherwise.
+
+    Bricked textures are used for single-valued images which require a 3D
+    texture, and which are larger than the ``fsleyes.texture.brickThreshold``
+    setting (default 1GB). A threshold of ``0`` or less disables bricked
+    textures.
+    """
+
+    threshold = fslsettings.read('fsleyes.texture.brickThreshold', 1073741824)
+
+    if threshold is None or threshold <= 0:
+        return False
+
+    if image.nvals != 1:
+        return False
+
+    nbytes = np.prod(image.shape[:3]) * image.dtype.itemsize
+
+    return nbytes >= threshold and \
+        texdata.numTextureDims(image.shape[:3]) == 3
+
+
+def brickIndices(shape, brickSize, lo, hi):
+    """Returns a list of the indices of all bricks which overlap the voxel
+    region ``[lo, hi]`` (inclusive).
+
+    :arg shape:     Shape of the full 3D volume
+    :arg brickSize: Brick size along each dimension
+    :arg lo:        Low voxel coordinates of the region
+    :arg hi:        High voxel coordinates of the region
+    :returns:       A list of ``(i, j, k)`` brick indices.
+    """
+
+    ranges = []
+
+    # region does not overlap the volume
+    if any((h < 0) or (low > s - 1) for low, h, s in zip(lo, hi, shape[:3])):
+        return []
+
+    for d in range(3):
+        dlo = int(np.clip(np.floor(lo[d]), 0, shape[d] - 1)) // brickSize
+        dhi = int(np.clip(np.ceil( hi[d]), 0, shape[d] - 1)) // brickSize
+        ranges.append(range(dlo, dhi + 1))
+
+    return list(it.product(*ranges))
+
+
+def brickSlices(shape, brickSize, brick):
+    """Returns a tuple of ``slice`` objects which may be used to extract the
+    data for the given ``brick`` from an array of the given ``shape``.
+    """
+    return tuple(slice(b * brickSize, min((b + 1) * brickSize, s))
+                 for b, s in zip(brick, shape[:3]))
+
+
+class BrickedImageTexture(imagetexture.ImageTexture):
+    """The ``BrickedImageTexture`` is an :class:`.ImageTexture` which is
+    intended for very large images.
+
+    A regular ``ImageTexture`` reads an entire volume from the
+    :class:`.Image`, prepares it (see :func:`.data.prepareData`), and then
+    copies it to the GPU before anything can be drawn. A
+    ``BrickedImageTexture`` instead allocates storage for the full texture,
+    but does not copy any data to it. The volume is split into cubic bricks
+    (of the size specified by the ``fsleyes.texture.brickSize`` setting,
+    default 64 voxels), which are read, prepared, and copied to the GPU when
+    they are requested via the :meth:`loadRegion` method. The
+    :class:`.GLVolume` class calls :meth:`loadRegion` for every slice that
+    it draws, so only the part of the image that is visible needs to be
+    loaded.
+
+    Prepared bricks are retained in a host memory cache, so they can be
+    re-uploaded quickly when the volume is changed back, or when the texture
+    needs to be re-configured (e.g. due to a change in interpolation). The
+    least recently used bricks are evicted when the size of this cache
+    exceeds the ``fsleyes.texture.brickBudget`` setting (default 256MB).
+
+    Bricked textures do not support the ``resolution`` setting.
+    """
+
+
+    def __init__(self, name, image, brickSize=None, budget=None, **kwargs):
+        """Create a ``BrickedImageTexture``.
+
+        :arg name:      A name for this texture.
+        :arg image:     The :class:`.Image`.
+        :arg brickSize: Brick size, in voxels. Defaults to the
+                        ``fsleyes.texture.brickSize`` setting.
+        :arg budget:    Maximum size, in bytes, of the host-side brick cache.
+                        Defaults to the ``fsleyes.texture.brickBudget``
+                        setting.
+
+        All other arguments are passed through to
+        :meth:`.ImageTexture.__init__`.
+        """
+
+        if brickSize is None:
+            brickSize = fslsettings.read('fsleyes.texture.brickSize', 64)
+        if budget is None:
+            budget = fslsettings.read('fsleyes.texture.brickBudget',
+                                      268435456)
+
+        # cache of prepared brick data,
+        # { (volume, brick index) : array },
+        # in least-recently-used order
+        self.__brickSize = int(brickSize)
+        self.__budget    = int(budget)
+        self.__cache     = collections.OrderedDict()
+        self.__cacheSize = 0
+        self.__cacheKey  = None
+
+        # Set of indices of bricks which
+        # have been copied to the GPU
+        self.__resident  = set()
+
+        imagetexture.ImageTexture.__init__(self, name, image, **kwargs)
+
+
+    def destroy(self):
+        """Must be called when this ``BrickedImageTexture`` is no longer
+        needed. Clears the brick cache.
+        """
+        imagetexture.ImageTexture.destroy(self)
+        self.__clearCache()
+
+
+    @property
+    def brickSize(self):
+        """Returns the brick size, in voxels. """
+        return self.__brickSize
+
+
+    @property
+    def residentBricks(self):
+        """Returns the number of bricks which have been copied to the GPU. """
+        return len(self.__resident)
+
+
+    @property
+    def cacheSize(self):
+        """Returns the size, in bytes, of the host-side brick cache. """
+        return self.__cacheSize
+
+
+    @property
+    def voxValXform(self):
+        """Overrides :meth:`.Texture.voxValXform`. As the full volume is never
+        passed to :func:`.data.prepareData`, the transform is calculated from
+        the current texture settings.
+        """
+        return self.__valueXforms()[0]
+
+
+    @property
+    def invVoxValXform(self):
+        """Overrides :meth:`.Texture.invVoxValXform`. """
+        return self.__valueXforms()[1]
+
+
+    def prepareVolumeArgs(self, volume, channel):
+        """Overrides :meth:`.ImageTextureBase.prepareVolumeArgs`. Instead of
+        extracting the volume data from the image, marks all bricks as
+        needing to be re-loaded, and returns the texture shape and data type.
+        """
+
+        image = self.image
+        slc   = (slice(0, 1),) * 3
+
+        if volume is not None:
+            slc += tuple(volume)
+
+        # Read a single voxel to find out the
+        # type of data that the image returns,
+        # which may differ from the on-disk
+        # type (e.g. if scaling is applied)
+        dtype = np.asarray(image[slc]).dtype
+
+        self.__resident.clear()
+
+        return {'shape' : tuple(image.shape[:3]), 'dtype' : dtype}
+
+
+    def set(self, **kwargs):
+        """Overrides :meth:`.ImageTexture.set`. Makes sure that a notification
+        is emitted when the volume changes, even if no other texture settings
+        have changed.
+        """
+
+        notify  = kwargs.get('notify', True)
+        kwargs  = self.prepareSetArgs(**kwargs)
+        volume  = 'shape' in kwargs
+        changed = texture3d.Texture3D.set(self, **kwargs)
+
+        if volume and not changed and notify:
+            self.notify()
+
+        return changed or volume
+
+
+    def doRefresh(self):
+        """Overrides :meth:`.Texture3D.doRefresh`. (Re-)allocates the
+        texture storage, and clears the set of resident bricks.
+        """
+        texture3d.Texture3D.doRefresh(self)
+        self.__resident.clear()
+
+
+    def doPatch(self, data, offset):
+        """Overrides :meth:`.Texture3D.doPatch`. Removes any cached bricks
+        which overlap with the patched region, then copies the data to the
+        GPU.
+        """
+
+        lo     = offset[:3]
+        hi     = [o + s - 1 for o, s in zip(offset, data.shape[:3])]
+        bricks = set(brickIndices(self.shape, self.__brickSize, lo, hi))
+
+        for key in list(self.__cache.keys()):
+            if key[1] in bricks:
+                self.__cacheSize -= self.__cache.pop(key).nbytes
+
+        texture3d.Texture3D.doPatch(self, data, offset)
+
+
+    def loadRegion(self, lo, hi):
+        """Makes sure that all bricks which overlap the voxel region
+        ``[lo, hi]`` have been copied to the GPU. Bricks are retrieved from
+        the brick cache, or read from the image and prepared if they are not
+        cached.
+
+        This method must be called while the GL context is current. If this
+        texture is bound to a texture unit, that unit is made active.
+
+        :arg lo: Low voxel coordinates of the region
+        :arg hi: High voxel coordinates of the region
+        :returns: The number of bricks that were copied to the GPU.
+        """
+
+        if not self.ready():
+            return 0
+
+        bricks = brickIndices(self.shape, self.__brickSize, lo, hi)
+        bricks = [b for b in bricks if b not in self.__resident]
+
+        if len(bricks) == 0:
+            return 0
+
+        log.debug('%s: loading %u bricks for region %s - %s',
+                  self.name, len(bricks), lo, hi)
+
+        if self.textureUnit is not None:
+            gl.glActiveTexture(self.textureUnit)
+
+        gl.glPixelStorei(gl.GL_UNPACK_ALIGNMENT, 1)
+
+        for brick in bricks:
+            data   = self.__getBrick(brick)
+            offset = [b * self.__brickSize for b in brick]
+            texture3d.Texture3D.doPatch(self, data, offset)
+            self.__resident.add(brick)
+
+        return len(bricks)
+
+
+    def __valueXforms(self):
+        """Returns the ``voxValXform`` and ``invVoxValXform`` for the current
+        texture settings.
+        """
+        normalise = self.normalise
+        normRange = self.normaliseRange
+
+        if normalise                       and \
+           self.prefilter      is not None and \
+           self.prefilterRange is not None:
+            normRange = self.prefilterRange(*normRange)
+
+        return texdata.valueXforms(self.dtype, normalise, normRange)
+
+
+    def __clearCache(self):
+        """Clears the brick cache. """
+        self.__cache.clear()
+        self.__cacheSize = 0
+
+
+    def __getBrick(self, brick):
+        """Returns the prepared data for the given ``brick``, either from the
+        cache, or by reading it from the image and passing it through
+        :func:`.data.prepareData`.
+        """
+
+        # Bricks are prepared according to
+        # the current normalisation settings,
+        # so if those have changed, all of
+        # the cached bricks are invalid.
+        cacheKey = (self.normalise,
+                    self.normaliseRange,
+                    self.prefilter,
+                    self.prefilterRange)
+
+        if cacheKey != self.__cacheKey:
+            self.__clearCache()
+            self.__cacheKey = cacheKey
+
+        volume = self.volume
+
+        if volume is None: volume = ()
+        else:              volume = tuple(volume)
+
+        key  = (volume, brick)
+        data = self.__cache.pop(key, None)
+
+        if data is None:
+            slc  = brickSlices(self.shape, self.__brickSize, brick)
+            slc += volume
+
+            data = np.asarray(self.image[slc])
+            data = data.reshape([s.stop - s.start for s in slc[:3]])
+            data = texdata.prepareData(
+                data,
+                prefilter=self.prefilter,
+                prefilterRange=self.prefilterRange,
+                normalise=self.normalise,
+                normaliseRange=self.normaliseRange)[0]
+        else:
+            self.__cacheSize -= data.nbytes
+
+        self.__cache[key]  = data
+        self.__cacheSize  += data.nbytes
+
+        while self.__cacheSize > self.__budget and len(self.__cache) > 1:
+            _, evicted        = self.__cache.popitem(last=False)
+            self.__cacheSize -= evicted.nbytes
+
+        return data
@@ -13,6 +13,7 @@
    canUseFloatTextures
    oneChannelFormat
    getTextureType
+   valueXforms
    prepareData
 """
 
@@ -298,35 +299,20 @@ def getTextureType(normalise, dtype, nvals):
     return texDtype, baseFmt, intFmt
 
 
-def prepareData(data,
-                prefilter=None,
-                prefilterRange=None,
-                resolution=None,
-                scales=None,
-                normalise=None,
-                normaliseRange=None):
-    """This function prepares and returns the given ``data``, ready to be
-    used as GL texture data.
-
-    This process potentially involves:
+def valueXforms(dtype, normalise, normaliseRange):
+    """Calculates transformations between texture values and the original
+    data values, for data of the given type. This function is used by
+    :func:`prepareData`.
 
-      - Resampling to a different resolution (see the
-        :func:`.routines.subsample` function).
-
-      - Pre-filtering (see the ``prefilter`` parameter to
-        :meth:`__init__`).
+    :arg dtype:          The original data type.
 
-      - Normalising (if the ``normalise`` parameter to :meth:`__init__`
-        was ``True``, or if the data type cannot be used as-is).
+    :arg normalise:      Whether the data is to be normalised.
 
-      - Casting to a different data type (if the data type cannot be used
-        as-is).
+    :arg normaliseRange: Normalisation range (ignored if ``normalise`` is
+                         ``False``).
 
     :returns: A tuple containing:
 
-                - A ``numpy`` array containing the image data, ready to be
-                   copied to the GPU.
-
                 - An affine transformation matrix which encodes an offset
                   and a scale, which may be used to transform the texture
                   data from the range ``[0.0, 1.0]`` to its raw data
@@ -335,17 +321,12 @@ def prepareData(data,
                 - Inverse of ``voxValXform``.
     """
 
-    dtype         = data.dtype
+    dtype         = _makeInstance(dtype)
     floatTextures = canUseFloatTextures()
 
     if normalise: dmin, dmax = normaliseRange
     else:         dmin, dmax = 0, 0
 
-    if normalise                  and \
-       prefilter      is not None and \
-       prefilterRange is not None:
-        dmin, dmax = prefilterRange(dmin, dmax)
-
     # Offsets/scales which can be used to transform from
     # the texture data (which may be offset or normalised)
     # back to the original voxel data
@@ -381,6 +362,59 @@ def prepareData(data,
             invScale,
             -offset * invScale)
 
+    return voxValXform, invVoxValXform
+
+
+def prepareData(data,
+                prefilter=None,
+                prefilterRange=None,
+                resolution=None,
+                scales=None,
+                normalise=None,
+                normaliseRange=None):
+    """This function prepares and returns the given ``data``, ready to be
+    used as GL texture data.
+
+    This process potentially involves:
+
+      - Resampling to a different resolution (see the
+        :func:`.routines.subsample` function).
+
+      - Pre-filtering (see the ``prefilter`` parameter to
+        :meth:`__init__`).
+
+      - Normalising (if the ``normalise`` parameter to :meth:`__init__`
+        was ``True``, or if the data type cannot be used as-is).
+
+      - Casting to a different data type (if the data type cannot be used
+        as-is).
+
+    :returns: A tuple containing:
+
+                - A ``numpy`` array containing the image data, ready to be
+                   copied to the GPU.
+
+                - An affine transformation matrix which encodes an offset
+                  and a scale, which may be used to transform the texture
+                  data from the range ``[0.0, 1.0]`` to its raw data
+                  range.
+
+                - Inverse of ``voxValXform``.
+    """
+
+    dtype         = data.dtype
+    floatTextures = canUseFloatTextures()
+
+    if normalise: dmin, dmax = normaliseRange
+    else:         dmin, dmax = 0, 0
+
+    if normalise                  and \
+       prefilter      is not None and \
+       prefilterRange is not None:
+        dmin, dmax = prefilterRange(dmin, dmax)
+
+    voxValXform, invVoxValXform = valueXforms(dtype, normalise, (dmin, dmax))
+
     if resolution is not None:
         data = glroutines.subsample(data, resolution, pixdim=scales)[0]
 
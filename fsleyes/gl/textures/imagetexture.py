@@ -16,11 +16,14 @@ import collections.abc as abc
 
 import numpy as np
 
+import fsl.data.image                   as fslimage
 import fsl.transform.affine             as affine
+import fsl.utils.naninfrange            as nir
 import fsleyes.data.imagewrapper        as imagewrapper
 import fsleyes_widgets                  as fwidgets
 import fsleyes.displaycontext.niftiopts as niftiopts
 import fsleyes.gl.textures.data         as texdata
+import fsleyes.gl.textures.prefetch     as prefetch
 import fsleyes.gl.textures.texture2d    as texture2d
 import fsleyes.gl.textures.texture3d    as texture3d
 
@@ -44,6 +47,27 @@ class ImageTextureBase:
     :class:`ImageTexture2D` classes. Contains logic for retrieving a
     specific volume from a 3D + time or 2D + time :class:`.Image`, and
     for retrieving a specific channel from an RGB(A) ``Image``.
+
+    For images with more than one volume, a :class:`.VolumePrefetcher` is
+    created the first time that the volume is changed, so that subsequent
+    volumes can be read and prepared ahead of time (see the
+    :func:`.prefetch.usePrefetch` function).
+
+    When the image data is changed, only the region of the texture which
+    contains the changed data is refreshed. If the texture data is normalised
+    (see :meth:`.Texture.normalise`), and the new data lies outside of the
+    current normalisation range, the texture is re-normalised to a range
+    which is widened by :attr:`normaliseHeadroom`, so that subsequent changes
+    are unlikely to require another full refresh. A full refresh cannot be
+    avoided in this case, as normalised texture data can only store values
+    within the normalisation range. Texture data is only normalised when
+    floating point textures are not available.
+    """
+
+
+    normaliseHeadroom = 0.25
+    """Proportion by which the normalisation range is widened when the image
+    data is changed to lie outside of the current normalisation range.
     """
 
 
@@ -100,10 +124,17 @@ class ImageTextureBase:
 
         self.validateShape(image, nvals, ndims)
 
-        self.__name    = 'ImageTextureBase_{}'.format(id(self))
-        self.__image   = image
-        self.__volume  = None
-        self.__channel = None
+        self.__name       = 'ImageTextureBase_{}'.format(id(self))
+        self.__image      = image
+        self.__volume     = None
+        self.__channel    = None
+        self.__prefetcher = None
+
+        # True if the normalisation range
+        # was derived from the image data
+        # range, False if it was specified
+        # by the caller.
+        self.__autoNormRange = True
 
         self.__image.register(self.__name,
                               self.__imageDataChanged,
@@ -117,6 +148,10 @@ class ImageTextureBase:
         self.__image.deregister(self.__name, 'data')
         self.__image = None
 
+        if self.__prefetcher is not None:
+            self.__prefetcher.destroy()
+            self.__prefetcher = None
+
 
     @property
     def image(self):
@@ -142,6 +177,15 @@ class ImageTextureBase:
         self.set(volume=volume)
 
 
+    @property
+    def prefetcher(self):
+        """Returns the :class:`.VolumePrefetcher` used by this
+        ``ImageTextureBase``, or ``None`` if volumes are not being
+        prefetched.
+        """
+        return self.__prefetcher
+
+
     @property
     def channel(self):
         """For :class:`.Image` instances with multiple values per voxel, such
@@ -193,7 +237,9 @@ class ImageTextureBase:
         if len(image.shape) == 3: volume  = None
         if image.nvals      == 1: channel = None
 
-        if normRange is None:
+        autoNormRange = normRange is None
+
+        if autoNormRange:
             normRange = image.dataRange
 
         if ndims == 3 or nvals > 1:
@@ -216,21 +262,83 @@ class ImageTextureBase:
         if not volRefresh:
             return kwargs
 
-        self.__volume  = volume
-        self.__channel = channel
+        # Start prefetching the first
+        # time the volume is changed
+        if self.__prefetcher is None     and \
+           self.__volume     is not None and \
+           self.__volume     != volume   and \
+           prefetch.usePrefetch(image):
+            self.__prefetcher = prefetch.VolumePrefetcher(self)
 
-        if volRefresh:
-            data = self.__getData(volume, channel)
-            data = self.shapeData(data)
-        else:
-            data = None
+        self.__volume        = volume
+        self.__channel       = channel
+        self.__autoNormRange = autoNormRange
 
-        kwargs['data']           = data
+        kwargs.update(self.prepareVolumeArgs(volume, channel))
         kwargs['normaliseRange'] = normRange
 
         return kwargs
 
 
+    def prepareVolumeArgs(self, volume, channel):
+        """Called by :meth:`prepareSetArgs` when the texture data needs to
+        be refreshed for a new ``volume``/``channel``.
+
+        This implementation extracts the data for the volume/channel from the
+        image, and returns it as ``{'data' : data}``. Sub-classes may override
+        this method to avoid loading the full volume (see the
+        :class:`.BrickedImageTexture`).
+
+        :arg volume:  Volume index/indices, for images with more than three
+                      dimensions.
+        :arg channel: Channel, for RGB(A) images.
+        :returns:     A ``dict`` of arguments to be passed to ``set``.
+        """
+        prefetcher = self.__prefetcher
+        data       = None
+
+        if prefetcher is not None and volume is not None:
+            data = prefetcher.lookup(volume, channel)
+
+        if data is None:
+            data = self.volumeData(volume, channel)
+            if prefetcher is not None and volume is not None:
+                prefetcher.add(volume, channel, data)
+
+        return {'data' : data}
+
+
+    def volumeData(self, volume, channel):
+        """Extracts and returns the data for the given ``volume`` and
+        ``channel`` from the image, shaped so that it can be used as texture
+        data.
+        """
+        return self.shapeData(self.__getData(volume, channel))
+
+
+    def doPrepare(self, data):
+        """Overrides :meth:`.Texture.doPrepare`. If the ``data`` has already
+        been prepared by the :class:`.VolumePrefetcher`, the prepared data is
+        returned. Otherwise the data is prepared, and passed to the
+        ``VolumePrefetcher``.
+        """
+
+        prefetcher = self.__prefetcher
+        settings   = self.prepareSettings()
+
+        if prefetcher is not None:
+            prepared = prefetcher.prepared(data, settings)
+            if prepared is not None:
+                return prepared
+
+        prepared = texdata.prepareData(data, **settings)
+
+        if prefetcher is not None:
+            prefetcher.setPrepared(data, settings, prepared)
+
+        return prepared
+
+
     def __getData(self, volume, channel):
         """Extracts data from the :class:`.Image` for use as texture data.
 
@@ -278,7 +386,9 @@ class ImageTextureBase:
 
     def __imageDataChanged(self, image, topic, sliceobj):
         """Called when the :class:`.Image` notifies about a data changes.
-        Triggers an image texture refresh via a call to :meth:`set`.
+        Refreshes the part of the texture which contains the changed data,
+        via :meth:`patchData`, or refreshes the full texture via a call to
+        :meth:`set` if necessary.
 
         :arg image:    The ``Image`` instance
 
@@ -288,47 +398,151 @@ class ImageTextureBase:
                        that was changed.
         """
 
-        # TODO If the change has caused the image
-        #      data range to change, and texture
-        #      data normalisation is on, you have
-        #      to refresh the full texture.
-        #
-        #      The Image instance does follow up
-        #      data change notifications with a
-        #      data range notification; perhaps
-        #      you can use this somehow.
-
-        # If the data change was performed using
-        # normal array indexing, we can just replace
-        # that part of the image texture.
-        if isinstance(sliceobj, tuple):
-
-            # Get the new data, and calculate an
-            # offset into the full image from the
-            # slice object.
-            data   = np.array(image[sliceobj])
-            offset = imagewrapper.sliceObjToSliceTuple(sliceobj, image.shape)
-            offset = [o[0] for o in offset]
-
-            # Make sure the data/offset are
-            # compatible with 2D textures
-            data       = self.shapeData(data, oldShape=image.shape)
-            offset[:3] = affine.transform(
-                offset[:3], self.texCoordXform(image.shape))
-
-            log.debug('%s data changed - refreshing part of '
-                      'texture (offset: %s, size: %s)',
-                      image.name, offset, data.shape)
-
-            self.patchData(data, offset)
-
-        # Otherwise (boolean array indexing) we have
-        # to replace the whole image texture.
+        # Any prefetched volumes are now stale
+        if self.__prefetcher is not None:
+            self.__prefetcher.clear()
+
+        shape  = image.shape
+        volume = self.__volume
+
+        # Figure out the bounding box of the
+        # change - for boolean array indexing,
+        # this is the extent of the selected
+        # voxels.
+        if fslimage.isValidFancySliceObj(sliceobj, shape):
+            slices = imagewrapper.fancySliceBoundingBox(sliceobj, shape)
+
+            # Nothing was changed
+            if slices is None:
+                return
+
+        elif isinstance(sliceobj, tuple):
+            slices = imagewrapper.sliceObjToSliceTuple(sliceobj, shape)
         else:
+            slices = None
+
+        # We can't easily patch multi-valued
+        # textures (e.g. RGB, or volumes as
+        # channels), or single channels of
+        # multi-valued images, so these are
+        # refreshed in full.
+        if slices is None            or \
+           self.nvals > 1            or \
+           self.__channel is not None:
             log.debug('%s data changed - refreshing '
                       'full texture', image.name)
-
             self.set()
+            return
+
+        # If the change was to a different
+        # volume, the texture is unaffected
+        if volume is not None:
+            for (lo, hi), v in zip(slices[3:], volume):
+                if v < lo or v >= hi:
+                    return
+            slices = slices[:3] + tuple((v, v + 1) for v in volume)
+
+        # Get the new data, and calculate an
+        # offset into the full image from the
+        # slice object.
+        data   = np.array(image[imagewrapper.sliceTupleToSliceObj(slices)])
+        data   = data.reshape([hi - lo for lo, hi in slices[:3]])
+        offset = [lo for lo, _ in slices[:3]]
+
+        # If the texture data is normalised to the
+        # image data range, and the new data lies
+        # outside of that range, the whole texture
+        # needs to be re-normalised. This cannot be
+        # absorbed by only updating voxValXform (and
+        # hence the shader uniforms), as normalised
+        # texture data is stored as integers which
+        # span the normalisation range - values
+        # outside of it cannot be stored without
+        # re-encoding all of the existing data.
+        # Textures are only normalised when floating
+        # point textures are unavailable - otherwise
+        # changes to the data range never require
+        # the texture to be refreshed. The headroom
+        # added by __widenNormaliseRange means that
+        # this should happen rarely.
+        if self.__needsRenormalise(data):
+            normRange = self.__widenNormaliseRange(data)
+
+            log.debug('%s data changed outside of normalisation range - '
+                      'refreshing full texture with new range %s',
+                      image.name, normRange)
+
+            self.set(normaliseRange=normRange)
+            self.__autoNormRange = True
+            return
+
+        # Make sure the data/offset are
+        # compatible with 2D textures
+        data   = self.shapeData(data, oldShape=shape[:3])
+        offset = affine.transform(offset, self.texCoordXform(shape))
+
+        log.debug('%s data changed - refreshing part of '
+                  'texture (offset: %s, size: %s)',
+                  image.name, offset, data.shape)
+
+        self.patchData(data, offset)
+
+
+    def __needsRenormalise(self, data):
+        """Called by :meth:`__imageDataChanged`. Returns ``True`` if the
+        texture data is normalised to the image data range, and the given
+        ``data`` lies outside of the current normalisation range, ``False``
+        otherwise. Data outside of a normalisation range which has been
+        specified by the caller is clipped, so does not require the texture
+        to be re-normalised.
+        """
+
+        if not (self.normalise and self.__autoNormRange):
+            return False
+
+        # We can't easily determine the
+        # range of prefiltered data
+        if self.prefilter is not None:
+            return True
+
+        normRange = self.normaliseRange
+
+        if normRange is None or data.size == 0:
+            return False
+
+        dmin, dmax = normRange
+        pmin, pmax = nir.naninfrange(data)
+
+        if pmin is None or np.isnan(pmin):
+            return False
+
+        return pmin < dmin or pmax > dmax
+
+
+    def __widenNormaliseRange(self, data):
+        """Called by :meth:`__imageDataChanged`. Calculates and returns a new
+        normalisation range which includes the current normalisation range,
+        the image data range, and the range of the given ``data``, and which
+        is widened by :attr:`normaliseHeadroom` on the side(s) that have been
+        exceeded.
+        """
+
+        imin, imax = self.image.dataRange
+
+        if self.prefilter is not None:
+            return imin, imax
+
+        dmin, dmax = self.normaliseRange
+        pmin, pmax = nir.naninfrange(data)
+
+        lo    = min(v for v in (dmin, imin, pmin) if v is not None)
+        hi    = max(v for v in (dmax, imax, pmax) if v is not None)
+        width = (hi - lo) * self.normaliseHeadroom
+
+        if lo < dmin: lo = lo - width
+        if hi > dmax: hi = hi + width
+
+        return lo, hi
 
 
 class ImageTexture(ImageTextureBase, texture3d.Texture3D):
@@ -0,0 +1,400 @@
+#!/usr/bin/env python
+#
+# prefetch.py - The VolumePrefetcher class.
+#
+# Author: Paul McCarthy <pauldmccarthy@gmail.com>
+#
+"""This module provides the :class:`VolumePrefetcher` class, which is used by
+the :class:`.ImageTexture` and :class:`.ImageTexture2D` classes to read and
+prepare volumes of a 4D :class:`.Image` ahead of time, so that changes to the
+displayed volume (e.g. in movie mode) do not have to wait for the data to be
+loaded.
+
+.. autosummary::
+   :nosignatures:
+
+   usePrefetch
+   settingsKey
+"""
+
+
+import              logging
+import              threading
+import              collections
+import numpy     as np
+
+import fsl.utils.idle           as idle
+import fsl.utils.settings       as fslsettings
+import fsleyes.gl.textures.data as texdata
+
+
+log = logging.getLogger(__name__)
+
+
+def usePrefetch(image):
+    """Returns ``True`` if volumes of the given :class:`.Image` should be
+    prefetched, ``False`` otherwise. Prefetching is used for single-valued
+    images with more than one volume, and can be disabled by setting the
+    ``fsleyes.prefetch.budget`` setting to ``0``.
+    """
+
+    budget = fslsettings.read('fsleyes.prefetch.budget', 536870912)
+
+    if budget is None or budget <= 0:
+        return False
+
+    return image.nvals == 1      and \
+           len(image.shape) >= 4 and \
+           image.shape[3] > 1
+
+
+def settingsKey(settings):
+    """Converts a dictionary of texture settings, as returned by
+    :meth:`.Texture.prepareSettings`, into a hashable value which can be
+    compared against the settings for other volumes. The normalisation
+    ranges are ignored if normalisation is disabled, as they do not affect
+    the prepared data.
+    """
+
+    settings = dict(settings)
+
+    if not settings.get('normalise', False):
+        settings.pop('normaliseRange', None)
+        settings.pop('prefilterRange', None)
+
+    def conv(val):
+        if isinstance(val, (list, tuple, np.ndarray)):
+            return tuple(float(v) for v in val)
+        return val
+
+    return tuple((k, conv(settings[k])) for k in sorted(settings.keys()))
+
+
+class VolumePrefetcher:
+    """A ``VolumePrefetcher`` maintains a ring of volumes, for a single
+    :class:`.ImageTextureBase`, which have been read from the image, and
+    passed through :func:`.data.prepareData` ahead of time.
+
+    Every time the texture volume changes, the texture calls :meth:`lookup`.
+    The ``VolumePrefetcher`` records the direction in which the volume is
+    moving, along the fourth image dimension, and schedules the next few
+    volumes in that direction to be read and prepared on a separate thread
+    (wrapping around at either end, as is the case in movie mode). Volumes
+    behind the current volume are discarded first when the memory budget is
+    exceeded.
+
+    The number of volumes which are prefetched is controlled by the
+    ``fsleyes.prefetch.ahead`` setting (default 8), and the maximum amount of
+    memory used by the ring is controlled by the ``fsleyes.prefetch.budget``
+    setting (default 512MB).
+
+    The number of hits and misses (volumes which were/were not available
+    when they were requested) are available via the :meth:`stats` method.
+
+    GPU-side storage is not managed by the ``VolumePrefetcher`` - a volume
+    change still results in the prepared data being copied to the texture.
+    """
+
+
+    def __init__(self, texture, budget=None, ahead=None, threaded=True):
+        """Create a ``VolumePrefetcher``.
+
+        :arg texture:  The :class:`.ImageTextureBase` instance
+        :arg budget:   Maximum memory, in bytes, to use. Defaults to the
+                       ``fsleyes.prefetch.budget`` setting.
+        :arg ahead:    Maximum number of volumes to prefetch. Defaults to the
+                       ``fsleyes.prefetch.ahead`` setting.
+        :arg threaded: If ``True`` (the default), volumes are prefetched on a
+                       separate thread, which is started the first time
+                       that a volume needs to be prefetched. Otherwise they
+                       are prefetched immediately (intended for testing).
+        """
+
+        if budget is None:
+            budget = fslsettings.read('fsleyes.prefetch.budget', 536870912)
+        if ahead is None:
+            ahead = fslsettings.read('fsleyes.prefetch.ahead', 8)
+
+        self.__texture  = texture
+        self.__name     = '{}_{}'.format(type(self).__name__, id(self))
+        self.__budget   = int(budget)
+        self.__ahead    = int(ahead)
+        self.__threaded = threaded
+        self.__thread   = None
+        self.__lock     = threading.RLock()
+
+        # { (volume, channel) : [raw, settings, prepared] }
+        # in least recently used order
+        self.__entries  = collections.OrderedDict()
+        self.__last     = None
+        self.__window   = []
+        self.__pending  = set()
+        self.__hits     = 0
+        self.__misses   = 0
+        self.__fetched  = 0
+
+        # Incremented on calls to clear, so
+        # that volumes which were being
+        # prefetched at the time are discarded
+        self.__generation = 0
+
+
+    def destroy(self):
+        """Must be called when this ``VolumePrefetcher`` is no longer needed.
+        """
+        with self.__lock:
+            self.__threaded = False
+            if self.__thread is not None:
+                self.__thread.stop()
+        self.clear()
+        self.__thread  = None
+        self.__texture = None
+
+
+    def stats(self):
+        """Returns a dictionary containing statistics about this
+        ``VolumePrefetcher``:
+
+        ============= =====================================================
+        ``hits``      Number of volume requests which were available.
+        ``misses``    Number of volume requests which were not available.
+        ``fetched``   Number of volumes which have been prefetched.
+        ``volumes``   Number of volumes currently stored.
+        ``size``      Memory, in bytes, currently in use.
+        ``budget``    Maximum memory, in bytes.
+        ============= =====================================================
+        """
+        with self.__lock:
+            return {'hits'    : self.__hits,
+                    'misses'  : self.__misses,
+                    'fetched' : self.__fetched,
+                    'volumes' : len(self.__entries),
+                    'size'    : self.__size(),
+                    'budget'  : self.__budget}
+
+
+    def clear(self):
+        """Discards all stored volumes, and cancels any pending prefetches.
+        Called when the image data changes.
+        """
+        with self.__lock:
+            if self.__thread is not None:
+                for volume, channel in self.__pending:
+                    self.__thread.dequeue(self.__taskName(volume, channel))
+            self.__pending.clear()
+            self.__entries.clear()
+            self.__generation += 1
+
+
+    def lookup(self, volume, channel):
+        """Returns the data for the given ``volume`` and ``channel``, if it
+        has been prefetched, or ``None`` otherwise. The next volumes, in the
+        direction of the most recent volume changes, are scheduled for
+        prefetching.
+
+        :arg volume:  Sequence of volume indices
+        :arg channel: Channel index, or ``None``
+        """
+
+        volume = tuple(volume)
+        key    = (volume, channel)
+
+        with self.__lock:
+            entry = self.__entries.get(key, None)
+
+            if entry is None:
+                self.__misses += 1
+                raw            = None
+            else:
+                self.__hits += 1
+                raw          = entry[0]
+                self.__entries.move_to_end(key)
+
+        self.__advance(volume, channel)
+
+        return raw
+
+
+    def add(self, volume, channel, raw):
+        """Adds the given ``raw`` data for the given ``volume`` and
+        ``channel``. Called by the texture after it has read a volume which
+        was not available, so that it will be available the next time it is
+        requested.
+        """
+        with self.__lock:
+            self.__entries[(tuple(volume), channel)] = [raw, None, None]
+            self.__evict()
+
+
+    def prepared(self, raw, settings):
+        """Returns the result of :func:`.data.prepareData` for the given
+        ``raw`` data (which must have been returned by :meth:`lookup`, or
+        passed to :meth:`add`), if it has already been prepared with the given
+        ``settings``. Otherwise returns ``None``.
+        """
+        key = settingsKey(settings)
+        with self.__lock:
+            for entry in self.__entries.values():
+                if entry[0] is raw:
+                    if entry[1] == key: return entry[2]
+                    else:               return None
+        return None
+
+
+    def setPrepared(self, raw, settings, prepared):
+        """Stores the result of :func:`.data.prepareData` for the given
+        ``raw`` data, with the given ``settings``.
+        """
+        key = settingsKey(settings)
+        with self.__lock:
+            for entry in self.__entries.values():
+                if entry[0] is raw:
+                    entry[1] = key
+                    entry[2] = prepared
+                    break
+            self.__evict()
+
+
+    def __size(self):
+        """Returns the memory, in bytes, used by all stored volumes. """
+        size = 0
+        for raw, _, prepared in self.__entries.values():
+            size += raw.nbytes
+            if prepared is not None and prepared[0] is not raw:
+                size += prepared[0].nbytes
+        return size
+
+
+    def __evict(self):
+        """Removes stored volumes until the memory budget is satisfied.
+        Volumes which are not in the prefetch window are removed first,
+        in least recently used order, followed by the volumes which are
+        furthest ahead in the window. The most recently used volume is
+        never removed.
+        """
+
+        window = self.__window
+
+        while len(self.__entries) > 1 and self.__size() > self.__budget:
+
+            keys   = list(self.__entries.keys())[:-1]
+            behind = [k for k in keys if k[0] not in window]
+
+            if len(behind) > 0:
+                self.__entries.pop(behind[0])
+            else:
+                self.__entries.pop(max(keys, key=lambda k: window.index(k[0])))
+
+
+    def __advance(self, volume, channel):
+        """Called by :meth:`lookup`. Updates the prefetch window, and
+        schedules volumes within the window to be prefetched.
+        """
+
+        texture = self.__texture
+        nvols   = texture.image.shape[3]
+        last    = self.__last
+        self.__last = volume
+
+        if last is None or last[1:] != volume[1:] or last[0] == volume[0]:
+            return
+
+        # Figure out which direction we are
+        # moving in, allowing for wrap-around
+        delta = (volume[0] - last[0]) % nvols
+        if delta <= nvols // 2: step =  1
+        else:                   step = -1
+
+        # Limit the number of volumes
+        # to the memory budget
+        volbytes = np.prod(texture.image.shape[:3]) * \
+                   texture.image.dtype.itemsize
+        ahead    = int(self.__budget // max(volbytes, 1)) - 1
+        ahead    = min(ahead, self.__ahead, nvols - 1)
+
+        if ahead <= 0:
+            return
+
+        window = [((volume[0] + step * i) % nvols,) + volume[1:]
+                  for i in range(1, ahead + 1)]
+        settings = texture.prepareSettings()
+
+        with self.__lock:
+            self.__window = [volume] + window
+
+            # Cancel prefetches which
+            # are no longer needed
+            if self.__thread is not None:
+                for vol, chan in list(self.__pending):
+                    if vol not in self.__window:
+                        self.__thread.dequeue(self.__taskName(vol, chan))
+                        self.__pending.discard((vol, chan))
+
+            todo = [v for v in window
+                    if (v, channel) not in self.__entries]
+
+            # The prefetch thread is started
+            # the first time that it is needed
+            if self.__threaded and self.__thread is None and len(todo) > 0:
+                self.__thread        = idle.TaskThread()
+                self.__thread.daemon = True
+                self.__thread.start()
+
+            thread = self.__thread
+
+        generation = self.__generation
+
+        for vol in todo:
+            if thread is None:
+                self.__prefetch(vol, channel, settings, generation)
+                continue
+
+            if (vol, channel) in self.__pending:
+                continue
+
+            self.__pending.add((vol, channel))
+            thread.enqueue(self.__prefetch,
+                           vol,
+                           channel,
+                           settings,
+                           generation,
+                           taskName=self.__taskName(vol, channel))
+
+
+    def __taskName(self, volume, channel):
+        """Returns a name to use for the task which prefetches the given
+        volume.
+        """
+        return '{}_{}_{}'.format(self.__name, volume, channel)
+
+
+    def __prefetch(self, volume, channel, settings, generation):
+        """Reads and prepares the given volume, and stores it. """
+
+        texture = self.__texture
+        key     = (volume, channel)
+
+        with self.__lock:
+            self.__pending.discard(key)
+            if texture is None or key in self.__entries:
+                return
+
+            # stop if the budget has been used up
+            # by volumes which are in the window
+            if self.__size() >= self.__budget and \
+               all(k[0] in self.__window for k in self.__entries):
+                return
+
+        raw      = texture.volumeData(volume, channel)
+        prepared = texdata.prepareData(raw, **settings)
+
+        with self.__lock:
+            if volume     not in self.__window or \
+               generation != self.__generation:
+                return
+            self.__entries[key] = [raw, settingsKey(settings), prepared]
+            self.__entries.move_to_end(key, last=False)
+            self.__fetched += 1
+            self.__evict()
+
+        log.debug('%s: prefetched volume %s', texture.name, volume)
@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+#
+# pyramidtexture.py - The PyramidLevelTexture class.
+#
+# Author: Paul McCarthy <pauldmccarthy@gmail.com>
+#
+"""This module provides the :class:`PyramidLevelTexture` class, a
+:class:`.Texture3D` which stores one level of an :class:`.ImagePyramid`.
+"""
+
+
+import fsl.transform.affine          as affine
+import fsleyes.gl.textures.texture3d as texture3d
+
+
+class PyramidLevelTexture(texture3d.Texture3D):
+    """A ``PyramidLevelTexture`` stores a downsampled copy of one volume of an
+    :class:`.Image`, as calculated by an :class:`.ImagePyramid`. It may be
+    used in place of an :class:`.ImageTexture` when an image is displayed at
+    a low magnification.
+
+    Because the shape of a downsampled level is rounded up, a level may
+    cover slightly more space than the original image. The
+    :meth:`texCoordXform` method is overridden to account for this, so that
+    image texture coordinates can be used to sample a ``PyramidLevelTexture``.
+    """
+
+
+    def __init__(self, name, pyramid, factor, volume=None, **kwargs):
+        """Create a ``PyramidLevelTexture``.
+
+        :arg name:    A unique name for this texture.
+        :arg pyramid: The :class:`.ImagePyramid`.
+        :arg factor:  Downsampling factor of the level to store.
+        :arg volume:  Indices into the fourth and higher image dimensions.
+
+        All other arguments are passed through to
+        :meth:`.Texture3D.__init__`. The level must be available (see
+        :meth:`.ImagePyramid.readyFactors`).
+        """
+
+        data = pyramid.level(factor, volume)
+
+        if data is None:
+            raise ValueError('Pyramid level {} is not available for '
+                             'volume {}'.format(factor, volume))
+
+        self.__factor = factor
+        self.__volume = volume
+
+        kwargs['nvals'] = 1
+        kwargs['data']  = data
+
+        texture3d.Texture3D.__init__(self, name, **kwargs)
+
+
+    @property
+    def factor(self):
+        """Returns the downsampling factor of the level stored in this
+        ``PyramidLevelTexture``.
+        """
+        return self.__factor
+
+
+    @property
+    def volume(self):
+        """Returns the volume of the level stored in this
+        ``PyramidLevelTexture``.
+        """
+        return self.__volume
+
+
+    def texCoordXform(self, origShape):
+        """Overrides :meth:`.Texture.texCoordXform`. Returns a transform which
+        scales image texture coordinates into the texture coordinates of this
+        level.
+        """
+        scales = [s / float(l * self.__factor)
+                  for s, l in zip(origShape[:3], self.shape[:3])]
+        return affine.scaleOffsetXform(scales, 0)
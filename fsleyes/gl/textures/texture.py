@@ -49,6 +49,7 @@ class TextureBase:
        ndim
        nvals
        isBound
+       textureUnit
        bound
        bindTexture
        unbindTexture
@@ -172,6 +173,15 @@ class TextureBase:
         return self.__bound > 0
 
 
+    @property
+    def textureUnit(self):
+        """Returns the texture unit that this texture is currently bound to,
+        or ``None`` if it is not bound, or was bound without specifying a
+        texture unit.
+        """
+        return self.__textureUnit
+
+
     @contextlib.contextmanager
     def bound(self, textureUnit=None):
         """Context manager which can be used to bind and unbind this texture,
@@ -503,6 +513,8 @@ class Texture(notifier.Notifier, TextureBase, TextureSettingsMixin):
     ``Texture`` sub-classes (e.g. :class:`.Texture2D`, :class:`.Texture3D`,
     :class:`.ColourMapTexture`) must override the :meth:`doRefresh` method
     such that it performs the GL calls required to configure the textureb.
+    Sub-classes may also override the :meth:`doPrepare` method, e.g. to use
+    data which has already been prepared.
 
 
     See the :mod:`.resources` module for a method of sharing texture resources.
@@ -728,6 +740,29 @@ class Texture(notifier.Notifier, TextureBase, TextureSettingsMixin):
         self.set(data=data)
 
 
+    def prepareSettings(self):
+        """Returns a dictionary containing the current texture settings which
+        are passed to the :func:`.data.prepareData` function.
+        """
+        return {'prefilter'      : self.prefilter,
+                'prefilterRange' : self.prefilterRange,
+                'resolution'     : self.resolution,
+                'scales'         : self.scales,
+                'normalise'      : self.normalise,
+                'normaliseRange' : self.normaliseRange}
+
+
+    def doPrepare(self, data):
+        """Prepares the given ``data`` so that it can be copied to the GPU.
+        Called by :meth:`refresh` (possibly on a separate thread).
+
+        This implementation passes the data, along with the current
+        :meth:`prepareSettings`, to :func:`.data.prepareData`, and returns its
+        result. Sub-classes may override this method.
+        """
+        return texdata.prepareData(data, **self.prepareSettings())
+
+
     @property
     def preparedData(self):
         """Returns the prepared data, i.e. the data as it has been copied
@@ -1068,9 +1103,10 @@ class Texture(notifier.Notifier, TextureBase, TextureSettingsMixin):
     def __prepareTextureData(self):
         """Prepare the texture data.
 
-        This method passes the stored data to the :func:`.data.prepareData`
-        function and then stores references to its return valuesa as
-        attributes on this ``Texture`` instance:
+        This method passes the stored data to the :meth:`doPrepare` method
+        (which by default calls :func:`.data.prepareData`) and then stores
+        references to its return valuesa as attributes on this ``Texture``
+        instance:
 
         ==================== =============================================
         ``__preparedata``    A ``numpy`` array containing the image data,
@@ -1085,14 +1121,7 @@ class Texture(notifier.Notifier, TextureBase, TextureSettingsMixin):
         ==================== =============================================
         """
 
-        data, voxValXform, invVoxValXform = texdata.prepareData(
-            self.__data,
-            prefilter=self.prefilter,
-            prefilterRange=self.prefilterRange,
-            resolution=self.resolution,
-            scales=self.scales,
-            normalise=self.normalise,
-            normaliseRange=self.normaliseRange)
+        data, voxValXform, invVoxValXform = self.doPrepare(self.__data)
 
         self.__preparedData   = data
         self.__dtype          = data.dtype
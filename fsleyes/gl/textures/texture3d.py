@@ -78,33 +78,41 @@ class Texture3D(texture.Texture):
 
         data = self.preparedData
 
-        if data is None:
+        if data is None and self.shape is None:
             return
 
         log.debug('Configuring 3D texture (id %s) for %s (data shape: %s)',
                   self.name, self.handle, self.shape)
 
-        # First dimension for multi-
-        # valued textures
-        if self.nvals > 1: shape = data.shape[1:]
-        else:              shape = data.shape
-
-        # The image data is flattened, with
-        # fortran dimension ordering, so the
-        # data, as stored on the GPU, has its
-        # first dimension as the fastest
-        # changing.
-        data = np.asarray(data.ravel(order='F'))
-
-        # PyOpenGL needs the data array
-        # to be writeable, as it uses
-        # PyArray_ISCARRAY to check
-        # for contiguousness. but if the
-        # data has come from a nibabel
-        # ArrayProxy, the writeable flag
-        # will be set to False for some
-        # reason.
-        data    = dutils.makeWriteable(data)
+        # If we have not been given any data,
+        # we just allocate texture storage of
+        # the requested shape - the data may
+        # be populated later via doPatch.
+        # Otherwise the first dimension is
+        # ignored for multi-valued textures.
+        if   data is None:   shape = self.shape
+        elif self.nvals > 1: shape = data.shape[1:]
+        else:                shape = data.shape
+
+        if data is not None:
+
+            # The image data is flattened, with
+            # fortran dimension ordering, so the
+            # data, as stored on the GPU, has its
+            # first dimension as the fastest
+            # changing.
+            data = np.asarray(data.ravel(order='F'))
+
+            # PyOpenGL needs the data array
+            # to be writeable, as it uses
+            # PyArray_ISCARRAY to check
+            # for contiguousness. but if the
+            # data has come from a nibabel
+            # ArrayProxy, the writeable flag
+            # will be set to False for some
+            # reason.
+            data = dutils.makeWriteable(data)
+
         interp  = self.interp
         intFmt  = self.internalFormat
         baseFmt = self.baseFormat
@@ -204,13 +204,15 @@ class FSLeyesApp(wx.App):
             if len(overlays) == 0:
                 return
 
-            self.__overlayList.extend(overlays)
+            with self.__overlayList.batch():
 
-            if self.__displayCtx.autoDisplay:
-                for overlay in overlays:
-                    autodisplay.autoDisplay(overlay,
-                                            self.__overlayList,
-                                            self.__displayCtx)
+                self.__overlayList.extend(overlays)
+
+                if self.__displayCtx.autoDisplay:
+                    for overlay in overlays:
+                        autodisplay.autoDisplay(overlay,
+                                                self.__overlayList,
+                                                self.__displayCtx)
 
         loadoverlay.loadOverlays(
             filenames,
@@ -231,8 +233,7 @@ def main(args=None):
     # be called via fsleyes.main
     if len(args) >= 1 and args[0] == 'render':
         import fsleyes.render as render
-        render.main(args[1:])
-        sys.exit(0)
+        sys.exit(render.main(args[1:]) or 0)
 
     # the fsleyes.initialise function figures
     # out the path to asset files (e.g. cmaps)
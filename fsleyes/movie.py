@@ -0,0 +1,621 @@
+#!/usr/bin/env python
+#
+# movie.py - Stream rendered frames into a movie file.
+#
+# Author: Paul McCarthy <pauldmccarthy@gmail.com>
+#
+"""This module provides the :class:`MovieWriter` class and its sub-classes,
+which are used to save a sequence of rendered frames as a movie. Frames are
+encoded and written as soon as they are received, so a movie of any length
+can be saved while only a few frames are held in memory at any one time.
+
+The following writers are available:
+
+.. autosummary::
+   :nosignatures:
+
+   GifWriter
+   APNGWriter
+   PipeWriter
+
+The :func:`openMovie` function can be used to create a writer appropriate
+for a given file name. :class:`MovieWriter` instances are used by the
+:func:`.moviegif.makeGif` function, and by ``fsleyes render`` when the
+``--movie`` option is used.
+"""
+
+
+import os.path    as op
+import               os
+import               io
+import               queue
+import               shlex
+import               struct
+import               logging
+import               fractions
+import               threading
+import               zlib
+import subprocess as sp
+
+import numpy as np
+
+import fsl.utils.settings as fslsettings
+
+
+log = logging.getLogger(__name__)
+
+
+DEFAULT_COMMAND = 'ffmpeg -y -loglevel error -f rawvideo -pix_fmt rgb24 ' \
+                  '-s {width}x{height} -r {fps} -i - '                    \
+                  '-vf pad=ceil(iw/2)*2:ceil(ih/2)*2 -pix_fmt yuv420p '   \
+                  '{outfile}'
+"""Default command used by the :class:`PipeWriter` to encode movies, when
+``ffmpeg`` is available.
+"""
+
+
+def openMovie(filename, fps=None, command=None, bufferSize=None):
+    """Creates and returns a :class:`MovieWriter` which can be used to save
+    a movie to ``filename``. The movie format is determined by the file
+    suffix:
+
+      - ``.gif``: Animated GIF, via a :class:`GifWriter`
+      - ``.png`` or ``.apng``: Animated PNG, via an :class:`APNGWriter`
+      - Anything else: Raw frames are passed to an external encoder, via a
+        :class:`PipeWriter`.
+
+    :arg filename:   File to save the movie to.
+    :arg fps:        Frame rate in frames per second.
+    :arg command:    Encoder command, only used by the :class:`PipeWriter`.
+    :arg bufferSize: Maximum number of frames to queue for encoding (see
+                     :class:`MovieWriter`).
+    """
+
+    suffix = op.splitext(filename)[1].lower()
+
+    if suffix == '.gif':
+        return GifWriter(filename, fps, bufferSize=bufferSize)
+    elif suffix in ('.png', '.apng'):
+        return APNGWriter(filename, fps, bufferSize=bufferSize)
+    else:
+        return PipeWriter(filename, fps, command, bufferSize=bufferSize)
+
+
+class MovieWriter:
+    """Base class for movie writers. Frames are passed to the :meth:`addFrame`
+    method, and are encoded on a separate thread, so that the next frame can
+    be rendered while the previous one is being encoded. Up to ``bufferSize``
+    frames are queued for encoding - if the queue is full, :meth:`addFrame`
+    will block until the encoder has caught up. The :meth:`close` method
+    must be called once all frames have been added.
+
+    A ``MovieWriter`` can be used as a context manager - it is closed when
+    the ``with`` block exits, and the movie file is removed if an error
+    occurs within the block.
+
+    All frames must be ``numpy`` arrays of shape ``(height, width, 3)`` or
+    ``(height, width, 4)``, containing ``uint8`` RGB or RGBA values, and
+    must all have the same size. The alpha channel is discarded.
+
+    Sub-classes must implement the following methods:
+
+    .. autosummary::
+       :nosignatures:
+
+       _open
+       _write
+       _close
+
+    These methods are called on the encoding thread. If any of them raise an
+    error, the remaining frames are discarded, and the error is re-raised on
+    the next call to :meth:`addFrame` or :meth:`close`.
+    """
+
+
+    def __init__(self, filename, fps=None, bufferSize=None):
+        """Create a ``MovieWriter``.
+
+        :arg filename:   File to save the movie to.
+        :arg fps:        Frame rate in frames per second. Defaults to 10.
+        :arg bufferSize: Maximum number of frames to queue for encoding.
+                         Defaults to the ``fsleyes.movie.bufferSize`` setting
+                         (default 4).
+        """
+
+        if fps is None:
+            fps = 10
+        if bufferSize is None:
+            bufferSize = fslsettings.read('fsleyes.movie.bufferSize', 4)
+
+        if fps <= 0:
+            raise ValueError('Invalid frame rate: {}'.format(fps))
+
+        self.__filename = op.abspath(filename)
+        self.__fps      = fps
+        self.__shape    = None
+        self.__nframes  = 0
+        self.__error    = None
+        self.__closed   = False
+        self.__abort    = False
+        self.__queue    = queue.Queue(maxsize=max(1, int(bufferSize)))
+        self.__thread   = threading.Thread(
+            target=self.__encodeLoop,
+            name='{}_{}'.format(type(self).__name__, id(self)),
+            daemon=True)
+
+        self.__thread.start()
+
+
+    def __enter__(self):
+        """Returns this ``MovieWriter``. """
+        return self
+
+
+    def __exit__(self, exc, *a):
+        """Calls :meth:`close`. If an error has occurred, the movie is
+        discarded.
+        """
+        if exc is None:
+            self.close()
+        else:
+            try:
+                self.close(discard=True)
+            except Exception as e:
+                log.warning('Error closing movie %s: %s', self.filename, e)
+
+
+    @property
+    def filename(self):
+        """Returns the name of the movie file. """
+        return self.__filename
+
+
+    @property
+    def fps(self):
+        """Returns the movie frame rate in frames per second. """
+        return self.__fps
+
+
+    @property
+    def nframes(self):
+        """Returns the number of frames that have been added. """
+        return self.__nframes
+
+
+    def addFrame(self, frame):
+        """Adds a frame to the movie. The frame is copied, so the caller
+        is free to re-use the array.
+
+        :arg frame: ``numpy`` ``uint8`` array of shape ``(height, width, 3)``
+                    or ``(height, width, 4)``.
+        """
+
+        if self.__closed:
+            raise RuntimeError('Movie {} has been closed'.format(
+                self.filename))
+
+        self.__raiseError()
+
+        frame = np.asarray(frame)
+
+        if frame.ndim != 3 or frame.shape[2] not in (3, 4):
+            raise ValueError('Invalid frame shape: {}'.format(frame.shape))
+
+        frame = np.array(frame[:, :, :3], dtype=np.uint8, order='C')
+
+        if self.__shape is None:
+            self.__shape = frame.shape
+        elif frame.shape != self.__shape:
+            raise ValueError('Frame shape {} does not match movie shape '
+                             '{}'.format(frame.shape, self.__shape))
+
+        self.__queue.put(frame)
+        self.__nframes += 1
+
+
+    def close(self, discard=False):
+        """Waits for all queued frames to be encoded, and closes the movie.
+
+        :arg discard: If ``True``, any queued frames are dropped, and the
+                      movie file is removed.
+        """
+
+        if self.__closed:
+            return
+
+        self.__closed = True
+        self.__abort  = discard
+        self.__queue.put(None)
+        self.__thread.join()
+
+        if discard:
+            if op.exists(self.filename):
+                os.remove(self.filename)
+        else:
+            self.__raiseError()
+
+
+    def __raiseError(self):
+        """Raises the first error that occurred on the encoding thread, if
+        there is one.
+        """
+        if self.__error is not None:
+            raise self.__error
+
+
+    def __encodeLoop(self):
+        """Run on the encoding thread. Passes frames from the queue to the
+        :meth:`_open`, :meth:`_write`, and :meth:`_close` methods, until
+        :meth:`close` is called.
+        """
+
+        opened = False
+
+        while True:
+
+            frame = self.__queue.get()
+
+            if frame is None:
+                break
+
+            # After an error, or when the movie
+            # is being discarded, the remaining
+            # frames are drained and dropped,
+            # so that addFrame does not block.
+            if self.__error is not None or self.__abort:
+                continue
+
+            try:
+                if not opened:
+                    height, width = frame.shape[:2]
+                    opened        = True
+                    self._open(width, height)
+                self._write(frame)
+
+            except Exception as e:
+                log.error('Error encoding movie %s: %s',
+                          self.filename, e, exc_info=True)
+                self.__error = e
+
+        if opened:
+            try:
+                self._close(self.__abort or self.__error is not None)
+            except Exception as e:
+                log.error('Error closing movie %s: %s',
+                          self.filename, e, exc_info=True)
+                if self.__error is None:
+                    self.__error = e
+
+
+    def _open(self, width, height):
+        """Called with the first frame, before it is passed to :meth:`_write`.
+        Must be implemented by sub-classes to create the movie file.
+
+        :arg width:  Frame width in pixels
+        :arg height: Frame height in pixels
+        """
+        raise NotImplementedError()
+
+
+    def _write(self, frame):
+        """Must be implemented by sub-classes to encode and write the given
+        frame, a ``(height, width, 3)`` ``uint8`` array.
+        """
+        raise NotImplementedError()
+
+
+    def _close(self, abort):
+        """Called after the last frame has been written, if :meth:`_open`
+        was called. Must be implemented by sub-classes to finalise and close
+        the movie file.
+
+        :arg abort: If ``True``, the movie is about to be discarded, so does
+                    not need to be finalised.
+        """
+        raise NotImplementedError()
+
+
+class GifWriter(MovieWriter):
+    """The ``GifWriter`` saves a movie as an animated GIF, which loops
+    forever. Each frame is quantised to its own 256-colour palette via
+    ``PIL``, and is appended to the file as soon as it has been encoded.
+    """
+
+
+    def __init__(self, filename, fps=None, **kwargs):
+        """Create a ``GifWriter``. All arguments are passed through to
+        :meth:`MovieWriter.__init__`.
+        """
+        MovieWriter.__init__(self, filename, fps, **kwargs)
+        self.__file  = None
+        self.__delay = max(1, int(round(100 / self.fps)))
+
+
+    def _open(self, width, height):
+        """Creates the GIF file, and writes the GIF header and loop
+        extension.
+        """
+
+        self.__file = open(self.filename, 'wb')
+
+        # Logical screen descriptor with no global
+        # colour table - every frame has its own
+        # colour table.  Followed by a "NETSCAPE2.0"
+        # application extension, which tells viewers
+        # to loop the movie indefinitely.
+        self.__file.write(b'GIF89a')
+        self.__file.write(struct.pack('<HHBBB', width, height, 0, 0, 0))
+        self.__file.write(b'\x21\xff\x0bNETSCAPE2.0\x03\x01\x00\x00\x00')
+
+
+    def _write(self, frame):
+        """Quantises the frame, and appends it to the GIF file. """
+
+        import PIL.Image as Image
+
+        # Encode the frame as a single-frame GIF,
+        # and then copy its image block into the
+        # movie file, preceded by a graphic
+        # control extension containing the frame
+        # delay (in hundredths of a second).
+        image = Image.fromarray(frame, 'RGB').quantize(256)
+        buf   = io.BytesIO()
+        image.save(buf, format='gif')
+
+        self.__file.write(b'\x21\xf9\x04\x04')
+        self.__file.write(struct.pack('<HBB', self.__delay, 0, 0))
+        self.__file.write(_gifImageBlock(buf.getvalue()))
+
+
+    def _close(self, abort):
+        """Writes the GIF trailer, and closes the file. """
+        if self.__file is None:
+            return
+        if not abort:
+            self.__file.write(b'\x3b')
+        self.__file.close()
+        self.__file = None
+
+
+def _gifImageBlock(data):
+    """Used by the :class:`GifWriter`. Given the contents of a single-frame
+    GIF file, returns its image block (image descriptor, local colour table,
+    and compressed image data), so that it can be appended to another GIF
+    file. The global colour table is converted into a local colour table.
+    """
+
+    data  = bytes(data)
+    flags = data[10]
+    pos   = 13
+    table = b''
+    tbits = 0
+
+    if data[:3] != b'GIF' or data[-1:] != b'\x3b':
+        raise ValueError('Invalid GIF data')
+
+    # global colour table
+    if flags & 0x80:
+        tbits  = 0x80 | (flags & 0x07)
+        tsize  = 3 * 2 ** ((flags & 0x07) + 1)
+        table  = data[pos:pos + tsize]
+        pos   += tsize
+
+    # skip over any extension blocks
+    while data[pos] == 0x21:
+        pos += 2
+        while data[pos] != 0:
+            pos += data[pos] + 1
+        pos += 1
+
+    if data[pos] != 0x2c:
+        raise ValueError('Invalid GIF data')
+
+    # The image already has a local colour table
+    descriptor = bytearray(data[pos:pos + 10])
+    if descriptor[9] & 0x80:
+        return data[pos:-1]
+
+    # Otherwise copy the global colour table in,
+    # preserving the interlace and sort flags
+    descriptor[9] = (descriptor[9] & 0x60) | tbits
+
+    return bytes(descriptor) + table + data[pos + 10:-1]
+
+
+class APNGWriter(MovieWriter):
+    """The ``APNGWriter`` saves a movie as an animated PNG, which loops
+    forever. Animated PNGs are lossless, and can be viewed in most web
+    browsers. Frames which are not displayed as an animation are displayed
+    as a static image of the first frame.
+
+    Each frame is compressed with ``zlib`` as soon as it is received. The
+    number of frames is written into the file header when the movie is
+    closed, so the file must be seekable.
+    """
+
+
+    def __init__(self, filename, fps=None, **kwargs):
+        """Create an ``APNGWriter``. All arguments are passed through to
+        :meth:`MovieWriter.__init__`.
+        """
+        MovieWriter.__init__(self, filename, fps, **kwargs)
+
+        delay = 1 / fractions.Fraction(self.fps).limit_denominator(1000)
+        delay = delay.limit_denominator(65535)
+
+        self.__file     = None
+        self.__actl     = None
+        self.__seq      = 0
+        self.__nwritten = 0
+        self.__delay    = (delay.numerator, delay.denominator)
+
+
+    def _open(self, width, height):
+        """Creates the PNG file, and writes the PNG header. """
+
+        self.__file = open(self.filename, 'wb')
+
+        # signature, and 8-bit RGB image header
+        self.__file.write(b'\x89PNG\r\n\x1a\n')
+        self.__writeChunk(b'IHDR', struct.pack('>IIBBBBB',
+                                               width, height, 8, 2, 0, 0, 0))
+
+        # Animation control - the number of frames
+        # is updated when the movie is closed
+        self.__actl = self.__file.tell()
+        self.__writeChunk(b'acTL', struct.pack('>II', 0, 0))
+
+
+    def _write(self, frame):
+        """Compresses the frame, and appends it to the PNG file. """
+
+        height, width = frame.shape[:2]
+
+        # Scanlines are stored with the PNG "up" filter
+        # (the difference from the previous scanline),
+        # which compresses rendered scenes well.
+        rows     = frame.reshape(height, width * 3)
+        filtered = np.empty((height, width * 3 + 1), dtype=np.uint8)
+
+        filtered[:,  0]  = 2
+        filtered[0,  1:] = rows[0]
+        np.subtract(rows[1:], rows[:-1], out=filtered[1:, 1:])
+
+        data = zlib.compress(filtered.tobytes(), 6)
+
+        self.__writeChunk(b'fcTL', struct.pack('>IIIIIHHBB',
+                                               self.__seq,
+                                               width,
+                                               height,
+                                               0,
+                                               0,
+                                               self.__delay[0],
+                                               self.__delay[1],
+                                               0,
+                                               0))
+        self.__seq += 1
+
+        # The first frame is stored as the default
+        # image, and subsequent frames as frame data
+        if self.__nwritten == 0:
+            self.__writeChunk(b'IDAT', data)
+        else:
+            self.__writeChunk(b'fdAT', struct.pack('>I', self.__seq) + data)
+            self.__seq += 1
+
+        self.__nwritten += 1
+
+
+    def _close(self, abort):
+        """Writes the final number of frames into the file header, and closes
+        the file.
+        """
+
+        if self.__file is None:
+            return
+
+        if not abort:
+            self.__writeChunk(b'IEND', b'')
+            self.__file.seek(self.__actl)
+            self.__writeChunk(b'acTL', struct.pack('>II', self.__nwritten, 0))
+
+        self.__file.close()
+        self.__file = None
+
+
+    def __writeChunk(self, ctype, data):
+        """Writes a PNG chunk to the file. """
+        crc = zlib.crc32(ctype + data) & 0xffffffff
+        self.__file.write(struct.pack('>I', len(data)))
+        self.__file.write(ctype)
+        self.__file.write(data)
+        self.__file.write(struct.pack('>I', crc))
+
+
+class PipeWriter(MovieWriter):
+    """The ``PipeWriter`` passes raw frames to an external encoder, such as
+    ``ffmpeg``, which is started when the first frame is received. Each
+    frame is written to the standard input of the encoder as packed 8-bit RGB
+    values, so the encoder is responsible for all compression.
+
+    The encoder command may contain the following placeholders, which are
+    replaced with the corresponding value:
+
+      - ``{width}``:   Frame width in pixels
+      - ``{height}``:  Frame height in pixels
+      - ``{fps}``:     Frame rate in frames per second
+      - ``{outfile}``: Movie file name
+
+    The default command (:data:`DEFAULT_COMMAND`) uses ``ffmpeg``, and works
+    for any movie format supported by ``ffmpeg`` (e.g. ``.mp4``).
+    """
+
+
+    def __init__(self, filename, fps=None, command=None, **kwargs):
+        """Create a ``PipeWriter``.
+
+        :arg filename: File to save the movie to.
+        :arg fps:      Frame rate in frames per second.
+        :arg command:  Encoder command, either as a string or as a list of
+                       arguments. Defaults to :data:`DEFAULT_COMMAND`.
+
+        All other arguments are passed through to
+        :meth:`MovieWriter.__init__`.
+        """
+
+        if command is None:
+            command = DEFAULT_COMMAND
+        if isinstance(command, str):
+            command = shlex.split(command)
+
+        MovieWriter.__init__(self, filename, fps, **kwargs)
+
+        self.__command = list(command)
+        self.__proc    = None
+
+
+    def _open(self, width, height):
+        """Starts the encoder process. """
+
+        values  = {'width'   : width,
+                   'height'  : height,
+                   'fps'     : self.fps,
+                   'outfile' : self.filename}
+        command = [arg.format(**values) for arg in self.__command]
+
+        log.debug('Starting movie encoder: %s', ' '.join(command))
+
+        self.__command = command
+        self.__proc    = sp.Popen(command, stdin=sp.PIPE)
+
+
+    def _write(self, frame):
+        """Writes the frame to the encoder. """
+        try:
+            self.__proc.stdin.write(memoryview(frame).cast('B'))
+        except BrokenPipeError:
+            raise RuntimeError('Movie encoder ({}) exited with code '
+                               '{}'.format(self.__command[0],
+                                           self.__proc.wait()))
+
+
+    def _close(self, abort):
+        """Closes the encoder input, and waits for the encoder to finish. """
+
+        if self.__proc is None:
+            return
+
+        if abort:
+            self.__proc.kill()
+
+        try:
+            self.__proc.stdin.close()
+        except BrokenPipeError:
+            pass
+
+        code        = self.__proc.wait()
+        self.__proc = None
+
+        if not abort and code != 0:
+            raise RuntimeError('Movie encoder ({}) exited with code '
+                               '{}'.format(self.__command[0], code))
@@ -73,12 +73,13 @@ This module also provides a few convenience classes and functions:
 """
 
 
-import functools as ft
-import              gc
-import              logging
-import os.path   as op
-import              pathlib
-import              weakref
+import functools  as ft
+import contextlib as ctxlib
+import               gc
+import               logging
+import os.path    as op
+import               pathlib
+import               weakref
 
 import fsl.data.image      as fslimage
 import fsl.data.vtk        as fslvtk
@@ -123,6 +124,11 @@ class OverlayList(props.HasProperties):
 
     The :meth:`getData` and :meth:`setData` methods allow arbitrary bits
     of data associated with an overlay to be stored and retrieved.
+
+    The :meth:`batch` method can be used to add many overlays at once, so
+    that listeners on the :attr:`overlays` property (e.g. the
+    :class:`.DisplayContext`, canvases and control panels) are only notified
+    once, after all of the overlays have been added.
     """
 
 
@@ -178,6 +184,70 @@ class OverlayList(props.HasProperties):
         #   }
         self.__overlayData = weakref.WeakKeyDictionary()
 
+        # Used by the batch method - the
+        # number of active batches, and
+        # the contents of the list and
+        # notification state when the
+        # outermost batch started.
+        self.__batchDepth = 0
+        self.__batchStart = None
+        self.__batchState = True
+
+
+    @property
+    def inBatch(self):
+        """Returns ``True`` if a :meth:`batch` is currently active, ``False``
+        otherwise.
+        """
+        return self.__batchDepth > 0
+
+
+    @ctxlib.contextmanager
+    def batch(self):
+        """Context manager which may be used to make many changes to the
+        list. Listeners registered on the :attr:`overlays` property are not
+        notified of any changes made within the ``with`` block. When the
+        block exits, they are notified once, if the contents of the list
+        have changed. Batches may be nested - listeners are notified when
+        the outermost batch exits.
+
+        Within a batch, :class:`.Display` and :class:`.DisplayOpts` instances
+        may still be retrieved for newly added overlays, via
+        :meth:`.DisplayContext.getDisplay`. However, anything else which is
+        derived from the list contents by a listener (e.g. the
+        :attr:`.DisplayContext.overlayOrder`, or the options of properties
+        which refer to other overlays) will not be updated until the batch
+        exits.
+        """
+
+        if self.__batchDepth == 0:
+            self.__batchStart = list(self.overlays)
+            self.__batchState = self.getNotificationState('overlays')
+            self.disableNotification('overlays')
+
+        self.__batchDepth += 1
+
+        try:
+            yield
+
+        finally:
+            self.__batchDepth -= 1
+
+            if self.__batchDepth == 0:
+                start             = self.__batchStart
+                end               = list(self.overlays)
+                self.__batchStart = None
+
+                self.setNotificationState('overlays', self.__batchState)
+
+                changed = len(start) != len(end) or \
+                          any(a is not b for a, b in zip(start, end))
+
+                if changed and self.__batchState:
+                    log.debug('Overlay list batch committed '
+                              '(%i -> %i overlays)', len(start), len(end))
+                    self.propNotify('overlays')
+
 
     def initProps(self, overlay):
         """Returns a dict containing initial :class:`.Display` and
@@ -298,7 +368,7 @@ class OverlayList(props.HasProperties):
         may be passed in as keyword arguments.
         """
 
-        with props.suppress(self, 'overlays', notify=True):
+        with props.suppress(self, 'overlays', notify=not self.inBatch):
             self.overlays.insert(index, item)
             self.__initProps[item] = initProps
 
@@ -319,7 +389,7 @@ class OverlayList(props.HasProperties):
         ``{overlay : value}`` mappings.
         """
 
-        with props.suppress(self, 'overlays', notify=True):
+        with props.suppress(self, 'overlays', notify=not self.inBatch):
 
             result = self.overlays.extend(iterable)
 
@@ -2731,10 +2731,11 @@ def applySceneArgs(args, overlayList, displayCtx, sceneOpts):
             if args.standard1mm:       stds.append('MNI152_T1_1mm')
             if args.standard1mm_brain: stds.append('MNI152_T1_1mm_brain')
 
-            for std in stds:
-                std = op.join(fslplatform.fsldir, 'data', 'standard', std)
-                std = fslimage.Image(std)
-                overlayList.insert(0, std)
+            with overlayList.batch():
+                for std in stds:
+                    std = op.join(fslplatform.fsldir, 'data', 'standard', std)
+                    std = fslimage.Image(std)
+                    overlayList.insert(0, std)
 
         # First apply all command line options
         # related to the display context...
@@ -13,9 +13,10 @@ import logging
 
 import numpy as np
 
-import fsl.utils.idle  as idle
-import fsl.utils.cache as cache
-import fsleyes_props   as props
+import fsl.utils.idle           as idle
+import fsl.utils.cache          as cache
+import fsleyes_props            as props
+import fsleyes.data.blockcache  as blockcache
 
 
 log = logging.getLogger(__name__)
@@ -210,7 +211,10 @@ class VoxelDataSeries(DataSeries):
     from a voxel in an :class:`.Image` overlay.
 
     It contains a built-in cache which is used to prevent repeated access
-    to data from the same voxel.
+    to data from the same voxel. For 4D images, data is retrieved through a
+    :class:`.TimeSeriesBlockCache`, which is shared by all ``VoxelDataSeries``
+    for the same image, and which reads and caches blocks of neighbouring
+    voxels at a time.
 
     Sub-classes may need to override:
 
@@ -235,12 +239,29 @@ class VoxelDataSeries(DataSeries):
         # most recently accessed voxels. This is
         # done to improve performance on big
         # images (which may be compressed and
-        # on disk).
-        #
-        # TODO You need to invalidate the cache
-        #      when the image data changes.
+        # on disk). The cache is cleared when
+        # the image data changes.
         self.__cache = cache.Cache(maxsize=1000)
 
+        self.overlay.register(self.name, self.__overlayDataChanged, 'data')
+
+
+    def destroy(self):
+        """Must be called when this ``VoxelDataSeries`` is no longer needed.
+        Removes a listener from the overlay, and calls
+        :meth:`DataSeries.destroy`.
+        """
+        if self.overlay is not None:
+            self.overlay.deregister(self.name, 'data')
+        self.__cache.clear()
+        DataSeries.destroy(self)
+
+
+    def __overlayDataChanged(self, *a):
+        """Called when the overlay data changes. Clears the voxel data cache.
+        """
+        self.__cache.clear()
+
 
     def makeLabel(self):
         """Returns a string representation of this ``VoxelDataSeries``
@@ -346,8 +367,12 @@ class VoxelDataSeries(DataSeries):
 
         This method may be overridden by sub-classes.
         """
-        voxel = location[:3]
-        opts  = self.displayCtx.getOpts(self.overlay)
-        data  = self.overlay[opts.index(voxel, atVolume=False)]
+        voxel   = location[:3]
+        overlay = self.overlay
+        opts    = self.displayCtx.getOpts(overlay)
+        slc     = opts.index(voxel, atVolume=False)
 
-        return data
+        if blockcache.useBlockCache(overlay):
+            return blockcache.blockCache(overlay).timeSeries(slc)
+
+        return overlay[slc]
@@ -9,6 +9,10 @@
  :class:`MeshHistogramSeries` classes, used by the :class:`.HistogramPanel`
  for plotting histogram data.
 
+Histograms are calculated from a :class:`BaseHistogram`, a fine-grained
+histogram of the data, from which histograms with any number of bins, over
+any range, can be derived without access to the data.
+
 Two standalone functions are also defined in this module:
 
   .. autosummary::
@@ -23,9 +27,12 @@ import logging
 import numpy as np
 
 import fsl.utils.cache              as cache
+import fsl.utils.settings           as fslsettings
 import fsleyes_widgets.utils.status as status
 import fsleyes_props                as props
 import fsleyes.colourmaps           as fslcm
+import fsleyes.data.imagestats      as imagestats
+import fsleyes.data.imagewrapper    as imagewrapper
 from . import                          dataseries
 
 
@@ -84,16 +91,13 @@ class HistogramSeries(dataseries.DataSeries):
         dataseries.DataSeries.__init__(
             self, overlay, overlayList, displayCtx, plotCanvas)
 
-        self.__nvals              = 0
-        self.__dataKey            = None
-        self.__xdata              = np.array([])
-        self.__ydata              = np.array([])
-        self.__finiteData         = np.array([])
-        self.__nonZeroData        = np.array([])
-        self.__clippedFiniteData  = np.array([])
-        self.__clippedNonZeroData = np.array([])
-        self.__dataCache          = cache.Cache(maxsize=10)
-        self.__histCache          = cache.Cache(maxsize=100)
+        self.__nvals     = 0
+        self.__dataKey   = None
+        self.__xdata     = np.array([])
+        self.__ydata     = np.array([])
+        self.__baseHist  = None
+        self.__dataCache = cache.Cache(maxsize=10)
+        self.__histCache = cache.Cache(maxsize=100)
 
         self.addListener('dataRange',       self.name, self.__dataRangeChanged)
         self.addListener('nbins',           self.name, self.__histPropsChanged)
@@ -115,16 +119,13 @@ class HistogramSeries(dataseries.DataSeries):
 
         self.__dataCache.clear()
         self.__histCache.clear()
-        self.__dataCache          = None
-        self.__histCache          = None
-        self.__nvals              = 0
-        self.__dataKey            = None
-        self.__xdata              = None
-        self.__ydata              = None
-        self.__finiteData         = None
-        self.__nonZeroData        = None
-        self.__clippedFiniteData  = None
-        self.__clippedNonZeroData = None
+        self.__dataCache = None
+        self.__histCache = None
+        self.__nvals     = 0
+        self.__dataKey   = None
+        self.__xdata     = None
+        self.__ydata     = None
+        self.__baseHist  = None
         dataseries.DataSeries.destroy(self)
 
 
@@ -140,48 +141,40 @@ class HistogramSeries(dataseries.DataSeries):
                    a ``dict`` key.
         """
 
+        if data is not None:
+
+            # We cache a BaseHistogram for each
+            # key, so the data doesn't need to
+            # be re-read. Each BaseHistogram is
+            # small, and independent of the size
+            # of the data.
+            baseHist = self.__dataCache.get(key, None)
+
+            if baseHist is None:
+                log.debug('New histogram data {} - calculating '
+                          'base histogram'.format(key))
+                baseHist = self.calcBaseHistogram(data, key)
+                self.__dataCache.put(key, baseHist)
+            else:
+                log.debug('Got histogram data {} from cache'.format(key))
+
+            # No finite values
+            if baseHist.dataRange is None:
+                data = None
+
         if data is None:
-            self.__nvals              = 0
-            self.__dataKey            = None
-            self.__xdata              = np.array([])
-            self.__ydata              = np.array([])
-            self.__finiteData         = np.array([])
-            self.__nonZeroData        = np.array([])
-            self.__clippedFiniteData  = np.array([])
-            self.__clippedNonZeroData = np.array([])
+            self.__nvals    = 0
+            self.__dataKey  = None
+            self.__xdata    = np.array([])
+            self.__ydata    = np.array([])
+            self.__baseHist = None
 
             # force the panel to refresh
             with props.skip(self, 'dataRange', self.name):
                 self.propNotify('dataRange')
             return
 
-        # We cache the following data, based
-        # on the provided key, so they don't
-        # need to be recalculated:
-        #  - finite data
-        #  - non-zero data
-        #  - finite minimum
-        #  - finite maximum
-        #
-        # The cache size is restricted (see its
-        # creation in __init__) so we don't blow
-        # out RAM
-        cached = self.__dataCache.get(key, None)
-
-        if cached is None:
-
-            log.debug('New histogram data {} - extracting '
-                      'finite/non-zero data'.format(key))
-
-            finData = data[np.isfinite(data)]
-            nzData  = finData[finData != 0]
-            dmin    = finData.min()
-            dmax    = finData.max()
-
-            self.__dataCache.put(key, (finData, nzData, dmin, dmax))
-        else:
-            log.debug('Got histogram data {} from cache'.format(key))
-            finData, nzData, dmin, dmax = cached
+        dmin, dmax = baseHist.dataRange
 
         # The upper bound on the dataRange
         # is exclusive, so we initialise it
@@ -194,11 +187,10 @@ class HistogramSeries(dataseries.DataSeries):
             self.dataRange.xmax = dmax + dist
             self.dataRange.xlo  = dmin
             self.dataRange.xhi  = dmax + dist
-            self.nbins          = autoBin(nzData, self.dataRange.x)
+            self.nbins          = autoBin(baseHist.dtype, self.dataRange.x)
 
-            self.__dataKey     = key
-            self.__finiteData  = finData
-            self.__nonZeroData = nzData
+            self.__dataKey  = key
+            self.__baseHist = baseHist
 
             self.__dataRangeChanged()
 
@@ -256,19 +248,44 @@ class HistogramSeries(dataseries.DataSeries):
         return self.__nvals
 
 
+    def calcBaseHistogram(self, data, key):
+        """Called by :meth:`setHistogramData` when the :class:`BaseHistogram`
+        for some data needs to be calculated. May be overridden by sub-classes
+        which are able to retrieve base histograms more efficiently.
+
+        :arg data: A ``numpy`` array containing the data.
+        :arg key:  The key that was passed to :meth:`setHistogramData`.
+        """
+        return BaseHistogram(data)
+
+
+    def calcHistogram(self, data, histkey):
+        """Called when a histogram needs to be calculated. Calculates and
+        returns a histogram via the :meth:`BaseHistogram.histogram` method.
+        May be overridden by sub-classes which are able to retrieve
+        histograms more efficiently.
+
+        :arg data:    The :class:`BaseHistogram` of the data.
+
+        :arg histkey: A tuple containing the key that was passed to
+                      :meth:`setHistogramData`, the values of the
+                      :attr:`includeOutliers` and :attr:`ignoreZeros`
+                      properties, the ``(low, high)`` histogram range, the
+                      ``(min, max)`` data range, and the number of bins.
+
+        :returns:     A tuple containing the histogram bin edges, counts,
+                      and total number of values (see :func:`histogram`).
+        """
+        _, includeOutliers, ignoreZeros, hrange, drange, nbins = histkey
+        return data.histogram(
+            nbins, hrange, drange, includeOutliers, ignoreZeros)
+
+
     def __dataRangeChanged(self, *args, **kwargs):
         """Called when the :attr:`dataRange` property changes, and also by the
         :meth:`__initProperties` and :meth:`__volumeChanged` methods.
         """
 
-        finData = self.__finiteData
-        nzData  = self.__nonZeroData
-
-        self.__clippedFiniteData  = finData[(finData >= self.dataRange.xlo) &
-                                            (finData <  self.dataRange.xhi)]
-        self.__clippedNonZeroData = nzData[ (nzData  >= self.dataRange.xlo) &
-                                            (nzData  <  self.dataRange.xhi)]
-
         self.onDataRangeChange()
         self.__histPropsChanged()
 
@@ -284,21 +301,16 @@ class HistogramSeries(dataseries.DataSeries):
         status.update('Calculating histogram for '
                       'overlay {}'.format(self.overlay.name))
 
-        if np.isclose(self.dataRange.xhi, self.dataRange.xlo):
+        data = self.__baseHist
+
+        if data is None or np.isclose(self.dataRange.xhi, self.dataRange.xlo):
             self.__xdata = np.array([])
             self.__ydata = np.array([])
             self.__nvals = 0
             return
 
-        if self.ignoreZeros:
-            if self.includeOutliers: data = self.__nonZeroData
-            else:                    data = self.__clippedNonZeroData
-        else:
-            if self.includeOutliers: data = self.__finiteData
-            else:                    data = self.__clippedFiniteData
-
         # Figure out the number of bins to use
-        if self.autoBin: nbins = autoBin(data, self.dataRange.x)
+        if self.autoBin: nbins = autoBin(data.dtype, self.dataRange.x)
         else:            nbins = self.nbins
 
         # nbins is unclamped, but
@@ -327,12 +339,7 @@ class HistogramSeries(dataseries.DataSeries):
         if cached is not None:
             histX, histY, nvals = cached
         else:
-            histX, histY, nvals = histogram(data,
-                                            self.nbins,
-                                            hrange,
-                                            drange,
-                                            self.includeOutliers,
-                                            True)
+            histX, histY, nvals = self.calcHistogram(data, histkey)
             self.__histCache.put(histkey, (histX, histY, nvals))
 
         self.__xdata = histX
@@ -442,6 +449,32 @@ class ImageHistogramSeries(HistogramSeries):
                 self.showOverlayRange.xhi = min(dhi, self.showOverlayRange.xhi)
 
 
+    def calcBaseHistogram(self, data, key):
+        """Overrides :meth:`HistogramSeries.calcBaseHistogram`. The base
+        histogram of each volume is retrieved from, or saved to, the
+        statistics cache for the image (see the :mod:`.imagestats` module), so
+        it does not need to be re-calculated the next time that the image is
+        loaded. Histograms with any number of bins, over any range, are then
+        derived from it.
+        """
+
+        voldim, vol = key
+
+        # The key must also identify the data
+        # being plotted, as complex images have
+        # a series for each component. It also
+        # contains a version number, which must
+        # be incremented whenever the format or
+        # calculation of saved histograms
+        # changes, so that histograms saved by
+        # older versions are not used.
+        key   = ('v1', type(self).__name__, voldim, vol)
+        stats = imagestats.imageStats(self.overlay)
+        state = stats.histogram(key, lambda: BaseHistogram(data).toArray())
+
+        return BaseHistogram.fromArray(data.dtype, state)
+
+
     def __volumeChanged(self, *args, **kwargs):
         """Called when the :attr:`volume` property changes, and also by the
         :meth:`__init__` method.
@@ -613,6 +646,284 @@ class MeshHistogramSeries(HistogramSeries):
         else:          self.setHistogramData(vd[:, vdi],   (vdname, vdi))
 
 
+class BaseHistogram:
+    """A ``BaseHistogram`` contains a fine-grained histogram of some data,
+    from which histograms with any number of bins, over any range, can be
+    derived via the :meth:`histogram` method, without access to the data.
+    It is used by the :class:`HistogramSeries` class, so that changes to the
+    histogram settings do not require the data to be re-read.
+
+    The base histogram is calculated when a ``BaseHistogram`` is created.
+    The data is read in chunks (whose size, in bytes, is controlled by the
+    ``fsleyes.histogram.chunkSize`` setting), which are processed in parallel
+    on the :func:`.imagewrapper.rangePool`. No copy of the data is made, and
+    no reference to it is kept. Zeros and non-finite values are counted
+    separately from the base bins.
+
+    For 8 and 16 bit integer data, every possible value has its own base bin,
+    and the data is only read once. Otherwise the data is read twice - once
+    to calculate its range, and then to calculate the base histogram. If the
+    data only contains integer values over a small enough range, each value
+    has its own base bin. Otherwise, the data range is split into a large
+    number of base bins (controlled by the ``fsleyes.histogram.baseBins``
+    setting), which are aligned with the bins that :func:`autoBin` would
+    choose for the full data range.
+
+    Histograms are exact where each base bin contains a single value, and
+    for the default bins over the full data range (other than for values
+    which lie on a bin edge, which may be rounded into either bin).
+    Otherwise, the values within each base bin are assumed to be evenly
+    distributed.
+    """
+
+
+    def __init__(self, data):
+        """Create a ``BaseHistogram``.
+
+        :arg data: ``numpy`` array containing the data.
+        """
+
+        data    = np.asanyarray(data)
+        dtype   = data.dtype
+        chunks  = _chunks(data)
+        maxBins = int(fslsettings.read('fsleyes.histogram.baseBins', 65536))
+        integer = issubclass(dtype.type, np.integer)
+
+        # Small integer types - a bin for every
+        # value, so we can calculate the data
+        # range from the histogram
+        if integer and dtype.itemsize <= 2:
+            info          = np.iinfo(dtype)
+            lo, hi, exact = int(info.min), int(info.max) + 1, True
+            nbins         = hi - lo
+            dmin          = None
+
+        # Otherwise we need to calculate the
+        # data range before the histogram
+        else:
+            ranges = [r for r in _map(_chunkRange, chunks) if r is not None]
+
+            if len(ranges) == 0:
+                lo, hi, nbins, exact = 0, 1, 1, True
+                dmin                 = None
+            else:
+                dmin  = min(r[0] for r in ranges)
+                dmax  = max(r[1] for r in ranges)
+                exact = all(r[2] for r in ranges) and \
+                        (dmax - dmin) < maxBins
+
+            if dmin is not None and exact:
+                lo, hi = int(dmin), int(dmax) + 1
+                nbins  = hi - lo
+
+            # Same range as the default
+            # HistogramSeries.dataRange
+            elif dmin is not None:
+                lo    = float(dmin)
+                hi    = float(dmax + (dmax - dmin) / 10000.0)
+                if hi <= lo:
+                    hi = lo + 1
+                nauto = max(10, autoBin(dtype, (lo, hi)))
+                nbins = nauto * max(1, maxBins // nauto)
+
+        results   = _map(lambda c: _chunkHistogram(c, nbins, lo, hi), chunks)
+        counts    = np.zeros(nbins, dtype=np.int64)
+        nzero     = 0
+        nnonfin   = 0
+
+        for ccounts, cnzero, cnnonfin in results:
+            counts  += ccounts
+            nzero   += cnzero
+            nnonfin += cnnonfin
+
+        if integer and dtype.itemsize <= 2:
+            nonempty = np.nonzero(counts)[0]
+            if len(nonempty) > 0:
+                dmin = lo + nonempty[ 0]
+                dmax = lo + nonempty[-1]
+
+        # Zeros are counted separately
+        counts -= nzero * np.histogram([0], nbins, (lo, hi))[0]
+
+        if dmin is None: dataRange = None
+        else:            dataRange = (dmin, dmax)
+
+        self.__setState(dtype, exact, lo, hi, nzero, nnonfin, dataRange,
+                        np.concatenate(([0], np.cumsum(counts))))
+
+
+    def __setState(self,
+                   dtype,
+                   exact,
+                   lo,
+                   hi,
+                   nzero,
+                   nnonfin,
+                   dataRange,
+                   cumCounts):
+        """Used by :meth:`__init__` and :meth:`fromArray`. Initialises this
+        ``BaseHistogram``.
+        """
+
+        nbins = len(cumCounts) - 1
+
+        self.__dtype     = dtype
+        self.__exact     = exact
+        self.__lo        = lo
+        self.__hi        = hi
+        self.__nzero     = nzero
+        self.__nnonfin   = nnonfin
+        self.__cumCounts = cumCounts
+
+        if dataRange is None: self.__dataRange = None
+        else:                 self.__dataRange = (dtype.type(dataRange[0]),
+                                                  dtype.type(dataRange[1]))
+
+        if exact: self.__edges = None
+        else:     self.__edges = np.linspace(lo, hi, nbins + 1)
+
+
+    def toArray(self):
+        """Returns a ``numpy`` array which contains the state of this
+        ``BaseHistogram``, and from which it can be re-created with the
+        :meth:`fromArray` method (e.g. after it has been saved to disk).
+        """
+
+        if self.__dataRange is None: dmin, dmax = np.nan, np.nan
+        else:                        dmin, dmax = self.__dataRange
+
+        header = np.array([self.__exact,
+                           self.__lo,
+                           self.__hi,
+                           self.__nzero,
+                           self.__nnonfin,
+                           dmin,
+                           dmax], dtype=np.float64)
+
+        return np.concatenate((header, self.__cumCounts))
+
+
+    @classmethod
+    def fromArray(cls, dtype, arr):
+        """Creates a ``BaseHistogram`` from an array that was created by
+        :meth:`toArray`.
+
+        :arg dtype: ``numpy`` data type of the original data.
+        :arg arr:   Array created by :meth:`toArray`.
+        """
+
+        dtype                                     = np.dtype(dtype)
+        exact, lo, hi, nzero, nnonfin, dmin, dmax = arr[:7]
+
+        if np.isnan(dmin): dataRange = None
+        else:              dataRange = (dmin, dmax)
+
+        if exact: lo, hi = int(lo), int(hi)
+        else:     lo, hi = float(lo), float(hi)
+
+        hist = cls.__new__(cls)
+        hist.__setState(dtype,
+                        bool(exact),
+                        lo,
+                        hi,
+                        int(nzero),
+                        int(nnonfin),
+                        dataRange,
+                        arr[7:].astype(np.int64))
+        return hist
+
+
+    @property
+    def dtype(self):
+        """Returns the ``numpy`` data type of the data. """
+        return self.__dtype
+
+
+    @property
+    def dataRange(self):
+        """Returns the ``(min, max)`` of the finite values in the data
+        (including zeros), or ``None`` if the data does not contain any
+        finite values.
+        """
+        return self.__dataRange
+
+
+    @property
+    def zeroCount(self):
+        """Returns the number of zeros in the data. """
+        return self.__nzero
+
+
+    @property
+    def nonFiniteCount(self):
+        """Returns the number of non-finite values in the data. """
+        return self.__nnonfin
+
+
+    def histogram(self,
+                  nbins,
+                  histRange,
+                  dataRange,
+                  includeOutliers=False,
+                  ignoreZeros=True,
+                  count=True):
+        """Derives a histogram from the base histogram. The arguments and
+        return value are the same as for the :func:`histogram` function,
+        except that values equal to the upper bound of the ``histRange`` are
+        not counted, and:
+
+        :arg ignoreZeros: If ``True`` (the default), zeros are excluded from
+                          the histogram.
+        """
+
+        hlo, hhi = histRange
+        dlo, dhi = dataRange
+
+        bins = np.linspace(hlo, hhi, nbins + 1)
+
+        if includeOutliers:
+            bins[ 0] = dlo
+            bins[-1] = dhi
+
+        below = self.__countBelow(bins, ignoreZeros)
+        histX = bins
+        histY = np.diff(np.maximum.accumulate(below))
+        nvals = histY.sum()
+
+        if not count:
+            histY = histY / nvals
+
+        return histX, histY, nvals
+
+
+    def __countBelow(self, x, ignoreZeros):
+        """Returns the number of values in the data which are less than each
+        of the values in ``x``.
+        """
+
+        cumCounts = self.__cumCounts
+        nbins     = len(cumCounts) - 1
+
+        # The base bins contain one integer
+        # value each - value v is < x if
+        # v <= ceil(x) - 1
+        if self.__exact:
+            idxs  = np.clip(np.ceil(x - self.__lo), 0, nbins).astype(np.intp)
+            below = cumCounts[idxs]
+
+        # Values are assumed to be evenly
+        # distributed across each base bin
+        else:
+            below = np.rint(np.interp(x, self.__edges, cumCounts))
+
+        below = below.astype(np.int64)
+
+        if not ignoreZeros:
+            below += self.__nzero * (x > 0)
+
+        return below
+
+
 def histogram(data,
               nbins,
               histRange,
@@ -675,7 +986,8 @@ def autoBin(data, dataRange):
     of the given data. The calculation is identical to that implemented
     in the original FSLView.
 
-    :arg data:      The data that the histogram is to be calculated on.
+    :arg data:      The data that the histogram is to be calculated on,
+                    or its ``numpy`` data type.
 
     :arg dataRange: A tuple containing the ``(min, max)`` histogram range.
     """
@@ -694,7 +1006,9 @@ def autoBin(data, dataRange):
         binSize /= 2
         nbins    = dRange / binSize
 
-    if issubclass(data.dtype.type, np.integer):
+    dtype = np.dtype(getattr(data, 'dtype', data))
+
+    if issubclass(dtype.type, np.integer):
         binSize = max(1, np.ceil(binSize))
 
     adjMin = np.floor(dMin / binSize) * binSize
@@ -703,3 +1017,86 @@ def autoBin(data, dataRange):
     nbins = int((adjMax - adjMin) / binSize) + 1
 
     return nbins
+
+
+def _chunks(data):
+    """Used by :class:`BaseHistogram`. Splits ``data`` into chunks (views)
+    along its slowest changing axis, each of which is no larger than the
+    ``fsleyes.histogram.chunkSize`` setting (in bytes, defaulting to 16MB),
+    or one slice along that axis.
+    """
+
+    if data.ndim == 0:
+        data = data.reshape(1)
+
+    chunkSize = fslsettings.read('fsleyes.histogram.chunkSize', 16777216)
+
+    if data.flags.f_contiguous and not data.flags.c_contiguous:
+        axis = data.ndim - 1
+    else:
+        axis = 0
+
+    slcsize = data.itemsize * data.size // max(1, data.shape[axis])
+    step    = max(1, int(chunkSize // max(1, slcsize)))
+    chunks  = []
+
+    for start in range(0, data.shape[axis], step):
+        slc = [slice(None)] * data.ndim
+        slc[axis] = slice(start, start + step)
+        chunks.append(data[tuple(slc)])
+
+    return chunks
+
+
+def _map(func, chunks):
+    """Used by :class:`BaseHistogram`. Calls ``func`` on each of the given
+    ``chunks``, in parallel on the :func:`.imagewrapper.rangePool` if there
+    is more than one chunk. Returns a list containing the results.
+    """
+    if len(chunks) > 1:
+        return list(imagewrapper.rangePool().map(func, chunks))
+    else:
+        return [func(c) for c in chunks]
+
+
+def _chunkRange(chunk):
+    """Used by :class:`BaseHistogram`. Returns a tuple containing the minimum
+    and maximum finite values in ``chunk``, and whether all of the finite
+    values are integers, or ``None`` if ``chunk`` contains no finite values.
+    """
+
+    if chunk.size == 0:
+        return None
+
+    if issubclass(chunk.dtype.type, np.integer):
+        return chunk.min(), chunk.max(), True
+
+    finite  = np.isfinite(chunk)
+    nfinite = np.count_nonzero(finite)
+
+    if nfinite == 0:
+        return None
+    if nfinite < chunk.size:
+        chunk = chunk[finite]
+
+    integral = np.all(np.floor(chunk) == chunk)
+
+    return chunk.min(), chunk.max(), integral
+
+
+def _chunkHistogram(chunk, nbins, lo, hi):
+    """Used by :class:`BaseHistogram`. Calculates a histogram of ``chunk``
+    with ``nbins`` bins over the range ``[lo, hi]``, in which non-finite
+    values are not counted. Returns a tuple containing the counts, the
+    number of zeros, and the number of non-finite values.
+    """
+
+    counts = np.histogram(chunk, nbins, (lo, hi))[0]
+    nzero  = chunk.size - np.count_nonzero(chunk)
+
+    if issubclass(chunk.dtype.type, np.integer):
+        nnonfin = 0
+    else:
+        nnonfin = chunk.size - np.count_nonzero(np.isfinite(chunk))
+
+    return counts, nzero, nnonfin
@@ -25,6 +25,7 @@ import fsleyes_props                     as props
 import fsleyes_widgets                   as fwidgets
 
 import fsleyes.strings                   as strings
+import fsleyes.plotting.workerpool       as workerpool
 
 
 log = logging.getLogger(__name__)
@@ -88,6 +89,14 @@ class PlotCanvas(props.HasProperties):
     blocked while this is occurring. The ``TaskThread`` instance is accessible
     through the :meth:`getDrawQueue` method, in case anything needs to be
     scheduled on it.
+
+    The data for each ``DataSeries`` is prepared on a pool of worker threads
+    which is shared by all ``PlotCanvas`` instances (see the
+    :mod:`.workerpool` module). When a new draw request is made before the
+    data for a previous request has been prepared, any outstanding work for
+    the previous request is cancelled. The time taken to prepare the data
+    for each ``DataSeries`` is available through the
+    :meth:`getPrepareLatencies` method.
     """
 
 
@@ -239,11 +248,17 @@ class PlotCanvas(props.HasProperties):
         self.__drawQueue.daemon = True
         self.__drawQueue.start()
 
+        # Data for each data series is
+        # prepared on a pool of threads
+        # shared by all PlotCanvases.
+        self.__prepareQueue = workerpool.PrepareQueue()
+
         # Whenever a new request comes in to
-        # draw the plot, we can't cancel any
-        # pending requests, as they are running
-        # on separate threads and out of our
-        # control (and could be blocking on I/O).
+        # draw the plot, any pending data
+        # preparation tasks are cancelled, but
+        # we can't cancel tasks which are
+        # already running (and could be blocking
+        # on I/O).
         #
         # Instead, we keep track of the total
         # number of pending requests. The
@@ -333,7 +348,9 @@ class PlotCanvas(props.HasProperties):
                 ds.removeListener(propName, self.__name)
             ds.destroy()
 
+        self.__prepareQueue.destroy()
         self.__drawQueue.stop()
+        self.__prepareQueue    = None
         self.__drawQueue       = None
         self.__drawnDataSeries = None
         self.dataSeries        = []
@@ -375,6 +392,15 @@ class PlotCanvas(props.HasProperties):
         return self.__drawQueue
 
 
+    def getPrepareLatencies(self):
+        """Returns a dictionary of ``{DataSeries : seconds}`` mappings,
+        containing the time taken to prepare the data for each
+        :class:`.DataSeries` in the most recent call to
+        :meth:`drawDataSeries`.
+        """
+        return self.__prepareQueue.latencies()
+
+
     def draw(self, *a):
         """Call :meth:`drawDataSeries` and then :meth:`drawArtists`.
         Or, if a ``drawFunc`` was provided, calls that instead.
@@ -516,13 +542,15 @@ class PlotCanvas(props.HasProperties):
         asynchronously, to avoid locking up the GUI:
 
          1. The data for each ``DataSeries`` instance is prepared on
-            separate threads (using :func:`.idle.run`).
+            a shared pool of threads (using a
+            :class:`.workerpool.PrepareQueue`). Any data preparation for
+            previous calls which has not yet started is cancelled.
 
-         2. A call to :func:`.idle.wait` is enqueued on a
+         2. A call to :func:`.workerpool.wait` is enqueued on a
             :class:`.TaskThread`.
 
          3. This ``wait`` function waits until all of the data preparation
-            threads have completed, and then passes all of the data to
+            tasks have completed, and then passes all of the data to
             the :meth:`__drawDataSeries` method.
 
         :arg extraSeries: A sequence of additional ``DataSeries`` to be
@@ -580,7 +608,7 @@ class PlotCanvas(props.HasProperties):
         axylim = list(sorted(self.limits.y))
 
         # Here we are preparing the data for
-        # each data series on separate threads,
+        # each data series on the worker pool,
         # as data preparation can be time
         # consuming for large images. We
         # display a message on the canvas
@@ -604,11 +632,13 @@ class PlotCanvas(props.HasProperties):
                 allXdata[i] = xdata
                 allYdata[i] = ydata
 
-            tasks.append(getData)
+            tasks.append((ds, getData))
 
-        # Run the data preparation tasks,
-        # a separate thread for each.
-        tasks = [idle.run(t) for t in tasks]
+        # Run the data preparation tasks on
+        # the worker pool. Any tasks from
+        # previous requests which have not
+        # yet run are cancelled.
+        tasks = self.__prepareQueue.prepare(tasks)
 
         # Show a message while we're
         # preparing the data.
@@ -620,7 +650,7 @@ class PlotCanvas(props.HasProperties):
         # Wait until data preparation is
         # done, then call __drawDataSeries.
         self.__drawRequests += 1
-        self.__drawQueue.enqueue(idle.wait,
+        self.__drawQueue.enqueue(workerpool.wait,
                                  tasks,
                                  self.__drawDataSeries,
                                  toPlot,
@@ -630,7 +660,6 @@ class PlotCanvas(props.HasProperties):
                                  axylim,
                                  refresh,
                                  taskName='{}.wait'.format(id(self)),
-                                 wait_direct=True,
                                  **plotArgs)
 
 
@@ -27,10 +27,12 @@ are use by the :class:`.TimeSeriesPanel`. The following classes are provided:
 
 import numpy as np
 
-import fsleyes_props      as props
-import fsleyes.strings    as strings
-import fsleyes.colourmaps as fslcm
-from . import                dataseries
+import fsl.data.featimage      as featimage
+import fsleyes_props           as props
+import fsleyes.strings         as strings
+import fsleyes.colourmaps      as fslcm
+import fsleyes.data.blockcache as blockcache
+from . import                     dataseries
 
 
 class VoxelTimeSeries(dataseries.VoxelDataSeries):
@@ -800,16 +802,43 @@ class FEATModelFitTimeSeries(VoxelTimeSeries):
 
 
     def dataAtCurrentVoxel(self):
-        """Returns the FEAT model fit at the current voxel. """
+        """Returns the FEAT model fit at the current voxel. The voxel data
+        is retrieved through the :class:`.TimeSeriesBlockCache` for the
+        image, if one is in use, so that it is shared with the other
+        time series for the image. Returns ``None`` if the analysis does
+        not have a design.
+        """
 
-        opts     = self.displayCtx.getOpts(self.overlay)
+        overlay  = self.overlay
+        opts     = self.displayCtx.getOpts(overlay)
         voxel    = opts.getVoxel()
         contrast = self.contrast
 
         if voxel is None:
             return None
 
-        return self.overlay.fit(contrast, voxel)
+        design = overlay.getDesign(voxel)
+
+        if design is None:
+            return None
+
+        if not blockcache.useBlockCache(overlay):
+            return overlay.fit(contrast, voxel)
+
+        x, y, z = voxel
+        numEVs  = overlay.numEVs()
+
+        if len(contrast) != numEVs:
+            raise ValueError('Contrast is wrong length')
+
+        data = self.currentVoxelData((x, y, z, opts.volumeDim))
+        pes  = [overlay.getPE(i)[x, y, z] for i in range(numEVs)]
+
+        return featimage.modelFit(data,
+                                  design,
+                                  contrast,
+                                  pes,
+                                  overlay.isFirstLevelAnalysis())
 
 
 class MelodicTimeSeries(dataseries.DataSeries):
@@ -0,0 +1,180 @@
+#!/usr/bin/env python
+#
+# workerpool.py - Shared pool of threads used to prepare data for plotting.
+#
+# Author: Paul McCarthy <pauldmccarthy@gmail.com>
+#
+"""This module provides a pool of worker threads which is shared by all
+:class:`.PlotCanvas` instances, and used to prepare :class:`.DataSeries`
+data for plotting, along with the :class:`PrepareQueue` class, which is used
+by each ``PlotCanvas`` to submit work to the pool.
+
+.. autosummary::
+   :nosignatures:
+
+   sharedPool
+   wait
+"""
+
+
+import                    os
+import                    time
+import                    logging
+import                    threading
+import concurrent.futures as futures
+
+import fsl.utils.idle     as idle
+import fsl.utils.settings as fslsettings
+
+
+log = logging.getLogger(__name__)
+
+
+_pool     = None
+_poolLock = threading.Lock()
+
+
+def sharedPool():
+    """Returns a ``concurrent.futures.ThreadPoolExecutor`` which is shared
+    by all :class:`PrepareQueue` instances. The pool is created on the first
+    call. The number of worker threads is controlled by the
+    ``fsleyes.plotting.workers`` setting, and defaults to the number of
+    CPUs, up to a maximum of 8.
+    """
+
+    global _pool
+
+    with _poolLock:
+        if _pool is None:
+            default = min(8, os.cpu_count() or 1)
+            workers = fslsettings.read('fsleyes.plotting.workers', default)
+            _pool   = futures.ThreadPoolExecutor(
+                max_workers=max(1, int(workers)),
+                thread_name_prefix='fsleyes-plotting')
+        return _pool
+
+
+def wait(fs, task, *args, **kwargs):
+    """Waits until all of the ``concurrent.futures.Future`` objects in ``fs``
+    have completed (or been cancelled), and then runs the given ``task`` via
+    :func:`.idle.idle`. All other arguments are passed to the ``task``.
+
+    This function blocks, so is intended to be called from a
+    :class:`.TaskThread`.
+    """
+    futures.wait(fs)
+    idle.idle(task, *args, **kwargs)
+
+
+class PrepareQueue:
+    """A ``PrepareQueue`` is used by a :class:`.PlotCanvas` to prepare the
+    data for a set of :class:`.DataSeries` on the :func:`sharedPool`.
+
+    Every call to :meth:`prepare` supersedes the previous call - any tasks
+    from a previous call which have not yet started are cancelled, and any
+    which have been cancelled too late (i.e. they have already been picked up
+    by a worker thread) will skip their work. Tasks which are already
+    running cannot be interrupted, but their results will not be plotted, as
+    the ``PlotCanvas`` only draws the most recent request.
+
+    The time taken to prepare each data series in the most recent request is
+    available through the :meth:`latencies` method.
+    """
+
+
+    def __init__(self, pool=None):
+        """Create a ``PrepareQueue``.
+
+        :arg pool: ``concurrent.futures.Executor`` to submit tasks to.
+                   Defaults to the :func:`sharedPool`.
+        """
+
+        if pool is None:
+            pool = sharedPool()
+
+        self.__pool       = pool
+        self.__lock       = threading.Lock()
+        self.__futures    = []
+        self.__generation = 0
+        self.__latencies  = {}
+
+
+    def destroy(self):
+        """Cancels any pending tasks. Must be called when this
+        ``PrepareQueue`` is no longer needed.
+        """
+        self.cancel()
+        self.__pool = None
+
+
+    def cancel(self):
+        """Cancels all pending tasks. Tasks which are already running are
+        allowed to finish.
+        """
+        with self.__lock:
+            self.__generation += 1
+            for f in self.__futures:
+                f.cancel()
+            self.__futures = []
+
+
+    def latencies(self):
+        """Returns a dictionary of ``{key : seconds}`` mappings, containing
+        the time taken by each task (identified by the key it was submitted
+        with) from the most recent call to :meth:`prepare`. Tasks which have
+        not yet completed, or which have been skipped, are not included.
+        """
+        with self.__lock:
+            return dict(self.__latencies)
+
+
+    def prepare(self, tasks):
+        """Submits the given ``tasks`` to the pool, cancelling any pending
+        tasks from previous calls.
+
+        :arg tasks: Sequence of ``(key, func)`` tuples, where ``func`` is a
+                    function which accepts no arguments, and ``key`` is a
+                    hashable identifier used by :meth:`latencies`.
+
+        :returns:   A list of ``concurrent.futures.Future`` objects, one for
+                    each task.
+        """
+
+        self.cancel()
+
+        with self.__lock:
+            generation       = self.__generation
+            self.__latencies = {}
+            self.__futures   = [self.__pool.submit(self.__run,
+                                                   key,
+                                                   func,
+                                                   generation)
+                                for key, func in tasks]
+            return list(self.__futures)
+
+
+    def __run(self, key, func, generation):
+        """Runs a task submitted via :meth:`prepare`, unless it has been
+        superseded by a more recent call to ``prepare``.
+        """
+
+        if generation != self.__generation:
+            return
+
+        start = time.perf_counter()
+
+        try:
+            func()
+
+        except Exception:
+            log.warning('Data preparation task for %s crashed',
+                        key, exc_info=True)
+            return
+
+        elapsed = time.perf_counter() - start
+
+        log.debug('Prepared data for %s in %0.4f seconds', key, elapsed)
+
+        with self.__lock:
+            if generation == self.__generation:
+                self.__latencies[key] = elapsed
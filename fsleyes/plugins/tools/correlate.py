@@ -7,22 +7,28 @@
 """This module provides the :class:`.PearsonCorrelateAction` class, which is
 an :class:`.Action` that calculates seed-based correlation on 4D
 :class:`.Image` overlays.
+
+Correlation values are calculated by a :class:`PearsonCorrelator`, which
+normalises the time series of every voxel once, so that the correlation
+values for each seed can be calculated with a single matrix-vector product.
 """
 
 
 import threading
 import logging
 
-import numpy                  as np
-import scipy.spatial.distance as spd
+import numpy as np
 
 import fsl.data.image               as fslimage
 import fsl.utils.idle               as idle
+import fsl.utils.settings           as fslsettings
 import fsleyes_props                as props
 import fsleyes.views.orthopanel     as orthopanel
 import fsleyes_widgets.utils.status as fslstatus
 import fsleyes.strings              as strings
 import fsleyes.actions.base         as base
+import fsleyes.data.diskcache       as diskcache
+import fsleyes.data.imagewrapper    as imagewrapper
 
 
 log = logging.getLogger(__name__)
@@ -39,6 +45,11 @@ class CorrelateAction(base.Action):
     invoked, a new 3D :class:`.Image` is created and added to the
     :class:`.OverlayList` - this image is referred to as a *correlate overlay*,
     and is used to store and display the correlation values.
+
+
+    If the ``CorrelateAction`` is invoked while a previous calculation is
+    still running, the previous calculation is cancelled, and only the
+    result of the most recent calculation is displayed.
     """
 
 
@@ -86,11 +97,10 @@ class CorrelateAction(base.Action):
         self.__correlateOverlays = {}
         self.__overlayCorrelates = {}
 
-        # The runCorrelateAction cannot be called
-        # more than once at a time - this is used
-        # as a semaphore to ensure that this is
-        # enforced.
-        self.__correlateFlag = threading.Event()
+        # Each invocation is given a number - a
+        # calculation is abandoned if the action
+        # is invoked again before it has finished.
+        self.__request = 0
 
         self.__selectedOverlayChanged()
 
@@ -182,46 +192,31 @@ class CorrelateAction(base.Action):
 
         The correlation calculation and overlay update is performed on a
         separate thread (via :meth:`.idle.run`), with a call to
-        :meth:`calculateCorrelation`.
+        :meth:`calculateCorrelation`. Any calculation which is still running
+        from a previous invocation is cancelled.
         """
 
-        # Because of the multi-threaded/asynchronous
-        # way that this function does its job,
-        # allowing it to be called multiple times
-        # before prior calls have completed would be
-        # very dangerous indeed.
-        if self.__correlateFlag.is_set():
-            log.debug('Correlate action is already '
-                      'running - ignoring request')
-            return
+        # See if the currently selected
+        # overlay is a correlate overlay
+        # and, if it is, look up the
+        # corresponding source overlay.
+        ovl = self.displayCtx.getSelectedOverlay()
+
+        if ovl in self.__overlayCorrelates:
+            ovl = self.__overlayCorrelates[ovl]
 
-        # See if a correlate overlay already exists
-        # for the currently selected overlay
-        ovl     = self.displayCtx.getSelectedOverlay()
-        corrOvl = self.__correlateOverlays.get(ovl, None)
-
-        # If not, check to see if it is a correlate
-        # overlay that is selected and, if it is,
-        # look up the corresponding source overlay.
-        if corrOvl is None:
-            if ovl in self.__overlayCorrelates:
-                corrOvl = ovl
-                ovl     = self.__overlayCorrelates[corrOvl]
-
-        # If corrOvl is still None, it means that
-        # there is no correlate overlay for the
-        # currently selected overlay. In this case,
-        # we'll create a new correlate overlay and
-        # add it to the overlay list after the
-        # correlation values have been calculated.
-
-        opts = self.displayCtx.getOpts(ovl)
-        xyz  = opts.getVoxel(vround=True)
+        opts  = self.displayCtx.getOpts(ovl)
+        xyz   = opts.getVoxel(vround=True)
+        index = opts.index(atVolume=False)
 
         if xyz is None:
             return
 
-        data = ovl.data[opts.index(atVolume=False)]
+        self.__request += 1
+        request         = self.__request
+
+        def cancelled():
+            return self.destroyed or request != self.__request
 
         # The correlation calculation is performed
         # on a separate thread. This thread then
@@ -230,17 +225,26 @@ class CorrelateAction(base.Action):
         # main thread.
         def calcCorr():
 
-            correlations = self.calculateCorrelation(xyz, data)
+            correlations = self.calculateCorrelation(
+                xyz, ovl, index, cancelled)
+
+            if correlations is None or cancelled():
+                log.debug('Correlation for seed %s cancelled', xyz)
+                return
 
             # The correlation overlay is updated/
             # created on the main thread.
             def update():
 
+                if cancelled():
+                    return
+
                 try:
 
                     # A correlation overlay already
                     # exists for the source overlay
                     # - update its data
+                    corrOvl = self.__correlateOverlays.get(ovl, None)
                     if corrOvl is not None:
                         corrOvl[:] = correlations
 
@@ -253,27 +257,32 @@ class CorrelateAction(base.Action):
 
                 finally:
                     fslstatus.clearStatus()
-                    self.__correlateFlag.clear()
 
             idle.idle(update)
 
-        # Protect against more calls
-        # while this job is running.
-        self.__correlateFlag.set()
         fslstatus.update(strings.messages[self, 'calculating'].format(*xyz))
         idle.run(calcCorr)
 
 
-    def calculateCorrelation(self, seed, data):
+    def calculateCorrelation(self, seed, overlay, index, cancelled):
         """Calculates correlation values between the given ``seed`` voxel (an
         ``(x, y, z)`` tuple) and all other voxels. This method must be
-        implemented by sub-classes.
+        implemented by sub-classes. It is called on a separate thread, and
+        should return early if ``cancelled`` returns ``True``.
+
+        :arg seed:      An ``(x, y, z)`` tuple specifying the seed voxel
+
+        :arg overlay:   The 4D :class:`.Image`.
 
-        :arg seed: An ``(x, y, z)`` tuple specifying the seed voxel
+        :arg index:     A slice which can be used to retrieve the 4D data
+                        from ``overlay``, as returned by
+                        :meth:`.NiftiOpts.index`.
 
-        :arg data: A 4D ``numpy`` array containing all of the data.
+        :arg cancelled: Function which returns ``True`` if the calculation
+                        has been cancelled.
 
-        :returns:  A 3D ``numpy`` array containing the correlation values.
+        :returns:       A 3D ``numpy`` array containing the correlation
+                        values, or ``None`` if the calculation was cancelled.
         """
         raise NotImplementedError('calculateCorrelation must be '
                                   'implemented by sub-classes')
@@ -283,33 +292,293 @@ class PearsonCorrelateAction(CorrelateAction):
     """The ``PearsonCorrelateAction`` is a :class:`CorrelateAction` which
     calculates Pearson correlation coefficient values between the seed voxel
     and all other voxels.
+
+    A :class:`PearsonCorrelator` is created for each 4D image, and re-used
+    for all seeds, until the image is removed from the :class:`.OverlayList`,
+    or its data is modified. The normalised data is stored in memory. If the
+    ``fsleyes.correlate.cache`` setting is ``True`` (it is ``False`` by
+    default), the normalised data for images which have been loaded from
+    file is instead saved in the FSLeyes cache directory, subject to its size
+    limit (see the :mod:`.diskcache` module).
     """
 
-    def calculateCorrelation(self, seed, data):
+
+    def __init__(self, *args, **kwargs):
+        """Create a ``PearsonCorrelateAction``. All arguments are passed
+        through to :meth:`CorrelateAction.__init__`.
+        """
+        CorrelateAction.__init__(self, *args, **kwargs)
+        self.__name        = '{}_{}'.format(type(self).__name__, id(self))
+        self.__lock        = threading.Lock()
+        self.__correlators = {}
+
+
+    def destroy(self):
+        """Must be called when this ``PearsonCorrelateAction`` is no longer
+        needed. Clears references to all :class:`PearsonCorrelator`
+        instances, and calls :meth:`CorrelateAction.destroy`.
+        """
+        if self.destroyed:
+            return
+        with self.__lock:
+            for overlay in list(self.__correlators.keys()):
+                self.__removeCorrelator(overlay)
+        CorrelateAction.destroy(self)
+
+
+    def calculateCorrelation(self, seed, overlay, index, cancelled):
         """Calculates Pearson correlation between the data at the specified
         seed voxel, and all other voxels.
         """
-        return pearsonCorrelation(seed, data)
+        correlator = self.__getCorrelator(overlay, index)
+        return correlator.correlate(seed, cancelled)
+
+
+    def __getCorrelator(self, overlay, index):
+        """Returns a :class:`PearsonCorrelator` for the given ``overlay`` and
+        ``index``, creating a new one if necessary. Correlators for overlays
+        which are no longer in the :class:`.OverlayList` are discarded.
+        """
+
+        ikey = repr(index)
+
+        with self.__lock:
+
+            for other in list(self.__correlators.keys()):
+                if other not in self.overlayList:
+                    self.__removeCorrelator(other)
+
+            cached = self.__correlators.get(overlay, None)
+
+            if cached is not None and cached[0] == ikey:
+                return cached[1]
+
+            # The normalised data is as large as
+            # the image (as float32), so is only
+            # saved to disk if the user asks for it
+            if fslsettings.read('fsleyes.correlate.cache', False):
+                key = diskcache.imageKey(overlay, 'correlate', ikey)
+            else:
+                key = None
+
+            if cached is None:
+                overlay.register(self.__name,
+                                 self.__overlayDataChanged,
+                                 topic='data')
+
+            correlator = PearsonCorrelator(overlay.data[index], key)
+            self.__correlators[overlay] = (ikey, correlator)
+
+            return correlator
+
+
+    def __removeCorrelator(self, overlay):
+        """Discards the :class:`PearsonCorrelator` for the given ``overlay``.
+        Must be called with the lock held.
+        """
+        self.__correlators.pop(overlay, None)
+        overlay.deregister(self.__name, topic='data')
+
+
+    def __overlayDataChanged(self, overlay, *a):
+        """Called when the data of an image, for which a
+        :class:`PearsonCorrelator` has been created, changes. Discards the
+        correlator, as its normalised data is out of date.
+        """
+        with self.__lock:
+            if overlay in self.__correlators:
+                self.__removeCorrelator(overlay)
+
+
+class PearsonCorrelator:
+    """A ``PearsonCorrelator`` calculates Pearson correlation coefficients
+    between the time series of a seed voxel and all other voxels of a 4D
+    image.
+
+    The first time that :meth:`correlate` (or :meth:`prepare`) is called,
+    the time series of every voxel is normalised to have zero mean and unit
+    length, and stored as a ``float32`` array with one row per voxel. The
+    correlation values for any seed can then be calculated by multiplying
+    the normalised data by the seed time series. The data is normalised,
+    and the correlation values are calculated, in blocks (whose size in
+    bytes is controlled by the ``fsleyes.correlate.blockSize`` setting),
+    which are processed in parallel on the :func:`.imagewrapper.rangePool`.
+
+    The normalised data is stored in memory by default. If a cache ``key``
+    is given, the normalised data is saved into, and memory-mapped from, the
+    FSLeyes cache directory (see the :mod:`.diskcache` module), so it does
+    not need to be held in memory, and is available immediately the next time
+    that the image is loaded. If the data is larger than the cache size
+    limit, it is stored in memory.
+    """
+
+
+    def __init__(self, data, key=None):
+        """Create a ``PearsonCorrelator``.
+
+        :arg data: 4D ``numpy`` array. A reference to ``data`` is only held
+                   until the data has been normalised.
+        :arg key:  Key used to save the normalised data in the on-disk cache,
+                   e.g. as returned by :func:`.diskcache.imageKey`. If
+                   ``None`` (the default), the normalised data is stored in
+                   memory.
+        """
+
+        self.__data  = data
+        self.__key   = key
+        self.__shape = tuple(data.shape[:3])
+        self.__zdata = None
+        self.__lock  = threading.Lock()
+
+
+    @property
+    def shape(self):
+        """Returns the shape of the correlation maps calculated by this
+        ``PearsonCorrelator``.
+        """
+        return self.__shape
+
+
+    def prepare(self):
+        """Normalises the data, if it has not already been normalised. It is
+        safe to call this method from multiple threads - the data is only
+        normalised once.
+
+        :returns: A ``float32`` array of shape ``(nvoxels, ntimepoints)``,
+                  containing the normalised time series for every voxel,
+                  with voxels in Fortran order.
+        """
+
+        with self.__lock:
+            if self.__zdata is None:
+                self.__zdata = self.__normalise()
+                self.__data  = None
+            return self.__zdata
+
+
+    def correlate(self, seed, cancelled=None):
+        """Calculates Pearson correlation coefficients between the seed voxel
+        and all other voxels. Voxels with a constant time series, or which
+        contain non-finite values, are given a correlation value of zero.
+
+        :arg seed:      ``(x, y, z)`` voxel coordinates of the seed.
+        :arg cancelled: Function which returns ``True`` if the calculation
+                        has been cancelled - it is called before each block
+                        is processed.
+        :returns:       A 3D ``float32`` array containing the correlation
+                        values, or ``None`` if the calculation was cancelled.
+        """
+
+        def isCancelled():
+            return cancelled is not None and cancelled()
+
+        zdata      = self.prepare()
+        nx, ny, _  = self.__shape
+        x, y, z    = seed
+        nvoxels    = zdata.shape[0]
+        sdata      = np.array(zdata[x + nx * (y + ny * z)])
+        result     = np.zeros(nvoxels, dtype=np.float32)
+        step       = _blockSize(zdata.shape[1] * zdata.itemsize)
+
+        def correlate(start):
+            if isCancelled():
+                return
+            end = min(nvoxels, start + step)
+            np.dot(zdata[start:end], sdata, out=result[start:end])
+
+        _map(correlate, range(0, nvoxels, step))
+
+        if isCancelled():
+            return None
+
+        np.clip(result, -1, 1, out=result)
+        return result.reshape(self.__shape, order='F')
+
+
+    def __normalise(self):
+        """Called by :meth:`prepare`. Loads the normalised data from the
+        on-disk cache or, if it is not available, normalises the data.
+        """
+
+        data       = self.__data
+        nvoxels    = int(np.prod(self.__shape))
+        shape      = (nvoxels, data.shape[3])
+        zdata      = diskcache.load('correlate', self.__key, mmap=True)
+
+        if zdata is not None and zdata.shape == shape:
+            log.debug('Loaded normalised data from cache (%s)', self.__key)
+            return zdata
+
+        zdata = None
+
+        if self.__key is not None:
+            with diskcache.create('correlate',
+                                  self.__key,
+                                  shape,
+                                  np.float32) as zdata:
+                if zdata is not None:
+                    _normalise(data, zdata)
+            zdata = diskcache.load('correlate', self.__key, mmap=True)
+
+        if zdata is None:
+            zdata = np.empty(shape, dtype=np.float32)
+            _normalise(data, zdata)
+
+        return zdata
 
 
 def pearsonCorrelation(seed, data):
     """Calculates Pearson correlation between the data at the specified
-    seed voxel, and all other voxels.
+    seed voxel, and all other voxels. See the :class:`PearsonCorrelator`
+    class.
     """
+    return PearsonCorrelator(data).correlate(seed)
 
-    x, y, z = seed
-    npoints = data.shape[3]
 
-    # the scipy.spatial.distance.cdist
-    # function can be used to calculate
-    # one-to-many correlation values.
-    with np.errstate(invalid='ignore'):
-        correlations = 1 - spd.cdist(
-            data[x, y, z, :].reshape( 1, npoints),
-            data            .reshape(-1, npoints),
-            metric='correlation')
+def _blockSize(rowsize):
+    """Returns the number of rows, each of ``rowsize`` bytes, which should
+    be processed at a time, according to the ``fsleyes.correlate.blockSize``
+    setting (in bytes, defaulting to 16MB).
+    """
+    blockSize = fslsettings.read('fsleyes.correlate.blockSize', 16777216)
+    return max(1, int(blockSize // max(1, rowsize)))
+
 
-    # Set any nans to 0
-    correlations[np.isnan(correlations)] = 0
+def _map(func, items):
+    """Calls ``func`` on each of the given ``items``, in parallel on the
+    :func:`.imagewrapper.rangePool` if there is more than one item.
+    """
+    items = list(items)
+    if len(items) > 1:
+        list(imagewrapper.rangePool().map(func, items))
+    else:
+        for item in items:
+            func(item)
+
+
+def _normalise(data, out):
+    """Used by :class:`PearsonCorrelator`. Normalises the time series of every
+    voxel in the 4D ``data`` to have zero mean and unit length, and stores
+    them in ``out``, with voxels in Fortran order. Time series which are
+    constant, or which contain non-finite values, are set to zero. The data
+    is processed in blocks of slices.
+    """
 
-    return correlations.reshape(data.shape[:3])
+    nx, ny, nz, npoints = data.shape
+    slcsize             = nx * ny
+    step                = _blockSize(slcsize * npoints * 8)
+
+    def normalise(zlo):
+        zhi  = min(nz, zlo + step)
+        blk  = np.array(data[:, :, zlo:zhi, :], dtype=np.float64, order='F')
+        blk  = blk.reshape((-1, npoints), order='F')
+        bad  = np.ptp(blk, axis=1, keepdims=True) == 0
+        blk -= blk.mean(axis=1, keepdims=True)
+        norm = np.sqrt((blk ** 2).sum(axis=1, keepdims=True))
+        bad |= ~np.isfinite(norm)
+        norm[bad]      = 1
+        blk[bad[:, 0]] = 0
+        blk /= norm
+        out[zlo * slcsize:zhi * slcsize] = blk
+
+    _map(normalise, range(0, nz, step))
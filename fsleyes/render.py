@@ -6,13 +6,29 @@
 #
 """The ``render`` module is a program which provides off-screen rendering
 capability for scenes which can otherwise be displayed via *FSLeyes*.
+
+Many scenes may be rendered by a single ``render`` process, by passing a
+file containing one set of ``render`` arguments per line via the
+``--batch`` option. The GL context is created once, and overlays which are
+used in more than one scene are only loaded once (see
+:class:`.OverlayCache`). The scenes may be rendered by several processes
+in parallel via the ``--workers`` option (see the :mod:`.renderfarm`
+module).
+
+A movie of a scene may be saved via the ``--movie`` option - the scene is
+rendered once for each frame, and frames are streamed into a
+:class:`.MovieWriter` as they are rendered (see :func:`renderMovie`).
 """
 
 
 import os.path as op
 import            sys
+import            json
+import            time
+import            shlex
 import            logging
 import            textwrap
+import            contextlib
 
 import numpy as np
 
@@ -21,7 +37,9 @@ import fsleyes_widgets.utils.layout          as fsllayout
 
 import                                          fsleyes
 import fsleyes.version                       as version
+import fsleyes.movie                         as fslmovie
 import fsleyes.overlay                       as fsloverlay
+import fsleyes.actions.loadoverlay           as loadoverlay
 import fsleyes.colourmaps                    as fslcm
 import fsleyes.parseargs                     as parseargs
 import fsleyes.displaycontext                as displaycontext
@@ -47,6 +65,11 @@ def main(args=None, hook=None):
     Creates and renders an OpenGL scene, and saves it to a file, according
     to the specified command line arguments (which default to
     ``sys.argv[1:]``).
+
+    If the ``--batch`` option is used, renders every scene listed in the
+    batch file (see :func:`renderBatch` and :func:`.renderfarm.renderFarm`),
+    and returns ``0`` if all scenes were rendered successfully, or ``1``
+    otherwise.
     """
 
     if args is None:
@@ -65,10 +88,36 @@ def main(args=None, hook=None):
     namespace = parseArgs(args)
     fsleyes.configLogging(namespace.verbose, namespace.noisy)
 
+    # Render a batch file on multiple
+    # processes - each worker process
+    # creates its own GL context.
+    if namespace.batch is not None and namespace.workers > 1:
+        import fsleyes.renderfarm as renderfarm
+        return renderfarm.renderFarm(namespace.batch,
+                                     stripBatchArgs(args),
+                                     namespace.workers)
+
+    with offscreenContext(namespace.glversion):
+        if namespace.batch is not None:
+            return renderBatch(namespace.batch, stripBatchArgs(args), hook)
+        else:
+            renderScene(namespace, hook)
+
+
+@contextlib.contextmanager
+def offscreenContext(glversion=None):
+    """Context manager which creates an off-screen GL context, and
+    initialises the :mod:`fsleyes.gl` package, so that scenes can be
+    rendered within the ``with`` block. The GL context is destroyed when
+    the block exits.
+
+    :arg glversion: Requested GL version, as a ``(major, minor)`` tuple.
+    """
+
     # Create a GL context
     fslgl.getGLContext(offscreen=True,
                        createApp=True,
-                       requestVersion=namespace.glversion)
+                       requestVersion=glversion)
 
     # Now that GL inititalisation is over,
     # make sure that the idle loop executes
@@ -80,14 +129,37 @@ def main(args=None, hook=None):
     with idle.idleLoop.synchronous(), \
          imagetexture.ImageTexture.enableThreading(False):
 
-
         # Initialise the fsleyes.gl modules
-        fslgl.bootstrap(namespace.glversion)
+        fslgl.bootstrap(glversion)
+
+        try:
+            yield
+
+        finally:
+            # Clear the GL context
+            fslgl.shutdown()
+
 
-        # Create a description of the scene
-        overlayList, displayCtx, sceneOpts = makeDisplayContext(namespace)
+def renderScene(namespace, hook=None, cache=None):
+    """Creates, renders, and saves the scene described by ``namespace``.
 
-        import matplotlib.image as mplimg
+    :arg namespace: ``argparse.Namespace`` object containing command line
+                    arguments.
+    :arg hook:      Passed through to :func:`render`.
+    :arg cache:     Optional :class:`.OverlayCache`. If provided, the
+                    scene is destroyed after it has been rendered, so that
+                    cached overlays may be used by subsequent scenes.
+    """
+
+    import matplotlib.image as mplimg
+
+    # Create a description of the scene
+    overlayList, displayCtx, sceneOpts = makeDisplayContext(namespace, cache)
+
+    try:
+        if namespace.movie is not None:
+            renderMovie(namespace, overlayList, displayCtx, sceneOpts, hook)
+            return
 
         # Render that scene, and save it to file
         bitmap, bg = render(
@@ -105,8 +177,196 @@ def main(args=None, hook=None):
 
         mplimg.imsave(namespace.outfile, bitmap)
 
-        # Clear the GL context
-        fslgl.shutdown()
+    finally:
+        if cache is not None:
+            destroyDisplayContext(overlayList, displayCtx)
+
+
+def renderMovie(namespace, overlayList, displayCtx, sceneOpts, hook=None):
+    """Renders a movie of the scene, and saves it to ``namespace.outfile``.
+    Each frame is passed to a :class:`.MovieWriter` as soon as it has been
+    rendered, and is encoded while the next frame is being rendered (see
+    :func:`.movie.openMovie`).
+
+    The ``--crop`` option is ignored, as all movie frames must have the
+    same size.
+
+    :arg namespace:   ``argparse.Namespace`` object containing command line
+                      arguments.
+    :arg overlayList: The :class:`.OverlayList` instance.
+    :arg displayCtx:  The :class:`.DisplayContext` instance.
+    :arg sceneOpts:   The :class:`.SceneOpts` instance.
+    :arg hook:        Passed through to :func:`renderFrames`.
+    """
+
+    if namespace.crop is not None:
+        log.warning('The --crop option cannot be used with --movie - '
+                    'ignoring')
+
+    writer = fslmovie.openMovie(namespace.outfile,
+                                namespace.frameRate,
+                                namespace.encoder)
+    frames = renderFrames(namespace,
+                          overlayList,
+                          displayCtx,
+                          sceneOpts,
+                          hook,
+                          movie=True)
+
+    with writer, contextlib.closing(frames):
+        for bitmap, _ in frames:
+            writer.addFrame(bitmap)
+
+    log.info('Saved %i frames to %s', writer.nframes, namespace.outfile)
+
+
+def renderBatch(batchFile, baseArgs=None, hook=None, cache=None):
+    """Renders every scene listed in ``batchFile`` (see
+    :func:`readBatchFile`). A JSON object describing the result of each
+    scene (see :func:`renderScenes`) is written to standard output, one per
+    line.
+
+    This function must be called after the GL context has been created and
+    the :mod:`fsleyes.gl` package bootstrapped (see
+    :func:`offscreenContext`). A scene which cannot be rendered is reported,
+    and then skipped.
+
+    :arg batchFile: Path to the batch file.
+    :arg baseArgs:  Arguments common to all scenes.
+    :arg hook:      Passed through to :func:`render`.
+    :arg cache:     :class:`.OverlayCache` used to share overlays between
+                    scenes. A new cache is created if not provided.
+    :returns:       ``0`` if all scenes were rendered successfully, ``1``
+                    otherwise.
+    """
+
+    scenes  = readBatchFile(batchFile)
+    nfailed = renderScenes(scenes, baseArgs, hook, cache, reportScene)
+
+    log.info('Rendered %i of %i scenes from %s',
+             len(scenes) - nfailed, len(scenes), batchFile)
+
+    return 1 if nfailed > 0 else 0
+
+
+def readBatchFile(batchFile):
+    """Reads a batch file. Each non-empty line of the file (excluding lines
+    beginning with ``#``) contains a set of ``render`` arguments for one
+    scene. Relative paths in the batch file are interpreted relative to the
+    current working directory.
+
+    :returns: A list of ``(lineno, args)`` tuples, one for each scene, where
+              ``lineno`` is the line number (starting from 1), and ``args``
+              is a list of arguments.
+    """
+
+    scenes = []
+
+    with open(batchFile, 'rt') as f:
+        for lineno, line in enumerate(f, 1):
+            line = line.strip()
+            if line == '' or line.startswith('#'):
+                continue
+            scenes.append((lineno, shlex.split(line)))
+
+    return scenes
+
+
+def renderScenes(scenes, baseArgs=None, hook=None, cache=None, report=None):
+    """Renders each of the given scenes in turn. This function must be
+    called after the GL context has been created and the :mod:`fsleyes.gl`
+    package bootstrapped (see :func:`offscreenContext`).
+
+    :arg scenes:   Sequence of ``(lineno, args)`` tuples, as returned by
+                   :func:`readBatchFile`.
+    :arg baseArgs: Arguments common to all scenes, which are prepended to
+                   the arguments for each scene.
+    :arg hook:     Passed through to :func:`render`.
+    :arg cache:    :class:`.OverlayCache` used to share overlays between
+                   scenes. A new cache is created if not provided.
+    :arg report:   Function which is called after each scene has been
+                   rendered (or has failed), and is passed a ``dict``
+                   containing:
+
+                    - ``line``:    The scene line number
+                    - ``outfile``: The output file, or ``None`` if the
+                                   scene arguments could not be parsed.
+                    - ``status``:  ``'ok'`` or ``'error'``
+                    - ``time``:    Time taken in seconds
+                    - ``error``:   Error message (only if ``status`` is
+                                   ``'error'``).
+    :returns:      The number of scenes which could not be rendered.
+    """
+
+    if baseArgs is None: baseArgs = []
+    if cache    is None: cache    = loadoverlay.OverlayCache()
+
+    nfailed = 0
+
+    for lineno, args in scenes:
+
+        start  = time.time()
+        result = {'line' : lineno, 'outfile' : None}
+
+        # Global state which may have
+        # been set by a previous scene
+        displaycontext.VolumeOpts.setInitialDisplayRange(None)
+
+        try:
+            namespace = parseArgs(list(baseArgs) + list(args))
+            result['outfile'] = namespace.outfile
+            if namespace.batch is not None:
+                raise ValueError('--batch cannot be used in a batch file')
+            log.info('Rendering scene (line %i) to %s',
+                     lineno, namespace.outfile)
+            renderScene(namespace, hook, cache)
+            result['status'] = 'ok'
+
+        except (Exception, SystemExit) as e:
+            nfailed += 1
+            result['status'] = 'error'
+            result['error']  = str(e)
+            log.error('Error rendering scene (line %i): %s',
+                      lineno, e, exc_info=True)
+
+        result['time'] = round(time.time() - start, 3)
+
+        if report is not None:
+            report(result)
+
+    return nfailed
+
+
+def reportScene(result):
+    """Writes the given scene result (see :func:`renderScenes`) to standard
+    output, as a single line of JSON.
+    """
+    sys.stdout.write(json.dumps(result) + '\n')
+    sys.stdout.flush()
+
+
+def stripBatchArgs(args):
+    """Returns a copy of the given list of command line arguments, with
+    the ``--batch`` option and its value removed.
+    """
+    args = list(args)
+    for i, arg in enumerate(args):
+        if arg in ('-bt', '--batch'):
+            return args[:i] + args[i + 2:]
+        if arg.startswith('--batch='):
+            return args[:i] + args[i + 1:]
+    return args
+
+
+def destroyDisplayContext(overlayList, displayCtx):
+    """Destroys a scene that was created by :func:`makeDisplayContext`, and
+    removes all overlays from the ``overlayList``. This must be called
+    before the overlays are re-used in another scene.
+    """
+    masterDisplayCtx = displayCtx.masterDisplayCtx
+    displayCtx      .destroy()
+    masterDisplayCtx.destroy()
+    overlayList.clear()
 
 
 def parseArgs(argv):
@@ -138,6 +398,41 @@ def parseArgs(argv):
                             metavar=('W', 'H'),
                             help='Size in pixels (width, height)',
                             default=(800, 600))
+    mainParser.add_argument('-bt',
+                            '--batch',
+                            metavar='FILE',
+                            help='Render all scenes listed in FILE, which '
+                                 'contains the arguments for one scene '
+                                 'per line')
+    mainParser.add_argument('-nw',
+                            '--workers',
+                            type=int,
+                            metavar='N',
+                            help='Number of processes to use when rendering '
+                                 'a batch file (default: 1)',
+                            default=1)
+    mainParser.add_argument('-mv',
+                            '--movie',
+                            choices=('x', 'y', 'z', 'time'),
+                            metavar='AXIS',
+                            help='Save a movie along AXIS (x, y, z, or time) '
+                                 'instead of a single image. The movie '
+                                 'format is determined by the output file '
+                                 'suffix - .gif (animated GIF), .png '
+                                 '(animated PNG), or any other format '
+                                 'supported by the encoder command')
+    mainParser.add_argument('-fr',
+                            '--frameRate',
+                            type=float,
+                            metavar='FPS',
+                            help='Movie frame rate (default: 10)',
+                            default=10)
+    mainParser.add_argument('-ec',
+                            '--encoder',
+                            metavar='CMD',
+                            help='Command used to encode movies which are not '
+                                 'saved as .gif or .png files (default: '
+                                 'ffmpeg)')
 
     name        = 'render'
     prolog      = 'FSLeyes render version {}\n'.format(version.__version__)
@@ -147,6 +442,14 @@ def parseArgs(argv):
 
         Use the '--scene' option to choose between orthographic
         ('ortho'), lightbox ('lightbox'), or 3D ('3d') views.
+
+        Use the '--batch' option to render many scenes at once.
+        Each line of the batch file contains the arguments for
+        one scene. Any other arguments are applied to every scene.
+        Use the '--workers' option to render the scenes in parallel.
+
+        Use the '--movie' option to save a movie instead of a
+        single image.
         """)
 
     exclude = {'Main' : ['skipfslcheck',
@@ -166,8 +469,14 @@ def parseArgs(argv):
         usageProlog=optStr,
         argOpts=['-of', '--outfile',
                  '-sz', '--size',
-                 '-c',  '--crop'],
-        shortHelpExtra=['--outfile', '--size', '--crop'],
+                 '-c',  '--crop',
+                 '-bt', '--batch',
+                 '-nw', '--workers',
+                 '-mv', '--movie',
+                 '-fr', '--frameRate',
+                 '-ec', '--encoder'],
+        shortHelpExtra=['--outfile', '--size', '--crop', '--batch',
+                        '--workers', '--movie'],
         exclude=exclude)
 
     if namespace.outfile is None:
@@ -177,6 +486,9 @@ def parseArgs(argv):
 
     namespace.outfile = op.abspath(namespace.outfile)
 
+    if namespace.batch is not None:
+        namespace.batch = op.abspath(namespace.batch)
+
     if namespace.scene not in ('ortho', 'lightbox', '3d'):
         log.info('Unknown scene specified  ("{}") - defaulting '
                  'to ortho'.format(namespace.scene))
@@ -185,10 +497,14 @@ def parseArgs(argv):
     return namespace
 
 
-def makeDisplayContext(namespace):
+def makeDisplayContext(namespace, cache=None):
     """Creates :class:`.OverlayList`, :class:`.DisplayContext``, and
     :class:`.SceneOpts` instances which represent the scene to be rendered,
     as described by the arguments in the given ``namespace`` object.
+
+    :arg namespace: ``argparse.Namespace`` object containing command line
+                    arguments.
+    :arg cache:     Optional :class:`.OverlayCache` to load overlays from.
     """
 
     # Set a display type hint. When running FSLeyes
@@ -217,79 +533,89 @@ def makeDisplayContext(namespace):
     # a weakref, so we need to create a real one.
     childDisplayCtx.masterDisplayCtx = masterDisplayCtx
 
-    # The handleOverlayArgs function uses the
-    # fsleyes.overlay.loadOverlays function,
-    # which will call these functions as it
-    # goes through the list of overlay to be
-    # loaded.
-    def load(ovl):
-        log.info('Loading overlay {} ...'.format(ovl))
-
-    def error(ovl, error):
-        log.error('Error loading overlay {}: {}'.format(ovl, error))
-        raise error
-
-    # Load the overlays specified on the command
-    # line, and configure their display properties
-    parseargs.applyMainArgs(   namespace,
-                               overlayList,
-                               masterDisplayCtx)
-    parseargs.applyOverlayArgs(namespace,
-                               overlayList,
-                               masterDisplayCtx,
-                               loadFunc=load,
-                               errorFunc=error)
-
-    # Create a SceneOpts instance describing
-    # the scene to be rendered. The parseargs
-    # module assumes that GL canvases have
-    # already been created, so we use mock
-    # objects to trick it. The options applied
-    # to these mock objects are applied to the
-    # real canvases later on, in the render
-    # function below.
-    if namespace.scene == 'ortho':
-        ncanvases = 3
-        optsCls   = orthoopts.OrthoOpts
-    elif namespace.scene == 'lightbox':
-        ncanvases = 1
-        optsCls   = lightboxopts.LightBoxOpts
-    elif namespace.scene == '3d':
-        ncanvases = 1
-        optsCls   = scene3dopts.Scene3DOpts
-
-    sceneOpts = optsCls(MockCanvasPanel(ncanvases, childDisplayCtx))
-
-    # 3D views default to
-    # world display space
-    if namespace.scene == '3d':
-        childDisplayCtx.displaySpace = 'world'
-
-    parseargs.applySceneArgs(namespace,
-                             overlayList,
-                             childDisplayCtx,
-                             sceneOpts)
-
-    # Centre the location. The DisplayContext
-    # will typically centre its location on
-    # initialisation, but this may not work
-    # if any overlay arguments change the bounds
-    # of an overlay (e.g. mesh reference image)
-    if namespace.worldLoc is None and namespace.voxelLoc is None:
-        b = childDisplayCtx.bounds
-        childDisplayCtx.location = [
-            b.xlo + 0.5 * b.xlen,
-            b.ylo + 0.5 * b.ylen,
-            b.zlo + 0.5 * b.zlen]
-
-    # This has to be applied after applySceneArgs,
-    # in case the user used the '-std'/'-std1mm'
-    # options.
-    if namespace.selectedOverlay is not None:
-        masterDisplayCtx.selectedOverlay = namespace.selectedOverlay
-
-    if len(overlayList) == 0:
-        raise RuntimeError('At least one overlay must be specified')
+    # If something goes wrong, and overlays
+    # are being cached, make sure that the
+    # cached overlays are released.
+    try:
+        # The handleOverlayArgs function uses the
+        # fsleyes.overlay.loadOverlays function,
+        # which will call these functions as it
+        # goes through the list of overlay to be
+        # loaded.
+        def load(ovl):
+            log.info('Loading overlay {} ...'.format(ovl))
+
+        def error(ovl, error):
+            log.error('Error loading overlay {}: {}'.format(ovl, error))
+            raise error
+
+        # Load the overlays specified on the command
+        # line, and configure their display properties
+        parseargs.applyMainArgs(   namespace,
+                                   overlayList,
+                                   masterDisplayCtx)
+        parseargs.applyOverlayArgs(namespace,
+                                   overlayList,
+                                   masterDisplayCtx,
+                                   loadFunc=load,
+                                   errorFunc=error,
+                                   cache=cache)
+
+        # Create a SceneOpts instance describing
+        # the scene to be rendered. The parseargs
+        # module assumes that GL canvases have
+        # already been created, so we use mock
+        # objects to trick it. The options applied
+        # to these mock objects are applied to the
+        # real canvases later on, in the render
+        # function below.
+        if namespace.scene == 'ortho':
+            ncanvases = 3
+            optsCls   = orthoopts.OrthoOpts
+        elif namespace.scene == 'lightbox':
+            ncanvases = 1
+            optsCls   = lightboxopts.LightBoxOpts
+        elif namespace.scene == '3d':
+            ncanvases = 1
+            optsCls   = scene3dopts.Scene3DOpts
+
+        sceneOpts = optsCls(MockCanvasPanel(ncanvases, childDisplayCtx))
+
+        # 3D views default to
+        # world display space
+        if namespace.scene == '3d':
+            childDisplayCtx.displaySpace = 'world'
+
+        parseargs.applySceneArgs(namespace,
+                                 overlayList,
+                                 childDisplayCtx,
+                                 sceneOpts)
+
+        # Centre the location. The DisplayContext
+        # will typically centre its location on
+        # initialisation, but this may not work
+        # if any overlay arguments change the bounds
+        # of an overlay (e.g. mesh reference image)
+        if namespace.worldLoc is None and namespace.voxelLoc is None:
+            b = childDisplayCtx.bounds
+            childDisplayCtx.location = [
+                b.xlo + 0.5 * b.xlen,
+                b.ylo + 0.5 * b.ylen,
+                b.zlo + 0.5 * b.zlen]
+
+        # This has to be applied after applySceneArgs,
+        # in case the user used the '-std'/'-std1mm'
+        # options.
+        if namespace.selectedOverlay is not None:
+            masterDisplayCtx.selectedOverlay = namespace.selectedOverlay
+
+        if len(overlayList) == 0:
+            raise RuntimeError('At least one overlay must be specified')
+
+    except Exception:
+        if cache is not None:
+            destroyDisplayContext(overlayList, childDisplayCtx)
+        raise
 
     return overlayList, childDisplayCtx, sceneOpts
 
@@ -312,6 +638,39 @@ def render(namespace, overlayList, displayCtx, sceneOpts, hook=None):
               be useful in other situations.
     """
 
+    frames = renderFrames(namespace, overlayList, displayCtx, sceneOpts, hook)
+
+    try:
+        return next(frames)
+    finally:
+        frames.close()
+
+
+def renderFrames(namespace,
+                 overlayList,
+                 displayCtx,
+                 sceneOpts,
+                 hook=None,
+                 movie=False):
+    """Generator which renders the scene, yielding a tuple containing the
+    bitmap and the background colour for each frame. The canvases are
+    created once, and are destroyed when the generator is exhausted or
+    closed.
+
+    :arg namespace:   ``argparse.Namespace`` object containing command line
+                      arguments.
+    :arg overlayList: The :class:`.OverlayList` instance.
+    :arg displayCtx:  The :class:`.DisplayContext` instance.
+    :arg sceneOpts:   The :class:`.SceneOpts` instance.
+    :arg hook:        Function which is called after the canvases have been
+                      created, but before the scene is rendered (see
+                      :func:`render`).
+    :arg movie:       If ``False`` (the default), a single frame is rendered.
+                      Otherwise, the scene is updated according to
+                      :func:`movieSteps`, and one frame is rendered for each
+                      step.
+    """
+
     # Calculate canvas and colour bar sizes
     # so that the entire scene will fit in
     # the width/height specified by the user
@@ -390,54 +749,144 @@ def render(namespace, overlayList, displayCtx, sceneOpts, hook=None):
         saveannotations.loadAnnotations(MockOrthoPanel(canvases),
                                         namespace.annotations)
 
+    if movie: steps = movieSteps(namespace, displayCtx, canvases)
+    else:     steps = [None]
+
+    bgColour = [c * 255 for c in sceneOpts.bgColour]
+    cbarBmp  = None
+
     # Configure each of the canvases (with those
     # properties that are common to both ortho and
     # lightbox canvases) and render them one by one
-    canvasBmps = []
+    try:
+        # Call hook if provided (used for testing)
+        if hook is not None:
+            hook(overlayList, displayCtx, sceneOpts, canvases)
 
-    # Call hook if provided (used for testing)
-    if hook is not None:
-        hook(overlayList, displayCtx, sceneOpts, canvases)
+        for i, _ in enumerate(steps):
 
-    for c in canvases:
+            canvasBmps = []
 
-        c.opts.pos = displayCtx.location
-        c.draw()
-        canvasBmps.append(c.getBitmap())
+            for c in canvases:
+                c.opts.pos = displayCtx.location
+                c.draw()
+                canvasBmps.append(c.getBitmap())
+
+            # layout the bitmaps
+            if namespace.scene in ('lightbox', '3d'):
+                layout = fsllayout.Bitmap(canvasBmps[0])
+            elif len(canvasBmps) > 0:
+                layout = fsllayout.buildOrthoLayout(canvasBmps,
+                                                    None,
+                                                    sceneOpts.layout,
+                                                    False,
+                                                    0)
+            else:
+                layout = fsllayout.Space(width, height)
+
+            # Render a colour bar if required -
+            # it is the same for every frame
+            if sceneOpts.showColourBar and i == 0:
+                cbarBmp = buildColourBarBitmap(overlayList,
+                                               displayCtx,
+                                               cbarWidth,
+                                               cbarHeight,
+                                               sceneOpts)
+            if cbarBmp is not None:
+                layout = buildColourBarLayout(layout,
+                                              cbarBmp,
+                                              sceneOpts.colourBarLocation,
+                                              sceneOpts.colourBarLabelSide)
+
+            # Turn the layout tree into a bitmap image
+            yield fsllayout.layoutToBitmap(layout, bgColour), bgColour
 
     # destroy the canvases
-    for c in canvases:
-        c.destroy()
-    canvases = None
-
-    # layout the bitmaps
-    if namespace.scene in ('lightbox', '3d'):
-        layout = fsllayout.Bitmap(canvasBmps[0])
-    elif len(canvasBmps) > 0:
-        layout = fsllayout.buildOrthoLayout(canvasBmps,
-                                            None,
-                                            sceneOpts.layout,
-                                            False,
-                                            0)
-    else:
-        layout = fsllayout.Space(width, height)
+    finally:
+        if namespace.scene == 'ortho':
+            labelMgr.destroy()
+        for c in canvases:
+            c.destroy()
+        canvases = None
 
-    # Render a colour bar if required
-    if sceneOpts.showColourBar:
-        cbarBmp = buildColourBarBitmap(overlayList,
-                                       displayCtx,
-                                       cbarWidth,
-                                       cbarHeight,
-                                       sceneOpts)
-        if cbarBmp is not None:
-            layout  = buildColourBarLayout(layout,
-                                           cbarBmp,
-                                           sceneOpts.colourBarLocation,
-                                           sceneOpts.colourBarLabelSide)
 
-    # Turn the layout tree into a bitmap image
-    bgColour = [c * 255 for c in sceneOpts.bgColour]
-    return fsllayout.layoutToBitmap(layout, bgColour), bgColour
+def movieSteps(namespace, displayCtx, canvases):
+    """Generator used by :func:`renderFrames` when a movie is being
+    rendered. Each iteration updates the scene to show the next frame of the
+    movie, along the axis given by the ``--movie`` option:
+
+      - ``time``: Each volume of the selected overlay, which must be a 4D
+        image, or a mesh with multiple vertex data sets.
+
+      - ``x``, ``y``, ``z`` (3D scenes): A full rotation of the scene about
+        the axis, in 5 degree steps.
+
+      - ``x``, ``y``, ``z`` (ortho/lightbox scenes): Each voxel along the
+        axis of the selected image, or 75 steps through the display bounds
+        for other overlays.
+
+    :arg namespace:  ``argparse.Namespace`` object containing command line
+                     arguments.
+    :arg displayCtx: The :class:`.DisplayContext` instance.
+    :arg canvases:   List of canvases being rendered.
+    """
+
+    import fsl.data.image       as fslimage
+    import fsl.data.mesh        as fslmesh
+    import fsl.transform.affine as affine
+
+    axis    = ('x', 'y', 'z', 'time').index(namespace.movie)
+    overlay = displayCtx.getSelectedOverlay()
+    opts    = displayCtx.getOpts(overlay)
+
+    # Time series - 4D images or
+    # meshes with N-D vertex data
+    if axis == 3:
+        if isinstance(overlay, fslimage.Nifti)         and \
+           isinstance(opts, displaycontext.VolumeOpts) and \
+           len(overlay.shape) > 3                      and \
+           overlay.shape[3] > 1:
+            for vol in range(overlay.shape[3]):
+                opts.volume = vol
+                yield
+
+        elif isinstance(overlay, fslmesh.Mesh) and opts.vertexDataLen() > 1:
+            for idx in range(opts.vertexDataLen()):
+                opts.vertexDataIndex = idx
+                yield
+
+        else:
+            raise ValueError('A time series movie requires a 4D image, or a '
+                             'mesh with multiple vertex data sets')
+
+    # Rotation around a 3D scene
+    elif namespace.scene == '3d':
+        opts  = canvases[0].opts
+        start = np.copy(opts.rotation)
+
+        for angle in range(0, 360, 5):
+            rots          = [0, 0, 0]
+            rots[axis]    = angle * np.pi / 180
+            opts.rotation = affine.concat(affine.axisAnglesToRotMat(*rots),
+                                          start)
+            yield
+
+    # Moving through the voxels of an image
+    elif isinstance(overlay, fslimage.Nifti):
+        voxel = opts.getVoxel(clip=False, vround=False)
+        for i in range(overlay.shape[axis]):
+            voxel[axis]         = i
+            displayCtx.location = opts.transformCoords(
+                voxel, 'voxel', 'display')
+            yield
+
+    # Moving through the display
+    # bounds of other overlays
+    else:
+        bmin, bmax = opts.bounds.getRange(axis)
+        for pos in np.linspace(bmin, bmax, 75):
+            displayCtx.location.setPos(axis, pos)
+            yield
 
 
 def createLightBoxCanvas(namespace,
@@ -683,6 +1132,7 @@ def buildColourBarBitmap(overlayList,
     cb.fontSize    = sceneOpts.labelSize
 
     cbarBmp = cb.colourBar(width, height)
+    cb.destroy()
 
     # The colourBarBitmap function returns a w*h*4
     # array, but the fsleyes_widgets.utils.layout.Bitmap
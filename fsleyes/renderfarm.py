@@ -0,0 +1,261 @@
+#!/usr/bin/env python
+#
+# renderfarm.py - Render a batch of scenes on multiple processes.
+#
+# Author: Paul McCarthy <pauldmccarthy@gmail.com>
+#
+"""This module provides the :func:`renderFarm` function, which is used by
+:mod:`fsleyes.render` to render the scenes listed in a batch file on
+several worker processes in parallel. It is used when the ``--batch`` and
+``--workers`` options are given to ``fsleyes render``.
+
+Each worker is a separate process, with its own off-screen GL context, so
+``renderFarm`` can be used on headless machines (e.g. with
+``PYOPENGL_PLATFORM=osmesa``). Scenes which use the same input files are
+rendered by the same worker where possible (see :func:`groupScenes`), so
+that each file only needs to be loaded by one worker.
+
+Each image is saved by its worker as soon as it has been rendered. A JSON
+object describing the result of each scene is written to standard output as
+soon as the scene has finished (see :func:`.render.renderScenes`), with an
+additional ``worker`` field containing the index of the worker which
+rendered the scene.
+
+.. autosummary::
+   :nosignatures:
+
+   renderFarm
+   groupScenes
+"""
+
+
+import os.path         as op
+import                    math
+import                    heapq
+import                    queue
+import                    logging
+import multiprocessing as mp
+
+import fsl.data.image as fslimage
+
+
+log = logging.getLogger(__name__)
+
+
+def renderFarm(batchFile, baseArgs, nworkers):
+    """Renders every scene listed in ``batchFile`` using ``nworkers``
+    worker processes.
+
+    :arg batchFile: Path to the batch file (see :func:`.render.readBatchFile`)
+    :arg baseArgs:  Arguments common to all scenes.
+    :arg nworkers:  Number of worker processes to use.
+    :returns:       ``0`` if all scenes were rendered successfully, ``1``
+                    otherwise.
+    """
+
+    import fsleyes.render as render
+
+    scenes = render.readBatchFile(batchFile)
+    groups = groupScenes(scenes, nworkers)
+    groups = [g for g in groups if len(g) > 0]
+
+    log.info('Rendering %i scenes from %s on %i workers',
+             len(scenes), batchFile, len(groups))
+
+    # Workers are started with the spawn method,
+    # rather than being forked from this process,
+    # so that each worker creates its own GL context
+    # from scratch.
+    ctx       = mp.get_context('spawn')
+    results   = ctx.Queue()
+    workers   = []
+    remaining = []
+    nfailed   = 0
+
+    for i, group in enumerate(groups):
+        worker = ctx.Process(target=_worker,
+                             args=(i, baseArgs, group, results),
+                             name='fsleyes-render-{}'.format(i),
+                             daemon=True)
+        worker.start()
+        workers  .append(worker)
+        remaining.append({lineno : args for lineno, args in group})
+
+    running = set(range(len(workers)))
+
+    # Called when a worker has finished or
+    # crashed - fails all of the scenes that
+    # it did not render, and returns the
+    # number of failed scenes.
+    def finish(i, error):
+        running.discard(i)
+        for lineno in sorted(remaining[i]):
+            render.reportScene({'line'    : lineno,
+                                'outfile' : None,
+                                'status'  : 'error',
+                                'time'    : 0,
+                                'error'   : error,
+                                'worker'  : i})
+        nremaining = len(remaining[i])
+        remaining[i].clear()
+        return nremaining
+
+    while len(running) > 0:
+
+        try:
+            msg, i, result = results.get(timeout=1)
+
+        # Check for workers which have crashed
+        except queue.Empty:
+            for i in list(running):
+                code = workers[i].exitcode
+                if code is not None and code != 0:
+                    nfailed += finish(
+                        i, 'Worker {} exited with code {}'.format(i, code))
+            continue
+
+        if i not in running:
+            continue
+
+        if msg == 'done':
+            nfailed += finish(i, 'Worker {} failed'.format(i))
+            continue
+
+        remaining[i].pop(result['line'], None)
+        result['worker'] = i
+
+        if result['status'] != 'ok':
+            nfailed += 1
+
+        render.reportScene(result)
+
+    for worker in workers:
+        worker.join()
+
+    log.info('Rendered %i of %i scenes from %s',
+             len(scenes) - nfailed, len(scenes), batchFile)
+
+    return 1 if nfailed > 0 else 0
+
+
+def groupScenes(scenes, nworkers):
+    """Divides a list of scenes into ``nworkers`` groups, so that scenes
+    which use the same input files are in the same group where possible,
+    and the groups are of similar size.
+
+    Scenes which share any input file are first joined into clusters. A
+    cluster which is larger than an even share of the scenes is split into
+    pieces, after sorting its scenes by their input files, so that scenes
+    with the same inputs stay together. The pieces are then assigned, largest
+    first, to the group with the fewest scenes.
+
+    :arg scenes:   Sequence of ``(lineno, args)`` tuples, as returned by
+                   :func:`.render.readBatchFile`.
+    :arg nworkers: Number of groups
+    :returns:      A list of ``nworkers`` lists of ``(lineno, args)`` tuples.
+    """
+
+    nworkers = max(1, int(nworkers))
+    nscenes  = len(scenes)
+    files    = [_sceneFiles(args) for _, args in scenes]
+
+    # Join scenes which share an input
+    # file into clusters (union-find)
+    parents = list(range(nscenes))
+    owners  = {}
+
+    def find(i):
+        while parents[i] != i:
+            parents[i] = parents[parents[i]]
+            i          = parents[i]
+        return i
+
+    for i, sfiles in enumerate(files):
+        for f in sfiles:
+            j = find(owners.setdefault(f, i))
+            parents[find(i)] = j
+
+    clusters = {}
+    for i in range(nscenes):
+        clusters.setdefault(find(i), []).append(i)
+
+    # Split large clusters, keeping
+    # scenes with the same inputs
+    # next to each other
+    share  = max(1, math.ceil(nscenes / nworkers))
+    pieces = []
+    for cluster in clusters.values():
+        cluster = sorted(cluster, key=lambda i: (sorted(files[i]), i))
+        for start in range(0, len(cluster), share):
+            pieces.append(cluster[start:start + share])
+
+    # Assign the largest pieces
+    # first, to the smallest group
+    groups = [[] for _ in range(nworkers)]
+    sizes  = [(0, i) for i in range(nworkers)]
+    pieces = sorted(pieces, key=lambda p: (-len(p), p[0]))
+
+    for piece in pieces:
+        size, i = heapq.heappop(sizes)
+        groups[i].extend(piece)
+        heapq.heappush(sizes, (size + len(piece), i))
+
+    return [[scenes[i] for i in group] for group in groups]
+
+
+def _sceneFiles(args):
+    """Used by :func:`groupScenes`. Returns a set containing the absolute
+    paths of all existing files or directories which are referred to in
+    the given list of scene arguments (excluding the output file).
+    """
+
+    files = set()
+    skip  = False
+
+    for arg in args:
+
+        if skip or arg.startswith('-'):
+            skip = arg in ('-of', '--outfile')
+            continue
+
+        try:
+            path = fslimage.addExt(arg, mustExist=True)
+        except Exception:
+            path = arg
+
+        if op.exists(path):
+            files.add(op.abspath(path))
+
+    return files
+
+
+def _worker(workerIdx, baseArgs, scenes, results):
+    """Target function for each worker process. Creates a GL context, and
+    renders each of the given scenes via :func:`.render.renderScenes`.
+    The result of each scene, and a final ``'done'`` message, are put onto
+    the ``results`` queue.
+
+    :arg workerIdx: Worker index
+    :arg baseArgs:  Arguments common to all scenes.
+    :arg scenes:    Sequence of ``(lineno, args)`` tuples.
+    :arg results:   ``multiprocessing.Queue`` to put results onto.
+    """
+
+    import fsleyes
+    import fsleyes.colourmaps as fslcm
+    import fsleyes.render     as render
+
+    fsleyes.initialise()
+    fslcm.init()
+
+    namespace = render.parseArgs(baseArgs)
+    fsleyes.configLogging(namespace.verbose, namespace.noisy)
+
+    def report(result):
+        results.put(('scene', workerIdx, result))
+
+    try:
+        with render.offscreenContext(namespace.glversion):
+            render.renderScenes(scenes, baseArgs, report=report)
+    finally:
+        results.put(('done', workerIdx, None))
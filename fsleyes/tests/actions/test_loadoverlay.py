@@ -0,0 +1,213 @@
+#!/usr/bin/env python
+#
+# test_loadoverlay.py -
+#
+# Author: Paul McCarthy <pauldmccarthy@gmail.com>
+#
+
+
+import os
+import queue
+import threading
+from unittest import mock
+
+import numpy as np
+
+from   fsl.utils.tempdir import tempdir
+import fsl.data.image        as fslimage
+import fsl.utils.settings    as fslsettings
+
+import fsleyes.actions.loadoverlay as loadoverlay
+from fsleyes.tests import run_with_fsleyes, yieldUntil
+
+
+def test_probeImage():
+    with tempdir():
+        fslimage.Image(np.zeros((10, 11, 12, 5), dtype=np.int16)).save('4d')
+        fslimage.Image(np.zeros((10, 11, 12, 1), dtype=np.float32)).save('3d')
+
+        assert loadoverlay.probeImage(fslimage.Image, '4d') == \
+            ((10, 11, 12, 5), 10 * 11 * 12 * 5 * 2)
+        assert loadoverlay.probeImage(fslimage.Image, '3d') == \
+            ((10, 11, 12), 10 * 11 * 12 * 4)
+
+
+def test_LoadBudget():
+
+    budget  = loadoverlay._LoadBudget()
+    entered = threading.Event()
+    release = threading.Event()
+    events  = []
+
+    def hold():
+        with budget.reserve(60):
+            entered.set()
+            release.wait()
+            events.append('first')
+
+    def wait():
+        with budget.reserve(60):
+            events.append('second')
+
+    with tempdir() as td, \
+         fslsettings.use(fslsettings.Settings('fsleyes', td, False)):
+        fslsettings.write('fsleyes.overlay.loadBudget', 100)
+
+        t1 = threading.Thread(target=hold)
+        t2 = threading.Thread(target=wait)
+        t1.start()
+        entered.wait()
+        t2.start()
+        t2.join(0.5)
+
+        # second reservation should be
+        # blocked until the first is done
+        assert events == []
+        release.set()
+        t1.join()
+        t2.join()
+        assert events == ['first', 'second']
+
+        # reservations larger than the
+        # budget are allowed on their own
+        with budget.reserve(1000):
+            pass
+
+
+def test_loadOverlays_blocking():
+    with tempdir():
+        for i in range(3):
+            fslimage.Image(np.full((5, 5, 5), i, dtype=np.float32)).save(
+                f'image{i}.nii.gz')
+        with open('bad.nii.gz', 'wt') as f:
+            f.write('not an image')
+
+        errors  = []
+        loadOne = []
+        paths   = ['image0', 'bad.nii.gz', 'image1', 'image2']
+        ovls    = loadoverlay.loadOverlays(
+            paths,
+            loadFunc=None,
+            errorFunc=lambda s, e: errors.append(s),
+            saveDir=False,
+            blocking=True,
+            onLoadOne=lambda i, o: loadOne.append(i))
+
+        assert [o.name for o in ovls] == ['image0', 'image1', 'image2']
+        assert loadOne                == [0, 2, 3]
+        assert len(errors)            == 1
+
+
+def test_loadOverlays_cache():
+    with tempdir():
+        for i in range(3):
+            fslimage.Image(np.full((5, 5, 5), i, dtype=np.float32)).save(
+                f'image{i}.nii.gz')
+
+        cache = loadoverlay.OverlayCache(2)
+
+        def load(*paths):
+            return loadoverlay.loadOverlays(paths,
+                                            loadFunc=None,
+                                            errorFunc=None,
+                                            saveDir=False,
+                                            blocking=True,
+                                            cache=cache)
+
+        ovls1 = load('image0', 'image1')
+        ovls2 = load('image0', 'image1')
+        assert len(cache) == 2
+        assert all(a is b for a, b in zip(ovls1, ovls2))
+
+        # the same file twice - only
+        # one copy should be re-used
+        ovls3 = load('image0', 'image0')
+        assert ovls3[0] is ovls1[0]
+        assert ovls3[1] is not ovls1[0]
+        assert np.all(ovls3[1][:] == 0)
+
+        # least recently used file
+        # (image1) should be evicted
+        ovls4 = load('image2')
+        ovls5 = load('image1')
+        assert len(cache) == 2
+        assert ovls5[0] is not ovls1[1]
+
+        # modified files should be re-loaded
+        os.utime('image2.nii.gz', ns=(0, 0))
+        ovls6 = load('image2')
+        assert ovls6[0] is not ovls4[0]
+
+
+def test_loadConcurrently_error():
+
+    calls    = queue.Queue()
+    loaded   = []
+    finished = []
+
+    # errors raised by loadPath should be
+    # passed through to pathLoaded, and
+    # not hold up subsequent paths
+    def loadPath(path):
+        if path == 'bad':
+            raise ValueError(path)
+        return path, [path], None
+
+    def pathLoaded(idx, path, ovls, error):
+        loaded.append((idx, path, ovls, type(error)))
+
+    def idle(func, *args):
+        calls.put((func, args))
+
+    with mock.patch.object(loadoverlay.idle, 'idle', idle):
+        loadoverlay._loadConcurrently(['a', 'bad', 'c'],
+                                      loadPath,
+                                      lambda p: None,
+                                      pathLoaded,
+                                      lambda: finished.append(True))
+        while len(finished) == 0:
+            func, args = calls.get(timeout=5)
+            func(*args)
+
+    assert loaded == [(0, 'a',   ['a'], type(None)),
+                      (1, 'bad', [],    ValueError),
+                      (2, 'c',   ['c'], type(None))]
+
+
+def test_loadOverlays_concurrent():
+    run_with_fsleyes(_test_loadOverlays_concurrent)
+def _test_loadOverlays_concurrent(frame, overlayList, displayCtx):
+
+    with tempdir():
+        paths = []
+        for i in range(10):
+            fslimage.Image(np.full((10, 10, 10), i, dtype=np.float32)).save(
+                f'image{i}.nii.gz')
+            paths.append(f'image{i}.nii.gz')
+
+        loadOne = []
+        result  = []
+
+        def onLoadOne(idx, ovls):
+            loadOne.append(idx)
+            overlayList.extend(ovls)
+
+        def onLoad(idxs, ovls):
+            result.append((idxs, ovls))
+
+        loadoverlay.loadOverlays(paths,
+                                 saveDir=False,
+                                 onLoad=onLoad,
+                                 onLoadOne=onLoadOne)
+        yieldUntil(lambda : len(result) > 0)
+
+        idxs, ovls = result[0]
+        names      = [f'image{i}' for i in range(10)]
+
+        assert loadOne == list(range(10))
+        assert idxs    == list(range(10))
+        assert [o.name for o in ovls]        == names
+        assert [o.name for o in overlayList] == names
+
+        for i, o in enumerate(ovls):
+            assert np.all(o[:] == i)
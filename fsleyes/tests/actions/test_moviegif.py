@@ -18,7 +18,7 @@ def test_MovieContext():
             got =  ctx.processFrame(f)
             assert np.isclose(exp[0], got[0])
             assert exp[1] == got[1]
-            ctx.addFrame(expf, None)
+            ctx.addFrame(expf)
 
     ctx    = moviegif.MovieContext(False)
     frames = [0, 1, 2, 3, 4, 5, 6, 7, 8, 0]
@@ -231,6 +231,35 @@ def test_overlay_volume_swapdim():
                   extras={'swapdim' : swapdim})
 
 
+# bricked textures should produce
+# exactly the same result as regular
+# textures, so we use the same
+# benchmarks as the main test
+bricked_cli_tests = """
+3d.nii.gz -dr 2000 7500
+-xz 750 -yz 750 -zz 750 3d.nii.gz -in none
+-xz 750 -yz 750 -zz 750 3d.nii.gz -in linear
+-xz 750 -yz 750 -zz 750 3d.nii.gz -in spline
+4d.nii.gz -v 0 -b 40 -c 90
+4d.nii.gz -v 3 -b 40 -c 90
+{{complex()}}  -ot volume
+"""
+
+
+def test_overlay_volume_bricked():
+
+    class MockSettings:
+        def read(self, name, default=None):
+            return {'fsleyes.texture.brickThreshold' : 1,
+                    'fsleyes.texture.brickSize'      : 4}.get(name, default)
+
+    with mock.patch('fsleyes.gl.textures.brickedtexture.fslsettings',
+                    MockSettings()):
+        run_cli_tests('test_overlay_volume',
+                      bricked_cli_tests,
+                      extras={'complex' : complex})
+
+
 def silly_range():
 
     data = np.arange(1000, dtype=np.float32).reshape((10, 10, 10))
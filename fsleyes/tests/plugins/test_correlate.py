@@ -6,11 +6,16 @@
 #
 
 
-import numpy as np
+import os.path as op
+import            glob
 
+import numpy as np
 
-from fsl.data.image import Image
+import fsl.utils.settings    as fslsettings
+from   fsl.utils.tempdir import tempdir
+from   fsl.data.image    import Image
 
+import fsleyes.data.diskcache          as diskcache
 import fsleyes.plugins.tools.correlate as correlate
 
 from fsleyes.tests import realYield, run_with_orthopanel
@@ -48,8 +53,86 @@ def _test_PearsonCorrelateAction(panel, overlayList, displayCtx):
     assert np.all(np.isclose(
         corr.data, correlate.pearsonCorrelation((5, 5, 5), img4d.data)))
 
+    # Earlier requests are cancelled
+    # when a new request is made
+    for seed in [(1, 2, 3), (4, 5, 6), (7, 8, 9)]:
+        displayCtx.location = opts.transformCoords(seed, 'voxel', 'display')
+        pcorr()
+    realYield(100)
+    assert len(overlayList) == 3
+    assert np.all(np.isclose(
+        corr.data, correlate.pearsonCorrelation((7, 8, 9), img4d.data)))
+
 
 def test_pearsonCorrelation():
     data   = np.random.randint(0, 1000, (10, 10, 10, 50)).astype(np.int32)
     result = correlate.pearsonCorrelation((0, 0, 0), data)
     assert result.shape == data.shape[:3]
+
+
+def test_pearsonCorrelation_values():
+
+    # constant/non-finite voxels
+    # should have correlation 0
+    data          = np.random.random((10, 10, 10, 50)).astype(np.float32)
+    data[1, 1, 1] = 5
+    data[2, 2, 2] = np.nan
+
+    result = correlate.pearsonCorrelation((0, 0, 0), data)
+    assert result.shape == data.shape[:3]
+
+    expect = np.zeros(data.shape[:3])
+    with np.errstate(invalid='ignore', divide='ignore'):
+        for x, y, z in np.ndindex(*data.shape[:3]):
+            expect[x, y, z] = np.corrcoef(data[0, 0, 0], data[x, y, z])[0, 1]
+    expect[1, 1, 1] = 0
+    expect[2, 2, 2] = 0
+
+    assert np.all(np.isclose(result, expect, atol=1e-5))
+
+    # seed with constant time series
+    assert np.all(correlate.pearsonCorrelation((1, 1, 1), data) == 0)
+
+
+def test_PearsonCorrelator():
+
+    data = np.random.random((10, 11, 12, 40)).astype(np.float32)
+    exp  = np.zeros(data.shape[:3])
+    for x, y, z in np.ndindex(*data.shape[:3]):
+        exp[x, y, z] = np.corrcoef(data[3, 4, 5], data[x, y, z])[0, 1]
+
+    with tempdir() as td, \
+         fslsettings.use(fslsettings.Settings('fsleyes', td, False)):
+
+        # small blocks, so the calculation
+        # is split across threads
+        fslsettings.write('fsleyes.correlate.blockSize', 10000)
+
+        Image(data, xform=np.eye(4)).save('data.nii.gz')
+        img = Image('data.nii.gz')
+        key = diskcache.imageKey(img, 'correlate')
+
+        corr = correlate.PearsonCorrelator(img.data, key)
+        assert corr.shape == (10, 11, 12)
+        assert np.all(np.isclose(corr.correlate((3, 4, 5)), exp, atol=1e-5))
+
+        # normalised data should be saved
+        # in, and memory-mapped from, the
+        # on-disk cache
+        assert op.exists(diskcache.cachePath('correlate', key))
+        assert len(glob.glob(op.join(td, 'cache', 'correlate', '*.tmp'))) == 0
+        corr = correlate.PearsonCorrelator(img.data, key)
+        assert isinstance(corr.prepare(), np.memmap)
+        assert np.all(np.isclose(corr.correlate((3, 4, 5)), exp, atol=1e-5))
+
+        # cancelled calculations return None
+        assert corr.correlate((3, 4, 5), lambda : True) is None
+
+        # data which does not fit in the
+        # cache is stored in memory
+        diskcache.clear()
+        fslsettings.write('fsleyes.cache.maxSize', 1000)
+        corr = correlate.PearsonCorrelator(img.data, key)
+        assert not isinstance(corr.prepare(), np.memmap)
+        assert np.all(np.isclose(corr.correlate((3, 4, 5)), exp, atol=1e-5))
+        assert not op.exists(diskcache.cachePath('correlate', key))
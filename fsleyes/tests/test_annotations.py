@@ -6,6 +6,11 @@
 #
 
 
+from unittest import mock
+
+import numpy as np
+
+import fsleyes.gl.annotations as annotations
 from fsleyes.tests import run_cli_tests
 
 
@@ -138,3 +143,132 @@ def test_text():
         # gl.text.Text object at draw time
 
     run_cli_tests('test_annotations_text', '3d', hook=hook)
+
+
+class Unbatched:
+    """Non-batchable annotation which records when it is drawn. """
+    batchable     = False
+    enabled       = True
+    honourZLimits = False
+    def __init__(self, drawn):
+        self.drawn = drawn
+    def expired(self, now):
+        return False
+    def draw2D(self, canvas, zpos, axes):
+        self.drawn.append(self)
+
+
+def _batchAnnotations():
+    """Creates an Annotations object with a mock canvas and shader, the
+    latter of which records each batched draw call as a tuple containing
+    the colour, and the number of vertices drawn.
+    """
+
+    drawn  = []
+    colour = [None]
+    canvas = mock.MagicMock()
+    shader = mock.MagicMock()
+
+    canvas.pixelSize.return_value = (1, 1)
+    canvas.GetSize  .return_value = (100, 100)
+    canvas.mvpMatrix              = np.eye(4)
+
+    def set(name, value):
+        if name == 'colour':
+            colour[0] = tuple(value)
+
+    def draw(prim, offset, count):
+        drawn.append((colour[0], count))
+
+    shader.set .side_effect = set
+    shader.draw.side_effect = draw
+
+    annot = annotations.Annotations(canvas)
+    return annot, shader, drawn
+
+
+def test_AnnotationBatch_order():
+
+    annot, shader, drawn = _batchAnnotations()
+    red                  = (1, 0, 0, 1)
+    blue                 = (0, 0, 1, 1)
+
+    with mock.patch.object(annot, 'createShader', return_value=shader):
+
+        # overlapping annotations should be
+        # drawn in order, and consecutive
+        # annotations with the same colour
+        # drawn together
+        annot.point(10, 10, colour=red[:3],  hold=True)
+        annot.point(10, 10, colour=red[:3],  hold=True)
+        annot.point(10, 10, colour=blue[:3], hold=True)
+        annot.point(10, 10, colour=red[:3],  hold=True)
+        annot.draw2D(0, (0, 1, 2))
+
+        nverts = drawn[1][1]
+        assert drawn == [(red,  nverts * 2),
+                         (blue, nverts),
+                         (red,  nverts)]
+
+        # non-batchable annotations split the
+        # batched annotations into runs
+        drawn.clear()
+        annot.clear()
+        unbatched = Unbatched(drawn)
+        annot.point(10, 10, colour=red[:3],  hold=True)
+        annot.obj(unbatched, hold=True)
+        annot.point(10, 10, colour=red[:3],  hold=True)
+        annot.point(10, 10, colour=blue[:3], hold=True)
+        annot.draw2D(0, (0, 1, 2))
+
+        assert drawn == [(red,  nverts),
+                         unbatched,
+                         (red,  nverts),
+                         (blue, nverts)]
+
+
+def test_AnnotationBatch_cache():
+
+    annot, shader, drawn = _batchAnnotations()
+    calls                = []
+    vertices2D           = annotations.Point.vertices2D
+
+    def countVertices(self, zpos, axes):
+        calls.append(self)
+        return vertices2D(self, zpos, axes)
+
+    with mock.patch.object(annot, 'createShader', return_value=shader), \
+         mock.patch.object(annotations.Point, 'vertices2D', countVertices):
+
+        p1 = annot.point(10, 10, hold=True)
+        p2 = annot.point(20, 20, hold=True)
+
+        annot.draw2D(0, (0, 1, 2))
+        assert sorted(map(id, calls)) == sorted([id(p1), id(p2)])
+        assert shader.setAtt.call_count == 1
+
+        # nothing changed - nothing re-generated
+        # or re-uploaded
+        calls.clear()
+        annot.draw2D(0, (0, 1, 2))
+        assert calls == []
+        assert shader.setAtt.call_count == 1
+
+        # only changed annotations re-generated
+        p1.x = 15
+        annot.draw2D(0, (0, 1, 2))
+        assert calls == [p1]
+        assert shader.setAtt.call_count == 2
+
+        # new slice - all re-generated
+        calls.clear()
+        annot.draw2D(1, (0, 1, 2))
+        assert len(calls) == 2
+
+        # removed annotation - vertex buffer
+        # re-uploaded, nothing re-generated
+        calls.clear()
+        annot.dequeue(p2, hold=True)
+        annot.draw2D(1, (0, 1, 2))
+        assert calls == []
+        assert shader.setAtt.call_count == 4
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+#
+# test_blockcache.py -
+#
+# Author: Paul McCarthy <pauldmccarthy@gmail.com>
+#
+
+
+import numpy as np
+
+from fsl.utils.tempdir import tempdir
+import fsl.utils.settings      as fslsettings
+import fsl.data.image          as fslimage
+import fsleyes.data.blockcache as blockcache
+
+
+def test_useBlockCache():
+    img3d = fslimage.Image(np.zeros((5, 5, 5)))
+    img4d = fslimage.Image(np.zeros((5, 5, 5, 5)))
+
+    with tempdir() as td, \
+         fslsettings.use(fslsettings.Settings('fsleyes', td, False)):
+        assert not blockcache.useBlockCache(img3d)
+        assert     blockcache.useBlockCache(img4d)
+        fslsettings.write('fsleyes.timeseries.cacheSize', 0)
+        assert not blockcache.useBlockCache(img4d)
+
+
+def test_blockCache_shared():
+    img = fslimage.Image(np.zeros((5, 5, 5, 5)))
+    assert blockcache.blockCache(img) is blockcache.blockCache(img)
+
+
+def test_TimeSeriesBlockCache():
+
+    data    = np.random.random((20, 20, 20, 10)).astype(np.float32)
+    img     = fslimage.Image(data)
+    blksize = 4 * 4 * 4 * 10 * 4
+    cache   = blockcache.TimeSeriesBlockCache(img,
+                                              blockSize=4,
+                                              budget=blksize * 4,
+                                              threaded=False)
+
+    def ts(x, y, z):
+        return cache.timeSeries((x, y, z, slice(None)))
+
+    assert np.all(ts(1, 2, 3) == data[1, 2, 3, :])
+    assert cache.stats()['misses'] == 1
+
+    # same block - should be a hit
+    assert np.all(ts(3, 3, 3) == data[3, 3, 3, :])
+    assert cache.stats()['hits'] == 1
+
+    # moving along x - the next
+    # block should be prefetched
+    assert np.all(ts(5, 3, 3) == data[5, 3, 3, :])
+    assert cache.stats()['misses']  == 2
+    assert cache.stats()['fetched'] == 1
+    assert np.all(ts(9, 3, 3) == data[9, 3, 3, :])
+    assert cache.stats()['hits'] == 2
+
+    # edge blocks, and memory budget
+    for x in range(0, 20, 4):
+        for y in range(0, 20, 4):
+            assert np.all(ts(x, y, 19) == data[x, y, 19, :])
+            assert cache.stats()['size'] <= cache.stats()['budget']
+    assert cache.stats()['blocks'] <= 4
+
+    # data change
+    img[1, 2, 3, :] = 5
+    assert cache.stats()['blocks'] == 0
+    assert np.all(ts(1, 2, 3) == 5)
+
+    cache.destroy()
+
+
+def test_TimeSeriesBlockCache_5d():
+    data  = np.random.random((6, 6, 6, 4, 3)).astype(np.float32)
+    img   = fslimage.Image(data)
+    cache = blockcache.TimeSeriesBlockCache(img, blockSize=4, threaded=False)
+
+    assert np.all(cache.timeSeries((5, 1, 2, slice(None), 2)) ==
+                  data[5, 1, 2, :, 2])
+    assert np.all(cache.timeSeries((5, 1, 2, 3, slice(None))) ==
+                  data[5, 1, 2, 3, :])
+    cache.destroy()
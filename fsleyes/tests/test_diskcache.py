@@ -0,0 +1,171 @@
+#!/usr/bin/env python
+#
+# test_diskcache.py -
+#
+# Author: Paul McCarthy <pauldmccarthy@gmail.com>
+#
+
+
+import os.path as op
+import            os
+import            time
+
+from unittest import mock
+
+import numpy as np
+
+import fsl.utils.settings    as fslsettings
+from   fsl.utils.tempdir import tempdir
+
+import fsleyes.data.diskcache as diskcache
+
+
+def _setmtime(category, key, mtime):
+    path = diskcache.cachePath(category, key)
+    os.utime(path, (mtime, mtime))
+
+
+def test_save_load():
+    with tempdir() as td, \
+         fslsettings.use(fslsettings.Settings('fsleyes', td, False)):
+        data = np.random.random((10, 10))
+        assert diskcache.save('cat', 'key', data)
+        assert np.all(diskcache.load('cat', 'key') == data)
+        assert diskcache.load('cat', 'nokey') is None
+
+        fslsettings.write('fsleyes.cache.enabled', False)
+        assert diskcache.load('cat', 'key') is None
+        assert not diskcache.save('cat', 'key2', data)
+
+
+def test_evict_lru():
+    with tempdir() as td, \
+         fslsettings.use(fslsettings.Settings('fsleyes', td, False)), \
+         mock.patch.object(diskcache, '_pruned', True):
+
+        data = np.zeros(1000, dtype=np.uint8)
+
+        diskcache.save('cat', 'a', data)
+        size = op.getsize(diskcache.cachePath('cat', 'a'))
+        fslsettings.write('fsleyes.cache.maxSize', size * 3)
+
+        diskcache.save('cat', 'b', data)
+        diskcache.save('cat', 'c', data)
+
+        now = time.time()
+        _setmtime('cat', 'a', now - 30)
+        _setmtime('cat', 'b', now - 20)
+        _setmtime('cat', 'c', now - 10)
+
+        # loading an entry marks it
+        # as recently used
+        diskcache.load('cat', 'a')
+
+        # b is the least recently used
+        diskcache.save('cat', 'd', data)
+        assert     op.exists(diskcache.cachePath('cat', 'a'))
+        assert not op.exists(diskcache.cachePath('cat', 'b'))
+        assert     op.exists(diskcache.cachePath('cat', 'c'))
+        assert     op.exists(diskcache.cachePath('cat', 'd'))
+
+        # data larger than the limit is not saved
+        assert not diskcache.save('cat', 'e', np.zeros(size * 4, np.uint8))
+        assert not op.exists(diskcache.cachePath('cat', 'e'))
+        with diskcache.create('cat', 'e', (size * 4,), np.uint8) as arr:
+            assert arr is None
+
+
+def test_evict_entries():
+    # All files for a key are a single entry
+    with tempdir() as td, \
+         fslsettings.use(fslsettings.Settings('fsleyes', td, False)), \
+         mock.patch.object(diskcache, '_pruned', True):
+
+        with open('src', 'wt') as f:
+            f.write('src')
+
+        key  = diskcache.fileKey('src')
+        data = np.zeros(1000, dtype=np.uint8)
+
+        diskcache.save('cat', f'{key}_1', data)
+        diskcache.save('cat', f'{key}_2', data)
+        diskcache.save('cat', 'other',   data)
+
+        size = op.getsize(diskcache.cachePath('cat', 'other'))
+        fslsettings.write('fsleyes.cache.maxSize', size * 3)
+
+        now = time.time()
+        _setmtime('cat', f'{key}_1', now - 30)
+        _setmtime('cat', f'{key}_2', now - 25)
+        _setmtime('cat', 'other',    now - 20)
+
+        diskcache.save('cat', 'new', data)
+
+        assert not op.exists(diskcache.cachePath('cat', f'{key}_1'))
+        assert not op.exists(diskcache.cachePath('cat', f'{key}_2'))
+        assert     op.exists(diskcache.cachePath('cat', 'other'))
+        assert     op.exists(diskcache.cachePath('cat', 'new'))
+
+
+def test_evict_stale():
+    with tempdir() as td, \
+         fslsettings.use(fslsettings.Settings('fsleyes', td, False)), \
+         mock.patch.object(diskcache, '_pruned', True):
+
+        for name in ('src1', 'src2', 'src3'):
+            with open(name, 'wt') as f:
+                f.write(name)
+
+        data = np.zeros(10)
+        key1 = diskcache.fileKey('src1')
+        key2 = diskcache.fileKey('src2')
+        key3 = diskcache.fileKey('src3')
+        diskcache.save('cat', key1, data)
+        diskcache.save('cat', key2, data)
+        diskcache.save('cat', key3, data)
+
+        # modify src1, delete src2
+        time.sleep(0.05)
+        with open('src1', 'at') as f:
+            f.write('more')
+        os.remove('src2')
+
+        # stale temporary file
+        tmp = op.join(op.dirname(diskcache.cachePath('cat', key1)), 'x.tmp')
+        with open(tmp, 'wt') as f:
+            f.write('tmp')
+        os.utime(tmp, (0, 0))
+
+        with mock.patch.object(diskcache, '_pruned', False):
+            diskcache.save('cat', 'new', data)
+
+        assert not op.exists(diskcache.cachePath('cat', key1))
+        assert not op.exists(diskcache.cachePath('cat', key2))
+        assert     op.exists(diskcache.cachePath('cat', key3))
+        assert     op.exists(diskcache.cachePath('cat', 'new'))
+        assert not op.exists(tmp)
+
+        srcdir = op.join(td, 'cache', '.sources')
+        assert sorted(os.listdir(srcdir)) == [key3]
+
+
+def test_create():
+    with tempdir() as td, \
+         fslsettings.use(fslsettings.Settings('fsleyes', td, False)):
+
+        with diskcache.create('cat', 'key', (10, 5), np.float32) as arr:
+            arr[:] = 5
+        data = diskcache.load('cat', 'key', mmap=True)
+        assert isinstance(data, np.memmap)
+        assert data.shape == (10, 5)
+        assert np.all(data == 5)
+
+        # file is not saved on error
+        try:
+            with diskcache.create('cat', 'key2', (10,), np.float32) as arr:
+                raise ValueError()
+        except ValueError:
+            pass
+        assert diskcache.load('cat', 'key2') is None
+        cdir = op.dirname(diskcache.cachePath('cat', 'key'))
+        assert not any(f.endswith('.tmp') for f in os.listdir(cdir))
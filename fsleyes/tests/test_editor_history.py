@@ -0,0 +1,136 @@
+#!/usr/bin/env python
+#
+# test_editor_history.py -
+#
+# Author: Paul McCarthy <pauldmccarthy@gmail.com>
+#
+
+
+import numpy as np
+
+import fsleyes.editor.history as history
+
+
+class Change:
+    def __init__(self, old, new):
+        self.old       = history.StoredArray(old)
+        self.new       = history.StoredArray(new, self.old)
+        self.destroyed = False
+    def arrays(self):
+        return [self.old, self.new]
+    def destroy(self):
+        self.destroyed = True
+        self.old.destroy()
+        self.new.destroy()
+
+
+def test_StoredArray():
+    old = np.random.random((20, 20, 20)).astype(np.float32)
+    old[1, 1, 1] = np.nan
+    new = np.array(old)
+    new[5:10, 5:10, 5:10] = 3
+    new[0, 0, 0] = np.nan
+
+    sold = history.StoredArray(old)
+    snew = history.StoredArray(new, sold)
+
+    assert snew.array() is new
+    assert snew.nbytes == new.nbytes
+
+    snew.compress()
+    assert snew.compressed
+    assert snew.nbytes < new.nbytes / 4
+    assert np.array_equal(snew.array(), new, equal_nan=True)
+
+    sold.spill()
+    snew.spill()
+    assert sold.spilled and snew.spilled
+    assert sold.nbytes == 0 and snew.nbytes == 0
+    assert sold.diskBytes > 0
+    assert np.array_equal(sold.array(), old, equal_nan=True)
+    assert np.array_equal(snew.array(), new, equal_nan=True)
+    sold.destroy()
+    snew.destroy()
+
+
+def test_StoredArray_selection():
+    sel = np.zeros((50, 50, 50), dtype=np.uint8)
+    sel[10:20, 10:40, 5:6] = 1
+    stored = history.StoredArray(sel)
+    stored.compress()
+    assert stored.nbytes < sel.nbytes / 50
+    assert np.all(stored.array() == sel)
+
+
+def test_History_undo_redo():
+    hist = history.History(budget=2 ** 30)
+    arrs = [np.full(10, i) for i in range(5)]
+
+    for i in range(4):
+        hist.add(Change(arrs[i], arrs[i + 1]))
+
+    assert len(hist) == 4
+    assert hist.canUndo and not hist.canRedo
+
+    change = hist.undo()
+    assert len(change) == 1
+    assert np.all(change[0].new.array() == arrs[4])
+    assert hist.canRedo
+
+    hist.startGroup()
+    hist.add(Change(arrs[0], arrs[1]))
+    hist.add(Change(arrs[1], arrs[2]))
+    hist.endGroup()
+
+    assert len(hist) == 4
+    assert not hist.canRedo
+    assert len(hist.undo()) == 2
+    assert len(hist.redo()) == 2
+
+
+def test_History_budget():
+
+    block   = 1000
+    budget  = block * 8 * 10
+    hist    = history.History(budget=budget)
+    changes = []
+
+    for i in range(100):
+        old    = np.random.random(block)
+        new    = np.array(old)
+        new[i] = -1
+        change = Change(old, new)
+        changes.append(change)
+        hist.add(change)
+
+        assert hist.nbytes()[0] <= budget
+
+    # the most recent changes are
+    # not compressed, and the oldest
+    # changes are discarded
+    assert not changes[-1].old.compressed
+    assert changes[0].destroyed
+    assert not changes[-1].destroyed
+    assert len(hist) < 100
+
+    # everything that is left can be undone
+    while hist.canUndo:
+        change = hist.undo()[0]
+        assert not change.destroyed
+        assert (change.old.array() != change.new.array()).sum() == 1
+
+
+def test_History_spill():
+    block  = 1000
+    budget = block * 8 * 4
+    hist   = history.History(budget=budget, spill=True,
+                             diskBudget=block * 8 * 20)
+
+    for i in range(30):
+        hist.add(Change(np.random.random(block), np.random.random(block)))
+        mem, disk = hist.nbytes()
+        assert mem  <= budget
+        assert disk <= block * 8 * 20
+
+    assert hist.nbytes()[1] > 0
+    assert len(hist) > 4
@@ -0,0 +1,145 @@
+#!/usr/bin/env python
+#
+# test_gllinevector.py -
+#
+# Author: Paul McCarthy <pauldmccarthy@gmail.com>
+#
+
+
+from unittest import mock
+
+import numpy as np
+
+import fsl.data.image          as fslimage
+import fsleyes.gl.gllinevector as gllinevector
+
+
+class GLVec:
+    """Mock GLLineVector, providing the attributes used by
+    GLLineVertices.
+    """
+
+    def __init__(self, data):
+        self.vectorImage = fslimage.Image(data)
+        self.lineWidth   = 1
+        self.generated   = []
+        self.opts        = mock.MagicMock()
+
+        self.opts.transform   = 'id'
+        self.opts.orientFlip  = False
+        self.opts.directed    = False
+        self.opts.unitLength  = False
+        self.opts.lengthScale = 100
+        self.opts.getTransform.return_value = np.eye(4)
+
+    def normalisedLineWidth(self, canvas):
+        return self.lineWidth
+
+    def generateVoxelCoordinates2D(self, zpos, axes):
+        self.generated.append(zpos)
+        shape           = self.vectorImage.shape[:3]
+        xax, yax, zax   = axes
+        xs, ys          = np.meshgrid(np.arange(shape[xax]),
+                                      np.arange(shape[yax]),
+                                      indexing='ij')
+        coords          = np.zeros((xs.size, 3))
+        coords[:, xax]  = xs.flat
+        coords[:, yax]  = ys.flat
+        coords[:, zax]  = zpos
+        return coords
+
+
+def test_GLLineVertices_slices():
+
+    data  = np.random.random((5, 6, 7, 3)).astype(np.float32)
+    glvec = GLVec(data)
+    verts = gllinevector.GLLineVertices(glvec, cacheSize=3)
+    axes  = (0, 1, 2)
+
+    vertices, indices, voxCoords = verts.getVertices2D(glvec, None, 2, axes)
+
+    # Four vertices for each voxel in the slice
+    assert len(vertices)  == 5 * 6 * 4
+    assert len(voxCoords) == 5 * 6 * 4
+    assert np.all(voxCoords[:, 2] == 2)
+
+    # vertices for each vector should be centred
+    # on its voxel, and end at +/- the vector
+    lines = verts.generateVertices(glvec, np.array([[1], [2], [2]]))
+    assert np.all(np.isclose(lines[0], -data[1, 2, 2]))
+    assert np.all(np.isclose(lines[1],  data[1, 2, 2]))
+
+    # slice should be cached
+    again = verts.getVertices2D(glvec, None, 2, axes)
+    assert glvec.generated == [2]
+    assert again[0] is vertices
+
+    # slices evicted in LRU order - slice 2 was
+    # used most recently, so 3 should be evicted
+    for z in (3, 4, 2, 5):
+        verts.getVertices2D(glvec, None, z, axes)
+    assert glvec.generated == [2, 3, 4, 5]
+
+    verts.getVertices2D(glvec, None, 2, axes)
+    verts.getVertices2D(glvec, None, 4, axes)
+    assert glvec.generated == [2, 3, 4, 5]
+    verts.getVertices2D(glvec, None, 3, axes)
+    assert glvec.generated == [2, 3, 4, 5, 3]
+
+
+def test_GLLineVertices_hash():
+
+    data  = np.random.random((5, 6, 7, 3)).astype(np.float32)
+    glvec = GLVec(data)
+    verts = gllinevector.GLLineVertices(glvec)
+    axes  = (0, 1, 2)
+
+    orig = verts.getVertices2D(glvec, None, 2, axes)[0]
+    assert hash(verts) == verts.calculateHash(glvec)
+
+    # changing a display property
+    # should invalidate the slice
+    glvec.opts.lengthScale = 200
+    assert hash(verts) != verts.calculateHash(glvec)
+    verts.refresh(glvec)
+    assert hash(verts) == verts.calculateHash(glvec)
+
+    scaled = verts.getVertices2D(glvec, None, 2, axes)[0]
+    assert glvec.generated == [2, 2]
+    assert not np.all(np.isclose(scaled, orig))
+
+    # old slice discarded by refresh, so
+    # must be re-generated when the property
+    # is restored
+    glvec.opts.lengthScale = 100
+    verts.refresh(glvec)
+    restored = verts.getVertices2D(glvec, None, 2, axes)[0]
+    assert glvec.generated == [2, 2, 2]
+    assert np.all(np.isclose(restored, orig))
+
+
+def test_GLLineVertices_lineWidth():
+
+    data  = np.random.random((5, 6, 7, 3)).astype(np.float32)
+    glvec = GLVec(data)
+    verts = gllinevector.GLLineVertices(glvec)
+    axes  = (0, 1, 2)
+
+    thin, thinIdxs, _ = verts.getVertices2D(glvec, None, 2, axes)
+    thin              = np.array(thin)
+
+    # polygons are re-generated when the line width
+    # changes, but the line vertices are not
+    glvec.lineWidth = 2
+    thick, thickIdxs, _ = verts.getVertices2D(glvec, None, 2, axes)
+    assert glvec.generated == [2]
+    assert thick.shape == thin.shape
+    assert np.all(thickIdxs == thinIdxs)
+    assert not np.all(np.isclose(thick, thin))
+
+    # polygons should be centred on the same line
+    # segments, and twice as wide
+    thinWidth  = np.abs(thin[ 0] - thin[ 1])
+    thickWidth = np.abs(thick[0] - thick[1])
+    assert np.all(np.isclose(thin[:2].mean(0), thick[:2].mean(0)))
+    assert np.all(np.isclose(thickWidth, thinWidth * 2))
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+#
+# test_gltractogram.py -
+#
+# Author: Paul McCarthy <pauldmccarthy@gmail.com>
+#
+
+
+import os.path as op
+import            shutil
+import            types
+
+import numpy as np
+
+from fsl.utils.tempdir import tempdir
+import fsl.utils.settings        as fslsettings
+import fsleyes.data.tractogram   as tractogram
+import fsleyes.gl.gltractogram   as gltractogram
+
+
+datadir = op.join(op.dirname(__file__), 'testdata', 'tractogram')
+
+
+def _glTractogram(trk, zax, xform, subsample=100):
+    """Creates a mock GLTractogram, and calls
+    GLTractogram.updateStreamlineData on it.
+    """
+    opts = types.SimpleNamespace(subsample=subsample,
+                                 effectiveColourMode='orientation',
+                                 effectiveClipMode=None)
+    glt  = types.SimpleNamespace(
+        overlay=trk,
+        opts=opts,
+        threedee=False,
+        depthKey=(zax, np.asarray(xform, dtype=np.float64).tobytes()),
+        shaderAttributeArgs=lambda: {},
+        iterShaders=lambda *a: [])
+
+    gltractogram.GLTractogram.updateStreamlineData(glt)
+    return glt
+
+
+def _sliceRange(glt, zlo, zhi):
+    return gltractogram.GLTractogram.sliceRange(glt, zlo, zhi)
+
+
+def _depths(vertices, zax, xform):
+    return vertices @ xform[zax, :3] + xform[zax, 3]
+
+
+def test_sliceRange():
+
+    with tempdir() as td, \
+         fslsettings.use(fslsettings.Settings('fsleyes', td, False)):
+
+        shutil.copy(op.join(datadir, 'spirals.trk'), 'spirals.trk')
+        trk = tractogram.Tractogram('spirals.trk')
+
+        xform = np.diag([2, 3, 0.5, 1])
+        xform[:3, 3] = [10, -5, 2]
+
+        for zax in range(3):
+            glt    = _glTractogram(trk, zax, xform)
+            depths = _depths(trk.vertices, zax, xform)
+            dmin   = depths.min()
+            dmax   = depths.max()
+
+            # vertices sorted by depth, and
+            # the same as the original vertices
+            assert np.all(np.diff(glt.depths) >= 0)
+            assert np.all(np.isclose(
+                glt.depths, _depths(glt.vertices, zax, xform), atol=1e-4))
+            assert np.all(np.isclose(np.sort(glt.depths), np.sort(depths)))
+
+            # slices within, and clipped
+            # at the edges of, the data
+            for zlo, zhi in [(dmin + (dmax - dmin) * 0.4,
+                              dmin + (dmax - dmin) * 0.6),
+                             (dmin - 10, dmin + 1),
+                             (dmax - 1,  dmax + 10),
+                             (dmin - 10, dmax + 10),
+                             (dmin, dmax)]:
+                first, count = _sliceRange(glt, zlo, zhi)
+                expect       = (depths >= zlo) & (depths <= zhi)
+                slcdepths    = glt.depths[first:first + count]
+
+                assert count == np.count_nonzero(expect)
+                assert first >= 0 and first + count <= len(depths)
+                assert np.all((slcdepths >= zlo) & (slcdepths <= zhi))
+
+            assert _sliceRange(glt, dmin - 10, dmax + 10) == (0, len(depths))
+            assert _sliceRange(glt, dmin, dmax)           == (0, len(depths))
+
+            # empty ranges - outside of the
+            # data, or between two vertices
+            udepths = np.unique(glt.depths)
+            between = (udepths[0] + udepths[1]) / 2
+            for zlo, zhi in [(dmin - 10, dmin - 5),
+                             (dmax + 5,  dmax + 10),
+                             (between,   between),
+                             (dmax,      dmin)]:
+                assert _sliceRange(glt, zlo, zhi)[1] == 0
+
+
+def test_sliceRange_subsample():
+
+    with tempdir() as td, \
+         fslsettings.use(fslsettings.Settings('fsleyes', td, False)):
+
+        shutil.copy(op.join(datadir, 'spirals.trk'), 'spirals.trk')
+        trk   = tractogram.Tractogram('spirals.trk')
+        xform = np.eye(4)
+        glt   = _glTractogram(trk, 2, xform, 50)
+
+        # only vertices from the subsampled
+        # streamlines should be included
+        nstrms  = int(trk.nstreamlines * 50 / 100)
+        strms   = np.sort(trk.lodOrder[:nstrms])
+        expidxs = trk.vertexIndices(strms)
+
+        assert len(glt.vertices) == len(expidxs)
+        assert np.all(np.sort(glt.indices) == np.sort(expidxs))
+        assert np.all(np.isclose(glt.vertices, trk.vertices[glt.indices]))
+
+        depths       = trk.vertices[expidxs, 2]
+        zlo, zhi     = np.percentile(depths, [25, 75])
+        first, count = _sliceRange(glt, zlo, zhi)
+        assert count == np.count_nonzero((depths >= zlo) & (depths <= zhi))
+
+        # not sorted - all vertices
+        glt.depths = None
+        assert _sliceRange(glt, zlo, zhi) == (0, len(glt.vertices))
@@ -0,0 +1,184 @@
+#!/usr/bin/env python
+#
+# test_gzipindex.py -
+#
+# Author: Paul McCarthy <pauldmccarthy@gmail.com>
+#
+
+
+import os.path as op
+import            gzip
+from unittest import mock
+
+import numpy               as np
+import nibabel             as nib
+import nibabel.arrayproxy  as arrayproxy
+import pytest
+
+from fsl.utils.tempdir import tempdir
+import fsl.utils.settings        as fslsettings
+import fsleyes.data.gzipindex    as gzipindex
+import fsleyes.data.imagewrapper as imagewrapper
+
+
+def test_useIndex():
+    with tempdir() as td, \
+         fslsettings.use(fslsettings.Settings('fsleyes', td, False)):
+
+        data = np.zeros((5, 5, 5, 5), dtype=np.float32)
+        nib.Nifti1Image(data, np.eye(4)).to_filename('image.nii')
+        nib.Nifti1Image(data, np.eye(4)).to_filename('image.nii.gz')
+
+        assert not gzipindex.useIndex(None)
+        assert not gzipindex.useIndex('image.nii')
+        assert not gzipindex.useIndex('missing.nii.gz')
+        assert gzipindex.useIndex('image.nii.gz') == gzipindex.available()
+
+        fslsettings.write('fsleyes.overlay.gzipindex', False)
+        assert not gzipindex.useIndex('image.nii.gz')
+
+
+def test_indexPath():
+    with tempdir() as td, \
+         fslsettings.use(fslsettings.Settings('fsleyes', td, False)):
+
+        with open('file.gz', 'wt') as f:
+            f.write('abc')
+
+        path = gzipindex.indexPath('file.gz')
+        assert path.startswith(op.join(td, 'cache', 'gzipindex'))
+        assert path.endswith('.gzidx')
+        assert not gzipindex.hasIndex('file.gz')
+
+        # index path changes when file changes
+        with open('file.gz', 'wt') as f:
+            f.write('abcd')
+        assert gzipindex.indexPath('file.gz') != path
+
+        fslsettings.write('fsleyes.cache.enabled', False)
+        assert gzipindex.indexPath('file.gz') is None
+
+
+def test_ImageWrapper_indexed():
+
+    pytest.importorskip('indexed_gzip')
+
+    with tempdir() as td, \
+         fslsettings.use(fslsettings.Settings('fsleyes', td, False)):
+
+        data = np.random.random((20, 20, 20, 30)).astype(np.float32)
+        nib.Nifti1Image(data, np.eye(4)).to_filename('image.nii.gz')
+
+        gzipindex.buildIndex('image.nii.gz', threaded=False)
+        assert gzipindex.hasIndex('image.nii.gz')
+
+        nibimg  = nib.load('image.nii.gz')
+        wrapper = imagewrapper.ImageWrapper(indexed=True)
+        wrapper.setImage(nibimg)
+
+        assert np.all(np.isclose(wrapper[..., 29], data[..., 29]))
+        assert np.all(np.isclose(wrapper[..., 3],  data[..., 3]))
+        assert np.all(np.isclose(wrapper[1, 2, 3, :], data[1, 2, 3, :]))
+
+
+def test_ImageWrapper_indexed_range():
+
+    # Reads via the index are serialised, so
+    # range chunks should not be read on the
+    # range pool
+    pytest.importorskip('indexed_gzip')
+
+    with tempdir() as td, \
+         fslsettings.use(fslsettings.Settings('fsleyes', td, False)), \
+         mock.patch.object(imagewrapper, 'rangePool',
+                           side_effect=AssertionError):
+
+        data = np.random.random((10, 10, 10, 20)).astype(np.float32)
+        nib.Nifti1Image(data, np.eye(4)).to_filename('image.nii.gz')
+        gzipindex.buildIndex('image.nii.gz', threaded=False)
+        fslsettings.write('fsleyes.imagewrapper.chunkSize', 4000)
+
+        wrapper = imagewrapper.ImageWrapper(indexed=True)
+        wrapper.setImage(nib.load('image.nii.gz'))
+        wrapper[..., :]
+
+        assert np.isclose(wrapper.dataRange[0], data.min())
+        assert np.isclose(wrapper.dataRange[1], data.max())
+
+
+def test_arrayProxy():
+
+    class IndexedGzipFile:
+        def __init__(self, filename):
+            self.fobj = gzip.open(filename, 'rb')
+
+        def __getattr__(self, name):
+            return getattr(self.fobj, name)
+
+    igzip = mock.MagicMock(IndexedGzipFile=IndexedGzipFile)
+
+    with tempdir() as td, \
+         fslsettings.use(fslsettings.Settings('fsleyes', td, False)), \
+         mock.patch.dict('sys.modules', indexed_gzip=igzip):
+
+        data = np.random.randint(0, 100, (10, 10, 10)).astype(np.int16)
+        img  = nib.Nifti1Image(data, np.eye(4))
+        img.header.set_slope_inter(2, 5)
+        img.to_filename('image.nii.gz')
+
+        img   = nib.load('image.nii.gz')
+        proxy = gzipindex.arrayProxy('image.nii.gz', img.dataobj)
+
+        assert np.all(np.isclose(proxy[:],       img.get_fdata()))
+        assert np.all(np.isclose(proxy[..., 3], data[..., 3] * 2 + 5))
+
+
+def test_ImageWrapper_indexed_close():
+
+    # ImageWrapper should close the file handle used
+    # by its ArrayProxy whenever it is replaced
+    fobjs = []
+    built = []
+
+    def arrayProxy(path, dataobj):
+        fobj = gzip.open(path, 'rb')
+        fobjs.append(fobj)
+        return arrayproxy.ArrayProxy(fobj, (dataobj.shape,
+                                            dataobj.dtype,
+                                            dataobj.offset))
+
+    def buildIndex(path, onFinish):
+        built.append(onFinish)
+
+    with tempdir() as td, \
+         fslsettings.use(fslsettings.Settings('fsleyes', td, False)), \
+         mock.patch.object(gzipindex, 'useIndex',   return_value=True), \
+         mock.patch.object(gzipindex, 'hasIndex',   return_value=False), \
+         mock.patch.object(gzipindex, 'arrayProxy', arrayProxy), \
+         mock.patch.object(gzipindex, 'buildIndex', buildIndex):
+
+        data = np.random.random((10, 10, 10)).astype(np.float32)
+        nib.Nifti1Image(data, np.eye(4)).to_filename('image.nii.gz')
+
+        nibimg  = nib.load('image.nii.gz')
+        wrapper = imagewrapper.ImageWrapper(indexed=True)
+        wrapper.setImage(nibimg)
+        assert len(fobjs) == 1 and not fobjs[0].closed
+
+        # index built - proxy replaced
+        built[0]()
+        assert len(fobjs) == 2
+        assert fobjs[0].closed and not fobjs[1].closed
+        assert np.all(np.isclose(wrapper[..., 3], data[..., 3]))
+
+        # new image
+        wrapper.setImage(nib.load('image.nii.gz'))
+        assert len(fobjs) == 3
+        assert fobjs[1].closed and not fobjs[2].closed
+
+        # index for old image ignored
+        built[0]()
+        assert len(fobjs) == 3
+
+        wrapper.__del__()
+        assert all(f.closed for f in fobjs)
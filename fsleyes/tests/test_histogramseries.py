@@ -14,6 +14,7 @@ from unittest import mock
 
 import numpy as np
 
+import fsl.utils.settings as fslsettings
 from fsl.utils.tempdir import tempdir
 from fsl.data.image    import Image
 from fsl.data.vtk      import VTKMesh
@@ -223,3 +224,147 @@ def _test_MeshHistogramSeries(panel, overlayList, displayCtx):
     expx, expy = calc(data[:, 2])
     assert np.all(np.isclose(gotx, expx))
     assert np.all(np.isclose(gotx, expx))
+
+
+def _refHistogram(data, nbins, hrange, drange, outliers, zeros):
+    data = data[np.isfinite(data)]
+    if not zeros:
+        data = data[data != 0]
+    if not outliers:
+        data = data[(data >= hrange[0]) & (data < hrange[1])]
+    return hseries.histogram(data, nbins, hrange, drange, outliers)
+
+
+def test_BaseHistogram_integer():
+
+    for dtype in (np.uint8, np.int16, np.int32, np.float32):
+        data = np.random.randint(0, 100, (20, 20, 20)).astype(dtype)
+        data[data < 20] = 0
+        base = hseries.BaseHistogram(data)
+
+        assert base.dtype          == dtype
+        assert base.dataRange      == (0, data.max())
+        assert base.zeroCount      == np.sum(data == 0)
+        assert base.nonFiniteCount == 0
+
+        drange = (0, data.max() + data.max() / 10000)
+        for nbins, hrange in [(10,  drange),
+                              (37,  (12.3, 87.1)),
+                              (100, (5, 50))]:
+            for outliers in (True, False):
+                for zeros in (True, False):
+                    got = base.histogram(nbins, hrange, drange,
+                                         outliers, not zeros)
+                    exp = _refHistogram(data, nbins, hrange, drange,
+                                        outliers, zeros)
+                    assert np.all(got[0] == exp[0])
+                    assert np.all(got[1] == exp[1])
+                    assert got[2] == exp[2]
+
+
+def test_BaseHistogram_float():
+
+    data = np.random.random((30, 30, 30)).astype(np.float32) * 50 - 10
+    data[ :5]  = 0
+    data[5, 0, 0] = np.nan
+    data[5, 0, 1] = np.inf
+    data[5, 0, 2] = -np.inf
+    base       = hseries.BaseHistogram(data)
+    finite     = data[np.isfinite(data)]
+    dmin, dmax = finite.min(), finite.max()
+
+    assert base.dataRange      == (dmin, dmax)
+    assert base.zeroCount      == np.sum(data == 0)
+    assert base.nonFiniteCount == 3
+
+    # The default histogram over the full
+    # data range is exact, other than for
+    # values which fall on a bin edge, and
+    # may be rounded into either bin. Other
+    # histograms are close.
+    drange = (dmin, dmax + (dmax - dmin) / 10000.0)
+    nbins  = hseries.autoBin(data, drange)
+    for zeros in (True, False):
+        got = base.histogram(nbins, drange, drange, False, not zeros)
+        exp = _refHistogram(data, nbins, drange, drange, False, zeros)
+        assert np.all(np.abs(got[1] - exp[1]) <= 1)
+        assert got[2] == exp[2]
+
+    for nbins, hrange in [(13, (-5.3, 20.7)), (200, (0, 30))]:
+        for outliers in (True, False):
+            got = base.histogram(nbins, hrange, drange, outliers)
+            exp = _refHistogram(data, nbins, hrange, drange, outliers, False)
+            assert np.all(np.abs(got[1] - exp[1]) <= 5)
+            assert abs(got[2] - exp[2]) <= 5
+
+    # no finite values
+    assert hseries.BaseHistogram(np.full(10, np.nan)).dataRange is None
+
+
+def test_BaseHistogram_chunked():
+
+    data  = np.random.randint(-500, 500, (20, 20, 20, 5)).astype(np.float64)
+    data  = np.asfortranarray(data)[..., 2]
+    drange = (data.min(), data.max() + (data.max() - data.min()) / 10000)
+    exp   = hseries.BaseHistogram(data).histogram(50, drange, drange)
+
+    with tempdir() as td, \
+         fslsettings.use(fslsettings.Settings('fsleyes', td, False)):
+        fslsettings.write('fsleyes.histogram.chunkSize', 100)
+        got = hseries.BaseHistogram(data).histogram(50, drange, drange)
+
+    assert np.all(got[1] == exp[1])
+    assert got[2] == exp[2] == np.count_nonzero(data)
+
+
+def test_BaseHistogram_toArray():
+
+    data  = np.random.random((20, 20, 20)).astype(np.float32) * 100
+    data[:5] = 0
+    ints  = np.random.randint(-50, 50, (20, 20, 20)).astype(np.int16)
+    empty = np.full(10, np.nan)
+
+    for d in (data, ints, data.astype(np.int32), empty):
+        base = hseries.BaseHistogram(d)
+        copy = hseries.BaseHistogram.fromArray(d.dtype, base.toArray())
+
+        assert copy.dtype          == base.dtype
+        assert copy.dataRange      == base.dataRange
+        assert copy.zeroCount      == base.zeroCount
+        assert copy.nonFiniteCount == base.nonFiniteCount
+
+        if base.dataRange is None:
+            continue
+
+        dmin, dmax = base.dataRange
+        drange     = (dmin, dmax + (dmax - dmin) / 10000)
+        for nbins, hrange in [(10, drange), (37, (12.3, 47.1))]:
+            for zeros in (True, False):
+                exp = base.histogram(nbins, hrange, drange, True, zeros)
+                got = copy.histogram(nbins, hrange, drange, True, zeros)
+                assert np.all(got[0] == exp[0])
+                assert np.all(got[1] == exp[1])
+                assert got[2] == exp[2]
+
+
+def test_HistogramSeries_float():
+
+    class Overlay(object):
+        def name(self):
+            return str(id(self))
+
+    hs     = hseries.HistogramSeries(Overlay(), None, None, None)
+    data   = np.random.random(10000) * 1000
+    dmin   = data.min()
+    dmax   = data.max()
+    drange = (dmin, dmax + (dmax - dmin) / 10000.0)
+    nbins  = hseries.autoBin(data, drange)
+
+    hs.setHistogramData(data, 'data')
+
+    hx, hy, nvals = hseries.histogram(data, nbins, drange, drange)
+    gotx, goty = hs.getData()
+    assert hs.nbins              == nbins
+    assert hs.numHistogramValues == nvals
+    assert np.all(np.isclose(hx, gotx))
+    assert np.all(hy == goty)
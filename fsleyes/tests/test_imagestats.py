@@ -0,0 +1,135 @@
+#!/usr/bin/env python
+#
+# test_imagestats.py -
+#
+# Author: Paul McCarthy <pauldmccarthy@gmail.com>
+#
+
+
+import os.path as op
+import            os
+
+import numpy as np
+
+from fsl.utils.tempdir import tempdir
+import fsl.utils.settings        as fslsettings
+import fsl.data.image            as fslimage
+import fsleyes.data.imagestats   as imagestats
+import fsleyes.data.imagewrapper as imagewrapper
+
+
+def test_imageStats_shared():
+    img = fslimage.Image(np.zeros((5, 5, 5)))
+    assert imagestats.imageStats(img) is imagestats.imageStats(img)
+
+
+def test_volumeRanges():
+    data = np.random.random((10, 10, 10, 4)).astype(np.float32)
+
+    with tempdir() as td, \
+         fslsettings.use(fslsettings.Settings('fsleyes', td, False)):
+
+        fslimage.Image(data).save('image.nii.gz')
+        img   = fslimage.Image('image.nii.gz')
+        stats = imagestats.ImageStats(img)
+
+        assert stats.volumeRanges is None
+        assert stats.dataRange    is None
+
+        ranges = np.array([[0, 1], [-1, 2], [np.nan, np.nan], [0, 3]])
+        stats.setVolumeRanges(ranges)
+
+        # reloaded image should get saved stats
+        img   = fslimage.Image('image.nii.gz')
+        stats = imagestats.ImageStats(img)
+        assert np.allclose(stats.volumeRanges, ranges, equal_nan=True)
+        assert stats.dataRange == (-1, 3)
+
+        # in-memory images are not cached
+        img   = fslimage.Image(data)
+        stats = imagestats.ImageStats(img)
+        stats.setVolumeRanges(ranges)
+        assert stats.volumeRanges is None
+
+
+def test_percentiles():
+    data = np.random.randint(-100, 100, (10, 10, 10, 3)).astype(np.float32)
+    data[0, 0, 0, 1] = np.nan
+
+    with tempdir() as td, \
+         fslsettings.use(fslsettings.Settings('fsleyes', td, False)):
+
+        fslimage.Image(data).save('image.nii.gz')
+        img   = fslimage.Image('image.nii.gz')
+        stats = imagestats.ImageStats(img)
+
+        for vol in range(3):
+            voldata = data[..., vol]
+            voldata = voldata[np.isfinite(voldata) & (voldata != 0)]
+            expect  = np.percentile(voldata, [1, 50, 99])
+            assert np.allclose(stats.percentiles([1, 50, 99], vol), expect)
+
+        cachedir = op.join(td, 'cache', 'stats')
+        assert len(os.listdir(cachedir)) == 3
+
+        # default to first volume
+        assert np.allclose(stats.percentiles([5, 95]),
+                           stats.percentiles([5, 95], 0))
+        assert len(os.listdir(cachedir)) == 3
+
+
+def test_histogram():
+
+    calls = []
+
+    def calc():
+        calls.append(True)
+        return np.arange(10)
+
+    with tempdir() as td, \
+         fslsettings.use(fslsettings.Settings('fsleyes', td, False)):
+
+        fslimage.Image(np.zeros((5, 5, 5))).save('image.nii.gz')
+        img   = fslimage.Image('image.nii.gz')
+        stats = imagestats.ImageStats(img)
+
+        for _ in range(2):
+            hist = stats.histogram(('a', 1), calc)
+            assert np.all(hist == np.arange(10))
+
+        assert len(calls) == 1
+
+        stats.histogram(('a', 2), calc)
+        assert len(calls) == 2
+
+
+def test_percentiles_gc():
+    img   = fslimage.Image(np.random.random((5, 5, 5)))
+    stats = imagestats.ImageStats(img)
+    assert stats.percentiles([50]) is not None
+    del img
+    assert stats.percentiles([50]) is None
+
+
+def test_ImageWrapper_initial_range():
+    data = np.random.random((10, 10, 10, 4)).astype(np.float32)
+    data[..., 2] = data[..., 2] * 10 + 5
+
+    with tempdir(), \
+         fslsettings.use(fslsettings.Settings('fsleyes', '.', False)):
+
+        fslimage.Image(data).save('image.nii.gz')
+        img     = fslimage.Image('image.nii.gz')
+        stats   = imagestats.ImageStats(img)
+        wrapper = imagewrapper.ImageWrapper()
+        wrapper.setImage(img.nibImage, (-10, 100))
+        wrapper[..., 0]
+
+        # initial range must not be narrowed
+        assert wrapper.dataRange == (-10, 100)
+
+        wrapper[:]
+        assert wrapper.covered
+
+        stats.setVolumeRanges(wrapper.volumeRanges)
+        assert stats.dataRange == (data.min(), data.max())
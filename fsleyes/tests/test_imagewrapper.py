@@ -14,7 +14,9 @@ import numpy     as np
 import nibabel   as nib
 import              pytest
 
+from fsl.utils.tempdir import tempdir
 import fsl.utils.naninfrange     as nir
+import fsl.utils.settings        as fslsettings
 import fsleyes.data.imagewrapper as imagewrap
 
 
@@ -280,6 +282,32 @@ def test_sliceObjToSliceTuple():
     assert func((8,           slice(1, 10), slice(None)), shape) == ((8, 9),  (1, 10), (0, 10))
 
 
+def test_fancySliceBoundingBox():
+
+    func  = imagewrap.fancySliceBoundingBox
+    shape = (10, 10, 10)
+    mask  = np.zeros(shape, dtype=bool)
+
+    assert func(mask, shape) is None
+
+    mask[3, 4, 5] = True
+    assert func(mask, shape) == ((3, 4), (4, 5), (5, 6))
+
+    mask[7, 2, 5] = True
+    assert func(mask, shape) == ((3, 8), (2, 5), (5, 6))
+
+    mask[:] = True
+    assert func(mask, shape) == ((0, 10), (0, 10), (0, 10))
+
+    # flattened masks are accepted
+    mask = np.zeros(shape, dtype=bool)
+    mask[1:3, 2:9, 9] = True
+    assert func(mask.flatten(), shape) == ((1, 3), (2, 9), (9, 10))
+
+    with pytest.raises(ValueError):
+        func(np.zeros((5, 5, 5), dtype=bool), shape)
+
+
 
 def test_sliceTupleToSliceObj():
 
@@ -1119,3 +1147,70 @@ def test_collapseExpansions(niters):
 
         for exp, col in zip(expected, collapsed):
             assert expEq(exp, col)
+
+
+def test_calcVolumeRanges():
+
+    data = np.random.random((10, 10, 10, 6)).astype(np.float32)
+    data[..., 1]       = np.nan
+    data[0, 0, 0, 2]   = np.nan
+    data[0, 0, 0, 3]   = np.inf
+    data[1, 1, 1, 3]   = -np.inf
+    data[..., 4]       = np.inf
+    data[..., 4][0, 0] = 5
+
+    ranges   = imagewrap.calcVolumeRanges(data)
+    expected = [nir.naninfrange(data[..., v]) for v in range(6)]
+
+    assert ranges.shape == (6, 2)
+    assert np.allclose(ranges, expected, equal_nan=True)
+
+    data   = np.random.randint(-100, 100, (10, 10, 10, 6)).astype(np.int16)
+    ranges = imagewrap.calcVolumeRanges(data)
+    assert np.all(ranges[:, 0] == data.min(axis=(0, 1, 2)))
+    assert np.all(ranges[:, 1] == data.max(axis=(0, 1, 2)))
+
+
+def test_ImageWrapper_chunked_threaded():
+    _test_ImageWrapper_chunked(True)
+def test_ImageWrapper_chunked_unthreaded():
+    _test_ImageWrapper_chunked(False)
+def _test_ImageWrapper_chunked(threaded):
+
+    # A chunk size smaller than one volume, so
+    # every volume is calculated separately
+    data = np.random.random((10, 10, 10, 20)).astype(np.float32)
+    for v in range(20):
+        data[..., v] *= v + 1
+
+    with tempdir() as td, \
+         fslsettings.use(fslsettings.Settings('fsleyes', td, False)):
+
+        fslsettings.write('fsleyes.imagewrapper.chunkSize', 100)
+
+        # Listeners are weakly referenced, so
+        # we must keep a ref to the callback
+        notified = []
+
+        def listener(*a):
+            notified.append(True)
+
+        img      = nib.Nifti1Image(data, np.eye(4))
+        wrapper  = imagewrap.ImageWrapper(threaded=threaded)
+        wrapper.register('test', listener)
+        wrapper.setImage(img)
+
+        wrapper[..., 2:17]
+        _ImageWraper_busy_wait(wrapper)
+
+        assert wrapper.dataRange == (data[..., 2:17].min(),
+                                     data[..., 2:17].max())
+        assert len(notified) == 1
+        assert not wrapper.covered
+
+        wrapper[:]
+        _ImageWraper_busy_wait(wrapper)
+
+        assert wrapper.dataRange == (data.min(), data.max())
+        assert len(notified) == 2
+        assert wrapper.covered
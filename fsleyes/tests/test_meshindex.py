@@ -0,0 +1,115 @@
+#!/usr/bin/env python
+#
+# test_meshindex.py -
+#
+# Author: Paul McCarthy <pauldmccarthy@gmail.com>
+#
+
+
+import os.path as op
+import            sys
+from unittest import mock
+
+import numpy as np
+
+import fsl.data.vtk           as fslvtk
+import fsl.transform.affine   as affine
+import fsleyes.data.meshindex as meshindex
+
+
+datadir = op.join(op.dirname(__file__), 'testdata')
+
+
+def _check_intersection(mesh, zax, zpos, xform, lines, faces, dists):
+
+    verts  = affine.transform(mesh.vertices, xform)
+    coords = verts[:, zax][mesh.indices]
+
+    # every face which strictly straddles
+    # the plane must have been intersected
+    straddle = np.where((coords.min(axis=1) < zpos) &
+                        (coords.max(axis=1) > zpos))[0]
+    assert np.all(np.isin(straddle, faces))
+
+    # line vertices lie on the plane,
+    # and on the intersected faces
+    dlines = affine.transform(lines.reshape(-1, 3), xform)
+    assert np.allclose(dlines[:, zax], zpos, atol=1e-4)
+    assert np.allclose(dists.sum(axis=2), 1)
+    assert np.all(dists >= 0)
+
+    tris = mesh.vertices[mesh.indices[faces]]
+    assert np.allclose(np.einsum('nij,njk->nik', dists, tris), lines,
+                       atol=1e-4)
+
+
+def test_planeIntersection():
+
+    mesh  = fslvtk.VTKMesh(op.join(datadir, 'mesh_l_thal.vtk'))
+    index = meshindex.MeshFaceIndex(mesh)
+    lo    = mesh.vertices.min(axis=0)
+    hi    = mesh.vertices.max(axis=0)
+    xform = affine.compose([2, 1.5, 1], [10, -5, 3], [0, 0, 0])
+
+    for zax in range(3):
+        for zpos in np.linspace(lo[zax], hi[zax], 7)[1:-1]:
+            lines, faces, dists = index.planeIntersection(zax, zpos)
+            assert len(faces) > 0
+            _check_intersection(mesh, zax, zpos, np.eye(4),
+                                lines, faces, dists)
+
+            dzpos = affine.transform([lo + (hi - lo) / 2], xform)[0, zax]
+            lines, faces, dists = index.planeIntersection(zax, dzpos, xform)
+            _check_intersection(mesh, zax, dzpos, xform,
+                                lines, faces, dists)
+
+    # no intersection outside of the mesh
+    lines, faces, dists = index.planeIntersection(2, hi[2] + 10)
+    assert lines.shape == (0, 2, 3)
+    assert faces.shape == (0, )
+    assert dists.shape == (0, 2, 3)
+
+
+def test_planeIntersection_no_trimesh():
+
+    # The GLMesh outline mode relies on the
+    # MeshFaceIndex, which must not need trimesh
+    with mock.patch.dict(sys.modules, {'trimesh' : None}):
+        mesh  = fslvtk.VTKMesh(op.join(datadir, 'mesh_l_thal.vtk'))
+        index = meshindex.MeshFaceIndex(mesh)
+        zpos  = mesh.vertices[:, 1].mean()
+
+        assert mesh.trimesh is None
+
+        lines, faces, dists = index.planeIntersection(1, zpos)
+        assert len(faces) > 0
+        _check_intersection(mesh, 1, zpos, np.eye(4), lines, faces, dists)
+
+
+def test_cache():
+
+    mesh  = fslvtk.VTKMesh(op.join(datadir, 'mesh_l_thal.vtk'))
+    index = meshindex.MeshFaceIndex(mesh, cacheSize=2)
+    zpos  = mesh.vertices[:, 2].mean()
+
+    first = index.planeIntersection(2, zpos)
+    again = index.planeIntersection(2, zpos)
+    assert index.stats() == (1, 1)
+    assert all(a is b for a, b in zip(first, again))
+
+    # lru eviction
+    index.planeIntersection(2, zpos + 1)
+    index.planeIntersection(2, zpos + 2)
+    index.planeIntersection(2, zpos)
+    assert index.stats() == (1, 4)
+
+    # cache is cleared when vertices change
+    mesh.addVertices(mesh.vertices * 2, 'scaled', select=True)
+    lines, faces, dists = index.planeIntersection(2, zpos)
+    assert index.stats() == (1, 5)
+    _check_intersection(mesh, 2, zpos, np.eye(4), lines, faces, dists)
+
+
+def test_faceIndex_shared():
+    mesh = fslvtk.VTKMesh(op.join(datadir, 'mesh_l_thal.vtk'))
+    assert meshindex.faceIndex(mesh) is meshindex.faceIndex(mesh)
@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+#
+# test_movie.py -
+#
+# Author: Paul McCarthy <pauldmccarthy@gmail.com>
+#
+
+
+import os.path as op
+import            sys
+
+import numpy as np
+import pytest
+
+import PIL.Image as Image
+
+from fsl.utils.tempdir import tempdir
+
+import fsleyes.movie as fslmovie
+
+
+def _frames(nframes=5, width=41, height=30):
+    frames = []
+    for i in range(nframes):
+        frame = np.random.randint(0, 255, (height, width, 4), dtype=np.uint8)
+        frame[:10, :10, :3] = i * 40
+        frames.append(frame)
+    return frames
+
+
+def test_openMovie():
+    with tempdir():
+        for fname, cls in [('movie.gif',  fslmovie.GifWriter),
+                           ('movie.png',  fslmovie.APNGWriter),
+                           ('movie.apng', fslmovie.APNGWriter),
+                           ('movie.mp4',  fslmovie.PipeWriter)]:
+            writer = fslmovie.openMovie(fname)
+            assert isinstance(writer, cls)
+            writer.close()
+            assert not op.exists(fname)
+
+
+def test_GifWriter():
+    frames = _frames()
+    with tempdir():
+        with fslmovie.GifWriter('movie.gif', fps=20) as writer:
+            for frame in frames:
+                writer.addFrame(frame)
+        assert writer.nframes == 5
+
+        img = Image.open('movie.gif')
+        assert img.n_frames         == 5
+        assert img.size             == (41, 30)
+        assert img.info['duration'] == 50
+        assert img.info['loop']     == 0
+
+        # gif frames are quantised
+        for i in range(5):
+            img.seek(i)
+            data = np.asarray(img.convert('RGB'), dtype=int)
+            assert np.all(np.abs(data[:10, :10] - i * 40) < 8)
+
+
+def test_APNGWriter():
+    frames = _frames()
+    with tempdir():
+        with fslmovie.APNGWriter('movie.png', fps=12.5) as writer:
+            for frame in frames:
+                writer.addFrame(frame)
+
+        img = Image.open('movie.png')
+        assert img.n_frames         == 5
+        assert img.size             == (41, 30)
+        assert img.info['duration'] == 80
+
+        # png frames are lossless
+        for i in range(5):
+            img.seek(i)
+            assert np.all(np.asarray(img.convert('RGB')) == frames[i][..., :3])
+
+
+def test_PipeWriter():
+    frames  = _frames()
+    command = [sys.executable, '-c',
+               'import sys; open(sys.argv[1], "wb").write('
+               'sys.stdin.buffer.read())',
+               '{outfile}']
+    with tempdir():
+        with fslmovie.PipeWriter('movie.raw', 5, command) as writer:
+            for frame in frames:
+                writer.addFrame(frame)
+
+        got = np.fromfile('movie.raw', dtype=np.uint8).reshape(5, 30, 41, 3)
+        assert np.all(got == np.array(frames)[..., :3])
+
+        # encoder errors are reported
+        with pytest.raises(RuntimeError):
+            with fslmovie.PipeWriter('movie.mp4', command=['false']) as writer:
+                for frame in frames * 20:
+                    writer.addFrame(frame)
+
+
+def test_MovieWriter_errors():
+    frames = _frames()
+    with tempdir():
+
+        writer = fslmovie.openMovie('movie.gif')
+        writer.addFrame(frames[0])
+        with pytest.raises(ValueError):
+            writer.addFrame(frames[0][:20])
+        with pytest.raises(ValueError):
+            writer.addFrame(frames[0][..., 0])
+        writer.close()
+        with pytest.raises(RuntimeError):
+            writer.addFrame(frames[0])
+        assert op.exists('movie.gif')
+
+        # the movie is discarded on error
+        with pytest.raises(ZeroDivisionError):
+            with fslmovie.openMovie('discard.png') as writer:
+                writer.addFrame(frames[0])
+                1 / 0
+        assert not op.exists('discard.png')
@@ -46,6 +46,76 @@ def _test_overlayList_initProps(frame, overlayList, displayCtx):
     assert list(opts.colour)   == [0.5, 0.2, 0.3, 1.0]
 
 
+def test_overlayList_batch():
+
+    overlayList = fslovl.OverlayList()
+    imgs        = [Image(op.join(datadir, '3d')) for _ in range(4)]
+    called      = [0]
+
+    def changed(*a):
+        called[0] += 1
+
+    overlayList.addListener('overlays', 'test', changed)
+
+    with overlayList.batch():
+        assert overlayList.inBatch
+        overlayList.append(imgs[0])
+        overlayList.extend(imgs[1:3])
+        with overlayList.batch():
+            overlayList.insert(0, imgs[3])
+        assert called[0] == 0
+        assert len(overlayList) == 4
+
+    assert not overlayList.inBatch
+    assert called[0] == 1
+    assert overlayList[:] == [imgs[3], imgs[0], imgs[1], imgs[2]]
+
+    # no notification if the
+    # list has not changed
+    with overlayList.batch():
+        overlayList.remove(imgs[3])
+        overlayList.insert(0, imgs[3])
+    assert called[0] == 1
+
+    # listeners notified even if
+    # an error occurs in the batch
+    try:
+        with overlayList.batch():
+            overlayList.clear()
+            raise RuntimeError()
+    except RuntimeError:
+        pass
+    assert called[0] == 2
+    assert len(overlayList) == 0
+
+    overlayList.append(imgs[0])
+    assert called[0] == 3
+
+
+def test_overlayList_batch_initProps():
+    run_with_fsleyes(_test_overlayList_batch_initProps)
+
+
+def _test_overlayList_batch_initProps(frame, overlayList, displayCtx):
+
+    img1 = Image(op.join(datadir, '3d'))
+    img2 = Image(op.join(datadir, '3d'))
+
+    with overlayList.batch():
+        overlayList.append(img1, overlayType='mask', alpha=75)
+        overlayList.append(img2)
+
+        # Display created before the
+        # DisplayContext is notified
+        assert displayCtx.getDisplay(img1).overlayType == 'mask'
+
+    realYield()
+
+    assert displayCtx.getDisplay(img1).alpha       == 75
+    assert displayCtx.getDisplay(img2).overlayType == 'volume'
+    assert sorted(displayCtx.overlayOrder)         == [0, 1]
+
+
 def test_findFEATImage():
     contents = ['analysis.feat/design.con',
                 'analysis.feat/design.fsf',
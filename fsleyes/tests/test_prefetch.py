@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+#
+# test_prefetch.py -
+#
+# Author: Paul McCarthy <pauldmccarthy@gmail.com>
+#
+
+
+from unittest import mock
+
+import numpy as np
+
+import fsl.data.image               as fslimage
+import fsleyes.gl.textures.prefetch as prefetch
+
+
+class MockTexture:
+    """Stands in for an ImageTextureBase - provides the attributes and
+    methods used by the VolumePrefetcher.
+    """
+    def __init__(self, image):
+        self.image = image
+        self.name  = 'texture'
+        self.reads = []
+
+    def prepareSettings(self):
+        return {'prefilter'      : None,
+                'prefilterRange' : None,
+                'resolution'     : None,
+                'scales'         : None,
+                'normalise'      : False,
+                'normaliseRange' : None}
+
+    def volumeData(self, volume, channel):
+        self.reads.append(volume)
+        return np.array(self.image[..., volume[0]])
+
+
+def test_settingsKey():
+    s1 = {'normalise' : False, 'normaliseRange' : (0, 1), 'scales' : [1, 1]}
+    s2 = {'normalise' : False, 'normaliseRange' : (0, 2), 'scales' : [1, 1]}
+    s3 = {'normalise' : True,  'normaliseRange' : (0, 1), 'scales' : [1, 1]}
+    s4 = {'normalise' : True,  'normaliseRange' : (0, 2), 'scales' : [1, 1]}
+
+    assert prefetch.settingsKey(s1) == prefetch.settingsKey(s2)
+    assert prefetch.settingsKey(s3) != prefetch.settingsKey(s4)
+    assert prefetch.settingsKey(s1) != prefetch.settingsKey(s3)
+
+
+def test_VolumePrefetcher():
+
+    data    = np.random.random((10, 10, 10, 20)).astype(np.float32)
+    volsize = data[..., 0].nbytes
+    tex     = MockTexture(fslimage.Image(data))
+
+    with mock.patch('fsleyes.gl.textures.data.canUseFloatTextures',
+                    return_value=(True, None, None)):
+        pf = prefetch.VolumePrefetcher(tex,
+                                       budget=volsize * 5,
+                                       ahead=3,
+                                       threaded=False)
+
+        # first request - nothing
+        # to prefetch, as we don't
+        # know the direction yet
+        assert pf.lookup((0,), None) is None
+        pf.add((0,), None, tex.volumeData((0,), None))
+        assert pf.stats()['misses'] == 1
+
+        # moving forwards - volumes 2-4
+        # should be prefetched
+        assert pf.lookup((1,), None) is None
+        assert sorted(tex.reads[1:]) == [(2,), (3,), (4,)]
+
+        for i in range(2, 5):
+            raw = pf.lookup((i,), None)
+            assert raw is not None
+            assert np.all(raw == data[..., i])
+            assert pf.prepared(raw, tex.prepareSettings()) is not None
+
+        stats = pf.stats()
+        assert stats['hits']   == 3
+        assert stats['misses'] == 2
+        assert stats['size']   <= stats['budget']
+
+        # moving backwards, wrapping around
+        tex.reads.clear()
+        pf.lookup((0,), None)
+        assert tex.reads == [(19,), (18,), (17,)]
+        assert pf.lookup((19,), None) is not None
+        assert tex.reads == [(19,), (18,), (17,), (16,)]
+        assert pf.stats()['size'] <= pf.stats()['budget']
+
+        # data change
+        pf.clear()
+        assert pf.stats()['volumes'] == 0
+        pf.destroy()
+
+
+def test_VolumePrefetcher_lazy_thread():
+
+    data = np.random.random((10, 10, 10, 20)).astype(np.float32)
+    tex  = MockTexture(fslimage.Image(data))
+
+    with mock.patch('fsleyes.gl.textures.data.canUseFloatTextures',
+                    return_value=(True, None, None)), \
+         mock.patch('fsl.utils.idle.TaskThread') as TaskThread:
+
+        # The thread is not started until
+        # a volume needs to be prefetched
+        pf = prefetch.VolumePrefetcher(tex, ahead=3)
+        assert TaskThread.call_count == 0
+
+        pf.add((0,), None, tex.volumeData((0,), None))
+        assert pf.lookup((0,), None) is not None
+        assert TaskThread.call_count == 0
+
+        pf.lookup((1,), None)
+        pf.lookup((2,), None)
+        assert TaskThread.call_count == 1
+        assert TaskThread.return_value.start.call_count == 1
+        assert TaskThread.return_value.enqueue.call_count > 0
+
+        pf.destroy()
+        assert TaskThread.return_value.stop.call_count == 1
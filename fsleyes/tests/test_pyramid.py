@@ -0,0 +1,116 @@
+#!/usr/bin/env python
+#
+# test_pyramid.py -
+#
+# Author: Paul McCarthy <pauldmccarthy@gmail.com>
+#
+
+
+import os.path as op
+import            os
+
+import numpy as np
+
+from fsl.utils.tempdir import tempdir
+import fsl.utils.settings     as fslsettings
+import fsl.data.image         as fslimage
+import fsleyes.data.pyramid   as pyramid
+import fsleyes.data.diskcache as diskcache
+
+
+def test_levelShape():
+    assert pyramid.levelShape((10, 10, 10), 2) == (5, 5, 5)
+    assert pyramid.levelShape((11, 9, 1),   2) == (6, 5, 1)
+    assert pyramid.levelShape((11, 9, 1),   8) == (2, 2, 1)
+
+
+def test_downsample():
+    data = np.arange(64, dtype=np.float32).reshape((4, 4, 4))
+    ds   = pyramid.downsample(data, 2)
+
+    assert ds.shape == (2, 2, 2)
+    assert np.isclose(ds[0, 0, 0], data[:2, :2, :2].mean())
+    assert np.isclose(ds[1, 1, 1], data[2:, 2:, 2:].mean())
+
+    # edge padding
+    data = np.random.random((5, 3, 7))
+    ds   = pyramid.downsample(data, 2)
+    assert ds.shape == (3, 2, 4)
+    assert np.isclose(ds[2, 1, 3], data[4, 2, 6])
+    assert np.isclose(ds[2, 0, 0], data[4, :2, :2].mean())
+
+    # integer output is rounded and clipped
+    data = np.array([[[0, 1], [1, 1]], [[1, 1], [1, 1]]], dtype=np.uint8)
+    assert pyramid.downsample(data, 2, np.uint8)[0, 0, 0] == 1
+    assert pyramid.castData(np.array([-1.6, 300]), np.uint8).tolist() == \
+        [0, 255]
+
+
+def test_usePyramid():
+    img = fslimage.Image(np.zeros((10, 10, 10), dtype=np.float32))
+
+    with tempdir() as td, \
+         fslsettings.use(fslsettings.Settings('fsleyes', td, False)):
+        fslsettings.write('fsleyes.pyramid.threshold', 4000)
+        assert pyramid.usePyramid(img)
+        fslsettings.write('fsleyes.pyramid.threshold', 4001)
+        assert not pyramid.usePyramid(img)
+        fslsettings.write('fsleyes.pyramid.threshold', 0)
+        assert not pyramid.usePyramid(img)
+
+        fslsettings.write('fsleyes.pyramid.threshold', 1)
+        img = fslimage.Image(np.zeros((10, 10, 1), dtype=np.float32))
+        assert not pyramid.usePyramid(img)
+        img = fslimage.Image(np.zeros((10, 10, 10), dtype=np.complex64))
+        assert not pyramid.usePyramid(img)
+
+
+def test_ImagePyramid():
+    data = np.random.randint(0, 1000, (37, 21, 45, 2)).astype(np.int16)
+
+    with tempdir() as td, \
+         fslsettings.use(fslsettings.Settings('fsleyes', td, False)):
+
+        fslimage.Image(data).save('image.nii.gz')
+        img = fslimage.Image('image.nii.gz')
+        pyr = pyramid.ImagePyramid(img, threaded=False)
+
+        assert pyr.factors           == (2, 4, 8)
+        assert pyr.readyFactors([1]) == []
+        assert pyr.level(2, [1])     is None
+
+        pyr.build([1])
+
+        assert pyr.readyFactors([1]) == [2, 4, 8]
+        assert pyr.readyFactors([0]) == []
+
+        for f in pyr.factors:
+            level = pyr.level(f, [1])
+            assert level.dtype == np.int16
+            assert level.shape == pyramid.levelShape(data.shape, f)
+
+        expect = pyramid.downsample(data[..., 1], 2, np.int16)
+        assert np.all(pyr.level(2, [1]) == expect)
+
+        # levels should have been saved to the cache
+        cachedir = op.join(td, 'cache', 'pyramid')
+        assert len(os.listdir(cachedir)) == 3
+
+        # and loaded from the cache
+        pyr2 = pyramid.ImagePyramid(img, threaded=False)
+        pyr2.build([1])
+        for f in pyr.factors:
+            assert np.all(pyr.level(f, [1]) == pyr2.level(f, [1]))
+
+        # levels discarded on data change
+        img[0, 0, 0, 1] = 5
+        assert pyr.readyFactors([1]) == []
+
+        # modified images are not cached
+        assert diskcache.imageKey(img) is None
+        pyr.build([1])
+        assert pyr.readyFactors([1]) == [2, 4, 8]
+        assert len(os.listdir(cachedir)) == 3
+
+        pyr .destroy()
+        pyr2.destroy()
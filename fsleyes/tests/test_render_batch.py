@@ -0,0 +1,78 @@
+#!/usr/bin/env python
+#
+# test_render_batch.py -
+#
+# Author: Paul McCarthy <pauldmccarthy@gmail.com>
+#
+
+
+import os.path as op
+import            os
+import            shutil
+
+import pytest
+
+import matplotlib.image as mplimg
+
+from   fsl.utils.tempdir import tempdir
+import fsl.utils.idle        as idle
+
+import fsleyes.render                  as fslrender
+import fsleyes.displaycontext          as dc
+from   fsleyes.tests.compare_images import compare_images
+
+
+pytestmark = pytest.mark.clitest
+
+
+datadir = op.join(op.dirname(__file__), 'testdata')
+
+
+scenes = """
+-of ortho.png    3d.nii.gz -cm hot
+-of lightbox.png -s lightbox 3d.nii.gz -cm red-yellow -dr 2000 7500
+-of 3d.png       -s 3d 3d.nii.gz
+-of ortho2.png   3d.nii.gz -cm blue 3d.nii.gz -cm red -a 50
+"""
+
+
+def test_render_batch():
+
+    glver = os.environ.get('FSLEYES_TEST_GL', None)
+    if glver is not None: glver = ['-gl'] + glver.split('.')
+    else:                 glver = []
+
+    with tempdir():
+
+        shutil.copy(op.join(datadir, '3d.nii.gz'), '3d.nii.gz')
+
+        lines = [line.strip() for line in scenes.split('\n')]
+        lines = [line for line in lines if line != '']
+
+        with open('batch.txt', 'wt') as f:
+            f.write('# comment\n')
+            for line in lines:
+                f.write(line + '\n')
+            f.write('-of bad.png nonexistent.nii.gz\n')
+
+        idle.idleLoop.reset()
+        idle.idleLoop.allowErrors = True
+
+        # the bad scene should be reported,
+        # but should not stop the others
+        assert fslrender.main(glver + ['-sz', '320', '240',
+                                       '-bt', 'batch.txt']) == 1
+        assert not op.exists('bad.png')
+
+        # Each scene should look the same
+        # as when rendered on its own
+        for line in lines:
+            outfile = line.split()[1]
+            batched = mplimg.imread(outfile)
+
+            os.remove(outfile)
+            dc.VolumeOpts.setInitialDisplayRange(None)
+            fslrender.main(glver + ['-sz', '320', '240'] + line.split())
+
+            single = mplimg.imread(outfile)
+            assert compare_images(batched, single, 5)[0]
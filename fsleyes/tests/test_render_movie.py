@@ -0,0 +1,88 @@
+#!/usr/bin/env python
+#
+# test_render_movie.py -
+#
+# Author: Paul McCarthy <pauldmccarthy@gmail.com>
+#
+
+
+import os.path as op
+import            os
+import            shutil
+
+import numpy as np
+import pytest
+
+import PIL.Image        as Image
+import matplotlib.image as mplimg
+
+from   fsl.utils.tempdir import tempdir
+import fsl.utils.idle        as idle
+
+import fsleyes.render         as fslrender
+import fsleyes.displaycontext as dc
+
+
+pytestmark = pytest.mark.clitest
+
+
+datadir = op.join(op.dirname(__file__), 'testdata')
+
+
+def _glver():
+    glver = os.environ.get('FSLEYES_TEST_GL', None)
+    if glver is not None: return ['-gl'] + glver.split('.')
+    else:                 return []
+
+
+def _render(args):
+    idle.idleLoop.reset()
+    idle.idleLoop.allowErrors = True
+    dc.VolumeOpts.setInitialDisplayRange(None)
+    fslrender.main(_glver() + ['-sz', '320', '240'] + args)
+
+
+def test_render_movie_time():
+    with tempdir():
+        shutil.copy(op.join(datadir, '4d.nii.gz'), '4d.nii.gz')
+
+        _render(['-of', 'movie.png', '-mv', 'time', '-fr', '20',
+                 '4d.nii.gz', '-dr', '0', '10000'])
+
+        movie = Image.open('movie.png')
+        assert movie.n_frames         == 45
+        assert movie.size             == (320, 240)
+        assert movie.info['duration'] == 50
+
+        # Each frame should be the same as a
+        # screenshot of the corresponding volume
+        for vol in (0, 20, 44):
+            _render(['-of', 'frame.png', '4d.nii.gz',
+                     '-dr', '0', '10000', '-v', str(vol)])
+            movie.seek(vol)
+            frame    = np.asarray(movie.convert('RGB'))
+            expected = mplimg.imread('frame.png')[..., :3]
+            expected = np.round(expected * 255).astype(np.uint8)
+            assert np.all(frame == expected)
+
+
+def test_render_movie_slices():
+    with tempdir():
+        shutil.copy(op.join(datadir, '3d.nii.gz'), '3d.nii.gz')
+        _render(['-of', 'movie.gif', '-mv', 'z', '3d.nii.gz'])
+        assert Image.open('movie.gif').n_frames == 14
+
+
+def test_render_movie_3d_rotation():
+    with tempdir():
+        shutil.copy(op.join(datadir, '3d.nii.gz'), '3d.nii.gz')
+        _render(['-of', 'movie.gif', '-s', '3d', '-mv', 'y', '3d.nii.gz'])
+        assert Image.open('movie.gif').n_frames == 72
+
+
+def test_render_movie_no_time_series():
+    with tempdir():
+        shutil.copy(op.join(datadir, '3d.nii.gz'), '3d.nii.gz')
+        with pytest.raises(ValueError):
+            _render(['-of', 'movie.gif', '-mv', 'time', '3d.nii.gz'])
+        assert not op.exists('movie.gif')
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+#
+# test_renderfarm.py -
+#
+# Author: Paul McCarthy <pauldmccarthy@gmail.com>
+#
+
+
+import os.path as op
+import            os
+import            json
+import            shutil
+
+import numpy as np
+import pytest
+
+import matplotlib.image as mplimg
+
+from   fsl.utils.tempdir import tempdir
+import fsl.data.image        as fslimage
+
+import fsleyes.renderfarm as renderfarm
+import fsleyes.render     as fslrender
+
+
+datadir = op.join(op.dirname(__file__), 'testdata')
+
+
+def test_groupScenes():
+
+    with tempdir():
+        for s in range(4):
+            os.mkdir(f'sub{s}')
+            for f in ('T1', 'mask'):
+                fslimage.Image(np.zeros((4, 4, 4), dtype=np.float32)).save(
+                    op.join(f'sub{s}', f))
+
+        scenes = []
+        for s in range(4):
+            for i in range(3):
+                scenes.append((len(scenes) + 1,
+                               ['-of', f'sub{s}_{i}.png', f'sub{s}/T1',
+                                f'sub{s}/mask', '-cm', 'red']))
+
+        # each subject should be
+        # allocated to one group
+        groups = renderfarm.groupScenes(scenes, 2)
+        assert len(groups) == 2
+        assert [len(g) for g in groups] == [6, 6]
+        for group in groups:
+            subjs = {args[2].split('/')[0] for _, args in group}
+            assert len(subjs) == 2
+        assert sorted(s for g in groups for s in g) == sorted(scenes)
+
+        # more workers than subjects - subjects
+        # are split to keep all workers busy
+        groups = renderfarm.groupScenes(scenes, 8)
+        assert len(groups) == 8
+        assert sorted(len(g) for g in groups) == [1, 1, 1, 1, 2, 2, 2, 2]
+        for group in groups:
+            subjs = {args[2].split('/')[0] for _, args in group}
+            assert len(subjs) == 1
+
+        # A file used by every scene should
+        # not stop the scenes from being
+        # split evenly, but each group should
+        # still contain whole subjects
+        for _, args in scenes:
+            args.append('sub0/T1')
+        groups = renderfarm.groupScenes(scenes, 4)
+        assert [len(g) for g in groups] == [3, 3, 3, 3]
+        for group in groups:
+            subjs = {args[2].split('/')[0] for _, args in group}
+            assert len(subjs) == 1
+
+
+@pytest.mark.clitest
+def test_renderFarm(capsys):
+
+    glver = os.environ.get('FSLEYES_TEST_GL', None)
+    if glver is not None: glver = ['-gl'] + glver.split('.')
+    else:                 glver = []
+
+    with tempdir():
+
+        shutil.copy(op.join(datadir, '3d.nii.gz'), '3d.nii.gz')
+
+        with open('batch.txt', 'wt') as f:
+            for i, cmap in enumerate(['hot', 'red', 'blue', 'green']):
+                f.write(f'-of {i}.png 3d.nii.gz -cm {cmap}\n')
+            f.write('-of bad.png nonexistent.nii.gz\n')
+
+        capsys.readouterr()
+
+        assert fslrender.main(glver + ['-sz', '320', '240',
+                                       '-bt', 'batch.txt',
+                                       '-nw', '2']) == 1
+
+        results = [json.loads(line) for line in
+                   capsys.readouterr().out.strip().split('\n')]
+        results = {r['line'] : r for r in results}
+
+        assert sorted(results.keys()) == [1, 2, 3, 4, 5]
+        assert results[5]['status'] == 'error'
+        assert not op.exists('bad.png')
+
+        for i in range(4):
+            assert results[i + 1]['status'] == 'ok'
+            assert results[i + 1]['worker'] in (0, 1)
+            assert mplimg.imread(f'{i}.png').shape[:2] == (240, 320)
@@ -0,0 +1,93 @@
+#!/usr/bin/env python
+#
+# test_selection.py -
+#
+# Author: Paul McCarthy <pauldmccarthy@gmail.com>
+#
+
+
+from unittest import mock
+
+import numpy         as np
+import scipy.ndimage as ndimage
+
+import fsl.data.image           as fslimage
+import fsleyes.editor.selection as selection
+
+
+def _expected(data, seed, precision, radius, connectivity):
+    hits = np.abs(data - data[seed]) <= precision
+    if radius is not None:
+        idxs  = np.indices(data.shape).astype(float)
+        dists = sum(((idxs[i] - seed[i]) / radius[i]) ** 2 for i in range(3))
+        hits &= dists <= 1
+    struct    = ndimage.generate_binary_structure(3, {6 : 1,
+                                                      18 : 2,
+                                                      26 : 3}[connectivity])
+    labels, _ = ndimage.label(hits, struct)
+    return labels == labels[seed]
+
+
+def test_selectByValue_local():
+
+    data = np.random.randint(0, 5, (20, 20, 20)).astype(np.float32)
+    seed = (10, 10, 10)
+
+    for conn in (6, 18, 26):
+        for prec in (0, 1, 2):
+            hits, off = selection.selectByValue(data, seed, prec,
+                                                local=True,
+                                                connectivity=conn)
+            assert tuple(off) == (0, 0, 0)
+            assert np.all(hits == _expected(data, seed, prec, None, conn))
+
+    hits, off = selection.selectByValue(data, seed, 2, 5, local=True)
+    exp       = _expected(data, seed, 2, (5, 5, 5), 6)
+    assert tuple(off) == (5, 5, 5)
+    assert np.all(hits == exp[5:16, 5:16, 5:16])
+
+
+def test_selectByValue_restrict():
+    data     = np.random.randint(0, 3, (20, 20, 20)).astype(np.float32)
+    seed     = (10, 10, 10)
+    restrict = [slice(None), slice(None), slice(10, 11)]
+
+    hits, off = selection.selectByValue(data, seed, 1, local=True,
+                                        restrict=restrict)
+    exp = _expected(data[:, :, 10:11], (10, 10, 0), 1, None, 6)
+    assert tuple(off) == (0, 0, 10)
+    assert np.all(hits == exp)
+
+
+def test_RegionGrower_incremental():
+
+    data   = np.random.randint(0, 10, (30, 30, 30)).astype(np.float32)
+    seed   = (15, 15, 15)
+    grower = selection.RegionGrower(data, seed, 26)
+
+    def check(prec, rad):
+        coords = grower.grow(prec, rad)
+        hits   = np.zeros(data.shape, dtype=bool)
+        hits[tuple(coords.T)] = True
+        assert len(coords) == hits.sum()
+        assert np.all(hits == _expected(data, seed, prec, rad, 26))
+
+    # grow, shrink, and grow again
+    check(2, (5, 5, 5))
+    check(3, (5, 5, 5))
+    check(3, (8, 8, 8))
+    check(4, None)
+    check(1, (4, 4, 4))
+    check(1, (4, 6, 4))
+
+
+def test_Selection_destroy():
+    img = fslimage.Image(np.random.random((10, 10, 10)))
+    sel = selection.Selection(img, None)
+
+    with mock.patch.object(img, 'deregister',
+                           wraps=img.deregister) as deregister:
+        sel.destroy()
+
+    deregister.assert_called_once()
+    assert deregister.call_args[0][1] == 'data'
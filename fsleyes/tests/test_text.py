@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+#
+# test_text.py -
+#
+# Author: Paul McCarthy <pauldmccarthy@gmail.com>
+#
+
+
+from unittest import mock
+
+import numpy as np
+
+import fsleyes.gl.resources as glresources
+import fsleyes.gl.text      as gltext
+
+
+def test_GlyphAtlas_layout():
+
+    atlas   = gltext.GlyphAtlas(12)
+    lheight = atlas.lineHeight
+    image   = atlas.image.copy()
+
+    # all printable ASCII characters are
+    # rasterised up front, so no new glyphs
+    # should be added for ASCII text
+    for text in ['hello', 'Hello world', '12.5 mm', 'S\nI']:
+        verts, tcoords, (w, h) = atlas.layout(text)
+        nglyphs = len(text.replace(' ', '').replace('\n', ''))
+
+        assert verts  .shape == (nglyphs, 6, 2)
+        assert tcoords.shape == (nglyphs, 6, 2)
+        assert h == lheight * (text.count('\n') + 1)
+        assert np.all(verts[..., 0] >= -1)
+        assert np.all(verts[..., 0] <= w + 1)
+        assert np.all(verts[..., 1] >= -1)
+        assert np.all(verts[..., 1] <= h + 1)
+
+    assert np.all(atlas.image == image)
+
+    # line height is independent of the text,
+    # and is equal to the font size
+    assert atlas.layout('a')[2][1] == atlas.layout('gT')[2][1]
+    assert lheight == 12 * gltext.DPI / 72
+
+    # new characters are added on demand,
+    # without affecting existing glyphs
+    atlas.layout('°')
+    new     = atlas.image[:image.shape[0]]
+    changed = new != image
+    assert atlas.image.shape[0] >= image.shape[0]
+    assert np.all(image[changed] == 0)
+    assert changed.any() or atlas.image.shape[0] > image.shape[0]
+
+
+def test_GlyphAtlas_halign():
+    atlas = gltext.GlyphAtlas(10)
+    text  = 'a\nlonger line'
+
+    left   = atlas.layout(text)[0]
+    centre = atlas.layout(text, 'centre')[0]
+    right  = atlas.layout(text, 'right')[0]
+
+    # only the first (shorter)
+    # line should be shifted
+    assert right[0, 0, 0] > centre[0, 0, 0] > left[0, 0, 0]
+    assert np.all(left[1:] == centre[1:])
+    assert np.all(left[1:] == right[1:])
+
+    # centred and right-aligned
+    # text has a margin on the right
+    margin = gltext.MARGIN * gltext.DPI / 72
+    width  = atlas.layout(text)[2][0]
+    assert atlas.layout(text, 'centre')[2][0] == width + margin
+    assert atlas.layout(text, 'right') [2][0] == width + margin
+
+
+def test_GlyphAtlas_kerning():
+    atlas = gltext.GlyphAtlas(20)
+    a     = atlas.layout('A')[2][0]
+    v     = atlas.layout('V')[2][0]
+    av    = atlas.layout('AV')
+
+    # "AV" is kerned in the default font
+    assert av[2][0] < a + v
+    assert av[0][1, 0, 0] < av[0][0, 0, 0] + a
+
+
+def test_GlyphAtlas_texCoords():
+    atlas   = gltext.GlyphAtlas(10)
+    tcoords = atlas.texCoords(atlas.layout('abc')[1])
+    solid   = atlas.texCoords(atlas.solid())
+
+    assert np.all((tcoords >= 0) & (tcoords <= 1))
+    assert np.all((solid   >= 0) & (solid   <= 1))
+
+    col, row = atlas.solid()
+    assert np.all(atlas.image[row, col] == 255)
+
+
+
+def test_textShader_shared():
+
+    created = []
+
+    def GLSLShader(*args, **kwargs):
+        shader = mock.MagicMock()
+        created.append(shader)
+        return shader
+
+    with mock.patch.object(gltext.shaders, 'GLSLShader', GLSLShader), \
+         mock.patch.object(gltext.shaders, 'getVertexShader'), \
+         mock.patch.object(gltext.shaders, 'getFragmentShader'), \
+         mock.patch.object(gltext.fslgl, 'GL_COMPATIBILITY', '2.1',
+                           create=True):
+
+        s1 = gltext.textShader()
+        s2 = gltext.textShader()
+
+        assert s1 is s2
+        assert len(created) == 1
+
+        # destroyed when the last reference is released
+        glresources.delete(gltext.SHADER_NAME)
+        created[0].destroy.assert_not_called()
+        glresources.delete(gltext.SHADER_NAME)
+        created[0].destroy.assert_called_once()
+        assert not glresources.exists(gltext.SHADER_NAME)
+
+        # new shader created on next request
+        s3 = gltext.textShader()
+        assert s3 is not s1
+        glresources.delete(gltext.SHADER_NAME)
@@ -172,6 +172,31 @@ def _test_FEATTimeSeries(panel, overlayList, displayCtx):
         assert np.all(pf.getData()[1] == img.partialFit(0, (x, y, z)))
 
 
+def test_FEATModelFitTimeSeries_no_design():
+
+    class MockFEATImage(Image):
+        def numEVs(self):
+            return 1
+
+        def getDesign(self, xyz):
+            return None
+
+        def fit(self, contrast, xyz):
+            raise RuntimeError('No design')
+
+    img        = MockFEATImage(np.random.random((10, 10, 10, 5)))
+    displayCtx = mock.MagicMock()
+    displayCtx.getOpts.return_value.getVoxel.return_value = (5, 5, 5)
+    displayCtx.getOpts.return_value.volumeDim             = 3
+
+    for useCache in (False, True):
+        with mock.patch('fsleyes.data.blockcache.useBlockCache',
+                        return_value=useCache):
+            ts = plotting.FEATModelFitTimeSeries(
+                img, None, displayCtx, None, None, [1], 'full', -1)
+            assert ts.dataAtCurrentVoxel() is None
+
+
 def test_MelodicTimeSeries():
     run_with_timeseriespanel(_test_MelodicTimeSeries)
 
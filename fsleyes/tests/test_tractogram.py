@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+#
+# test_tractogram.py -
+#
+# Author: Paul McCarthy <pauldmccarthy@gmail.com>
+#
+
+
+import os.path as op
+import            os
+import            shutil
+
+import numpy               as np
+import nibabel.streamlines as nibstrm
+
+from fsl.utils.tempdir import tempdir
+import fsl.utils.settings      as fslsettings
+import fsleyes.data.tractogram as tractogram
+
+
+datadir = op.join(op.dirname(__file__), 'testdata', 'tractogram')
+
+
+def test_Tractogram_cached():
+
+    with tempdir() as td, \
+         fslsettings.use(fslsettings.Settings('fsleyes', td, False)):
+
+        shutil.copy(op.join(datadir, 'spirals.trk'), 'spirals.trk')
+
+        nibfile  = nibstrm.load('spirals.trk')
+        expverts = nibfile.streamlines.get_data()
+
+        # converted on first load,
+        # memory-mapped on second
+        for _ in range(2):
+            trk = tractogram.Tractogram('spirals.trk')
+
+            assert isinstance(trk.vertices, np.memmap)
+            assert np.allclose(trk.vertices, expverts)
+            assert np.all(trk.lengths == nibfile.streamlines._lengths)
+            assert np.all(trk.offsets == nibfile.streamlines._offsets)
+            assert trk.nstreamlines == len(nibfile.streamlines)
+            assert np.allclose(trk.bounds[0], expverts.min(axis=0))
+            assert np.allclose(trk.bounds[1], expverts.max(axis=0))
+
+            for key in nibfile.tractogram.data_per_point.keys():
+                exp = nibfile.tractogram.data_per_point[key].get_data()
+                assert np.allclose(trk.getVertexData(key), exp[:, 0])
+
+            for key in nibfile.tractogram.data_per_streamline.keys():
+                exp = nibfile.tractogram.data_per_streamline[key][:, 0]
+                exp = np.repeat(exp, trk.lengths)
+                assert np.allclose(trk.getVertexData(key), exp)
+
+        cachedir = op.join(td, 'cache', 'tractogram')
+        assert len(os.listdir(cachedir)) > 0
+
+
+def test_Tractogram_uncached():
+
+    with tempdir() as td, \
+         fslsettings.use(fslsettings.Settings('fsleyes', td, False)):
+
+        fslsettings.write('fsleyes.cache.enabled', False)
+        shutil.copy(op.join(datadir, 'spirals.trk'), 'spirals.trk')
+
+        nibfile = nibstrm.load('spirals.trk')
+        trk     = tractogram.Tractogram('spirals.trk')
+
+        assert not isinstance(trk.vertices, np.memmap)
+        assert np.allclose(trk.vertices, nibfile.streamlines.get_data())
+        assert not op.exists(op.join(td, 'cache', 'tractogram'))
+
+
+def test_Tractogram_cache_limit():
+
+    with tempdir() as td, \
+         fslsettings.use(fslsettings.Settings('fsleyes', td, False)):
+
+        shutil.copy(op.join(datadir, 'spirals.trk'), 'spirals.trk')
+
+        # Too large for the cache - the file and
+        # orientations are loaded into memory
+        fslsettings.write('fsleyes.cache.maxSize', 100)
+
+        nibfile = nibstrm.load('spirals.trk')
+        trk     = tractogram.Tractogram('spirals.trk')
+        verts   = nibfile.streamlines.get_data()
+
+        assert not isinstance(trk.vertices, np.memmap)
+        assert np.allclose(trk.vertices, verts)
+
+        orients = trk.vertexOrientations
+        assert not isinstance(orients, np.memmap)
+        assert orients.shape == verts.shape
+
+        for which in ('vertices', 'orients'):
+            assert not op.exists(tractogram.cachePath('spirals.trk', which))
+
+
+def test_vertexOrientations():
+
+    with tempdir() as td, \
+         fslsettings.use(fslsettings.Settings('fsleyes', td, False)):
+
+        shutil.copy(op.join(datadir, 'spirals.trk'), 'spirals.trk')
+
+        trk     = tractogram.Tractogram('spirals.trk')
+        verts   = np.array(trk.vertices)
+        offsets = trk.offsets
+        exp     = np.zeros(verts.shape, dtype=np.float32)
+        diffs   = verts[1:] - verts[:-1]
+
+        exp[1:]      = diffs / np.linalg.norm(diffs, axis=1)[:, None]
+        exp[offsets] = exp[offsets + 1]
+
+        # small chunk size to test chunking
+        tractogram.CHUNK_SIZE = 7
+        try:
+            assert np.allclose(trk.vertexOrientations, exp, atol=1e-5)
+            trk2 = tractogram.Tractogram('spirals.trk')
+            assert np.allclose(trk2.vertexOrientations, exp, atol=1e-5)
+        finally:
+            tractogram.CHUNK_SIZE = 1048576
+
+
+def test_vertexOrientations_single_vertex():
+
+    with tempdir() as td, \
+         fslsettings.use(fslsettings.Settings('fsleyes', td, False)):
+
+        strms = [np.array([[0, 0, 0], [1, 0, 0]], dtype=np.float32),
+                 np.array([[5, 5, 5]],            dtype=np.float32),
+                 np.array([[0, 0, 0], [0, 2, 0]], dtype=np.float32)]
+        tract = nibstrm.Tractogram(strms, affine_to_rasmm=np.eye(4))
+        nibstrm.save(tract, 'single.tck')
+
+        exp = [[1, 0, 0], [1, 0, 0], [0, 0, 0], [0, 1, 0], [0, 1, 0]]
+
+        for _ in range(2):
+            trk = tractogram.Tractogram('single.tck')
+            assert np.allclose(trk.vertexOrientations, exp)
+
+
+def test_addVertexData():
+    with tempdir() as td, \
+         fslsettings.use(fslsettings.Settings('fsleyes', td, False)):
+
+        shutil.copy(op.join(datadir, 'spirals.trk'), 'spirals.trk')
+        trk = tractogram.Tractogram('spirals.trk')
+
+        sdata = np.random.random(trk.nstreamlines)
+        vdata = np.random.random(trk.nvertices)
+
+        trk.addVertexData('sdata2', sdata)
+        trk.addVertexData('vdata2', vdata)
+
+        assert 'sdata2' in trk.vertexDataSets()
+        assert 'vdata2' in trk.vertexDataSets()
+        assert np.all(trk.getVertexData('sdata2') ==
+                      np.repeat(sdata, trk.lengths))
+        assert np.all(trk.getVertexData('vdata2') == vdata)
+
+
+def test_subset():
+    with tempdir() as td, \
+         fslsettings.use(fslsettings.Settings('fsleyes', td, False)):
+
+        shutil.copy(op.join(datadir, 'spirals.trk'), 'spirals.trk')
+        trk     = tractogram.Tractogram('spirals.trk')
+        indices = np.random.choice(trk.nstreamlines, 10)
+
+        expidxs = np.concatenate([np.arange(trk.offsets[i],
+                                            trk.offsets[i] + trk.lengths[i])
+                                  for i in indices])
+
+        verts, offsets, lengths, vidxs = trk.subset(indices)
+
+        assert np.all(vidxs   == expidxs)
+        assert np.all(verts   == trk.vertices[expidxs])
+        assert np.all(lengths == trk.lengths[indices])
+        assert np.all(offsets == np.concatenate(([0], np.cumsum(lengths)[:-1])))
+
+
+def test_lodOrder():
+    with tempdir() as td, \
+         fslsettings.use(fslsettings.Settings('fsleyes', td, False)):
+
+        shutil.copy(op.join(datadir, 'spirals.trk'), 'spirals.trk')
+        trk   = tractogram.Tractogram('spirals.trk')
+        order = trk.lodOrder
+
+        # a permutation of all streamlines,
+        # and the same every time the file
+        # is loaded
+        assert np.all(np.sort(order) == np.arange(trk.nstreamlines))
+        assert np.all(tractogram.Tractogram('spirals.trk').lodOrder == order)
+
+        # short streamlines and long streamlines
+        # should be evenly represented in any
+        # prefix of the ordering
+        n       = trk.nstreamlines // 2
+        long    = trk.lengths >= np.median(trk.lengths)
+        nlong   = long[order[:n]].sum()
+        explong = long.sum() * n / trk.nstreamlines
+        assert abs(nlong - explong) <= max(3, 0.1 * n)
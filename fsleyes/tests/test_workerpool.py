@@ -0,0 +1,87 @@
+#!/usr/bin/env python
+#
+# test_workerpool.py -
+#
+# Author: Paul McCarthy <pauldmccarthy@gmail.com>
+#
+
+
+import threading
+import concurrent.futures as futures
+
+import fsleyes.plotting.workerpool as workerpool
+
+
+def test_sharedPool():
+    assert workerpool.sharedPool() is workerpool.sharedPool()
+
+
+def test_PrepareQueue():
+
+    pool    = futures.ThreadPoolExecutor(max_workers=1)
+    queue   = workerpool.PrepareQueue(pool)
+    block   = threading.Event()
+    started = threading.Event()
+    called  = []
+
+    def blocker():
+        started.set()
+        block.wait()
+        called.append('blocker')
+
+    def task(name):
+        def func():
+            called.append(name)
+        return func
+
+    # first request - the blocker ties up
+    # the only worker, so the second task
+    # is still pending when the next
+    # request arrives
+    fs1 = queue.prepare([('blocker', blocker), ('a', task('a'))])
+    started.wait()
+    fs2 = queue.prepare([('b', task('b')), ('c', task('c'))])
+
+    assert fs1[1].cancelled()
+
+    block.set()
+    futures.wait(fs1 + fs2)
+
+    assert called == ['blocker', 'b', 'c']
+    assert sorted(queue.latencies().keys()) == ['b', 'c']
+    assert all(lat >= 0 for lat in queue.latencies().values())
+
+    # crashing tasks are logged and skipped
+    def crash():
+        raise RuntimeError()
+
+    futures.wait(queue.prepare([('crash', crash), ('d', task('d'))]))
+    assert called[-1] == 'd'
+    assert list(queue.latencies().keys()) == ['d']
+
+    queue.destroy()
+    pool.shutdown()
+
+
+def test_wait():
+
+    pool    = futures.ThreadPoolExecutor(max_workers=2)
+    queue   = workerpool.PrepareQueue(pool)
+    results = [None, None]
+    called  = []
+
+    def task(i):
+        def func():
+            results[i] = i
+        return func
+
+    def done(arg, kwarg=None):
+        called.append((list(results), arg, kwarg))
+
+    fs = queue.prepare([(i, task(i)) for i in range(2)])
+    workerpool.wait(fs, done, 'arg', kwarg='kwarg')
+
+    assert called == [([0, 1], 'arg', 'kwarg')]
+
+    queue.destroy()
+    pool.shutdown()